@@ -0,0 +1,5 @@
+"""
+Performance benchmarks for CalPack.  Each :code:`bench_*` module can be run on its own, i.e.
+:code:`python -m benchmarks.bench_pcap`, or as part of the suite with :code:`python -m benchmarks`,
+which saves the results of a run and compares them with those of another commit.
+"""
@@ -0,0 +1,160 @@
+"""
+Runs the benchmark suite and saves the results, or compares the results of two runs.
+
+Example::
+
+    python -m benchmarks --list
+    python -m benchmarks core pickle --output before.json
+    python -m benchmarks core --output after.json --compare before.json
+    python -m benchmarks --compare before.json after.json
+
+The results file is a JSON object of the environment of the run (python version, platform, git
+commit) and of every result reported, tagged with its module.  Comparisons match the results of
+both runs by module and benchmark, and compare their :code:`seconds` (lower is better).
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+
+from benchmarks import harness
+
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def available_modules():
+    """the names of the benchmark modules, without their :code:`bench_` prefix"""
+    return sorted(
+        name[len('bench_'):-len('.py')] for name in os.listdir(PACKAGE_DIR)
+        if name.startswith('bench_') and name.endswith('.py')
+    )
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=PACKAGE_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(modules):
+    """
+    Runs the :code:`main` of every benchmark module.
+
+    :param list modules: the names of the modules (without their :code:`bench_` prefix)
+    :return: the environment of the run and every result reported
+    :rtype: dict
+    """
+    results = []
+    for module in modules:
+        del harness.RESULTS[:]
+        importlib.import_module('benchmarks.bench_' + module).main()
+        for result in harness.RESULTS:
+            results.append(dict(result, module=module))
+    return {
+        'commit': _git_commit(),
+        'python': platform.python_implementation() + ' ' + platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+
+def compare(base, new, threshold=0.1):
+    """
+    Compares the results of two runs.
+
+    :param dict base: the results of the reference run
+    :param dict new: the results of the run to compare
+    :param float threshold: the relative slow down above which a benchmark has regressed
+    :return: the (module, benchmark, base seconds, new seconds, ratio) of every benchmark in both
+        runs, and the number of regressions
+    :rtype: tuple
+    """
+    base_seconds = dict(
+        ((res['module'], res['benchmark']), res['seconds'])
+        for res in base['results'] if 'seconds' in res
+    )
+    rows = []
+    regressions = 0
+    for res in new['results']:
+        key = (res['module'], res['benchmark'])
+        if 'seconds' not in res or key not in base_seconds:
+            continue
+        ratio = res['seconds'] / base_seconds[key]
+        if ratio > 1 + threshold:
+            regressions += 1
+        rows.append(key + (base_seconds[key], res['seconds'], ratio))
+    return rows, regressions
+
+
+def _load(path):
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def print_comparison(rows, threshold):
+    for module, benchmark, before, after, ratio in rows:
+        if ratio > 1 + threshold:
+            flag = 'slower'
+        elif ratio < 1 / (1 + threshold):
+            flag = 'faster'
+        else:
+            flag = ''
+        print("{n:<48} {b:>12.4g} {a:>12.4g} {r:>7.2f}x {f}".format(
+            n=module + ':' + benchmark, b=before, a=after, r=ratio, f=flag
+        ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks', description=__doc__.strip().split('\n\n')[0]
+    )
+    parser.add_argument('modules', nargs='*', help="the modules to run (default all of them)")
+    parser.add_argument('--list', action='store_true', help="list the modules and exit")
+    parser.add_argument('--output', help="save the results to this JSON file")
+    parser.add_argument('--compare', nargs='+', metavar='RESULTS',
+                        help="compare the run (or the second results file) to this results file")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="the relative slow down reported as a regression (default 0.1)")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print('\n'.join(available_modules()))
+        return 0
+
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare takes one or two results files")
+    unknown = set(args.modules) - set(available_modules())
+    if unknown:
+        parser.error("unknown benchmark module(s): {}".format(', '.join(sorted(unknown))))
+
+    base = None
+    if args.compare:
+        base = _load(args.compare[0])
+
+    if args.compare and len(args.compare) == 2:
+        new = _load(args.compare[1])
+    else:
+        new = run(args.modules or available_modules())
+        if args.output:
+            with open(args.output, 'w') as out:
+                json.dump(new, out, indent=2, sort_keys=True)
+
+    if base is None:
+        return 0
+    rows, regressions = compare(base, new, args.threshold)
+    print_comparison(rows, args.threshold)
+    print("{r} regression(s) above {t:.0%} out of {n} benchmark(s)".format(
+        r=regressions, t=args.threshold, n=len(rows)
+    ))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Aggregating the fields of 10 million :code:`UDP_HEADER` records (bytes per destination port and
+statistics of the lengths), with NumPy, with the pure python fallback and by decoding every
+record as a :code:`Packet`.  The slower ones are timed on a tenth of the records.
+"""
+from benchmarks.harness import best_of, report
+from calpack.common.ip import UDP_HEADER
+from calpack.records import aggregate, columns
+
+NUM_RECORDS = 10000000
+RECORD_SIZE = 8
+
+
+def make_records():
+    import numpy
+    records = numpy.zeros(NUM_RECORDS, dtype=[
+        ('source_port', '=u2'), ('dest_port', '=u2'), ('length', '=u2'), ('checksum', '=u2')
+    ])
+    random = numpy.random.RandomState(1)
+    records['source_port'] = random.randint(1024, 65536, NUM_RECORDS)
+    records['dest_port'] = random.choice([53, 123, 161, 443, 514, 5353], NUM_RECORDS)
+    records['length'] = random.randint(8, 1500, NUM_RECORDS)
+    return bytearray(records.tobytes())
+
+
+def packet_loop(buf, count):
+    from_buffer = UDP_HEADER.from_buffer
+    totals = {}
+    for i in range(count):
+        pkt = from_buffer(buf, i * RECORD_SIZE)
+        totals[pkt.dest_port] = totals.get(pkt.dest_port, 0) + pkt.length
+    return totals
+
+
+def main():
+    buf = make_records()
+    subset = NUM_RECORDS // 10
+
+    def run(name, count, scale, **kwargs):
+        seconds = best_of(lambda: aggregate.aggregate(
+            UDP_HEADER, buf, count=count, **kwargs
+        ), repeat=1 if scale > 1 else 3) * scale
+        report(name, records=NUM_RECORDS, seconds=seconds, records_per_s=NUM_RECORDS / seconds)
+
+    run('aggregate_numpy_sum_by_port', None, 1, field='length', funcs='sum', by='dest_port')
+    run('aggregate_numpy_stats', None, 1, field='length', funcs=['min', 'max', 'mean'])
+    run('aggregate_numpy_distinct', None, 1, field='source_port', funcs='distinct')
+    run('aggregate_numpy_histogram', None, 1, field='length', funcs='histogram',
+        bins=list(range(0, 1501, 100)))
+
+    numpy = aggregate.numpy
+    aggregate.numpy = columns.numpy = None
+    try:
+        run('aggregate_python_sum_by_port_estimate', subset, 10, field='length', funcs='sum',
+            by='dest_port')
+        run('aggregate_python_stats_estimate', subset, 10, field='length',
+            funcs=['min', 'max', 'mean'])
+    finally:
+        aggregate.numpy = columns.numpy = numpy
+
+    seconds = best_of(lambda: packet_loop(buf, subset), repeat=1) * 10
+    report('packet_loop_sum_by_port_estimate', records=NUM_RECORDS, seconds=seconds,
+           records_per_s=NUM_RECORDS / seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""
+Micro benchmarks of the core packet operations: creating packets with their default values and
+with keyword arguments, :code:`to_bytes` / :code:`from_bytes`, getting and setting every type of
+field, nested :code:`PacketField` / :code:`ArrayField` access, and the bit fields of
+:code:`TCP_HEADER` in native, big and little endian.  Every result is the best time of a single
+operation.
+
+Every benchmark is a module level :code:`time_*` function performing the operation once, the
+naming `asv <https://asv.readthedocs.io>`_ discovers, so the module can also be run with asv
+(:code:`benchmark_dir` set to :code:`benchmarks`), or its functions passed to pytest-benchmark's
+:code:`benchmark` fixture.
+"""
+from benchmarks.harness import per_call, report
+from calpack import models
+from calpack.common import ip
+from calpack.utils import PYPY
+
+
+class ALL_FIELDS(models.Packet):
+    int_field = models.IntField32()
+    bit_field = models.IntField8(bit_len=4)
+    float_field = models.FloatField()
+    double_field = models.DoubleField()
+    bool_field = models.BoolField()
+    flag_field = models.FlagField()
+    array_field = models.ArrayField(models.IntField16(), 8)
+
+
+class POINT(models.Packet):
+    x = models.IntField16()
+    y = models.IntField16()
+
+
+class SHAPE(models.Packet):
+    origin = models.PacketField(POINT)
+    points = models.ArrayField(models.PacketField(POINT), 8)
+    values = models.ArrayField(models.IntField32(), 16)
+
+
+TCP_CLASSES = [('native', ip.TCP_HEADER)]
+if not PYPY:
+    TCP_CLASSES += [('big', ip.TCP_HEADER_BIG), ('little', ip.TCP_HEADER_LITTLE)]
+
+KWARGS = {
+    'int_field': 123456, 'bit_field': 9, 'float_field': 1.5, 'double_field': 2.25,
+    'bool_field': True, 'flag_field': True,
+}
+PKT = ALL_FIELDS(**KWARGS)
+RAW = PKT.to_bytes()
+ARRAY_VALUES = list(range(8))
+SHAPE_PKT = SHAPE()
+SHAPE_RAW = SHAPE_PKT.to_bytes()
+TCP_PKTS = dict((order, cls(seq_num=1000, data_offset=5, flag_syn=1, flag_ack=1))
+                for order, cls in TCP_CLASSES)
+
+
+def time_create_defaults():
+    ALL_FIELDS()
+
+
+def time_create_kwargs():
+    ALL_FIELDS(**KWARGS)
+
+
+def time_to_bytes():
+    PKT.to_bytes()
+
+
+def time_from_bytes():
+    ALL_FIELDS.from_bytes(RAW)
+
+
+def time_nested_to_bytes():
+    SHAPE_PKT.to_bytes()
+
+
+def time_nested_from_bytes():
+    SHAPE.from_bytes(SHAPE_RAW)
+
+
+def time_get_int():
+    PKT.int_field
+
+
+def time_set_int():
+    PKT.int_field = 123456
+
+
+def time_get_bit():
+    PKT.bit_field
+
+
+def time_set_bit():
+    PKT.bit_field = 9
+
+
+def time_get_float():
+    PKT.float_field
+
+
+def time_set_float():
+    PKT.float_field = 1.5
+
+
+def time_get_double():
+    PKT.double_field
+
+
+def time_set_double():
+    PKT.double_field = 2.25
+
+
+def time_get_bool():
+    PKT.bool_field
+
+
+def time_set_bool():
+    PKT.bool_field = True
+
+
+def time_get_flag():
+    PKT.flag_field
+
+
+def time_set_flag():
+    PKT.flag_field = True
+
+
+def time_get_array():
+    PKT.array_field
+
+
+def time_get_array_item():
+    PKT.array_field[3]
+
+
+def time_set_array():
+    PKT.array_field = ARRAY_VALUES
+
+
+def time_get_packet():
+    SHAPE_PKT.origin
+
+
+def time_get_nested_field():
+    SHAPE_PKT.origin.x
+
+
+def time_set_nested_field():
+    SHAPE_PKT.origin.x = 3
+
+
+def time_get_array_packet_field():
+    SHAPE_PKT.points[5].y
+
+
+def time_set_array_packet_field():
+    SHAPE_PKT.points[5].y = 4
+
+
+def time_iter_array():
+    for _ in SHAPE_PKT.values:
+        pass
+
+
+def _tcp_benchmarks():
+    """the get and set of TCP_HEADER's bit fields, for every byte order"""
+    benchmarks = []
+    for order, cls in TCP_CLASSES:
+        def get_flags(pkt=TCP_PKTS[order]):
+            pkt.data_offset, pkt.flag_syn, pkt.flag_ack, pkt.flag_fin
+
+        def set_flags(pkt=TCP_PKTS[order]):
+            pkt.data_offset = 6
+            pkt.flag_syn = 0
+            pkt.flag_ack = 1
+            pkt.flag_fin = 1
+
+        def create(cls=cls):
+            cls(seq_num=1000, data_offset=5, flag_syn=1, flag_ack=1)
+
+        raw = TCP_PKTS[order].to_bytes()
+
+        def from_bytes(cls=cls, raw=raw):
+            cls.from_bytes(raw)
+
+        benchmarks += [
+            ('tcp_{}_get_bitfields'.format(order), get_flags),
+            ('tcp_{}_set_bitfields'.format(order), set_flags),
+            ('tcp_{}_create'.format(order), create),
+            ('tcp_{}_from_bytes'.format(order), from_bytes),
+        ]
+    return benchmarks
+
+
+for _name, _func in _tcp_benchmarks():
+    _func.__name__ = 'time_' + _name
+    globals()[_func.__name__] = _func
+del _name, _func
+
+
+def benchmarks():
+    """the (name, function) of every benchmark of the module, in definition order"""
+    return [
+        (name[len('time_'):], func) for name, func in globals().items()
+        if name.startswith('time_') and callable(func)
+    ]
+
+
+def main():
+    for name, func in benchmarks():
+        seconds = per_call(func)
+        report(name, seconds=seconds, ns_per_op=seconds * 1e9, ops_per_s=1 / seconds)
+
+
+if __name__ == '__main__':
+    main()
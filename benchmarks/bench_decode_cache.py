@@ -0,0 +1,73 @@
+"""
+Decoding repetitive traffic (90% of the packets are identical heartbeats from 50 nodes) with and
+without the LRU decode cache, and reading a few fields of every decoded packet.
+"""
+import random
+
+from benchmarks.harness import best_of, report
+from calpack import models
+
+NUM_PACKETS = 100000
+NUM_NODES = 50
+
+
+class STATUS_FIELD(models.IntField8):
+    STATES = ('down', 'starting', 'up', 'degraded')
+
+    def c_to_py(self, c_field):
+        return self.STATES[c_field % 4]
+
+
+class HEARTBEAT(models.Packet):
+    node_id = models.IntField32()
+    status = STATUS_FIELD()
+    version = models.IntField16()
+    sequence = models.IntField32()
+    load = models.ArrayField(models.IntField8(), 8)
+
+
+def make_traffic():
+    rand = random.Random(5)
+    heartbeats = [
+        HEARTBEAT(node_id=node, status=2, version=7, load=[1] * 8).to_bytes()
+        for node in range(NUM_NODES)
+    ]
+    traffic = []
+    for i in range(NUM_PACKETS):
+        if rand.random() < 0.9:
+            traffic.append(rand.choice(heartbeats))
+        else:
+            traffic.append(HEARTBEAT(node_id=rand.randrange(NUM_NODES), sequence=i).to_bytes())
+    return traffic
+
+
+def main():
+    traffic = make_traffic()
+
+    def decode():
+        from_bytes = HEARTBEAT.from_bytes
+        for data in traffic:
+            from_bytes(data)
+
+    def decode_and_read():
+        from_bytes = HEARTBEAT.from_bytes
+        for data in traffic:
+            pkt = from_bytes(data)
+            pkt.node_id, pkt.status, pkt.load
+
+    for mode in ('uncached', 'frozen', 'copies'):
+        if mode != 'uncached':
+            cache = HEARTBEAT.enable_decode_cache(max_entries=256, frozen=mode == 'frozen')
+        for name, func in (('decode', decode), ('decode_read', decode_and_read)):
+            seconds = best_of(func)
+            metrics = dict(packets=NUM_PACKETS, seconds=seconds, packets_per_s=NUM_PACKETS / seconds)
+            if mode != 'uncached':
+                stats = cache.stats()
+                metrics['hit_rate'] = stats['hits'] / float(stats['hits'] + stats['misses'])
+                metrics['evictions'] = stats['evictions']
+            report('{n}_{m}'.format(n=name, m=mode), **metrics)
+        HEARTBEAT.disable_decode_cache()
+
+
+if __name__ == '__main__':
+    main()
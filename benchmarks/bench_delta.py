@@ -0,0 +1,80 @@
+"""
+Delta encoding 100 thousand telemetry samples (100 seconds at 1 kHz), compared to storing and
+loading the raw :code:`to_bytes()` of every packet: the compression ratio and the encode and
+decode throughputs.
+"""
+
+from benchmarks.harness import best_of, report
+from calpack import models
+from calpack.records.delta import DeltaEncoder, DeltaDecoder
+
+NUM_SAMPLES = 100000
+
+
+class TELEMETRY(models.Packet):
+    timestamp_us = models.IntField64()
+    sequence = models.IntField32()
+    mode = models.IntField8(bit_len=3)
+    fault = models.IntField8(bit_len=1)
+    battery_mv = models.IntField16()
+    temperature = models.IntField16(signed=True)
+    pressure = models.IntField32()
+    accel = models.ArrayField(models.IntField16(signed=True), 3)
+    gyro = models.ArrayField(models.IntField16(signed=True), 3)
+    firmware = models.IntField32()
+    serial = models.IntField64()
+
+
+def make_samples():
+    samples = []
+    for i in range(NUM_SAMPLES):
+        samples.append(TELEMETRY(
+            timestamp_us=1700000000000000 + i * 1000, sequence=i, mode=(i // 20000) % 4,
+            fault=0, battery_mv=12000 - i // 5000, temperature=215 + (i // 3000) % 5,
+            pressure=101325 + (i // 250) % 7, accel=[0, (i // 100) % 3, 981],
+            gyro=[(i // 500) % 2, 0, 0], firmware=0x010203, serial=123456789,
+        ))
+    return samples
+
+
+def main():
+    samples = make_samples()
+    raw = b''.join(pkt.to_bytes() for pkt in samples)
+    size = len(raw) // NUM_SAMPLES
+
+    encoded = DeltaEncoder(TELEMETRY).encode_records(raw)
+    report('delta_size', samples=NUM_SAMPLES, raw_bytes=len(raw), delta_bytes=len(encoded),
+           ratio=len(raw) / float(len(encoded)), bytes_per_sample=len(encoded) / float(NUM_SAMPLES))
+
+    seconds = best_of(lambda: b''.join(pkt.to_bytes() for pkt in samples))
+    report('raw_encode', samples=NUM_SAMPLES, seconds=seconds, samples_per_s=NUM_SAMPLES / seconds)
+
+    seconds = best_of(lambda: DeltaEncoder(TELEMETRY).encode_records(raw))
+    report('delta_encode_records', samples=NUM_SAMPLES, seconds=seconds,
+           samples_per_s=NUM_SAMPLES / seconds)
+
+    def encode_packets():
+        encode = DeltaEncoder(TELEMETRY).encode
+        return [encode(pkt) for pkt in samples]
+    seconds = best_of(encode_packets)
+    report('delta_encode_packets', samples=NUM_SAMPLES, seconds=seconds,
+           samples_per_s=NUM_SAMPLES / seconds)
+
+    seconds = best_of(lambda: [TELEMETRY.from_bytes(raw[i:i + size])
+                               for i in range(0, len(raw), size)])
+    report('raw_decode_packets', samples=NUM_SAMPLES, seconds=seconds,
+           samples_per_s=NUM_SAMPLES / seconds)
+
+    seconds = best_of(lambda: DeltaDecoder(TELEMETRY).decode_records(encoded))
+    report('delta_decode_records', samples=NUM_SAMPLES, seconds=seconds,
+           samples_per_s=NUM_SAMPLES / seconds)
+
+    seconds = best_of(lambda: DeltaDecoder(TELEMETRY).decode_packets(encoded))
+    report('delta_decode_packets', samples=NUM_SAMPLES, seconds=seconds,
+           samples_per_s=NUM_SAMPLES / seconds)
+
+    assert DeltaDecoder(TELEMETRY).decode_records(encoded) == raw
+
+
+if __name__ == '__main__':
+    main()
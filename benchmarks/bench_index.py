@@ -0,0 +1,66 @@
+"""
+Building and querying a :code:`HashIndex` over 10 million records, compared to finding records
+with a full scan (a compiled filter) and to a python dict built by decoding every record.
+"""
+import random
+import time
+
+from benchmarks.harness import best_of, report
+from calpack import models
+from calpack.records.index import HashIndex
+
+NUM_RECORDS = 10000000
+NUM_LOOKUPS = 100000
+
+
+class DEVICE_RECORD(models.Packet):
+    device_id = models.IntField64()
+    sequence = models.IntField32()
+    status = models.IntField16()
+    flags = models.IntField16()
+
+
+def make_records():
+    import numpy
+    records = numpy.zeros(NUM_RECORDS, dtype=[
+        ('device_id', '<u8'), ('sequence', '<u4'), ('status', '<u2'), ('flags', '<u2')
+    ])
+    records['device_id'] = numpy.random.RandomState(1).permutation(NUM_RECORDS) * 7 + 3
+    records['sequence'] = numpy.arange(NUM_RECORDS)
+    return bytearray(records.tobytes())
+
+
+def main():
+    buf = make_records()
+    keys = [random.randrange(NUM_RECORDS) * 7 + 3 for _ in range(NUM_LOOKUPS)]
+
+    start = time.time()
+    index = HashIndex(DEVICE_RECORD, 'device_id', buf)
+    seconds = time.time() - start
+    report('index_build', records=NUM_RECORDS, seconds=seconds,
+           records_per_s=NUM_RECORDS / seconds)
+
+    def lookups():
+        lookup = index.lookup
+        for key in keys:
+            lookup(key)
+
+    seconds = best_of(lookups)
+    report('index_lookup', lookups=NUM_LOOKUPS, seconds=seconds, lookups_per_s=NUM_LOOKUPS / seconds)
+
+    scan = DEVICE_RECORD.compile_filter("device_id == {}".format(keys[0]))
+    seconds = best_of(lambda: scan.scan(buf), repeat=1)
+    report('scan_lookup', lookups=1, seconds=seconds, lookups_per_s=1 / seconds)
+
+    def dict_build():
+        device_id = DEVICE_RECORD.from_buffer
+        return dict(
+            (device_id(buf, i * 16).device_id, i) for i in range(NUM_RECORDS // 10)
+        )
+    seconds = best_of(dict_build, repeat=1) * 10
+    report('dict_build_estimate', records=NUM_RECORDS, seconds=seconds,
+           records_per_s=NUM_RECORDS / seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Throughput of :code:`ParallelScan` over a buffer of UDP headers for an increasing number of worker
+processes, compared to a single process loop over the same records.  The per record function is
+deliberately python level work, the CPU bound case the scan is meant for.
+"""
+import multiprocessing
+import operator
+
+from benchmarks.harness import best_of, report
+from calpack.common.ip import UDP_HEADER_BIG
+from calpack.records.parallel import ParallelScan
+
+NUM_RECORDS = 1000000
+
+
+def count_dns(total, udp):
+    return total + (udp.dest_port == 53 and udp.length > 512)
+
+
+def serial(buf, size):
+    total = 0
+    for i in range(NUM_RECORDS):
+        total = count_dns(total, UDP_HEADER_BIG.from_buffer(buf, i * size))
+    return total
+
+
+def main():
+    pkt = UDP_HEADER_BIG(source_port=1234, dest_port=53, length=600)
+    buf = bytearray(pkt.to_bytes() * NUM_RECORDS)
+    size = len(pkt)
+
+    seconds = best_of(lambda: serial(buf, size), repeat=1)
+    report('scan_serial', records=NUM_RECORDS, processes=1, seconds=seconds,
+           records_per_s=NUM_RECORDS / seconds)
+
+    processes = 1
+    while processes <= multiprocessing.cpu_count():
+        with ParallelScan(UDP_HEADER_BIG, buf, processes=processes) as scan:
+            # start the pool outside of the timing
+            scan.filter("dest_port == 53")
+            seconds = best_of(lambda: scan.reduce(count_dns, 0, operator.add), repeat=1)
+        report('scan_parallel_reduce', records=NUM_RECORDS, processes=processes,
+               seconds=seconds, records_per_s=NUM_RECORDS / seconds)
+        processes *= 2
+
+
+if __name__ == '__main__':
+    main()
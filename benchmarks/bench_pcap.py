@@ -0,0 +1,93 @@
+"""
+Throughput of writing and reading pcap files with :code:`calpack.common.pcap` compared to packing
+and writing (or reading) every record individually with :code:`struct` and :code:`file.write`.
+"""
+import os
+import shutil
+import struct
+import tempfile
+
+from benchmarks.harness import best_of, report
+from calpack.common.ip import UDP_HEADER_BIG
+from calpack.common.pcap import PcapReader, PcapWriter
+
+NUM_RECORDS = 200000
+FRAME = b'\x00' * 34 + UDP_HEADER_BIG(source_port=1234, dest_port=53, length=8).to_bytes()
+
+
+def _file_size_mb(path):
+    return os.path.getsize(path) / float(1024 * 1024)
+
+
+def write_per_record(path):
+    record = struct.Struct('<IIII')
+    with open(path, 'wb') as capture:
+        capture.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        for i in range(NUM_RECORDS):
+            capture.write(record.pack(i, 0, len(FRAME), len(FRAME)))
+            capture.write(FRAME)
+
+
+def write_pcap_writer(path, background=False):
+    with PcapWriter(path, background=background) as capture:
+        write = capture.write
+        for i in range(NUM_RECORDS):
+            write(FRAME, i * 1000000000)
+
+
+def write_many_pcap_writer(path, background=False):
+    with PcapWriter(path, background=background) as capture:
+        capture.write_many((i * 1000000000, FRAME) for i in range(NUM_RECORDS))
+
+
+def read_per_record(path):
+    record = struct.Struct('<IIII')
+    total = 0
+    with open(path, 'rb') as capture:
+        capture.read(24)
+        while True:
+            header = capture.read(record.size)
+            if len(header) < record.size:
+                break
+            ts_sec, ts_usec, incl_len, _ = record.unpack(header)
+            timestamp = ts_sec * 1000000000 + ts_usec * 1000
+            data = capture.read(incl_len)
+            total += data[-1]
+    return total
+
+
+def read_pcap_reader(path):
+    total = 0
+    with PcapReader(path) as capture:
+        for record in capture:
+            total += record.data[-1]
+    return total
+
+
+def main():
+    tmp_dir = tempfile.mkdtemp()
+    path = os.path.join(tmp_dir, 'bench.pcap')
+    try:
+        for name, func in [
+                ('pcap_write_per_record', lambda: write_per_record(path)),
+                ('pcap_write_writer', lambda: write_pcap_writer(path)),
+                ('pcap_write_writer_background', lambda: write_pcap_writer(path, True)),
+                ('pcap_write_many_writer', lambda: write_many_pcap_writer(path)),
+                ('pcap_write_many_writer_background',
+                 lambda: write_many_pcap_writer(path, True))]:
+            seconds = best_of(func)
+            report(name, records=NUM_RECORDS, seconds=seconds,
+                   mb_per_s=_file_size_mb(path) / seconds)
+
+        for name, func in [
+                ('pcap_read_per_record', lambda: read_per_record(path)),
+                ('pcap_read_reader', lambda: read_pcap_reader(path))]:
+            seconds = best_of(func)
+            report(name, records=NUM_RECORDS, seconds=seconds,
+                   mb_per_s=_file_size_mb(path) / seconds)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Cost of pickling packets for process pools with :code:`Packet.__reduce_ex__`, compared to the
+ways packets had to be shipped by hand before it existed: as a (class, bytes) tuple restored with
+:code:`from_bytes`, or as a dict of field values.  Default pickling of a packet isn't possible
+(its internal structure class can't be pickled), so it has no entry.
+"""
+import pickle
+
+from benchmarks.harness import best_of, report
+from calpack import models
+from calpack.common.ip import TCP_HEADER_BIG
+
+NUM_PACKETS = 20000
+LARGE_SIZE = 1024 * 1024
+
+
+class LARGE_PACKET(models.Packet):
+    header = models.IntField32()
+    data = models.ArrayField(models.IntField8(), LARGE_SIZE)
+
+
+def by_bytes(pkts, protocol):
+    data = pickle.dumps([(type(pkt), pkt.to_bytes()) for pkt in pkts], protocol)
+    return [cls.from_bytes(raw) for cls, raw in pickle.loads(data)]
+
+
+def by_fields(pkts, protocol):
+    data = pickle.dumps(
+        [(type(pkt), dict(zip(pkt.fields_order, pkt.fields))) for pkt in pkts], protocol
+    )
+    return [cls(**values) for cls, values in pickle.loads(data)]
+
+
+def by_reduce(pkts, protocol):
+    return pickle.loads(pickle.dumps(pkts, protocol))
+
+
+def by_reduce_out_of_band(pkts):
+    buffers = []
+    data = pickle.dumps(pkts, 5, buffer_callback=buffers.append)
+    return pickle.loads(data, buffers=buffers)
+
+
+def main():
+    protocol = pickle.HIGHEST_PROTOCOL
+    small = [TCP_HEADER_BIG(source_port=i % 65536, dest_port=443, seq_num=i)
+             for i in range(NUM_PACKETS)]
+    large = [LARGE_PACKET(header=i) for i in range(4)]
+
+    for name, func in [
+            ('pickle_small_bytes_tuple', lambda: by_bytes(small, protocol)),
+            ('pickle_small_field_dict', lambda: by_fields(small, protocol)),
+            ('pickle_small_reduce', lambda: by_reduce(small, protocol))]:
+        seconds = best_of(func)
+        report(name, packets=NUM_PACKETS, seconds=seconds, packets_per_s=NUM_PACKETS / seconds)
+
+    size_mb = len(large) * (LARGE_SIZE + 4) / float(1024 * 1024)
+    benchmarks = [
+        ('pickle_large_bytes_tuple', lambda: by_bytes(large, protocol)),
+        ('pickle_large_reduce', lambda: by_reduce(large, protocol)),
+    ]
+    if protocol >= 5:
+        benchmarks.append(('pickle_large_reduce_out_of_band', lambda: by_reduce_out_of_band(large)))
+    for name, func in benchmarks:
+        seconds = best_of(func, repeat=5)
+        report(name, packets=len(large), seconds=seconds, mb_per_s=size_mb / seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Messages per second handed from a producer process to a consumer process through a
+:code:`PacketRing`, compared to a :code:`multiprocessing.Queue` (which pickles every packet).  The
+consumer reads one field of every packet in all of the variants.
+"""
+import multiprocessing
+import time
+
+from benchmarks.harness import report
+from calpack.common.ip import UDP_HEADER_BIG
+from calpack.records.ring import PacketRing
+
+NUM_MESSAGES = 200000
+BATCH = 256
+
+
+def _packets():
+    return [UDP_HEADER_BIG(source_port=i % 65536, dest_port=53, length=8) for i in range(BATCH)]
+
+
+def queue_producer(channel, go, batched):
+    pkts = _packets()
+    go.wait()
+    for _ in range(NUM_MESSAGES // BATCH):
+        if batched:
+            channel.put(pkts)
+        else:
+            for pkt in pkts:
+                channel.put(pkt)
+
+
+def ring_producer(channel, go, batched):
+    pkts = _packets()
+    go.wait()
+    for _ in range(NUM_MESSAGES // BATCH):
+        if batched:
+            channel.put_many(pkts)
+        else:
+            for pkt in pkts:
+                channel.put(pkt)
+    channel.close()
+
+
+def queue_consumer(channel, batched):
+    received = 0
+    total = NUM_MESSAGES // BATCH * BATCH
+    while received < total:
+        if batched:
+            for pkt in channel.get():
+                pkt.dest_port
+                received += 1
+        else:
+            channel.get().dest_port
+            received += 1
+
+
+def ring_consumer(channel, batched):
+    received = 0
+    total = NUM_MESSAGES // BATCH * BATCH
+    while received < total:
+        if batched:
+            with channel.read(BATCH) as batch:
+                for pkt in batch:
+                    pkt.dest_port
+                received += len(batch)
+        else:
+            channel.get().dest_port
+            received += 1
+
+
+def run(name, channel, producer, consumer, batched):
+    go = multiprocessing.Event()
+    process = multiprocessing.Process(target=producer, args=(channel, go, batched))
+    process.start()
+    start = time.time()
+    go.set()
+    consumer(channel, batched)
+    seconds = time.time() - start
+    process.join()
+    messages = NUM_MESSAGES // BATCH * BATCH
+    report(name, messages=messages, seconds=seconds, messages_per_s=messages / seconds)
+
+
+def main():
+    for batched in (False, True):
+        suffix = '_batched' if batched else ''
+        run('ipc_queue' + suffix, multiprocessing.Queue(1024), queue_producer, queue_consumer,
+            batched)
+        ring = PacketRing.create(UDP_HEADER_BIG, capacity=4096)
+        try:
+            run('ipc_ring' + suffix, ring, ring_producer, ring_consumer, batched)
+        finally:
+            ring.close()
+
+
+if __name__ == '__main__':
+    main()
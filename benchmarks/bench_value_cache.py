@@ -0,0 +1,79 @@
+"""
+Read heavy workloads on packets with costly field conversions (addresses, scaled units and
+enums), with and without the decoded value cache: a dashboard reading the same fields of a packet
+repeatedly, the same with occasional updates, and walking the records of a buffer with a single
+rebound packet.
+"""
+import socket
+import struct
+
+from benchmarks.harness import best_of, report
+from calpack import models
+
+NUM_READS = 100000
+NUM_RECORDS = 10000
+STATES = ('idle', 'starting', 'running', 'stopping', 'fault')
+
+
+class IPv4Field(models.IntField32):
+    def c_to_py(self, c_field):
+        return socket.inet_ntoa(struct.pack('>I', c_field))
+
+
+class CelsiusField(models.IntField16):
+    def c_to_py(self, c_field):
+        return round(c_field * 0.01 - 40.0, 2)
+
+
+class StateField(models.IntField8):
+    def c_to_py(self, c_field):
+        return STATES[c_field]
+
+
+class DEVICE_STATUS(models.Packet):
+    address = IPv4Field()
+    temperature = CelsiusField()
+    state = StateField()
+    uptime = models.IntField32()
+
+
+def dashboard(pkt, reads, update_every=None):
+    for i in range(reads):
+        if update_every and i % update_every == 0:
+            pkt.uptime = i
+        pkt.address, pkt.temperature, pkt.state, pkt.uptime
+
+
+def main():
+    template = DEVICE_STATUS(address=0x0a000001, temperature=6512, state=2, uptime=1)
+
+    for name, update_every in (('dashboard', None), ('dashboard_updates', 10)):
+        for cached in (False, True):
+            pkt = template.copy()
+            if cached:
+                pkt.cache_values()
+            seconds = best_of(lambda: dashboard(pkt, NUM_READS, update_every))
+            report('{n}_{c}'.format(n=name, c='cached' if cached else 'uncached'),
+                   reads=NUM_READS * 4, seconds=seconds, reads_per_s=NUM_READS * 4 / seconds)
+
+    buf = bytearray(template.to_bytes() * NUM_RECORDS)
+    size = len(template)
+
+    def walk(cached):
+        pkt = DEVICE_STATUS.from_buffer(buf)
+        if cached:
+            pkt.cache_values()
+        for offset in range(0, len(buf), size):
+            pkt.rebind(buf, offset)
+            # every record is read 5 times, i.e. by the panels of a dashboard
+            for _ in range(5):
+                pkt.address, pkt.temperature, pkt.state
+
+    for cached in (False, True):
+        seconds = best_of(lambda: walk(cached))
+        report('walk_records_{}'.format('cached' if cached else 'uncached'),
+               records=NUM_RECORDS, seconds=seconds, records_per_s=NUM_RECORDS / seconds)
+
+
+if __name__ == '__main__':
+    main()
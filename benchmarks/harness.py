@@ -0,0 +1,48 @@
+"""
+Small helpers shared by the benchmark modules.  Results are printed as one JSON object per line
+so they can be collected and compared between commits.
+"""
+import json
+import timeit
+
+# Every result reported, for the suite runner (:code:`python -m benchmarks`) to collect
+RESULTS = []
+
+
+def best_of(func, number=1, repeat=3):
+    """
+    Times :code:`func` and returns the best time of a single call in seconds.
+
+    :param func: a callable taking no arguments
+    :param int number: the number of calls per timing
+    :param int repeat: the number of timings to take the best of
+    """
+    return min(timeit.Timer(func).repeat(repeat=repeat, number=number)) / number
+
+
+def per_call(func, repeat=3):
+    """
+    Times a fast :code:`func` and returns the best time of a single call in seconds.  The
+    number of calls per timing is chosen like :code:`python -m timeit` does, so that a timing
+    takes at least 0.2 seconds.
+
+    :param func: a callable taking no arguments
+    :param int repeat: the number of timings to take the best of
+    """
+    timer = timeit.Timer(func)
+    number = timer.autorange()[0]
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def report(benchmark, **metrics):
+    """
+    Prints the result of a benchmark as a JSON line.
+
+    :param str benchmark: the name of the benchmark
+    :param metrics: the measured values (i.e. :code:`seconds`, :code:`mb_per_s`)
+    """
+    result = {'benchmark': benchmark}
+    result.update(metrics)
+    RESULTS.append(result)
+    print(json.dumps(result, sort_keys=True))
+    return result
@@ -0,0 +1,292 @@
+"""
+Internet checksum (RFC 1071) computation for the :code:`calpack.common.ip` headers, along with
+incremental updates (RFC 1624) for when only a few fields of a packet change.
+
+The one's complement sum of 16 bit words is computed without iterating over the words in python:
+because :code:`2**16` is congruent to 1 modulo :code:`0xffff`, the sum of the big endian words of
+a buffer is congruent to the buffer read as one big endian integer.  The whole buffer is therefore
+summed in a single C level conversion and reduction, which is considerably faster than any word
+by word loop.  Buffers of many equal sized records can be summed at once with NumPy, when
+available, using :code:`checksum_many`.
+
+Checksums are computed over the bytes as they are, so the big endian (network byte order)
+variants of the headers (i.e. :code:`UDP_HEADER_BIG`) should be used.
+
+Example::
+
+    udp = UDP_HEADER_BIG(source_port=1234, dest_port=53, length=8 + len(payload))
+    udp.checksum = udp_checksum(udp, payload, '10.0.0.1', '10.0.0.2')
+
+    # Rewrite the destination port without re-summing the payload
+    udp.checksum = update_checksum_word(udp.checksum, udp.dest_port, 5353)
+    udp.dest_port = 5353
+
+    # Or let the packet track what changed
+    udp.track_changes()
+    udp.source_port, udp.dest_port = 4321, 53
+    udp.checksum = update_checksum_dirty(udp.checksum, udp)
+"""
+import socket
+import struct
+
+from calpack.models.layout import get_layout
+from calpack.utils import PY2
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+__all__ = [
+    'ones_complement_sum', 'internet_checksum', 'checksum_many', 'update_checksum',
+    'update_checksum_dirty', 'update_checksum_word', 'ipv4_pseudo_header', 'ipv6_pseudo_header',
+    'udp_checksum', 'tcp_checksum', 'IPPROTO_TCP', 'IPPROTO_UDP'
+]
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+_MODULUS = 0xffff
+
+
+if PY2:  # pragma: no cover
+    import binascii
+
+    def _to_int(data):
+        return int(binascii.hexlify(data) or '0', 16)
+else:
+    def _to_int(data):
+        return int.from_bytes(data, 'big')
+
+
+def _fold(total, nonzero):
+    """reduces a sum modulo 0xffff to its one's complement representation"""
+    total %= _MODULUS
+    # In one's complement arithmetic a non-zero sum is never 0 (it's 0xffff, "negative zero")
+    if total == 0 and nonzero:
+        return _MODULUS
+    return total
+
+
+def ones_complement_sum(*chunks):
+    """
+    Computes the 16 bit one's complement sum of the concatenation of :code:`chunks`, as if
+    they were a single buffer padded to an even length with a zero byte.
+
+    :param chunks: bytes-like objects (:code:`bytes`, :code:`bytearray`, :code:`memoryview`, ...)
+    :return: the (uncomplemented) 16 bit sum
+    :rtype: int
+    """
+    total = 0
+    end = 0
+    nonzero = False
+    for chunk in chunks:
+        value = _to_int(chunk)
+        end += len(chunk)
+        if end & 1:
+            # A chunk ending on an odd offset is misaligned with the 16 bit words by one byte
+            value <<= 8
+        total += value
+        nonzero = nonzero or value != 0
+    return _fold(total, nonzero)
+
+
+def internet_checksum(*chunks):
+    """
+    Computes the RFC 1071 internet checksum of the concatenation of :code:`chunks`.
+
+    :param chunks: bytes-like objects
+    :return: the 16 bit checksum
+    :rtype: int
+    """
+    return ~ones_complement_sum(*chunks) & 0xffff
+
+
+def checksum_many(buf, record_size, count=None):
+    """
+    Computes the internet checksum of every fixed size record in :code:`buf`.  NumPy is used
+    when available to sum all of the records at once.
+
+    :param buf: a bytes-like object holding the records back to back
+    :param int record_size: the size in bytes of every record
+    :param int count: the number of records (default as many as fit in :code:`buf`)
+    :return: the checksums, as a NumPy array when NumPy is available otherwise a list
+    """
+    if count is None:
+        count = len(buf) // record_size
+
+    if numpy is not None:
+        records = numpy.frombuffer(buf, dtype=numpy.uint8, count=count * record_size)
+        records = records.reshape(count, record_size)
+        total = records[:, 0::2].sum(axis=1, dtype=numpy.uint64) << numpy.uint64(8)
+        total += records[:, 1::2].sum(axis=1, dtype=numpy.uint64)
+        folded = total % numpy.uint64(_MODULUS)
+        folded[(folded == 0) & (total != 0)] = _MODULUS
+        return (~folded.astype(numpy.uint16)).astype(numpy.uint16)
+
+    view = memoryview(buf)
+    return [
+        internet_checksum(view[i * record_size:(i + 1) * record_size]) for i in range(count)
+    ]
+
+
+def update_checksum(checksum, old_data, new_data, offset=0):
+    """
+    Incrementally updates an internet checksum after part of the checksummed data changed
+    (RFC 1624, eqn. 3), without having to sum the rest of the data again.
+
+    :param int checksum: the current checksum
+    :param old_data: the bytes that were replaced
+    :param new_data: the bytes that replaced them (the same length as :code:`old_data`)
+    :param int offset: the byte offset of the change within the checksummed data.  Only its
+        parity matters (default 0).
+    :return: the updated checksum
+    :rtype: int
+    """
+    if len(old_data) != len(new_data):
+        raise ValueError("old_data and new_data must be the same length")
+
+    old_value, new_value = _to_int(old_data), _to_int(new_data)
+    # Align the changed bytes onto the 16 bit word boundaries of the whole buffer
+    shift = 8 * ((offset + len(old_data)) & 1)
+
+    # HC' = ~(~HC + ~m + m'), where ~m is the one's complement negation of the old words
+    total = (~checksum & 0xffff) + ((_MODULUS - (old_value << shift) % _MODULUS) % _MODULUS)
+    total += new_value << shift
+    return ~_fold(total, True) & 0xffff
+
+
+def update_checksum_dirty(checksum, pkt, offset=0, exclude=()):
+    """
+    Incrementally updates an internet checksum after fields of a packet tracking its changes
+    (see :code:`Packet.track_changes`) were modified, from only the modified byte ranges.
+
+    :param int checksum: the checksum before the modifications
+    :param pkt: the modified packet
+    :param int offset: the byte offset of the packet within the checksummed data (default 0)
+    :param exclude: the names of fields whose changes are left out of the checksum, i.e. the
+        checksum field itself
+    :return: the updated checksum
+    :rtype: int
+    """
+    layout = get_layout(type(pkt))
+    excluded = [layout[name] for name in exclude]
+    for start, old_data, new_data in pkt.dirty_changes():
+        end = start + len(old_data)
+        for field in excluded:
+            low, high = max(start, field.offset), min(end, field.offset + field.size)
+            if low < high:
+                new_data = new_data[:low - start] + old_data[low - start:high - start] + \
+                    new_data[high - start:]
+        checksum = update_checksum(checksum, old_data, new_data, offset + start)
+    return checksum
+
+
+def update_checksum_word(checksum, old_word, new_word):
+    """
+    Incrementally updates an internet checksum after a single, word aligned, 16 bit value
+    changed (i.e. a port number).
+
+    :param int checksum: the current checksum
+    :param int old_word: the previous 16 bit value
+    :param int new_word: the new 16 bit value
+    :return: the updated checksum
+    :rtype: int
+    """
+    total = (~checksum & 0xffff) + (~old_word & 0xffff) + new_word
+    return ~_fold(total, True) & 0xffff
+
+
+def _is_text(addr):
+    if PY2:  # pragma: no cover
+        # bytes are str on python 2, raw addresses being the only ones of 4 or 16 characters
+        return isinstance(addr, unicode) or (isinstance(addr, str) and len(addr) not in (4, 16))
+    return isinstance(addr, str)
+
+
+def _address(addr, family):
+    if _is_text(addr):
+        return socket.inet_pton(family, str(addr))
+    return bytes(addr)
+
+
+def ipv4_pseudo_header(src_addr, dst_addr, protocol, length):
+    """
+    Creates the IPv4 pseudo header included in the TCP and UDP checksums.
+
+    :param src_addr: the source address as a dotted string or 4 bytes
+    :param dst_addr: the destination address as a dotted string or 4 bytes
+    :param int protocol: the IP protocol number (i.e. :code:`IPPROTO_UDP`)
+    :param int length: the length of the TCP/UDP header and payload
+    :rtype: bytes
+    """
+    return _address(src_addr, socket.AF_INET) + _address(dst_addr, socket.AF_INET) + \
+        struct.pack('>BBH', 0, protocol, length)
+
+
+def ipv6_pseudo_header(src_addr, dst_addr, next_header, length):
+    """
+    Creates the IPv6 pseudo header included in the TCP and UDP checksums.
+
+    :param src_addr: the source address as a string or 16 bytes
+    :param dst_addr: the destination address as a string or 16 bytes
+    :param int next_header: the upper layer protocol number (i.e. :code:`IPPROTO_TCP`)
+    :param int length: the length of the TCP/UDP header and payload
+    :rtype: bytes
+    """
+    return _address(src_addr, socket.AF_INET6) + _address(dst_addr, socket.AF_INET6) + \
+        struct.pack('>I3xB', length, next_header)
+
+
+def _pseudo_header(src_addr, dst_addr, protocol, length):
+    if (_is_text(src_addr) and ':' in src_addr) or len(src_addr) == 16:
+        return ipv6_pseudo_header(src_addr, dst_addr, protocol, length)
+    return ipv4_pseudo_header(src_addr, dst_addr, protocol, length)
+
+
+def _header_without_checksum(header):
+    """returns the bytes of a header packet with its checksum field zeroed"""
+    raw = bytearray(header.to_bytes())
+    field = get_layout(header).resolve('checksum')
+    raw[field.offset:field.offset + field.size] = bytearray(field.size)
+    return raw
+
+
+def _transport_checksum(header, payload, src_addr, dst_addr, protocol):
+    raw = _header_without_checksum(header)
+    length = len(raw) + len(payload)
+    return internet_checksum(
+        _pseudo_header(src_addr, dst_addr, protocol, length), raw, payload
+    )
+
+
+def udp_checksum(header, payload, src_addr, dst_addr):
+    """
+    Computes the checksum of a UDP datagram over the pseudo header, the header and the payload.
+    The header's own :code:`checksum` field is ignored.  A computed checksum of 0 is returned as
+    :code:`0xffff`, as 0 means "no checksum" for UDP.
+
+    :param header: a :code:`UDP_HEADER` packet (in network byte order, i.e.
+        :code:`UDP_HEADER_BIG`)
+    :param payload: the bytes-like payload of the datagram
+    :param src_addr: the source IPv4/IPv6 address as a string or bytes
+    :param dst_addr: the destination IPv4/IPv6 address as a string or bytes
+    :rtype: int
+    """
+    checksum = _transport_checksum(header, payload, src_addr, dst_addr, IPPROTO_UDP)
+    return checksum or 0xffff
+
+
+def tcp_checksum(header, payload, src_addr, dst_addr):
+    """
+    Computes the checksum of a TCP segment over the pseudo header, the header and the payload.
+    The header's own :code:`checksum` field is ignored.
+
+    :param header: a :code:`TCP_HEADER_OPTIONS` packet, options included (in network byte order,
+        i.e. :code:`TCP_HEADER_OPTIONS_BIG`)
+    :param payload: the bytes-like payload of the segment
+    :param src_addr: the source IPv4/IPv6 address as a string or bytes
+    :param dst_addr: the destination IPv4/IPv6 address as a string or bytes
+    :rtype: int
+    """
+    return _transport_checksum(header, payload, src_addr, dst_addr, IPPROTO_TCP)
@@ -0,0 +1,296 @@
+"""
+Layered dissection of raw frames into the :code:`calpack.common.ip` headers.
+
+A :code:`Dissector` chains the headers of a frame together through precomputed dispatch tables
+(ethertype -> header class, IP protocol -> header class).  Walking from one layer to the next
+only peeks the dispatch (and header length) fields through the precomputed layouts of the
+header classes, so classifying a frame never creates a single :code:`Packet`.  A layer is only
+decoded when it's accessed on a :code:`Frame`, as a zero-copy view over the frame's bytes.
+
+Example::
+
+    dissector = Dissector()
+
+    for record in open_capture('trace.pcap'):
+        frame = dissector.dissect(record.data)
+        if 'udp' in frame and frame.udp.dest_port == 53:
+            handle_dns(frame.payload)
+"""
+from calpack.common import ip
+from calpack.models.layout import get_layout
+
+
+__all__ = [
+    'Dissector', 'Frame', 'ETHERTYPES', 'IP_PROTOCOLS', 'ETHERTYPE_IPV4', 'ETHERTYPE_ARP',
+    'ETHERTYPE_VLAN', 'ETHERTYPE_IPV6', 'IPPROTO_ICMP', 'IPPROTO_TCP', 'IPPROTO_UDP',
+    'IPPROTO_ICMPV6'
+]
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_ARP = 0x0806
+ETHERTYPE_VLAN = 0x8100
+ETHERTYPE_IPV6 = 0x86dd
+
+IPPROTO_ICMP = 1
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+IPPROTO_ICMPV6 = 58
+
+ETHERTYPES = {
+    ETHERTYPE_IPV4: ip.IPV4_HEADER_BIG,
+    ETHERTYPE_ARP: ip.ARP_HEADER_BIG,
+    ETHERTYPE_VLAN: ip.VLAN_HEADER_BIG,
+    ETHERTYPE_IPV6: ip.IPV6_HEADER_BIG,
+}
+
+IP_PROTOCOLS = {
+    IPPROTO_ICMP: ip.ICMP_HEADER_BIG,
+    IPPROTO_TCP: ip.TCP_HEADER_OPTIONS_BIG,
+    IPPROTO_UDP: ip.UDP_HEADER_BIG,
+    IPPROTO_ICMPV6: ip.ICMP_HEADER_BIG,
+}
+
+
+class _Layer(object):
+    """
+    The precomputed information needed to step over a layer and find the next one.
+    """
+    __slots__ = (
+        'packet_cls', 'name', 'size', 'next_field', 'table', 'dispatch', 'length_field',
+        'length_scale', 'stop_field'
+    )
+
+    def __init__(self, packet_cls, name, next_field, table, length_field, length_scale,
+                 stop_field):
+        layout = get_layout(packet_cls)
+        self.packet_cls = packet_cls
+        self.name = name
+        self.size = layout.size
+        self.next_field = layout[next_field] if next_field is not None else None
+        self.table = {} if table is None else table
+        self.dispatch = {}
+        self.length_field = layout[length_field] if length_field is not None else None
+        self.length_scale = length_scale
+        self.stop_field = layout[stop_field] if stop_field is not None else None
+
+    def header_len(self, data, offset):
+        """returns the length of this layer's header within data, including any options"""
+        if self.length_field is None:
+            return self.size
+        return self.length_field.unpack_from(data, offset) * self.length_scale
+
+    def next_layer(self, data, offset):
+        """returns the (layer, offset) following this layer, or None"""
+        if self.next_field is None:
+            return None
+        if self.stop_field is not None and self.stop_field.unpack_from(data, offset):
+            return None
+
+        layer = self.dispatch.get(self.next_field.unpack_from(data, offset))
+        if layer is None:
+            return None
+
+        header_len = self.header_len(data, offset)
+        if header_len < self.size:
+            return None
+        offset += header_len
+        if offset + layer.size > len(data):
+            return None
+        return layer, offset
+
+
+class Dissector(object):
+    """
+    Splits raw frames into their layers.  By default Ethernet frames are dissected through
+    VLAN tags into ARP, IPv4 and IPv6 and on into ICMP, TCP and UDP.  Further layers can be
+    added with :code:`register`.
+
+    :param root: the :code:`Packet` class of the outermost header (default
+        :code:`ETHERNET_HEADER_BIG`)
+    """
+    def __init__(self, root=ip.ETHERNET_HEADER_BIG):
+        self._layers = {}
+        self._names = {}
+
+        self.register(ip.ETHERNET_HEADER_BIG, 'ethernet', 'ethertype', ETHERTYPES)
+        self.register(ip.VLAN_HEADER_BIG, 'vlan', 'ethertype', ETHERTYPES)
+        self.register(ip.ARP_HEADER_BIG, 'arp')
+        self.register(ip.IPV4_HEADER_BIG, 'ipv4', 'protocol', IP_PROTOCOLS,
+                      length_field='ihl', length_scale=4, stop_field='fragment_offset')
+        self.register(ip.IPV6_HEADER_BIG, 'ipv6', 'next_header', IP_PROTOCOLS)
+        self.register(ip.ICMP_HEADER_BIG, 'icmp')
+        self.register(ip.TCP_HEADER_OPTIONS_BIG, 'tcp', length_field='data_offset',
+                      length_scale=4)
+        self.register(ip.UDP_HEADER_BIG, 'udp')
+
+        if root not in self._layers:
+            self.register(root, 'root')
+        self._root_cls = root
+
+    @property
+    def root(self):
+        """the layer of the outermost header"""
+        return self._layers[self._root_cls]
+
+    def register(self, packet_cls, name, next_field=None, table=None, length_field=None,
+                 length_scale=1, stop_field=None):
+        """
+        Adds (or replaces) a layer.
+
+        :param packet_cls: the :code:`Packet` class of the layer's header
+        :param str name: the name used to access the layer on a :code:`Frame`
+        :param str next_field: the field selecting the next layer (i.e. :code:`'ethertype'`)
+        :param dict table: maps values of :code:`next_field` to the :code:`Packet` class of the
+            next layer.  Classes need to be registered as well to be dissected.
+        :param str length_field: a field holding the length of the header, for headers with
+            options (default the length of :code:`packet_cls`)
+        :param int length_scale: the number of bytes per unit of :code:`length_field` (default 1)
+        :param str stop_field: a field that, when non-zero, means the next layer isn't present
+            (i.e. the IPv4 :code:`fragment_offset`)
+        :return: the layer
+        """
+        layer = _Layer(packet_cls, name, next_field, table, length_field, length_scale,
+                       stop_field)
+        self._layers[packet_cls] = layer
+        self._names[name] = layer
+
+        # Resolve the dispatch tables from values straight to layers once, up front
+        for each in self._layers.values():
+            each.dispatch = dict(
+                (value, self._layers[cls]) for value, cls in each.table.items()
+                if cls in self._layers
+            )
+        return layer
+
+    def layer(self, key):
+        """returns the layer registered for a name or :code:`Packet` class, or None"""
+        if isinstance(key, str):
+            return self._names.get(key)
+        return self._layers.get(key)
+
+    def classify(self, data):
+        """
+        Returns the names of the layers of a frame, without decoding any of them.
+
+        :param data: a bytes-like object holding the frame
+        :rtype: tuple
+        """
+        layer = self.root
+        if layer.size > len(data):
+            return ()
+        names = [layer.name]
+        step = (layer, 0)
+        while True:
+            step = step[0].next_layer(data, step[1])
+            if step is None:
+                return tuple(names)
+            names.append(step[0].name)
+
+    def dissect(self, data):
+        """
+        Creates a lazily decoded :code:`Frame` from raw bytes.
+
+        :param data: a bytes-like object holding the frame.  Layers of writable buffers (i.e.
+            the records of a :code:`calpack.common.pcap` reader) are zero-copy views; layers of
+            read-only buffers are decoded from a copy of their header.
+        :rtype: Frame
+        """
+        return Frame(self, data)
+
+
+class Frame(object):
+    """
+    A frame split into layers.  Layers are located and decoded only when accessed, either by
+    name (:code:`frame.udp`, :code:`frame['udp']`) or by :code:`Packet` class
+    (:code:`frame[UDP_HEADER_BIG]`).  Accessing a layer that isn't present returns
+    :code:`None`.
+
+    :param dissector: the :code:`Dissector` describing the layers
+    :param data: a bytes-like object holding the frame
+    """
+    __slots__ = ('data', '_dissector', '_steps', '_complete', '_packets')
+
+    def __init__(self, dissector, data):
+        self.data = data
+        self._dissector = dissector
+        self._steps = []
+        self._complete = False
+        self._packets = {}
+
+        root = dissector.root
+        if root.size <= len(data):
+            self._steps.append((root, 0))
+        else:
+            self._complete = True
+
+    def _find(self, layer):
+        """walks the frame until :code:`layer` is found and returns its offset, or None"""
+        for step_layer, offset in self._steps:
+            if step_layer is layer:
+                return offset
+
+        while not self._complete:
+            last_layer, last_offset = self._steps[-1]
+            step = last_layer.next_layer(self.data, last_offset)
+            if step is None:
+                self._complete = True
+                break
+            self._steps.append(step)
+            if step[0] is layer:
+                return step[1]
+        return None
+
+    def _walk(self):
+        self._find(None)
+        return self._steps
+
+    def __getitem__(self, key):
+        layer = self._dissector.layer(key)
+        if layer is None:
+            return None
+
+        pkt = self._packets.get(layer)
+        if pkt is not None:
+            return pkt
+
+        offset = self._find(layer)
+        if offset is None:
+            return None
+
+        packet_cls = layer.packet_cls
+        try:
+            pkt = packet_cls.from_buffer(self.data, offset)
+        except TypeError:
+            pkt = packet_cls.from_bytes(memoryview(self.data)[offset:])
+        self._packets[layer] = pkt
+        return pkt
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def __contains__(self, key):
+        layer = self._dissector.layer(key)
+        return layer is not None and self._find(layer) is not None
+
+    @property
+    def layers(self):
+        """the names of all of the layers of the frame"""
+        return tuple(layer.name for layer, _ in self._walk())
+
+    def offset(self, key):
+        """returns the byte offset of a layer within the frame, or None if it isn't present"""
+        layer = self._dissector.layer(key)
+        return None if layer is None else self._find(layer)
+
+    @property
+    def payload(self):
+        """a zero-copy view of the bytes following the header of the innermost layer"""
+        layer, offset = self._walk()[-1] if self._steps else (None, 0)
+        if layer is not None:
+            offset += layer.header_len(self.data, offset)
+        return memoryview(self.data)[offset:]
+
+    def __repr__(self):
+        return "Frame({})".format(", ".join(self.layers))
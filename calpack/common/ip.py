@@ -1,5 +1,6 @@
 """
-A collection of common IP headers (i.e. TCP and UDP) created using the calpack.Packet class.
+A collection of common network headers (i.e. Ethernet, IPv4, IPv6, TCP and UDP) created using
+the calpack.Packet class.
 """
 
 from calpack import models
@@ -12,10 +13,19 @@ else:
     PacketBigEndian = models.PacketBigEndian
     PacketLittleEndian = models.PacketLittleEndian
 
-__all__ = ['UDP_HEADER', 'TCP_HEADER']
+__all__ = [
+    'UDP_HEADER', 'TCP_HEADER', 'TCP_HEADER_OPTIONS', 'ETHERNET_HEADER', 'VLAN_HEADER', 'IPV4_HEADER', 'IPV6_HEADER',
+    'ICMP_HEADER', 'ARP_HEADER'
+]
 
 if not PYPY:
-    __all__ += ['UDP_HEADER_BIG', 'UDP_HEADER_LITTLE', 'TCP_HEADER_BIG', 'TCP_HEADER_LITTLE']
+    __all__ += [
+        'UDP_HEADER_BIG', 'UDP_HEADER_LITTLE', 'TCP_HEADER_BIG', 'TCP_HEADER_LITTLE',
+        'TCP_HEADER_OPTIONS_BIG', 'TCP_HEADER_OPTIONS_LITTLE',
+        'ETHERNET_HEADER_BIG', 'ETHERNET_HEADER_LITTLE', 'VLAN_HEADER_BIG', 'VLAN_HEADER_LITTLE',
+        'IPV4_HEADER_BIG', 'IPV4_HEADER_LITTLE', 'IPV6_HEADER_BIG', 'IPV6_HEADER_LITTLE',
+        'ICMP_HEADER_BIG', 'ICMP_HEADER_LITTLE', 'ARP_HEADER_BIG', 'ARP_HEADER_LITTLE'
+    ]
 
 
 class UDP_HEADER(models.Packet):
@@ -83,3 +93,219 @@ class TCP_HEADER_LITTLE(TCP_HEADER, PacketLittleEndian):
     byte ordering.
     """
     pass
+
+
+def _tcp_options_present(pkt):
+    return pkt.data_offset > 5
+
+
+def _tcp_options_length(pkt):
+    return (pkt.data_offset - 5) * 4
+
+
+class TCP_HEADER_OPTIONS(TCP_HEADER):
+    """
+    TCP HEADER class including the urgent pointer and the options.  The options are present when
+    :code:`data_offset` is greater than 5 and are only decoded when first accessed.  Setting the
+    options doesn't update :code:`data_offset`, which needs to be set to
+    :code:`5 + len(options) // 4`.  This packet uses native byte ordering.
+    """
+    urgent_pointer = models.IntField16()
+    options = models.OptionalField(
+        models.BytesField(length=_tcp_options_length), present=_tcp_options_present
+    )
+
+
+class TCP_HEADER_OPTIONS_BIG(TCP_HEADER_OPTIONS, PacketBigEndian):
+    """
+    TCP HEADER class including the urgent pointer and the options.  This packet uses big endian
+    byte ordering.
+    """
+    pass
+
+
+class TCP_HEADER_OPTIONS_LITTLE(TCP_HEADER_OPTIONS, PacketLittleEndian):
+    """
+    TCP HEADER class including the urgent pointer and the options.  This packet uses little
+    endian byte ordering.
+    """
+    pass
+
+
+class ETHERNET_HEADER(models.Packet):
+    """
+    ETHERNET HEADER class.  A simple packet class representing the Ethernet II Header.  This
+    packet uses native byte ordering.
+    """
+    dest_mac = models.ArrayField(models.IntField8(), 6)
+    source_mac = models.ArrayField(models.IntField8(), 6)
+    ethertype = models.IntField16()
+
+
+class ETHERNET_HEADER_BIG(ETHERNET_HEADER, PacketBigEndian):
+    """
+    ETHERNET HEADER class.  A simple packet class representing the Ethernet II Header.  This
+    packet uses big endian byte ordering.
+    """
+    pass
+
+
+class ETHERNET_HEADER_LITTLE(ETHERNET_HEADER, PacketLittleEndian):
+    """
+    ETHERNET HEADER class.  A simple packet class representing the Ethernet II Header.  This
+    packet uses little endian byte ordering.
+    """
+    pass
+
+
+class VLAN_HEADER(models.Packet):
+    """
+    VLAN HEADER class.  A simple packet class representing the part of an 802.1Q tag following
+    the Ethernet Header.  This packet uses native byte ordering.
+    """
+    priority = models.IntField16(bit_len=3)
+    drop_eligible = models.IntField16(bit_len=1)
+    vlan_id = models.IntField16(bit_len=12)
+    ethertype = models.IntField16()
+
+
+class VLAN_HEADER_BIG(VLAN_HEADER, PacketBigEndian):
+    """
+    VLAN HEADER class.  A simple packet class representing the part of an 802.1Q tag following
+    the Ethernet Header.  This packet uses big endian byte ordering.
+    """
+    pass
+
+
+class VLAN_HEADER_LITTLE(VLAN_HEADER, PacketLittleEndian):
+    """
+    VLAN HEADER class.  A simple packet class representing the part of an 802.1Q tag following
+    the Ethernet Header.  This packet uses little endian byte ordering.
+    """
+    pass
+
+
+class IPV4_HEADER(models.Packet):
+    """
+    IPV4 HEADER class.  A simple packet class representing the IPv4 Header, without options.
+    This packet uses native byte ordering.
+    """
+    version = models.IntField8(bit_len=4)
+    ihl = models.IntField8(bit_len=4)
+    dscp = models.IntField8(bit_len=6)
+    ecn = models.IntField8(bit_len=2)
+    total_length = models.IntField16()
+    identification = models.IntField16()
+    flags = models.IntField16(bit_len=3)
+    fragment_offset = models.IntField16(bit_len=13)
+    ttl = models.IntField8()
+    protocol = models.IntField8()
+    checksum = models.IntField16()
+    source_addr = models.IntField32()
+    dest_addr = models.IntField32()
+
+
+class IPV4_HEADER_BIG(IPV4_HEADER, PacketBigEndian):
+    """
+    IPV4 HEADER class.  A simple packet class representing the IPv4 Header, without options.
+    This packet uses big endian byte ordering.
+    """
+    pass
+
+
+class IPV4_HEADER_LITTLE(IPV4_HEADER, PacketLittleEndian):
+    """
+    IPV4 HEADER class.  A simple packet class representing the IPv4 Header, without options.
+    This packet uses little endian byte ordering.
+    """
+    pass
+
+
+class IPV6_HEADER(models.Packet):
+    """
+    IPV6 HEADER class.  A simple packet class representing the fixed IPv6 Header.  This packet
+    uses native byte ordering.
+    """
+    version = models.IntField32(bit_len=4)
+    traffic_class = models.IntField32(bit_len=8)
+    flow_label = models.IntField32(bit_len=20)
+    payload_length = models.IntField16()
+    next_header = models.IntField8()
+    hop_limit = models.IntField8()
+    source_addr = models.ArrayField(models.IntField8(), 16)
+    dest_addr = models.ArrayField(models.IntField8(), 16)
+
+
+class IPV6_HEADER_BIG(IPV6_HEADER, PacketBigEndian):
+    """
+    IPV6 HEADER class.  A simple packet class representing the fixed IPv6 Header.  This packet
+    uses big endian byte ordering.
+    """
+    pass
+
+
+class IPV6_HEADER_LITTLE(IPV6_HEADER, PacketLittleEndian):
+    """
+    IPV6 HEADER class.  A simple packet class representing the fixed IPv6 Header.  This packet
+    uses little endian byte ordering.
+    """
+    pass
+
+
+class ICMP_HEADER(models.Packet):
+    """
+    ICMP HEADER class.  A simple packet class representing the ICMP (and ICMPv6) Header.  This
+    packet uses native byte ordering.
+    """
+    icmp_type = models.IntField8()
+    code = models.IntField8()
+    checksum = models.IntField16()
+    rest_of_header = models.IntField32()
+
+
+class ICMP_HEADER_BIG(ICMP_HEADER, PacketBigEndian):
+    """
+    ICMP HEADER class.  A simple packet class representing the ICMP (and ICMPv6) Header.  This
+    packet uses big endian byte ordering.
+    """
+    pass
+
+
+class ICMP_HEADER_LITTLE(ICMP_HEADER, PacketLittleEndian):
+    """
+    ICMP HEADER class.  A simple packet class representing the ICMP (and ICMPv6) Header.  This
+    packet uses little endian byte ordering.
+    """
+    pass
+
+
+class ARP_HEADER(models.Packet):
+    """
+    ARP HEADER class.  A simple packet class representing an ARP packet for IPv4 over Ethernet.
+    This packet uses native byte ordering.
+    """
+    hardware_type = models.IntField16()
+    protocol_type = models.IntField16()
+    hardware_len = models.IntField8()
+    protocol_len = models.IntField8()
+    operation = models.IntField16()
+    sender_hw_addr = models.ArrayField(models.IntField8(), 6)
+    sender_proto_addr = models.IntField32()
+    target_hw_addr = models.ArrayField(models.IntField8(), 6)
+    target_proto_addr = models.IntField32()
+
+
+class ARP_HEADER_BIG(ARP_HEADER, PacketBigEndian):
+    """
+    ARP HEADER class.  A simple packet class representing an ARP packet for IPv4 over Ethernet.
+    This packet uses big endian byte ordering.
+    """
+    pass
+
+
+class ARP_HEADER_LITTLE(ARP_HEADER, PacketLittleEndian):
+    """
+    ARP HEADER class.  A simple packet class representing an ARP packet for IPv4 over Ethernet.
+    This packet uses little endian byte ordering.
+    """
+    pass
@@ -0,0 +1,762 @@
+"""
+Readers for pcap and pcapng capture files, and a buffered pcap writer.
+
+The capture file is memory mapped rather than read, so files larger than the available memory
+can be walked and every frame is handed out as a zero-copy :code:`memoryview` into the mapping.
+The record headers themselves are defined as :code:`calpack.Packet` classes and are walked using
+their precompiled :code:`struct` layout.  Frames can be decoded directly into the
+:code:`calpack.common.ip` headers with :code:`Packet.from_buffer`.
+
+Example::
+
+    with open_capture('trace.pcap') as capture:
+        for record in capture:
+            udp = UDP_HEADER_BIG.from_buffer(record.data, 34)
+
+.. note:: The mapping is copy-on-write, changing a decoded packet never modifies the file.
+"""
+
+import mmap
+import struct
+import threading
+import time
+from collections import namedtuple
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from calpack import models
+from calpack.models.layout import get_layout
+from calpack.utils import PY2, PYPY, CaptureFormatError
+
+if PYPY:
+    PacketBigEndian = models.Packet
+    PacketLittleEndian = models.Packet
+else:
+    PacketBigEndian = models.PacketBigEndian
+    PacketLittleEndian = models.PacketLittleEndian
+
+__all__ = [
+    'PCAP_GLOBAL_HEADER', 'PCAP_RECORD_HEADER', 'PCAPNG_BLOCK_HEADER', 'PCAPNG_SECTION_HEADER',
+    'PCAPNG_INTERFACE_DESCRIPTION', 'PCAPNG_ENHANCED_PACKET', 'PCAPNG_SIMPLE_PACKET',
+    'CaptureRecord', 'PcapReader', 'PcapNgReader', 'PcapWriter', 'open_capture',
+    'PCAP_MAGIC', 'PCAP_MAGIC_NS', 'PCAPNG_BYTE_ORDER_MAGIC', 'LINKTYPE_ETHERNET'
+]
+
+if not PYPY:
+    __all__ += [
+        'PCAP_GLOBAL_HEADER_BIG', 'PCAP_GLOBAL_HEADER_LITTLE', 'PCAP_RECORD_HEADER_BIG',
+        'PCAP_RECORD_HEADER_LITTLE', 'PCAPNG_BLOCK_HEADER_BIG', 'PCAPNG_BLOCK_HEADER_LITTLE',
+        'PCAPNG_SECTION_HEADER_BIG', 'PCAPNG_SECTION_HEADER_LITTLE',
+        'PCAPNG_INTERFACE_DESCRIPTION_BIG', 'PCAPNG_INTERFACE_DESCRIPTION_LITTLE',
+        'PCAPNG_ENHANCED_PACKET_BIG', 'PCAPNG_ENHANCED_PACKET_LITTLE',
+        'PCAPNG_SIMPLE_PACKET_BIG', 'PCAPNG_SIMPLE_PACKET_LITTLE'
+    ]
+
+
+PCAP_MAGIC = 0xa1b2c3d4
+PCAP_MAGIC_NS = 0xa1b23c4d
+PCAPNG_BYTE_ORDER_MAGIC = 0x1a2b3c4d
+
+PCAPNG_SECTION_HEADER_BLOCK = 0x0a0d0d0a
+PCAPNG_INTERFACE_DESCRIPTION_BLOCK = 0x00000001
+PCAPNG_SIMPLE_PACKET_BLOCK = 0x00000003
+PCAPNG_ENHANCED_PACKET_BLOCK = 0x00000006
+
+PCAPNG_OPT_ENDOFOPT = 0
+PCAPNG_OPT_IF_TSRESOL = 9
+
+LINKTYPE_ETHERNET = 1
+
+_NS_PER_SEC = 1000000000
+
+
+class PCAP_GLOBAL_HEADER(models.Packet):
+    """
+    PCAP GLOBAL HEADER class.  The header found at the start of every pcap file.  This packet
+    uses native byte ordering.
+    """
+    magic_number = models.IntField32()
+    version_major = models.IntField16()
+    version_minor = models.IntField16()
+    thiszone = models.IntField32(signed=True)
+    sigfigs = models.IntField32()
+    snaplen = models.IntField32()
+    network = models.IntField32()
+
+
+class PCAP_GLOBAL_HEADER_BIG(PCAP_GLOBAL_HEADER, PacketBigEndian):
+    """
+    PCAP GLOBAL HEADER class.  The header found at the start of every pcap file.  This packet
+    uses big endian byte ordering.
+    """
+    pass
+
+
+class PCAP_GLOBAL_HEADER_LITTLE(PCAP_GLOBAL_HEADER, PacketLittleEndian):
+    """
+    PCAP GLOBAL HEADER class.  The header found at the start of every pcap file.  This packet
+    uses little endian byte ordering.
+    """
+    pass
+
+
+class PCAP_RECORD_HEADER(models.Packet):
+    """
+    PCAP RECORD HEADER class.  The header preceding every frame of a pcap file.  :code:`ts_frac`
+    is in microseconds, or nanoseconds for files using :code:`PCAP_MAGIC_NS`.  This packet uses
+    native byte ordering.
+    """
+    ts_sec = models.IntField32()
+    ts_frac = models.IntField32()
+    incl_len = models.IntField32()
+    orig_len = models.IntField32()
+
+
+class PCAP_RECORD_HEADER_BIG(PCAP_RECORD_HEADER, PacketBigEndian):
+    """
+    PCAP RECORD HEADER class.  The header preceding every frame of a pcap file.  This packet uses
+    big endian byte ordering.
+    """
+    pass
+
+
+class PCAP_RECORD_HEADER_LITTLE(PCAP_RECORD_HEADER, PacketLittleEndian):
+    """
+    PCAP RECORD HEADER class.  The header preceding every frame of a pcap file.  This packet uses
+    little endian byte ordering.
+    """
+    pass
+
+
+class PCAPNG_BLOCK_HEADER(models.Packet):
+    """
+    PCAPNG BLOCK HEADER class.  The type and length common to every pcapng block.  This packet
+    uses native byte ordering.
+    """
+    block_type = models.IntField32()
+    block_total_length = models.IntField32()
+
+
+class PCAPNG_BLOCK_HEADER_BIG(PCAPNG_BLOCK_HEADER, PacketBigEndian):
+    """
+    PCAPNG BLOCK HEADER class.  The type and length common to every pcapng block.  This packet
+    uses big endian byte ordering.
+    """
+    pass
+
+
+class PCAPNG_BLOCK_HEADER_LITTLE(PCAPNG_BLOCK_HEADER, PacketLittleEndian):
+    """
+    PCAPNG BLOCK HEADER class.  The type and length common to every pcapng block.  This packet
+    uses little endian byte ordering.
+    """
+    pass
+
+
+class PCAPNG_SECTION_HEADER(PCAPNG_BLOCK_HEADER):
+    """
+    PCAPNG SECTION HEADER class.  The block starting every section of a pcapng file.  This packet
+    uses native byte ordering.
+    """
+    byte_order_magic = models.IntField32()
+    version_major = models.IntField16()
+    version_minor = models.IntField16()
+    section_length = models.IntField64(signed=True)
+
+
+class PCAPNG_SECTION_HEADER_BIG(PCAPNG_SECTION_HEADER, PacketBigEndian):
+    """
+    PCAPNG SECTION HEADER class.  The block starting every section of a pcapng file.  This packet
+    uses big endian byte ordering.
+    """
+    pass
+
+
+class PCAPNG_SECTION_HEADER_LITTLE(PCAPNG_SECTION_HEADER, PacketLittleEndian):
+    """
+    PCAPNG SECTION HEADER class.  The block starting every section of a pcapng file.  This packet
+    uses little endian byte ordering.
+    """
+    pass
+
+
+class PCAPNG_INTERFACE_DESCRIPTION(PCAPNG_BLOCK_HEADER):
+    """
+    PCAPNG INTERFACE DESCRIPTION class.  The fixed part of the block describing a capture
+    interface.  This packet uses native byte ordering.
+    """
+    linktype = models.IntField16()
+    reserved = models.IntField16()
+    snaplen = models.IntField32()
+
+
+class PCAPNG_INTERFACE_DESCRIPTION_BIG(PCAPNG_INTERFACE_DESCRIPTION, PacketBigEndian):
+    """
+    PCAPNG INTERFACE DESCRIPTION class.  The fixed part of the block describing a capture
+    interface.  This packet uses big endian byte ordering.
+    """
+    pass
+
+
+class PCAPNG_INTERFACE_DESCRIPTION_LITTLE(PCAPNG_INTERFACE_DESCRIPTION, PacketLittleEndian):
+    """
+    PCAPNG INTERFACE DESCRIPTION class.  The fixed part of the block describing a capture
+    interface.  This packet uses little endian byte ordering.
+    """
+    pass
+
+
+class PCAPNG_ENHANCED_PACKET(PCAPNG_BLOCK_HEADER):
+    """
+    PCAPNG ENHANCED PACKET class.  The fixed part of the block holding a captured frame.  This
+    packet uses native byte ordering.
+    """
+    interface_id = models.IntField32()
+    ts_high = models.IntField32()
+    ts_low = models.IntField32()
+    captured_len = models.IntField32()
+    orig_len = models.IntField32()
+
+
+class PCAPNG_ENHANCED_PACKET_BIG(PCAPNG_ENHANCED_PACKET, PacketBigEndian):
+    """
+    PCAPNG ENHANCED PACKET class.  The fixed part of the block holding a captured frame.  This
+    packet uses big endian byte ordering.
+    """
+    pass
+
+
+class PCAPNG_ENHANCED_PACKET_LITTLE(PCAPNG_ENHANCED_PACKET, PacketLittleEndian):
+    """
+    PCAPNG ENHANCED PACKET class.  The fixed part of the block holding a captured frame.  This
+    packet uses little endian byte ordering.
+    """
+    pass
+
+
+class PCAPNG_SIMPLE_PACKET(PCAPNG_BLOCK_HEADER):
+    """
+    PCAPNG SIMPLE PACKET class.  The fixed part of the block holding a captured frame without
+    timestamp.  This packet uses native byte ordering.
+    """
+    orig_len = models.IntField32()
+
+
+class PCAPNG_SIMPLE_PACKET_BIG(PCAPNG_SIMPLE_PACKET, PacketBigEndian):
+    """
+    PCAPNG SIMPLE PACKET class.  The fixed part of the block holding a captured frame without
+    timestamp.  This packet uses big endian byte ordering.
+    """
+    pass
+
+
+class PCAPNG_SIMPLE_PACKET_LITTLE(PCAPNG_SIMPLE_PACKET, PacketLittleEndian):
+    """
+    PCAPNG SIMPLE PACKET class.  The fixed part of the block holding a captured frame without
+    timestamp.  This packet uses little endian byte ordering.
+    """
+    pass
+
+
+class CaptureRecord(namedtuple('CaptureRecord', ['timestamp', 'data', 'orig_len', 'linktype'])):
+    """
+    A single captured frame.
+
+    :ivar int timestamp: the capture time in nanoseconds since the epoch (0 when not recorded)
+    :ivar memoryview data: a zero-copy view of the captured bytes of the frame
+    :ivar int orig_len: the length of the frame on the wire
+    :ivar int linktype: the link layer type of the frame (i.e. :code:`LINKTYPE_ETHERNET`)
+    """
+    __slots__ = ()
+
+
+class _MappedCapture(object):
+    """
+    The common parts of the capture readers: memory mapping the file and closing it.
+
+    :param str path: the path to the capture file
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_COPY)
+        except ValueError:
+            self._file.close()
+            raise CaptureFormatError("{} is empty".format(path))
+        if hasattr(self._map, 'madvise'):
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+        if PY2:  # pragma: no cover
+            # python 2's mmap doesn't support memoryview, so the capture is read into memory and
+            #   the records are copies
+            self._view = bytearray(self._map[:])
+        else:
+            self._view = memoryview(self._map)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Closes the capture file.  Records (or packets decoded from them) that are still referenced
+        keep the mapping alive until they are released.
+        """
+        if self._view is None:
+            return
+        if not PY2:
+            self._view.release()
+        self._view = None
+        try:
+            self._map.close()
+        except BufferError:
+            # Views handed out are still alive, the mapping is released along with them.
+            pass
+        self._file.close()
+
+    def headers(self, packet_cls, offset=0):
+        """
+        Iterates over the capture, decoding :code:`packet_cls` at :code:`offset` within every
+        frame.  The packets are zero-copy views into the capture.  Frames too short to contain the
+        packet are skipped.
+
+        :param packet_cls: the :code:`calpack.models.Packet` class to decode
+        :param int offset: the byte offset of the packet within each frame (default 0)
+        """
+        needed = offset + len(packet_cls())
+        for record in self:
+            if len(record.data) >= needed:
+                yield packet_cls.from_buffer(record.data, offset)
+
+
+class PcapReader(_MappedCapture):
+    """
+    A memory mapped reader of classic pcap files.  Iterating over the reader yields a
+    :code:`CaptureRecord` for every frame.  A truncated final record ends the iteration.
+
+    :param str path: the path to the pcap file
+    :raises CaptureFormatError: if the file isn't a pcap file
+
+    :ivar header: the :code:`PCAP_GLOBAL_HEADER` of the file
+    :ivar int linktype: the link layer type of every frame
+    :ivar int snaplen: the maximum number of bytes captured per frame
+    :ivar bool nanosecond: whether the file records nanosecond timestamps
+    """
+    def __init__(self, path):
+        super(PcapReader, self).__init__(path)
+
+        if len(self._map) < len(PCAP_GLOBAL_HEADER()):
+            self.close()
+            raise CaptureFormatError("{} is too short to be a pcap file".format(path))
+
+        magic = struct.unpack_from('<I', self._map, 0)[0]
+        if magic in (PCAP_MAGIC, PCAP_MAGIC_NS):
+            header_cls, record_cls = PCAP_GLOBAL_HEADER_LITTLE, PCAP_RECORD_HEADER_LITTLE
+        else:
+            header_cls, record_cls = PCAP_GLOBAL_HEADER_BIG, PCAP_RECORD_HEADER_BIG
+
+        self.header = header_cls.from_bytes(self._map[:len(header_cls())])
+        if self.header.magic_number not in (PCAP_MAGIC, PCAP_MAGIC_NS):
+            self.close()
+            raise CaptureFormatError("{} is not a pcap file".format(path))
+
+        self.nanosecond = self.header.magic_number == PCAP_MAGIC_NS
+        self.linktype = self.header.network
+        self.snaplen = self.header.snaplen
+
+        self._data_start = len(self.header)
+        self._record_struct = get_layout(record_cls).struct
+
+    def __iter__(self):
+        view = self._view
+        end = len(view)
+        pos = self._data_start
+        unpack_from = self._record_struct.unpack_from
+        header_len = self._record_struct.size
+        frac_scale = 1 if self.nanosecond else 1000
+        linktype = self.linktype
+        ns_per_sec = _NS_PER_SEC
+        new_record = tuple.__new__
+
+        while pos + header_len <= end:
+            ts_sec, ts_frac, incl_len, orig_len = unpack_from(view, pos)
+            pos += header_len
+            if pos + incl_len > end:
+                break
+            # Skips the python level namedtuple __new__, this loop is the hot path of the reader
+            yield new_record(CaptureRecord, (
+                ts_sec * ns_per_sec + ts_frac * frac_scale, view[pos:pos + incl_len], orig_len,
+                linktype
+            ))
+            pos += incl_len
+
+
+class _Interface(object):
+    """The capture interface description needed to decode enhanced packet blocks"""
+    __slots__ = ('linktype', 'snaplen', 'ts_mul', 'ts_div')
+
+    def __init__(self, linktype, snaplen, tsresol=6):
+        self.linktype = linktype
+        self.snaplen = snaplen
+
+        # The most significant bit selects a power of 2 instead of a power of 10
+        if tsresol & 0x80:
+            units = 1 << (tsresol & 0x7f)
+        else:
+            units = 10 ** tsresol
+        if _NS_PER_SEC % units == 0:
+            self.ts_mul, self.ts_div = _NS_PER_SEC // units, 1
+        else:
+            self.ts_mul, self.ts_div = _NS_PER_SEC, units
+
+
+class PcapNgReader(_MappedCapture):
+    """
+    A memory mapped reader of pcapng files.  Iterating over the reader yields a
+    :code:`CaptureRecord` for every enhanced or simple packet block; all other blocks are skipped.
+    Files with multiple sections, of differing byte orders, are supported.
+
+    :param str path: the path to the pcapng file
+    :raises CaptureFormatError: if the file isn't a pcapng file or a block is malformed
+    """
+    def __init__(self, path):
+        super(PcapNgReader, self).__init__(path)
+        if len(self._map) < len(PCAPNG_SECTION_HEADER()) or \
+                struct.unpack_from('<I', self._map, 0)[0] != PCAPNG_SECTION_HEADER_BLOCK:
+            self.close()
+            raise CaptureFormatError("{} is not a pcapng file".format(path))
+
+    @staticmethod
+    def _section_structs(view, pos):
+        magic = struct.unpack_from('<I', view, pos + 8)[0]
+        if magic == PCAPNG_BYTE_ORDER_MAGIC:
+            classes = (PCAPNG_BLOCK_HEADER_LITTLE, PCAPNG_INTERFACE_DESCRIPTION_LITTLE,
+                       PCAPNG_ENHANCED_PACKET_LITTLE, PCAPNG_SIMPLE_PACKET_LITTLE)
+        elif struct.unpack_from('>I', view, pos + 8)[0] == PCAPNG_BYTE_ORDER_MAGIC:
+            classes = (PCAPNG_BLOCK_HEADER_BIG, PCAPNG_INTERFACE_DESCRIPTION_BIG,
+                       PCAPNG_ENHANCED_PACKET_BIG, PCAPNG_SIMPLE_PACKET_BIG)
+        else:
+            raise CaptureFormatError("invalid byte order magic at offset {}".format(pos))
+        return [get_layout(cls).struct for cls in classes]
+
+    @staticmethod
+    def _interface(view, pos, block_len, idb_struct):
+        _, _, linktype, _, snaplen = idb_struct.unpack_from(view, pos)
+        byte_order = idb_struct.format[0]
+        if not isinstance(byte_order, str):
+            byte_order = chr(byte_order)
+        option = struct.Struct(byte_order + 'HH')
+
+        tsresol = 6
+        opt_pos = pos + idb_struct.size
+        opt_end = pos + block_len - 4
+        while opt_pos + option.size <= opt_end:
+            code, length = option.unpack_from(view, opt_pos)
+            opt_pos += option.size
+            if code == PCAPNG_OPT_ENDOFOPT:
+                break
+            if code == PCAPNG_OPT_IF_TSRESOL and length >= 1:
+                tsresol = view[opt_pos]
+            opt_pos += (length + 3) & ~3
+        return _Interface(linktype, snaplen, tsresol)
+
+    def __iter__(self):
+        view = self._view
+        end = len(view)
+        pos = 0
+        interfaces = []
+        block_struct = idb_struct = epb_struct = spb_struct = None
+
+        while pos + 8 <= end:
+            if struct.unpack_from('<I', view, pos)[0] == PCAPNG_SECTION_HEADER_BLOCK:
+                block_struct, idb_struct, epb_struct, spb_struct = self._section_structs(view, pos)
+                interfaces = []
+            elif block_struct is None:
+                raise CaptureFormatError("block found before the section header")
+
+            block_type, block_len = block_struct.unpack_from(view, pos)
+            if block_len < 12 or block_len & 3:
+                raise CaptureFormatError("invalid block length at offset {}".format(pos))
+            if pos + block_len > end:
+                break
+
+            if block_type == PCAPNG_ENHANCED_PACKET_BLOCK:
+                _, _, iid, ts_high, ts_low, cap_len, orig_len = epb_struct.unpack_from(view, pos)
+                if iid >= len(interfaces):
+                    raise CaptureFormatError("unknown interface at offset {}".format(pos))
+                if cap_len > block_len - epb_struct.size - 4:
+                    raise CaptureFormatError(
+                        "captured length exceeds the block at offset {}".format(pos)
+                    )
+                iface = interfaces[iid]
+                data_start = pos + epb_struct.size
+                yield CaptureRecord(
+                    (((ts_high << 32) | ts_low) * iface.ts_mul) // iface.ts_div,
+                    view[data_start:data_start + cap_len], orig_len, iface.linktype
+                )
+            elif block_type == PCAPNG_SIMPLE_PACKET_BLOCK:
+                _, _, orig_len = spb_struct.unpack_from(view, pos)
+                if not interfaces:
+                    raise CaptureFormatError("unknown interface at offset {}".format(pos))
+                iface = interfaces[0]
+                data_start = pos + spb_struct.size
+                cap_len = min(orig_len, block_len - spb_struct.size - 4)
+                if iface.snaplen:
+                    cap_len = min(cap_len, iface.snaplen)
+                yield CaptureRecord(0, view[data_start:data_start + cap_len], orig_len,
+                                    iface.linktype)
+            elif block_type == PCAPNG_INTERFACE_DESCRIPTION_BLOCK:
+                interfaces.append(self._interface(view, pos, block_len, idb_struct))
+
+            pos += block_len
+
+
+def open_capture(path):
+    """
+    Opens a capture file, choosing :code:`PcapReader` or :code:`PcapNgReader` based on the
+    file's magic number.
+
+    :param str path: the path to the capture file
+    :raises CaptureFormatError: if the file is neither a pcap nor a pcapng file
+    """
+    with open(path, 'rb') as capture:
+        magic = capture.read(4)
+    if len(magic) == 4 and struct.unpack('<I', magic)[0] == PCAPNG_SECTION_HEADER_BLOCK:
+        return PcapNgReader(path)
+    return PcapReader(path)
+
+
+class _BackgroundWriter(threading.Thread):
+    """
+    A daemon thread writing filled buffers to a file so the producer never waits on disk I/O.
+    Written buffers are handed back through :code:`free` to be reused.
+    """
+    def __init__(self, file_obj, max_pending, buffer_size):
+        super(_BackgroundWriter, self).__init__(name='calpack-pcap-writer')
+        self.daemon = True
+        self.file_obj = file_obj
+        self.buffer_size = buffer_size
+        self.pending = queue.Queue(max_pending)
+        self.free = queue.Queue()
+        self.error = None
+
+    def run(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            buf, size = item
+            if self.error is None:
+                try:
+                    self.file_obj.write(memoryview(buf)[:size])
+                except Exception as err:  # pylint: disable=broad-except
+                    self.error = err
+            if len(buf) == self.buffer_size:
+                self.free.put(buf)
+
+
+class PcapWriter(object):
+    """
+    A buffered writer of classic pcap files.  Record headers are packed with the precompiled
+    :code:`struct` of :code:`PCAP_RECORD_HEADER` straight into a large write buffer, and the
+    buffer is only written out once full.  With :code:`background=True` full buffers are written
+    by a separate thread, so the producer never blocks on disk I/O (unless :code:`max_pending`
+    buffers are already waiting).
+
+    Example::
+
+        with PcapWriter('out.pcap', background=True) as capture:
+            capture.write(frame, timestamp=time_ns)
+
+    :param str path: the path of the pcap file to create
+    :param int linktype: the link layer type of the frames (default :code:`LINKTYPE_ETHERNET`)
+    :param int snaplen: the maximum number of bytes to store per frame (default 65535)
+    :param bool nanosecond: whether to store nanosecond timestamps (default False)
+    :param str byte_order: :code:`'<'` or :code:`'>'` (default :code:`'<'`)
+    :param int buffer_size: the size in bytes of each write buffer (default 4 MiB)
+    :param bool background: whether to write the buffers from a background thread (default False)
+    :param int max_pending: the maximum number of full buffers waiting for the background thread
+        (default 4)
+    """
+    def __init__(self, path, linktype=LINKTYPE_ETHERNET, snaplen=65535, nanosecond=False,
+                 byte_order='<', buffer_size=4 * 1024 * 1024, background=False, max_pending=4):
+        if byte_order == '>':
+            header_cls, record_cls = PCAP_GLOBAL_HEADER_BIG, PCAP_RECORD_HEADER_BIG
+        elif byte_order == '<':
+            header_cls, record_cls = PCAP_GLOBAL_HEADER_LITTLE, PCAP_RECORD_HEADER_LITTLE
+        else:
+            raise ValueError("byte_order must be '<' or '>'")
+
+        self.path = path
+        self.linktype = linktype
+        self.snaplen = snaplen
+        self.nanosecond = nanosecond
+        self.buffer_size = buffer_size
+
+        self._record_struct = get_layout(record_cls).struct
+        self._pack_header = self._record_struct.pack_into
+        self._header_len = self._record_struct.size
+        self._frac_div = 1 if nanosecond else 1000
+        self._buf = bytearray(buffer_size)
+        self._pos = 0
+        self._file = open(path, 'wb')
+
+        self._writer = None
+        if background:
+            self._writer = _BackgroundWriter(self._file, max_pending, buffer_size)
+            self._writer.start()
+
+        header = header_cls(
+            magic_number=PCAP_MAGIC_NS if nanosecond else PCAP_MAGIC,
+            version_major=2,
+            version_minor=4,
+            snaplen=snaplen,
+            network=linktype
+        )
+        self._pos = header.pack_into(self._buf)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, data, timestamp=None, orig_len=None):
+        """
+        Adds a frame to the capture.
+
+        :param data: a :code:`calpack.models.Packet`, or a bytes-like object (i.e. :code:`bytes`,
+            :code:`bytearray` or a byte :code:`memoryview`) holding the frame
+        :param int timestamp: the capture time in nanoseconds since the epoch (default now)
+        :param int orig_len: the length of the frame on the wire (default the length of
+            :code:`data`)
+        """
+        if self._file is None:
+            raise ValueError("write to a closed PcapWriter")
+        if timestamp is None:
+            timestamp = int(time.time() * _NS_PER_SEC)
+
+        is_pkt = isinstance(data, models.Packet)
+        length = len(data)
+        if orig_len is None:
+            orig_len = length
+        incl_len = length if length <= self.snaplen else self.snaplen
+
+        pos = self._pos + self._header_len
+        end = pos + incl_len
+        if end > self.buffer_size:
+            self.flush()
+            if self._header_len + incl_len > self.buffer_size:
+                self._write_large(data, timestamp, incl_len, orig_len, is_pkt)
+                return
+            pos, end = self._header_len, self._header_len + incl_len
+
+        ts_sec, ts_ns = divmod(timestamp, _NS_PER_SEC)
+        self._pack_header(self._buf, pos - self._header_len, ts_sec, ts_ns // self._frac_div,
+                          incl_len, orig_len)
+        if incl_len != length:
+            if is_pkt:
+                data = data.to_bytes()
+            self._buf[pos:end] = memoryview(data)[:incl_len]
+        elif is_pkt:
+            data.pack_into(self._buf, pos)
+        else:
+            self._buf[pos:end] = data
+        self._pos = end
+
+    def write_many(self, records):
+        """
+        Adds many frames to the capture.  This packs the records in a single loop and is
+        considerably faster than calling :code:`write` for every frame.
+
+        :param records: an iterable of :code:`(timestamp, data)` or
+            :code:`(timestamp, data, orig_len)` tuples.  :code:`CaptureRecord`'s have this layout,
+            so a capture can be replayed straight from a reader.
+        """
+        if self._file is None:
+            raise ValueError("write to a closed PcapWriter")
+
+        pack_header = self._pack_header
+        header_len = self._header_len
+        frac_div = self._frac_div
+        snaplen = self.snaplen
+        buffer_size = self.buffer_size
+        packet_cls = models.Packet
+        ns_per_sec = _NS_PER_SEC
+
+        buf, pos = self._buf, self._pos
+        for record in records:
+            data = record[1]
+            length = len(data)
+            start = pos + header_len
+            end = start + length
+            if length > snaplen or end > buffer_size:
+                # Truncated and buffer filling records go through the general path
+                self._pos = pos
+                self.write(data, record[0], record[2] if len(record) > 2 else None)
+                buf, pos = self._buf, self._pos
+                continue
+
+            ts_sec, ts_ns = divmod(record[0], ns_per_sec)
+            pack_header(buf, pos, ts_sec, ts_ns // frac_div, length,
+                        record[2] if len(record) > 2 else length)
+            if isinstance(data, packet_cls):
+                data.pack_into(buf, start)
+            else:
+                buf[start:end] = data
+            pos = end
+        self._pos = pos
+
+    def _write_large(self, data, timestamp, incl_len, orig_len, is_pkt):
+        """writes a record that doesn't fit in a write buffer in its own buffer"""
+        buf = bytearray(self._record_struct.size + incl_len)
+        ts_sec, ts_ns = divmod(timestamp, _NS_PER_SEC)
+        self._record_struct.pack_into(buf, 0, ts_sec, ts_ns // self._frac_div, incl_len, orig_len)
+        if is_pkt:
+            data = data.to_bytes()
+        buf[self._record_struct.size:] = memoryview(data)[:incl_len]
+        self._submit(buf, len(buf))
+
+    def _submit(self, buf, size):
+        if self._writer is None:
+            self._file.write(memoryview(buf)[:size])
+            return
+        if self._writer.error is not None:
+            raise self._writer.error
+        self._writer.pending.put((buf, size))
+
+    def flush(self):
+        """
+        Hands the buffered records over to be written.  With a background writer the data may
+        not be on disk yet when this returns; use :code:`close` to wait for it.
+        """
+        if self._pos == 0:
+            return
+        buf, size = self._buf, self._pos
+        self._submit(buf, size)
+        if self._writer is not None:
+            try:
+                self._buf = self._writer.free.get_nowait()
+            except queue.Empty:
+                self._buf = bytearray(self.buffer_size)
+        self._pos = 0
+
+    def close(self):
+        """Writes out all of the buffered records and closes the file"""
+        if self._file is None:
+            return
+        try:
+            self.flush()
+        finally:
+            if self._writer is not None:
+                self._writer.pending.put(None)
+                self._writer.join()
+            self._file.close()
+            self._file = None
+        if self._writer is not None and self._writer.error is not None:
+            raise self._writer.error
@@ -0,0 +1,127 @@
+"""
+A bounded LRU cache of decoded packets, keyed by their raw bytes.
+
+Much of the traffic of some protocols is made of identical packets (heartbeats, keepalives,
+periodic status reports).  Once a packet class has its decode cache enabled (see
+:code:`Packet.enable_decode_cache`), :code:`from_bytes` looks the raw bytes up in the cache
+before decoding them, and identical bytes return the packet decoded the first time: either as a
+shared immutable (frozen) packet, which also caches the values of its fields, or as a cheap copy
+of it.
+
+Example::
+
+    HEARTBEAT.enable_decode_cache(max_entries=256)
+    pkt = HEARTBEAT.from_bytes(data)
+    HEARTBEAT.decode_cache().stats()
+"""
+import threading
+from collections import OrderedDict
+
+from calpack.utils import PY2
+
+
+__all__ = ['DecodeCache']
+
+
+if PY2:  # pragma: no cover
+    def _key(data):
+        # bytes() of a python 2 memoryview is its repr rather than its data
+        return data.tobytes() if isinstance(data, memoryview) else bytes(data)
+else:
+    _key = bytes
+
+
+class DecodeCache(object):
+    """
+    The decode cache of a packet class.  Use :code:`Packet.enable_decode_cache` rather than
+    creating these directly.
+
+    :param decode: the function decoding the bytes of a packet when they aren't cached, called
+        as :code:`decode(packet_cls, data)`
+    :param int max_entries: the maximum number of packets cached
+    :param int max_bytes: the maximum number of bytes of the cached packets and of their keys
+        (default no limit)
+    :param bool frozen: whether to return the shared frozen packets (True), or copies of them
+        that can be modified (False)
+
+    :ivar int hits: the number of packets found in the cache
+    :ivar int misses: the number of packets decoded and added to the cache
+    :ivar int evictions: the number of packets removed from the cache to make room for others
+    """
+    def __init__(self, decode, max_entries=1024, max_bytes=None, frozen=True):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.decode = decode
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.frozen = frozen
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, packet_cls, data):
+        """
+        Returns the packet decoded from :code:`data`, from the cache when possible.
+
+        :param packet_cls: the :code:`Packet` class to decode
+        :param data: a bytes-like object holding the packet
+        """
+        key = data if type(data) is bytes else _key(data)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                # moved to the most recently used end
+                self._entries[key] = entry
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if entry is None:
+            entry = self.decode(packet_cls, key)
+            if self.frozen:
+                entry = entry.frozen().cache_values()
+            self._add(key, entry)
+        return entry if self.frozen else entry.copy()
+
+    def _add(self, key, entry):
+        cost = len(key) + len(entry)
+        if self.max_bytes is not None and cost > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= len(key) + len(previous)
+            self._entries[key] = entry
+            self.nbytes += cost
+            while len(self._entries) > self.max_entries or (
+                    self.max_bytes is not None and self.nbytes > self.max_bytes):
+                old_key, old_entry = self._entries.popitem(last=False)
+                self.nbytes -= len(old_key) + len(old_entry)
+                self.evictions += 1
+
+    def clear(self):
+        """Removes every packet from the cache, the counters are kept"""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """
+        Returns the counters of the cache.
+
+        :return: a dict of the :code:`hits`, :code:`misses`, :code:`evictions`, the number of
+            cached packets (:code:`entries`) and their size (:code:`nbytes`)
+        """
+        return {
+            'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+            'entries': len(self._entries), 'nbytes': self.nbytes,
+        }
+
+    def __repr__(self):
+        return "DecodeCache(entries={e}, hits={h}, misses={m}, evictions={v})".format(
+            e=len(self._entries), h=self.hits, m=self.misses, v=self.evictions
+        )
@@ -18,6 +18,9 @@ class PacketField(Field):
     def __init__(self, packet_cls):
         super(PacketField, self).__init__()
 
+        if getattr(packet_cls, '_var_fields', ()):
+            raise TypeError("PacketField does not support Packets with variable length fields!")
+
         self.packet_cls = packet_cls
         self.packet = packet_cls()
         self.c_type = self.packet._Packet__c_struct
@@ -0,0 +1,474 @@
+"""
+Variable length fields.
+
+These fields aren't part of a packet's internal :code:`ctypes.Structure`.  They must follow every
+fixed size field of the packet, which keeps the fixed size prefix on the :code:`ctypes` path, and
+their bytes are located through the length of each field, given either by a length prefix stored
+just before the field's data or by a reference to another field.
+
+The location of every variable field is computed lazily per packet instance, the first time a
+variable field is read, and cached.  Reading the Nth variable field only measures the fields up to
+it, and reading it again doesn't measure anything.
+"""
+
+__all__ = [
+    'VarField', 'BytesField', 'VarArrayField', 'PayloadField', 'OptionalField'
+]
+
+import ctypes
+import struct
+
+from calpack.models.fields.Fields import Field
+from calpack.models.layout import classify_c_type
+from calpack.utils import PY2
+
+
+if PY2:  # pragma: no cover
+    def _bytes(data):
+        # bytes() of a python 2 memoryview is its repr rather than its data
+        return data.tobytes() if isinstance(data, memoryview) else bytes(data)
+else:
+    _bytes = bytes
+
+
+def _int_codec(field, byte_order):
+    """returns the struct.Struct encoding a length prefix field in byte_order"""
+    kind, _, fmt = classify_c_type(field.c_type)
+    if kind != 'int' or len(field.create_field_c_tuple()) == 3:
+        raise TypeError("A length prefix must be a byte aligned integer field!")
+    return struct.Struct(byte_order + fmt)
+
+
+class VarField(Field):
+    """
+    A Super class for variable length fields.  This class is NOT intended for direct use.
+
+    The size of the field is given by exactly one of :code:`length` or :code:`length_prefix`.
+    Subclasses convert the field's data by overriding :code:`empty`, :code:`decode`,
+    :code:`encode` and :code:`prepare`, whose defaults handle raw bytes.
+
+    :param length: the size of the field, either the name of another (preceding) field holding it
+        or a callable taking the packet and returning it.  When it's a field name, that field is
+        updated whenever this field is set.
+    :param length_prefix: an integer :code:`Field` object (i.e. :code:`IntField16()`) stored just
+        before the field's data and holding its size.
+    :param default_val: the default value of the field
+    """
+    var_index = None
+    allow_remainder = False
+    memoize = False
+
+    def __init__(self, length=None, length_prefix=None, default_val=None):
+        super(VarField, self).__init__(default_val)
+        if length is not None and length_prefix is not None:
+            raise TypeError("Only one of length or length_prefix may be given!")
+        self.is_remainder = length is None and length_prefix is None
+        if self.is_remainder and not self.allow_remainder:
+            raise TypeError("Exactly one of length or length_prefix must be given!")
+        self.length = length
+        self.length_prefix = length_prefix
+        self._prefix_codecs = {}
+        if length_prefix is not None:
+            _int_codec(length_prefix, '<')
+
+    def __get__(self, instance, cls):
+        if instance is None:
+            return self
+        return instance._get_var_field(self)
+
+    def __set__(self, instance, val):
+        instance._set_var_field(self, val)
+
+    def create_field_c_tuple(self):
+        raise TypeError("{} can't be part of a fixed size structure!".format(type(self).__name__))
+
+    def prefix_codec(self, byte_order):
+        codec = self._prefix_codecs.get(byte_order)
+        if codec is None:
+            codec = self._prefix_codecs[byte_order] = _int_codec(self.length_prefix, byte_order)
+        return codec
+
+    def size_of(self, pkt, tail, pos):
+        """
+        returns (start, size) of the field's data within :code:`tail`, the bytes following the
+        fixed size part of :code:`pkt`, when the field (including any prefix) starts at :code:`pos`
+        """
+        if self.is_remainder:
+            return pos, len(tail) - pos
+
+        if self.length_prefix is not None:
+            codec = self.prefix_codec(pkt._var_byte_order)
+            if pos + codec.size > len(tail):
+                raise ValueError("Buffer too small for the length of '{}'".format(self.field_name))
+            return pos + codec.size, codec.unpack_from(tail, pos)[0]
+
+        if callable(self.length):
+            return pos, self.length(pkt)
+        return pos, getattr(pkt, self.length)
+
+    def measure(self, pkt, tail, pos):
+        """
+        returns the (start, end) of the field's data within :code:`tail`
+
+        :raises ValueError: if the data extends past the end of :code:`tail`
+        """
+        start, size = self.size_of(pkt, tail, pos)
+        end = start + size
+        if size < 0 or end > len(tail):
+            raise ValueError("Buffer too small to hold '{}'".format(self.field_name))
+        return start, end
+
+    def length_of(self, val, data):
+        """returns the length of a value as stored in the prefix or the referenced field"""
+        return len(data)
+
+    def update_length(self, pkt, val):
+        """updates the field referenced by :code:`length` after a new value was set"""
+        if self.length is not None and not callable(self.length):
+            setattr(pkt, self.length, self.length_of(val, self.encode(pkt, val)))
+
+    def to_bytes(self, pkt, val):
+        """returns the field's bytes, including any length prefix"""
+        data = self.encode(pkt, val)
+        if self.length_prefix is None:
+            return data
+        return self.prefix_codec(pkt._var_byte_order).pack(self.length_of(val, data)) + data
+
+    def empty(self):
+        """
+        returns the value of the field when it holds no data.  As a default the field holds raw
+        bytes, so this returns :code:`b''`.
+        """
+        return b''
+
+    def decode(self, pkt, data):
+        """
+        converts the field's data into a python value.  As a default the data is returned as
+        :code:`bytes`.
+        """
+        return _bytes(data)
+
+    def encode(self, pkt, val):
+        """
+        converts a python value into the field's data (without any prefix).  As a default
+        :code:`val` is returned as is.
+        """
+        return val
+
+    def prepare(self, pkt, val):
+        """
+        validates a value being set, updating any referenced length field.  As a default
+        :code:`val` is returned as is, after updating the length field.
+        """
+        self.update_length(pkt, val)
+        return val
+
+
+class BytesField(VarField):
+    """
+    A variable length field of raw bytes.
+
+    Example::
+
+        class Message(models.PacketBigEndian):
+            msg_id = models.IntField16()
+            body_len = models.IntField16()
+            name = models.BytesField(length_prefix=models.IntField8())
+            body = models.BytesField(length='body_len')
+
+    :param length: the size in bytes of the field; the name of another field or a callable taking
+        the packet
+    :param length_prefix: an integer :code:`Field` object stored before the data holding its size
+        in bytes
+    :param bytes default_val: the default value of the field
+    """
+    def prepare(self, pkt, val):
+        if not isinstance(val, (bytes, bytearray, memoryview)):
+            raise TypeError("Must be a bytes-like object")
+        return super(BytesField, self).prepare(pkt, _bytes(val))
+
+
+class VarArrayField(VarField):
+    """
+    A variable length array of either fixed size fields or packets.  The packets may have
+    variable fields of their own (i.e. a list of TLVs).
+
+    The length of the array is given by exactly one of :code:`count` / :code:`count_prefix`
+    (the number of items) or :code:`length` / :code:`length_prefix` (the size in bytes).
+
+    Example::
+
+        class TLV(models.PacketBigEndian):
+            tag = models.IntField8()
+            length = models.IntField8()
+            value = models.BytesField(length='length')
+
+        class Message(models.PacketBigEndian):
+            msg_id = models.IntField16()
+            n_ids = models.IntField8()
+            ids = models.VarArrayField(models.IntField32(), count='n_ids')
+            options = models.VarArrayField(TLV, length_prefix=models.IntField16())
+
+    :param array_cls: a byte aligned :code:`calpack.models.Field` subclass **object** or a
+        :code:`calpack.models.Packet` subclass that the array will be filled with
+    :param count: the number of items; the name of another field or a callable taking the packet
+    :param count_prefix: an integer :code:`Field` object stored before the items holding their
+        number
+    :param length: the size in bytes of the items; the name of another field or a callable
+    :param length_prefix: an integer :code:`Field` object stored before the items holding their
+        size in bytes
+    :param default_val: the default value of the field
+    """
+    def __init__(self, array_cls, count=None, count_prefix=None, length=None,
+                 length_prefix=None, default_val=None):
+        self.counted = count is not None or count_prefix is not None
+        if self.counted:
+            if length is not None or length_prefix is not None:
+                raise TypeError("Only one of count, count_prefix, length or length_prefix may "
+                                "be given!")
+            length, length_prefix = count, count_prefix
+        super(VarArrayField, self).__init__(length, length_prefix, default_val)
+
+        self.array_cls = array_cls
+        self.is_packet = getattr(array_cls, '_IS_PKT_CLASS', False) and \
+            isinstance(array_cls, type)
+        self._item_codecs = {}
+        if not self.is_packet:
+            if len(array_cls.create_field_c_tuple()) == 3:
+                raise TypeError(
+                    "VarArrayField does not support Fields with non-byte aligned field tuples!"
+                )
+            kind, _, self.item_fmt = classify_c_type(array_cls.c_type)
+            if self.item_fmt is None:
+                raise TypeError("VarArrayField only supports scalar Fields and Packets!")
+            self.item_size = struct.calcsize(self.item_fmt)
+
+    def _packet_size(self, tail, pos):
+        item_cls = self.array_cls
+        if not item_cls._var_fields:
+            return ctypes.sizeof(item_cls._Packet__c_struct)
+        return len(item_cls.from_bytes(tail[pos:]))
+
+    def size_of(self, pkt, tail, pos):
+        start, size = super(VarArrayField, self).size_of(pkt, tail, pos)
+        if not self.counted:
+            return start, size
+        if not self.is_packet:
+            return start, size * self.item_size
+
+        end = start
+        for _ in range(size):
+            if end >= len(tail):
+                raise ValueError("Buffer too small to hold '{}'".format(self.field_name))
+            end += self._packet_size(tail, end)
+        return start, end - start
+
+    def _item_codec(self, byte_order, count):
+        key = (byte_order, count)
+        codec = self._item_codecs.get(key)
+        if codec is None:
+            codec = struct.Struct("{}{}{}".format(byte_order, count, self.item_fmt))
+            if len(self._item_codecs) < 64:
+                self._item_codecs[key] = codec
+        return codec
+
+    def empty(self):
+        return ()
+
+    def decode(self, pkt, data):
+        if not self.is_packet:
+            if len(data) % self.item_size:
+                raise ValueError("'{}' is not a whole number of items".format(self.field_name))
+            return self._item_codec(pkt._var_byte_order, len(data) // self.item_size).unpack(data)
+
+        item_cls = self.array_cls
+        items = []
+        pos = 0
+        while pos < len(data):
+            size = self._packet_size(data, pos)
+            items.append(item_cls.from_bytes(_bytes(data[pos:pos + size])))
+            pos += size
+        return tuple(items)
+
+    def encode(self, pkt, val):
+        if self.is_packet:
+            return b''.join(item.to_bytes() for item in val)
+        return self._item_codec(pkt._var_byte_order, len(val)).pack(*val)
+
+    def prepare(self, pkt, val):
+        if not isinstance(val, (tuple, list)):
+            raise TypeError("Must be of type tuple or list")
+        val = tuple(val)
+        if self.is_packet:
+            for item in val:
+                if not isinstance(item, self.array_cls):
+                    raise TypeError("Items must be of type {}".format(self.array_cls.__name__))
+        self.update_length(pkt, val)
+        return val
+
+    def length_of(self, val, data):
+        return len(val) if self.counted else len(data)
+
+
+class PayloadField(VarField):
+    """
+    The opaque payload following a packet's header, exposed as a :code:`memoryview`.  Packets
+    created with :code:`from_buffer` or :code:`from_bytes` don't copy the payload: it's a view
+    of the original buffer, so decoding an encapsulated packet from it (i.e. :code:`from_buffer`
+    of the payload of a UDP datagram) is a view on a view.
+
+    Any bytes-like object or :code:`Packet` can be set as the payload.  When the packet is
+    encoded, the header and payload are written straight into the same output buffer.
+
+    Example::
+
+        class UDP(models.PacketBigEndian):
+            source_port = models.IntField16()
+            dest_port = models.IntField16()
+            length = models.IntField16()
+            checksum = models.IntField16()
+            payload = models.PayloadField(length=lambda pkt: pkt.length - 8)
+
+        udp = UDP.from_buffer(frame, 34)
+        telemetry = Telemetry.from_buffer(udp.payload)
+
+    :param length: (Optional) the size in bytes of the payload; the name of another field or a
+        callable taking the packet.  By default the payload is every remaining byte, in which case
+        it must be the last field of the packet.
+    :param length_prefix: (Optional) an integer :code:`Field` object stored before the payload
+        holding its size in bytes
+    :param default_val: the default value of the field
+    """
+    allow_remainder = True
+
+    def empty(self):
+        return memoryview(b'')
+
+    def decode(self, pkt, data):
+        return data
+
+    def encode(self, pkt, val):
+        return val
+
+    def prepare(self, pkt, val):
+        if getattr(val, '_IS_PKT_CLASS', False):
+            val = val.to_bytes()
+        val = memoryview(val)
+        if val.ndim != 1 or val.itemsize != 1:
+            val = val.cast('B')
+        self.update_length(pkt, val)
+        return val
+
+
+class OptionalField(VarField):
+    """
+    A field that is only present in a packet when a condition on the packet's other fields holds
+    (i.e. TCP options when :code:`data_offset > 5`).  An absent field takes no bytes and reads as
+    :code:`None`.
+
+    The field is decoded the first time it's read and the value is memoized on the packet, so
+    packets where the field is absent or never read don't pay for decoding it.  Setting any fixed
+    size field of the packet forgets the memoized value.
+
+    Example::
+
+        class Header(models.PacketBigEndian):
+            has_ext = models.FlagField()
+            kind = models.IntField8(bit_len=7)
+            ext = models.OptionalField(models.IntField32(), present='has_ext')
+            options = models.OptionalField(
+                models.BytesField(length=lambda pkt: (pkt.kind - 1) * 4),
+                present=lambda pkt: pkt.kind > 1
+            )
+
+    :param field: the optional content.  Either a byte aligned :code:`Field` **object**, a
+        variable length field (i.e. :code:`BytesField(...)`) or a :code:`Packet` subclass.
+    :param present: the name of a field whose value is true when the field is present, or a
+        callable taking the packet and returning whether it is.  When it's a field name, that
+        field is updated whenever this field is set (to :code:`None` for absent).
+    :param default_val: the default value of the field
+    """
+    allow_remainder = True
+    memoize = True
+
+    def __init__(self, field, present, default_val=None):
+        super(OptionalField, self).__init__(default_val=default_val)
+        self.field = field
+        self.present = present
+
+        self.is_packet = getattr(field, '_IS_PKT_CLASS', False) and isinstance(field, type)
+        self.is_var = isinstance(field, VarField)
+        self.is_remainder = getattr(field, 'is_remainder', False)
+        if not self.is_packet and not self.is_var:
+            if len(field.create_field_c_tuple()) == 3:
+                raise TypeError(
+                    "OptionalField does not support Fields with non-byte aligned field tuples!"
+                )
+            kind, _, self.fmt = classify_c_type(field.c_type)
+            if self.fmt is None:
+                raise TypeError("OptionalField only supports scalar, variable and Packet fields!")
+            self._codecs = {}
+
+    def __setattr__(self, arg, value):
+        # the wrapped field shares this field's name for its own errors and lookups
+        super(OptionalField, self).__setattr__(arg, value)
+        if arg == 'field_name' and getattr(self, 'is_var', False):
+            self.field.field_name = value
+
+    def is_present(self, pkt):
+        if callable(self.present):
+            return bool(self.present(pkt))
+        return bool(getattr(pkt, self.present))
+
+    def _codec(self, byte_order):
+        codec = self._codecs.get(byte_order)
+        if codec is None:
+            codec = self._codecs[byte_order] = struct.Struct(byte_order + self.fmt)
+        return codec
+
+    def size_of(self, pkt, tail, pos):
+        if not self.is_present(pkt):
+            return pos, 0
+        if self.is_var:
+            return self.field.size_of(pkt, tail, pos)
+        if self.is_packet:
+            if not self.field._var_fields:
+                return pos, ctypes.sizeof(self.field._Packet__c_struct)
+            return pos, len(self.field.from_bytes(tail[pos:]))
+        return pos, self._codec(pkt._var_byte_order).size
+
+    def empty(self):
+        return None
+
+    def decode(self, pkt, data):
+        if not self.is_present(pkt):
+            return None
+        if self.is_var:
+            return self.field.decode(pkt, data)
+        if self.is_packet:
+            return self.field.from_bytes(_bytes(data))
+        return self._codec(pkt._var_byte_order).unpack(data)[0]
+
+    def to_bytes(self, pkt, val):
+        if val is None:
+            return b''
+        if self.is_var:
+            return self.field.to_bytes(pkt, val)
+        if self.is_packet:
+            return val.to_bytes()
+        return self._codec(pkt._var_byte_order).pack(val)
+
+    def prepare(self, pkt, val):
+        if val is not None:
+            if self.is_var:
+                val = self.field.prepare(pkt, val)
+            elif self.is_packet and not isinstance(val, self.field):
+                raise TypeError("Must be of type {}".format(self.field.__name__))
+            elif not self.is_packet:
+                try:
+                    self._codec(pkt._var_byte_order).pack(val)
+                except struct.error as err:
+                    raise TypeError(str(err))
+        if not callable(self.present):
+            setattr(pkt, self.present, val is not None)
+        return val
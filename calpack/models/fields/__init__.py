@@ -14,6 +14,7 @@ from calpack.models.fields.BooleanFields import *
 from calpack.models.fields.FloatFields import *
 from calpack.models.fields.IntFields import *
 from calpack.models.fields.PacketFields import *
+from calpack.models.fields.VarFields import *
 
 
 from calpack.models.fields.Fields import __all__ as fields_all
@@ -22,6 +23,7 @@ from calpack.models.fields.BooleanFields import __all__ as bool_all
 from calpack.models.fields.FloatFields import __all__ as float_all
 from calpack.models.fields.IntFields import __all__ as int_all
 from calpack.models.fields.PacketFields import __all__ as packet_all
+from calpack.models.fields.VarFields import __all__ as var_all
 
 
 __all__ = [
@@ -34,3 +36,4 @@ __all__ += bool_all
 __all__ += float_all
 __all__ += int_all
 __all__ += packet_all
+__all__ += var_all
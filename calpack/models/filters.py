@@ -0,0 +1,407 @@
+"""
+Filter expressions compiled against a :code:`Packet` class and evaluated directly on raw bytes.
+
+An expression is written in python syntax using the field names of the packet, i.e.
+:code:`"dest_port == 443 and flag_syn"`.  When the filter is compiled every field is resolved
+once, through the packet's :code:`PacketLayout`, into its offset, storage unit, bit mask and byte
+order.  The expression is then turned into a plain python function that unpacks only the fields
+it needs straight from the buffer, so no :code:`Packet` (or :code:`ctypes` structure) is ever
+created for the records being tested.
+
+Supported in expressions:
+
+    * field names, including dotted names of encapsulated packets (:code:`header.msg_id`) and
+      items of array fields (:code:`dest_mac[0]`)
+    * int, float and bool constants
+    * :code:`and`, :code:`or`, :code:`not`
+    * comparisons, including chained comparisons and :code:`in` / :code:`not in` against a
+      tuple, list or set of constants
+    * the arithmetic and bitwise operators :code:`+ - * / // % << >> & | ^ ~`
+
+Example::
+
+    syn_to_https = TCP_HEADER_BIG.compile_filter("dest_port == 443 and flag_syn")
+
+    if syn_to_https(frame, 34):
+        ...
+
+    # indices of the matching records of a buffer of back to back headers
+    matches = syn_to_https.scan(buf)
+"""
+import ast
+import struct
+
+from calpack.models.layout import get_layout
+from calpack.utils import PY2, FilterError, FieldNameDoesntExistError
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+__all__ = ['PacketFilter', 'compile_filter']
+
+
+_BIN_OPS = {
+    ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/', ast.FloorDiv: '//', ast.Mod: '%',
+    ast.LShift: '<<', ast.RShift: '>>', ast.BitAnd: '&', ast.BitOr: '|', ast.BitXor: '^',
+}
+
+_CMP_OPS = {
+    ast.Eq: '==', ast.NotEq: '!=', ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>=',
+}
+
+_NAMED_CONSTANTS = {'True': True, 'False': False}
+
+
+def _sign_extend(val, bit_len):
+    if val >> (bit_len - 1):
+        return val - (1 << bit_len)
+    return val
+
+
+class _Load(object):
+    """A single scalar read from the buffer: a field, a bit field or an item of an array field"""
+    __slots__ = ('offset', 'fmt', 'byte_order', 'kind', 'signed', 'bit_offset', 'bit_len')
+
+    def __init__(self, field, offset, fmt):
+        self.offset = offset
+        self.fmt = fmt
+        self.byte_order = field.byte_order
+        self.kind = field.kind
+        self.signed = field.signed
+        self.bit_offset = field.bit_offset
+        self.bit_len = field.bit_len
+
+    @property
+    def key(self):
+        return (self.offset, self.fmt, self.byte_order, self.bit_offset, self.bit_len)
+
+    def column(self, buf, base, count, stride):
+        """decodes this value from :code:`count` records as a NumPy array"""
+        col = numpy.ndarray(
+            (count,), numpy.dtype(self.byte_order + self.fmt), buffer=buf,
+            offset=base + self.offset, strides=(stride,)
+        )
+        if self.kind not in ('int', 'array') or self.fmt == 'd' or self.fmt == 'f':
+            return col
+
+        col = col.astype(numpy.uint64 if self.fmt == 'Q' else numpy.int64)
+        if self.bit_len is not None:
+            col = (col >> self.bit_offset) & ((1 << self.bit_len) - 1)
+            if self.signed:
+                col = numpy.where(col >> (self.bit_len - 1), col - (1 << self.bit_len), col)
+        return col
+
+
+class _Compiler(object):
+    """
+    Translates a parsed expression into python source.  In vector mode the source operates on
+    NumPy columns, so the boolean operators are translated into their element-wise equivalents.
+    """
+    def __init__(self, layout, namespace, loads, vector=False):
+        self.layout = layout
+        self.namespace = namespace
+        self.loads = loads
+        self.vector = vector
+
+    def constant(self, value):
+        name = "_k{}".format(len(self.namespace))
+        self.namespace[name] = value
+        return name
+
+    def load(self, field, offset, fmt):
+        spec = _Load(field, offset, fmt)
+        for index, each in enumerate(self.loads):
+            if each.key == spec.key:
+                break
+        else:
+            index = len(self.loads)
+            self.loads.append(spec)
+
+        if self.vector:
+            return "_cols[{}]".format(index)
+
+        unpack = "_u{}".format(index)
+        if unpack not in self.namespace:
+            self.namespace[unpack] = struct.Struct(spec.byte_order + fmt).unpack_from
+
+        code = "{u}(buf, base + {o})[0]".format(u=unpack, o=offset)
+        if spec.bit_len is not None:
+            code = "(({c} >> {s}) & {m})".format(
+                c=code, s=spec.bit_offset, m=(1 << spec.bit_len) - 1
+            )
+            if spec.signed:
+                code = "_sign_extend({c}, {b})".format(c=code, b=spec.bit_len)
+        return code
+
+    def field(self, name, node):
+        try:
+            field = self.layout.resolve(name)
+        except KeyError:
+            raise FieldNameDoesntExistError("{} is not a valid field name".format(name))
+        if not field.is_scalar or field.fmt is None:
+            raise FilterError(
+                "field '{}' can't be used in a filter, only scalar fields and items of arrays "
+                "can".format(name)
+            )
+        return self.load(field, field.offset, field.fmt)
+
+    def truth(self, node):
+        """compiles a node used as a condition"""
+        code = self.visit(node)
+        if self.vector and not _is_boolean(node):
+            return "({} != 0)".format(code)
+        return code
+
+    def visit(self, node):
+        method = getattr(self, 'visit_' + type(node).__name__, None)
+        if method is None:
+            raise FilterError("'{}' is not supported in filters".format(type(node).__name__))
+        return method(node)
+
+    def visit_Expression(self, node):
+        return self.visit(node.body)
+
+    def visit_Name(self, node):
+        if node.id in _NAMED_CONSTANTS:
+            return repr(_NAMED_CONSTANTS[node.id])
+        return self.field(node.id, node)
+
+    def visit_Attribute(self, node):
+        return self.field(_dotted_name(node), node)
+
+    def visit_Subscript(self, node):
+        index = node.slice
+        if type(index).__name__ == 'Index':
+            index = index.value
+        index = _constant_value(index)
+        if not isinstance(index, int) or isinstance(index, bool):
+            raise FilterError("array fields can only be indexed by an int constant")
+
+        name = _dotted_name(node.value)
+        try:
+            field = self.layout.resolve(name)
+        except KeyError:
+            raise FieldNameDoesntExistError("{} is not a valid field name".format(name))
+        if field.kind != 'array':
+            raise FilterError("field '{}' is not an array".format(name))
+        if not -field.count <= index < field.count:
+            raise FilterError("index {i} is out of range for field '{n}'".format(i=index, n=name))
+
+        index %= field.count
+        return self.load(field, field.offset + index * (field.size // field.count), field.fmt)
+
+    def visit_Constant(self, node):
+        value = node.value
+        if isinstance(value, bool) or isinstance(value, (int, float)):
+            return repr(value)
+        raise FilterError("{!r} is not a supported constant".format(value))
+
+    def visit_Num(self, node):  # pragma: no cover
+        return repr(node.n)
+
+    def visit_NameConstant(self, node):  # pragma: no cover
+        return self.visit_Constant(node)
+
+    def visit_BoolOp(self, node):
+        values = [self.truth(each) for each in node.values]
+        if self.vector:
+            joiner = ' & ' if isinstance(node.op, ast.And) else ' | '
+        else:
+            joiner = ' and ' if isinstance(node.op, ast.And) else ' or '
+        return "(" + joiner.join("(" + each + ")" for each in values) + ")"
+
+    def visit_UnaryOp(self, node):
+        if isinstance(node.op, ast.Not):
+            if self.vector:
+                return "(~{})".format(self.truth(node.operand))
+            return "(not {})".format(self.visit(node.operand))
+        ops = {ast.USub: '-', ast.UAdd: '+', ast.Invert: '~'}
+        op = ops.get(type(node.op))
+        if op is None:
+            raise FilterError("'{}' is not supported in filters".format(type(node.op).__name__))
+        return "({}{})".format(op, self.visit(node.operand))
+
+    def visit_BinOp(self, node):
+        op = _BIN_OPS.get(type(node.op))
+        if op is None:
+            raise FilterError("'{}' is not supported in filters".format(type(node.op).__name__))
+        return "({l} {o} {r})".format(l=self.visit(node.left), o=op, r=self.visit(node.right))
+
+    def visit_Compare(self, node):
+        terms = []
+        left = self.visit(node.left)
+        for op, comparator in zip(node.ops, node.comparators):
+            if isinstance(op, (ast.In, ast.NotIn)):
+                term = self.membership(left, op, comparator)
+                right = None
+            else:
+                symbol = _CMP_OPS.get(type(op))
+                if symbol is None:
+                    raise FilterError(
+                        "'{}' is not supported in filters".format(type(op).__name__)
+                    )
+                right = self.visit(comparator)
+                term = "({l} {o} {r})".format(l=left, o=symbol, r=right)
+            terms.append(term)
+            left = right
+
+        joiner = ' & ' if self.vector else ' and '
+        return terms[0] if len(terms) == 1 else "(" + joiner.join(terms) + ")"
+
+    def membership(self, left, op, node):
+        if not isinstance(node, (ast.Tuple, ast.List, ast.Set)):
+            raise FilterError("'in' is only supported against a tuple, list or set of constants")
+        values = [_constant_value(each) for each in node.elts]
+
+        if self.vector:
+            code = "_isin({l}, {k})".format(l=left, k=self.constant(numpy.array(values)))
+            return "(~{})".format(code) if isinstance(op, ast.NotIn) else code
+
+        symbol = 'not in' if isinstance(op, ast.NotIn) else 'in'
+        return "({l} {o} {k})".format(l=left, o=symbol, k=self.constant(frozenset(values)))
+
+
+def _dotted_name(node):
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return _dotted_name(node.value) + '.' + node.attr
+    raise FilterError("'{}' is not a field name".format(type(node).__name__))
+
+
+def _constant_value(node):
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        return -_constant_value(node.operand)
+    if type(node).__name__ == 'Num':  # pragma: no cover
+        return node.n
+    if isinstance(node, ast.Name) and node.id in _NAMED_CONSTANTS:
+        return _NAMED_CONSTANTS[node.id]
+    value = getattr(node, 'value', None)
+    if type(node).__name__ in ('Constant', 'NameConstant') and isinstance(value, (int, float)):
+        return value
+    raise FilterError("only int, float and bool constants are supported")
+
+
+def _is_boolean(node):
+    if isinstance(node, ast.Compare):
+        return True
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        return True
+    if isinstance(node, ast.BoolOp):
+        return all(_is_boolean(each) for each in node.values)
+    return isinstance(getattr(node, 'value', None), bool)
+
+
+class PacketFilter(object):
+    """
+    A filter expression compiled against a :code:`Packet` class.  Use
+    :code:`Packet.compile_filter` (or :code:`compile_filter`) rather than creating these directly.
+
+    Calling the filter tests a single record: :code:`pkt_filter(buf, offset)`.  In hot loops the
+    underlying function, :code:`pkt_filter.match`, can be called directly to save a method call.
+
+    :ivar packet_cls: the packet class the filter was compiled against
+    :ivar str expression: the source expression
+    :ivar int size: the size in bytes of a record
+    :ivar match: the compiled function :code:`match(buf, base=0)`
+    """
+    def __init__(self, packet_cls, expression):
+        self.packet_cls = packet_cls
+        self.expression = expression
+
+        layout = get_layout(packet_cls)
+        self.size = layout.size
+
+        try:
+            tree = ast.parse(expression.strip(), mode='eval')
+        except SyntaxError as err:
+            raise FilterError("invalid filter expression {e!r}: {m}".format(
+                e=expression, m=err
+            ))
+
+        namespace = {'_sign_extend': _sign_extend}
+        self._loads = []
+        body = _Compiler(layout, namespace, self._loads).visit(tree)
+        if not _is_boolean(tree.body):
+            body = "bool({})".format(body)
+        self.source = "def match(buf, base=0):\n    return {}\n".format(body)
+        exec(self.source, namespace)
+        self.match = namespace['match']
+
+        self._vector = None
+        if numpy is not None:
+            vector_ns = {'_isin': numpy.isin}
+            body = _Compiler(layout, vector_ns, self._loads, vector=True).truth(tree.body)
+            exec("def vector(_cols):\n    return {}\n".format(body), vector_ns)
+            self._vector = vector_ns['vector']
+
+    def __call__(self, buf, offset=0):
+        """
+        Tests a single record.
+
+        :param buf: an object supporting the buffer protocol holding the record (a packet's
+            :code:`c_pkt` can be used as well)
+        :param int offset: the byte offset of the record within :code:`buf` (default 0)
+        :rtype: bool
+        """
+        return self.match(buf, offset)
+
+    def _count(self, buf, offset, stride):
+        if PY2:  # pragma: no cover
+            # python 2's memoryview has no nbytes
+            view = memoryview(buf)
+            available = len(view) * view.itemsize - offset
+        else:
+            available = memoryview(buf).nbytes - offset
+        if available < self.size:
+            return 0
+        return (available - self.size) // stride + 1
+
+    def scan(self, buf, offset=0, stride=None, count=None):
+        """
+        Tests every record of a buffer of fixed size records and returns the indices of the
+        matching ones.  When NumPy is available the fields are decoded as columns and the
+        expression is evaluated on all of the records at once.
+
+        :param buf: an object supporting the buffer protocol holding the records
+        :param int offset: the byte offset of the first record (default 0)
+        :param int stride: the distance in bytes between records (default the packet size)
+        :param int count: the number of records (default as many as fit in :code:`buf`)
+        :return: the indices of the matching records, as a NumPy array when NumPy is available
+            otherwise a list
+        """
+        if stride is None:
+            stride = self.size
+        if count is None:
+            count = self._count(buf, offset, stride)
+
+        if self._vector is not None:
+            if count == 0:
+                return numpy.zeros(0, dtype=numpy.intp)
+            cols = [load.column(buf, offset, count, stride) for load in self._loads]
+            result = numpy.broadcast_to(self._vector(cols), (count,))
+            return numpy.flatnonzero(result)
+
+        match = self.match
+        return [i for i in range(count) if match(buf, offset + i * stride)]
+
+    def __repr__(self):
+        return "PacketFilter({c}, {e!r})".format(c=self.packet_cls.__name__, e=self.expression)
+
+
+def compile_filter(packet_cls, expression):
+    """
+    Compiles a filter expression against a :code:`Packet` class.
+
+    :param packet_cls: the :code:`Packet` class (or an instance of it) describing the records
+    :param str expression: the filter expression, i.e. :code:`"dest_port == 443 and flag_syn"`
+    :rtype: PacketFilter
+    :raises FieldNameDoesntExistError: if the expression uses a field the packet doesn't have
+    :raises FilterError: if the expression is invalid or uses unsupported syntax
+    """
+    if not isinstance(packet_cls, type):
+        packet_cls = type(packet_cls)
+    return PacketFilter(packet_cls, expression)
@@ -0,0 +1,363 @@
+"""
+Precomputed byte layouts of :code:`Packet` classes.
+
+A :code:`PacketLayout` records where every field of a packet lives inside the packet's internal
+:code:`ctypes.Structure`: its byte offset, the size of its storage unit, its bit position (for bit
+fields), its signedness and the byte order of the structure.  This information is computed once
+per packet class and cached, so code working directly on raw buffers (capture readers, filters,
+column scans, ...) never has to go through the :code:`ctypes` machinery for every record.
+
+Example::
+
+    layout = get_layout(TCP_HEADER)
+    layout['dest_port'].unpack_from(raw_bytes)
+"""
+import ctypes
+import hashlib
+import struct
+import sys
+import weakref
+
+
+__all__ = ['FieldLayout', 'PacketLayout', 'get_layout', 'classify_c_type']
+
+
+NATIVE_BYTE_ORDER = '<' if sys.byteorder == 'little' else '>'
+
+_INT_FORMATS = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+_FLOAT_FORMATS = {4: 'f', 8: 'd'}
+
+_layouts = weakref.WeakKeyDictionary()
+
+
+def classify_c_type(c_type):
+    """returns the (kind, signed, struct format character) of a scalar ctypes type"""
+    size = ctypes.sizeof(c_type)
+    code = getattr(c_type, '_type_', None)
+    if code == '?':
+        return 'bool', False, '?'
+    if code in ('f', 'd', 'g'):
+        return 'float', True, _FLOAT_FORMATS.get(size)
+    if isinstance(code, str) and code in 'bBhHiIlLqQ' and size in _INT_FORMATS:
+        fmt = _INT_FORMATS[size]
+        if code.islower():
+            fmt = fmt.lower()
+        return 'int', code.islower(), fmt
+    return 'raw', False, None
+
+
+def _struct_byte_order(c_struct):
+    if issubclass(c_struct, ctypes.BigEndianStructure):
+        return '>'
+    if issubclass(c_struct, ctypes.LittleEndianStructure):
+        return '<'
+    return NATIVE_BYTE_ORDER
+
+
+def _bit_info(descriptor):
+    """returns the (bit_offset, bit_len) of a ctypes field descriptor, or (None, None)"""
+    if hasattr(descriptor, 'is_bitfield'):
+        if descriptor.is_bitfield:
+            return descriptor.bit_offset, descriptor.bit_size
+        return None, None
+
+    # Older versions of CPython encode bit fields into the descriptor size as
+    #   (bit_len << 16) | bit_offset
+    if descriptor.size >> 16:
+        return descriptor.size & 0xffff, descriptor.size >> 16
+    return None, None
+
+
+class FieldLayout(object):
+    """
+    The location and encoding of a single field within a packet's raw bytes.
+
+    :ivar str name: the name of the field
+    :ivar int offset: the byte offset of the field's storage unit
+    :ivar int size: the size in bytes of the field's storage unit
+    :ivar str kind: one of :code:`'int'`, :code:`'bool'`, :code:`'float'`, :code:`'array'`,
+        :code:`'packet'` or :code:`'raw'`
+    :ivar str byte_order: :code:`'<'` or :code:`'>'`
+    :ivar bool signed: whether integer values are signed
+    :ivar bit_offset: the position of the least significant bit of a bit field within its storage
+        unit, or :code:`None` for whole byte fields
+    :ivar bit_len: the length in bits of a bit field, or :code:`None` for whole byte fields
+    :ivar fmt: the :code:`struct` format character of a scalar (or array item), or :code:`None`
+    :ivar int count: the number of items of an array field (1 otherwise)
+    :ivar layout: the :code:`PacketLayout` of an encapsulated packet, or :code:`None`
+    """
+    __slots__ = (
+        'name', 'offset', 'size', 'kind', 'byte_order', 'signed', 'bit_offset', 'bit_len', 'fmt',
+        'count', 'layout', 'codec', 'mask'
+    )
+
+    def __init__(self, name, offset, size, kind, byte_order, signed=False, bit_offset=None,
+                 bit_len=None, fmt=None, count=1, layout=None):
+        self.name = name
+        self.offset = offset
+        self.size = size
+        self.kind = kind
+        self.byte_order = byte_order
+        self.signed = signed
+        self.bit_offset = bit_offset
+        self.bit_len = bit_len
+        self.fmt = fmt
+        self.count = count
+        self.layout = layout
+
+        self.mask = None
+        self.codec = None
+        if fmt is not None:
+            if count > 1:
+                self.codec = struct.Struct("{}{}{}".format(byte_order, count, fmt))
+            else:
+                self.codec = struct.Struct(byte_order + fmt)
+        if bit_len is not None:
+            self.mask = (1 << bit_len) - 1
+
+    @property
+    def is_bitfield(self):
+        """whether the field only occupies part of its storage unit"""
+        return self.bit_len is not None
+
+    @property
+    def is_scalar(self):
+        """whether the field decodes into a single number (int, bool or float)"""
+        return self.kind in ('int', 'bool', 'float')
+
+    def unpack_from(self, buf, base=0):
+        """
+        Decodes the field's value directly from a raw buffer.
+
+        :param buf: any object supporting the buffer protocol containing the packet
+        :param int base: the byte offset of the packet within :code:`buf`
+        :returns: the python value of the field (a tuple for array fields, bytes for raw fields)
+        """
+        if self.codec is None:
+            start = base + self.offset
+            return bytes(buf[start:start + self.size])
+
+        if self.count > 1:
+            return self.codec.unpack_from(buf, base + self.offset)
+
+        val = self.codec.unpack_from(buf, base + self.offset)[0]
+        if self.mask is not None:
+            val = (val >> self.bit_offset) & self.mask
+            if self.signed and val >> (self.bit_len - 1):
+                val -= 1 << self.bit_len
+        return val
+
+    def pack_into(self, buf, base, val):
+        """
+        Encodes :code:`val` directly into a raw, writable buffer.  Bit fields only modify their
+        own bits of the storage unit.
+
+        :param buf: a writable buffer containing the packet
+        :param int base: the byte offset of the packet within :code:`buf`
+        :param val: the value to write
+        """
+        if self.codec is None:
+            start = base + self.offset
+            buf[start:start + self.size] = val
+        elif self.count > 1:
+            self.codec.pack_into(buf, base + self.offset, *val)
+        elif self.mask is not None:
+            unit = self.codec.unpack_from(buf, base + self.offset)[0]
+            unit &= ~(self.mask << self.bit_offset)
+            unit |= (val & self.mask) << self.bit_offset
+            self.codec.pack_into(buf, base + self.offset, unit)
+        else:
+            self.codec.pack_into(buf, base + self.offset, val)
+
+    def shifted(self, delta, prefix=''):
+        """returns a copy of this layout moved :code:`delta` bytes further into the buffer"""
+        return FieldLayout(
+            prefix + self.name, self.offset + delta, self.size, self.kind, self.byte_order,
+            self.signed, self.bit_offset, self.bit_len, self.fmt, self.count, self.layout
+        )
+
+    def __repr__(self):
+        return "FieldLayout({n!r}, offset={o}, size={s}, kind={k!r})".format(
+            n=self.name, o=self.offset, s=self.size, k=self.kind
+        )
+
+
+class PacketLayout(object):
+    """
+    The layout of every field of a :code:`Packet` class.  Use :code:`get_layout` rather than
+    creating these directly.
+
+    :ivar packet_cls: the packet class described
+    :ivar int size: the size in bytes of the packet
+    :ivar str byte_order: :code:`'<'` or :code:`'>'`
+    :ivar fields: a mapping of field names to :code:`FieldLayout`
+    :ivar fields_order: the field names in the order they were defined
+    :ivar struct: a precompiled :code:`struct.Struct` encoding the whole packet when every field
+        is a whole byte scalar, otherwise :code:`None`.  The values are in :code:`fields_order`.
+    """
+    def __init__(self, packet_cls):
+        c_struct = packet_cls._Packet__c_struct
+
+        self.packet_cls = packet_cls
+        self.size = ctypes.sizeof(c_struct)
+        self.byte_order = _struct_byte_order(c_struct)
+        self.fields = dict()
+
+        order = []
+        for field_tuple in c_struct._fields_:
+            name, c_type = field_tuple[0], field_tuple[1]
+            self.fields[name] = self._create_field_layout(c_struct, name, c_type)
+            order.append(name)
+        self.fields_order = order
+
+        self.struct = self._create_struct()
+        self._fingerprint = None
+
+    def _create_field_layout(self, c_struct, name, c_type):
+        descriptor = getattr(c_struct, name)
+        bit_offset, bit_len = _bit_info(descriptor)
+        size = ctypes.sizeof(c_type)
+        byte_order = self.byte_order
+
+        if issubclass(c_type, ctypes.Structure):
+            sub_layout = _layout_of_c_struct(c_type)
+            return FieldLayout(name, descriptor.offset, size, 'packet', byte_order,
+                               layout=sub_layout)
+
+        if issubclass(c_type, ctypes.Array):
+            kind, signed, fmt = self._classify(c_type._type_)
+            if kind != 'raw' and fmt is not None:
+                return FieldLayout(name, descriptor.offset, size, 'array', byte_order,
+                                   signed=signed, fmt=fmt, count=c_type._length_)
+            return FieldLayout(name, descriptor.offset, size, 'raw', byte_order,
+                               count=c_type._length_)
+
+        kind, signed, fmt = self._classify(c_type)
+        if bit_len is not None:
+            fmt = _INT_FORMATS[size]
+        return FieldLayout(name, descriptor.offset, size, kind, byte_order, signed, bit_offset,
+                           bit_len, fmt)
+
+    def _classify(self, c_type):
+        return classify_c_type(c_type)
+
+    def _create_struct(self):
+        fmt = [self.byte_order]
+        pos = 0
+        for name in self.fields_order:
+            field = self.fields[name]
+            if not field.is_scalar or field.is_bitfield or field.fmt is None:
+                return None
+            if field.offset > pos:
+                fmt.append("{}x".format(field.offset - pos))
+            fmt.append(field.fmt)
+            pos = field.offset + field.size
+        if self.size > pos:
+            fmt.append("{}x".format(self.size - pos))
+        return struct.Struct("".join(fmt))
+
+    def describe(self):
+        """
+        Returns a canonical description of the encoding of every field: its name, offset, size,
+        kind, byte order, signedness, bit position, format and item count, recursing into
+        encapsulated packets.  Two packet classes with the same description encode their records
+        identically.
+
+        :rtype: str
+        """
+        parts = ["{s}{b}".format(s=self.size, b=self.byte_order)]
+        for field in self:
+            parts.append("{n}:{o}:{s}:{k}:{b}:{i}:{bo}:{bl}:{f}:{c}".format(
+                n=field.name, o=field.offset, s=field.size, k=field.kind, b=field.byte_order,
+                i=int(field.signed), bo=field.bit_offset, bl=field.bit_len, f=field.fmt,
+                c=field.count
+            ))
+            if field.layout is not None:
+                parts.append("({})".format(field.layout.describe()))
+        return ";".join(parts)
+
+    @property
+    def fingerprint(self):
+        """
+        A 64 bit fingerprint of the packet's encoding (see :code:`describe`), used to check that
+        stored records are read back with a compatible packet class.
+
+        :rtype: int
+        """
+        if self._fingerprint is None:
+            digest = hashlib.sha1(self.describe().encode('ascii')).digest()
+            self._fingerprint = struct.unpack('<Q', digest[:8])[0]
+        return self._fingerprint
+
+    def __getitem__(self, name):
+        return self.resolve(name)
+
+    def __contains__(self, name):
+        try:
+            self.resolve(name)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self.fields[name] for name in self.fields_order)
+
+    def __len__(self):
+        return len(self.fields_order)
+
+    def resolve(self, name):
+        """
+        Returns the :code:`FieldLayout` of a field.  Fields of encapsulated packets
+        (:code:`PacketField`) can be accessed with dotted names (i.e. :code:`'header.dest_port'`),
+        and have their offsets relative to the start of this packet.
+
+        :param str name: the (dotted) name of the field
+        :raises KeyError: if the field doesn't exist
+        """
+        field = self.fields.get(name)
+        if field is not None:
+            return field
+
+        head, sep, tail = name.partition('.')
+        field = self.fields.get(head)
+        if not sep or field is None or field.layout is None:
+            raise KeyError("'{c}' does not contain field '{n}'".format(
+                c=getattr(self.packet_cls, '__name__', self.packet_cls), n=name
+            ))
+        return field.layout.resolve(tail).shifted(field.offset, head + '.')
+
+    def __repr__(self):
+        return "PacketLayout({c}, size={s})".format(
+            c=getattr(self.packet_cls, '__name__', self.packet_cls), s=self.size
+        )
+
+
+class _CStructHolder(object):
+    """Allows a bare :code:`ctypes.Structure` to be described as if it were a Packet class"""
+    def __init__(self, c_struct):
+        self._Packet__c_struct = c_struct
+        self.__name__ = c_struct.__name__
+
+
+def _layout_of_c_struct(c_struct):
+    layout = _layouts.get(c_struct)
+    if layout is None:
+        layout = PacketLayout(_CStructHolder(c_struct))
+        _layouts[c_struct] = layout
+    return layout
+
+
+def get_layout(packet_cls):
+    """
+    Returns the (cached) :code:`PacketLayout` of a :code:`Packet` class.
+
+    :param packet_cls: a :code:`calpack.models.Packet` subclass (or instance)
+    :rtype: PacketLayout
+    """
+    if not isinstance(packet_cls, type):
+        packet_cls = type(packet_cls)
+    layout = _layouts.get(packet_cls)
+    if layout is None:
+        layout = PacketLayout(packet_cls)
+        _layouts[packet_cls] = layout
+    return layout
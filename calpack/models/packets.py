@@ -1,19 +1,30 @@
 """
 A collection of classes and function for creating custom :code:`Packet`s.
 """
+import copy
 import ctypes
+import pickle
 
 from collections import OrderedDict
 
 from calpack.utils import typed_property, PY2, PYPY, FieldNameError, \
-FieldAlreadyExistsError, FieldNameDoesntExistError
-from calpack.models.fields import Field
+FieldAlreadyExistsError, FieldNameDoesntExistError, DiscriminatorError, FrozenPacketError
+from calpack.models.fields import Field, VarField
+from calpack.models.layout import get_layout
+from calpack.models.filters import compile_filter
+from calpack.models.cache import DecodeCache
 
 
 __all__ = ['Packet']
 if not PYPY:
     __all__ += ['PacketLittleEndian', 'PacketBigEndian']
 
+PickleBuffer = getattr(pickle, 'PickleBuffer', None)
+
+# Packets at least this large are pickled as a PickleBuffer with protocol 5, so they can be sent
+#   out-of-band.  Smaller packets are cheaper to pickle as plain bytes.
+PICKLE_BUFFER_SIZE = 1024
+
 
 # This was taken from the six.py source code.  Reason being that I only needed a small part of six
 #   and didn't want to rely on the third-party installation just for this package.  I highly
@@ -51,6 +62,9 @@ class _MetaPacket(type):
             - The order in which it was defined is saved
             - The bit width of the field is summed
         3. A `ctypes.Structure` is created with :code:`_fields_` in order and type of the Fields.
+        4. If the class declares a :code:`discriminator_field` it gets a registry of its
+           subclasses.  If it declares a :code:`discriminator_value` it's added to the registry
+           it inherited, and the discriminator field defaults to that value.
 
     In order for this to work, the following are assumed about the defined :code:`Field` classes:
 
@@ -65,6 +79,7 @@ class _MetaPacket(type):
 
         order = []
         fields_tuple = []
+        var_fields = []
 
         fields = [
             (field_name, clsdict.get(field_name))
@@ -84,6 +99,11 @@ class _MetaPacket(type):
         for base in bases:
             base_dicts.update(base.__dict__)
             if getattr(base, '_IS_PKT_CLASS', False):
+                if var_fields and base._Packet__c_struct._fields_:
+                    raise TypeError("Fields can't follow the variable length field {}".format(
+                        var_fields[-1].field_name
+                    ))
+                var_fields += getattr(base, '_var_fields', ())
                 fields_tuple += getattr(base._Packet__c_struct, '_fields_', [])
                 base_order = getattr(base, 'fields_order', [])
                 order += base_order
@@ -102,6 +122,22 @@ class _MetaPacket(type):
 
             obj.field_name = name
 
+            # Variable length fields aren't part of the c struct, and must come after all of the
+            #   fixed size fields so that those keep a constant offset.
+            if isinstance(obj, VarField):
+                if var_fields and var_fields[-1].is_remainder:
+                    raise TypeError("{n} can't follow {v}, which holds all remaining bytes".format(
+                        n=name, v=var_fields[-1].field_name
+                    ))
+                obj.var_index = len(var_fields)
+                var_fields.append(obj)
+                class_dict[name] = obj
+                continue
+            if var_fields:
+                raise TypeError("{n} can't follow the variable length field {v}".format(
+                    n=name, v=var_fields[-1].field_name
+                ))
+
             field_tuple = obj.create_field_c_tuple()
 
             fields_tuple.append(field_tuple)
@@ -110,6 +146,7 @@ class _MetaPacket(type):
 
         # Here we save the order
         class_dict['fields_order'] = order
+        class_dict['_var_fields'] = tuple(var_fields)
 
         c_struct_type = base_dicts.get('_c_struct_type', ctypes.Structure)
 
@@ -120,7 +157,45 @@ class _MetaPacket(type):
         Cstruct._fields_ = fields_tuple
         class_dict['_Packet__c_struct'] = Cstruct
 
-        return type.__new__(mcs, clsname, bases, class_dict)
+        registry = None
+        disc_name = clsdict.get('discriminator_field')
+        if disc_name is not None:
+            if disc_name not in order:
+                raise FieldNameDoesntExistError("{} is not a valid field name".format(disc_name))
+            registry = class_dict['_discriminator_registry'] = {}
+        else:
+            for base in bases:
+                registry = getattr(base, '_discriminator_registry', None)
+                if registry is not None:
+                    disc_name = base.discriminator_field
+                    break
+
+        disc_value = clsdict.get('discriminator_value')
+        if disc_value is not None:
+            if registry is None:
+                raise DiscriminatorError(
+                    "{} defines a discriminator_value but no discriminator_field".format(clsname)
+                )
+            if disc_value in registry:
+                raise DiscriminatorError("discriminator value {v!r} already used by {c}".format(
+                    v=disc_value, c=registry[disc_value].__name__
+                ))
+
+            # The field object is shared with the base class, so the default is set on a copy
+            disc_field = copy.copy(class_dict[disc_name])
+            disc_field.default_val = disc_value
+            class_dict[disc_name] = disc_field
+
+        cls = type.__new__(mcs, clsname, bases, class_dict)
+
+        if var_fields:
+            cls._var_byte_order = get_layout(cls).byte_order
+        if clsdict.get('discriminator_field') is not None:
+            cls._discriminator_layout = get_layout(cls)[disc_name]
+        if disc_value is not None:
+            registry[disc_value] = cls
+
+        return cls
 
     @classmethod
     def __prepare__(mcs, clsname, bases, **kwargs):
@@ -147,10 +222,30 @@ class Packet(object):
         order for it to work properly.
     """
     _IS_PKT_CLASS = True
+    _mutable_cls = None
+    _uncached_cls = None
+    discriminator_field = None
+    discriminator_value = None
     word_size = typed_property('word_size', int, 16)
     fields_order = []
     bit_len = 0
 
+    # The state of variable length fields (see calpack.models.fields.VarFields).  These are only
+    #   ever set on instances of packets with variable length fields.
+    _var_fields = ()
+    _var_tail = None
+    _var_values = None
+    _var_spans = None
+    _var_cache = None
+
+    # A byte view of the internal c structure, created the first time the packet is compared
+    __view = None
+
+    # The names of the fields modified, and a copy of the fixed size fields' bytes from before
+    #   they were, while changes are tracked (see track_changes)
+    _dirty = None
+    _clean = None
+
     def __init__(self, c_pkt=None, **kwargs):
         # create an internal c structure instance for us to interface with.
         self.__c_pkt = c_pkt
@@ -187,28 +282,335 @@ class Packet(object):
         :return: the packet as a byte string
         :rtype: bytes
         """
-        return ctypes.string_at(ctypes.addressof(self.__c_pkt), ctypes.sizeof(self.__c_struct))
+        data = ctypes.string_at(ctypes.addressof(self.__c_pkt), ctypes.sizeof(self.__c_struct))
+        if self._var_fields:
+            return _join([data] + self._var_parts())
+        return data
+
+    def pack_into(self, buf, offset=0):
+        """
+        Writes the packet into a writable buffer without creating an intermediate bytes string.
+
+        :param buf: a writable object supporting the buffer protocol (i.e. :code:`bytearray`)
+        :param int offset: the byte offset within :code:`buf` to write the packet to (default 0)
+        :return: the number of bytes written
+        :rtype: int
+        :raises ValueError: if :code:`buf` is too small to hold the packet at :code:`offset`
+        """
+        size = ctypes.sizeof(self.__c_struct)
+        parts = self._var_parts() if self._var_fields else ()
+        total = size + sum(len(part) for part in parts)
+        if offset + total > len(buf):
+            raise ValueError("Buffer too small to pack the packet at offset {}".format(offset))
+        if PY2:  # pragma: no cover
+            # ctypes structures don't support python 2's memoryview
+            buf[offset:offset + size] = _c_bytes(self.__c_pkt)
+        else:
+            buf[offset:offset + size] = memoryview(self.__c_pkt).cast('B')
+
+        # variable length fields (i.e. a payload) are copied straight into buf
+        offset += size
+        for part in parts:
+            buf[offset:offset + len(part)] = part
+            offset += len(part)
+        return total
 
     @classmethod
     def from_bytes(cls, buf):
         """
         Creates a Packet from a bytes string
 
-        :param bytes buf: the bytes buffer that will be used to create the packet
+        The fixed size fields are copied.  The bytes following them, holding any variable length
+        fields, are not: they're read through a :code:`memoryview` of :code:`buf`.
+
+        :param bytes buf: the bytes buffer that will be used to create the packet.  Any object
+            supporting the buffer protocol (i.e. a :code:`memoryview`) can be used as well.
         :returns: an Instance of the Packet as parsed from the bytes string
         """
+        if cls._var_fields:
+            view = memoryview(buf)
+            size = ctypes.sizeof(cls.__c_struct)
+            if PY2:  # pragma: no cover
+                # ctypes doesn't support python 2's memoryview
+                pkt = cls(cls.__c_struct.from_buffer_copy(view[:size].tobytes()))
+            else:
+                pkt = cls(cls.__c_struct.from_buffer_copy(view))
+            pkt._var_tail = view[size:]
+            return pkt
+        if not isinstance(buf, bytes):
+            if PY2 and isinstance(buf, memoryview):  # pragma: no cover
+                # ctypes doesn't support python 2's memoryview
+                buf = buf.tobytes()
+            return cls(cls.__c_struct.from_buffer_copy(buf))
+
         cstring = ctypes.create_string_buffer(buf)
         c_pkt = ctypes.cast(ctypes.pointer(cstring), ctypes.POINTER(cls.__c_struct)).contents
         pkt = cls(c_pkt)
 
         return pkt
 
+    @classmethod
+    def enable_decode_cache(cls, max_entries=1024, max_bytes=None, frozen=True):
+        """
+        Puts a bounded LRU cache keyed by raw bytes in front of :code:`from_bytes` for this
+        packet class, so identical packets (i.e. heartbeats) are only decoded once.  Packets
+        found in the cache are returned as the same shared frozen packet (see :code:`frozen`),
+        which also caches the values of its fields, or as a copy of it.  Enabling the cache again
+        replaces it.
+
+        The cache is per class: subclasses (including the frozen variant) decode without it,
+        unless they enable their own.  Classes without a cache are unaffected.
+
+        :param int max_entries: the maximum number of cached packets (default 1024)
+        :param int max_bytes: the maximum number of bytes of the cached packets and their keys
+            (default no limit)
+        :param bool frozen: whether to return the shared, immutable packets (default True) or
+            modifiable copies of them
+        :return: the new cache, holding the hit, miss and eviction counters
+        :rtype: calpack.models.cache.DecodeCache
+        """
+        # the decoder is the closest from_bytes that isn't a cache's (a base class may have one)
+        for base in cls.__mro__:
+            current = base.__dict__.get('_decode_cache')
+            if current is not None:
+                decode = current.decode
+                break
+            method = base.__dict__.get('from_bytes')
+            if method is not None:
+                decode = method.__func__
+                break
+
+        if '_decode_cache' not in cls.__dict__:
+            # the class' own from_bytes, if any, is put back when the cache is disabled
+            cls._own_from_bytes = cls.__dict__.get('from_bytes')
+        cache = DecodeCache(decode, max_entries, max_bytes, frozen)
+        cls._decode_cache = cache
+        cls.from_bytes = classmethod(_cached_from_bytes(cls))
+        return cache
+
+    @classmethod
+    def disable_decode_cache(cls):
+        """Removes the decode cache of this packet class (see :code:`enable_decode_cache`)"""
+        if '_decode_cache' in cls.__dict__:
+            own = cls.__dict__['_own_from_bytes']
+            del cls._decode_cache
+            del cls._own_from_bytes
+            if own is not None:
+                cls.from_bytes = own
+            else:
+                del cls.from_bytes
+
+    @classmethod
+    def decode_cache(cls):
+        """
+        Returns the decode cache of this packet class (see :code:`enable_decode_cache`).
+
+        :rtype: calpack.models.cache.DecodeCache or None
+        """
+        return cls.__dict__.get('_decode_cache')
+
+    @classmethod
+    def from_buffer(cls, buf, offset=0):
+        """
+        Creates a Packet that uses the memory of :code:`buf` as its internal c structure.  No copy
+        is made; changes to the packet are written into :code:`buf` and changes to :code:`buf` are
+        seen by the packet.  Setting a variable length field detaches the packet from :code:`buf`:
+        the record in :code:`buf` is left as is, and the packet holds its own copy from then on.
+
+        :param buf: a writable object supporting the buffer protocol (i.e. :code:`bytearray`,
+            :code:`mmap.mmap` or a :code:`memoryview` of one)
+        :param int offset: the byte offset of the packet within :code:`buf` (default 0)
+        :returns: an Instance of the Packet backed by :code:`buf`
+        :raises TypeError: if :code:`buf` is read-only
+        :raises ValueError: if :code:`buf` is too small to hold the packet at :code:`offset`
+        """
+        pkt = cls(cls.__c_struct.from_buffer(buf, offset))
+        if cls._var_fields:
+            # Variable length fields are read from the buffer, but setting one detaches the
+            #   packet from the buffer rather than resizing it (see _set_var_field).
+            pkt._var_tail = memoryview(buf)[offset + ctypes.sizeof(cls.__c_struct):]
+        return pkt
+
+    @classmethod
+    def decode(cls, buf, offset=0):
+        """
+        Creates a Packet of the registered subclass matching the discriminator value in
+        :code:`buf`.  The discriminator is read straight from :code:`buf` at its precomputed
+        offset and the subclass looked up in the registry, so no packet is decoded twice.
+
+        Example::
+
+            class Telemetry(models.PacketBigEndian):
+                discriminator_field = 'msg_id'
+                msg_id = models.IntField16()
+
+            class Status(Telemetry):
+                discriminator_value = 5
+                state = models.IntField8()
+
+            pkt = Telemetry.decode(raw_bytes)   # a Status when msg_id is 5
+
+        :param buf: an object supporting the buffer protocol holding the packet
+        :param int offset: the byte offset of the packet within :code:`buf` (default 0)
+        :returns: an Instance of the matching subclass, holding a copy of its bytes
+        :raises DiscriminatorError: if no subclass is registered for the discriminator value
+        :raises ValueError: if :code:`buf` is too small to hold the packet
+        """
+        registry = getattr(cls, '_discriminator_registry', None)
+        if registry is None:
+            raise DiscriminatorError("{} has no discriminator_field".format(cls.__name__))
+
+        value = cls._discriminator_layout.unpack_from(buf, offset)
+        pkt_cls = registry.get(value)
+        if pkt_cls is None or not issubclass(pkt_cls, cls):
+            raise DiscriminatorError("no {c} registered for {f} {v!r}".format(
+                c=cls.__name__, f=cls.discriminator_field, v=value
+            ))
+        if pkt_cls._var_fields:
+            return pkt_cls.from_bytes(memoryview(buf)[offset:])
+        return pkt_cls(pkt_cls.__c_struct.from_buffer_copy(buf, offset))
+
+    @classmethod
+    def compile_filter(cls, expression):
+        """
+        Compiles a filter expression over the fields of this Packet into a predicate evaluated
+        directly on raw bytes, without creating any packets.  See :code:`calpack.models.filters`
+        for the supported syntax.
+
+        Example::
+
+            syn_to_https = TCP_HEADER_BIG.compile_filter("dest_port == 443 and flag_syn")
+            syn_to_https(raw_bytes)         # True or False
+            syn_to_https.scan(buf)          # indices of the matching records of buf
+
+        :param str expression: the filter expression
+        :rtype: calpack.models.filters.PacketFilter
+        """
+        return compile_filter(cls, expression)
+
     def __eq__(self, other):
         # if it's not the same packet type
         if not isinstance(other, type(self)):
             return False
 
-        return self.to_bytes() == other.to_bytes()
+        if self._var_fields:
+            return self.to_bytes() == other.to_bytes()
+
+        if PY2:  # pragma: no cover
+            # ctypes structures don't support python 2's memoryview
+            return _c_bytes(self.__c_pkt) == _c_bytes(other.__c_pkt)
+
+        # Comparing byte views of both structures is a memcmp, without creating any bytes
+        view = self.__view
+        if view is None:
+            view = self.__view = memoryview(self.__c_pkt).cast('B')
+        other_view = other.__view
+        if other_view is None:
+            other_view = other.__view = memoryview(other.__c_pkt).cast('B')
+        return view == other_view
+
+    def __ne__(self, other):
+        return not self == other
+
+    # mutable packets aren't hashable (python 3 implies this from __eq__, python 2 doesn't), see
+    #   frozen for hashable packets
+    __hash__ = None
+
+    def copy(self):
+        """
+        Creates a copy of the packet.  The internal c structure is duplicated in a single step
+        (including the content of any :code:`PacketField` and :code:`ArrayField`), without going
+        through an intermediate bytes string.
+
+        :returns: a new instance of the same Packet class
+        """
+        pkt = type(self)(self.__c_struct.from_buffer_copy(self.__c_pkt))
+        if self._var_fields:
+            pkt._copy_var_state(self, False)
+        return pkt
+
+    def _copy_var_state(self, src, deep, memo=None):
+        if src._var_values is not None:
+            values = dict(src._var_values)
+            if deep:
+                values = copy.deepcopy(values, memo)
+            self._var_values = values
+        elif src._var_tail is not None:
+            # the copy owns its variable bytes rather than viewing the source's buffer
+            self._var_tail = memoryview(_join(src._var_parts()))
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        pkt = type(self)(self.__c_struct.from_buffer_copy(self.__c_pkt))
+        if self._var_fields:
+            pkt._copy_var_state(self, True, memo)
+        memo[id(self)] = pkt
+        return pkt
+
+    def __reduce_ex__(self, protocol):
+        """
+        Pickles the packet as its class and raw bytes.  With protocol 5, packets of at least
+        :code:`PICKLE_BUFFER_SIZE` bytes are pickled as a :code:`pickle.PickleBuffer` of the
+        internal c structure, which is sent out-of-band when a :code:`buffer_callback` is given.
+        """
+        cls = type(self)
+        if cls._uncached_cls is not None:
+            cls = cls._uncached_cls
+        frozen = cls._mutable_cls is not None
+        if frozen:
+            cls = cls._mutable_cls
+
+        size = ctypes.sizeof(self.__c_struct)
+        if self._var_fields:
+            data = self.to_bytes()
+        elif protocol >= 5 and PickleBuffer is not None and size >= PICKLE_BUFFER_SIZE:
+            data = PickleBuffer(self.__c_pkt)
+        else:
+            data = ctypes.string_at(ctypes.addressof(self.__c_pkt), size)
+        return _unpickle_packet, (cls, data, frozen)
+
+    def __reduce__(self):
+        return self.__reduce_ex__(2)
+
+    def clone_many(self, count):
+        """
+        Creates :code:`count` copies of the packet, i.e. to fan out a template.  The copies are
+        laid out back to back in a single buffer, which is filled from the packet in one
+        operation, so cloning costs one allocation for the data plus the packet objects.
+
+        :param int count: the number of copies
+        :returns: a list of new instances of the same Packet class
+        """
+        if self._var_fields:
+            return [self.copy() for _ in range(count)]
+
+        size = ctypes.sizeof(self.__c_struct)
+        buf = bytearray(self.to_bytes() * count)
+        cls = type(self)
+        from_buffer = self.__c_struct.from_buffer
+        return [cls(from_buffer(buf, offset)) for offset in range(0, size * count, size)]
+
+    def frozen(self):
+        """
+        Creates an immutable, hashable copy of the packet.  The copy is an instance of a frozen
+        variant of the packet's class (a subclass of it), which raises a
+        :code:`FrozenPacketError` when a field is set and caches the hash of its contents, so it
+        can be used to key dicts and sets.  Frozen packets compare equal to packets of the same
+        type with the same contents.
+
+        .. warning:: encapsulated packets (:code:`PacketField`) are returned as raw c structures
+            and aren't protected from modification.
+
+        :returns: the frozen copy, or the packet itself if it's already frozen
+        """
+        if self._mutable_cls is not None:
+            return self
+        frozen_cls = _frozen_class(type(self)._uncached_cls or type(self))
+        if self._var_fields:
+            return frozen_cls.from_bytes(self.to_bytes())
+        return frozen_cls(self.__c_struct.from_buffer_copy(self.__c_pkt))
 
     @property
     def fields(self):
@@ -228,6 +630,285 @@ class Packet(object):
             raise FieldNameError("'{o}' does not contain field '{n}'".format(o=self, n=field_name))
 
         setattr(self.__c_pkt, field_name, val)
+        if self._var_fields and self._var_values is None:
+            # the variable fields may be located (i.e. length='n') or gated (i.e. present=) by
+            #   the fixed ones, so they're measured and decoded again
+            self._var_spans = None
+            self._var_cache = None
+
+    def cache_values(self, enable=True):
+        """
+        Starts (or stops) caching the values of the packet's fields: every field is converted
+        (:code:`c_to_py`) the first time it's read, and later reads return the same value until
+        the field is set again (through the packet's attributes or :code:`set_c_field`) or the
+        packet is rebound to another buffer (:code:`rebind`).  Useful when the same fields of a
+        packet are read repeatedly and their conversions are costly (i.e. custom fields).
+
+        Caching is enabled per packet, by switching the packet to a cached variant of its class
+        (a subclass of it), so reading the fields of other packets costs nothing more.
+
+        .. warning:: the cache isn't aware of changes made to the internal c structure directly,
+            or to the buffer of a packet created with :code:`from_buffer`.  Call
+            :code:`invalidate_values` after such changes.  Mutable values are shared between
+            reads.
+
+        :param bool enable: whether to cache the values (default True)
+        :return: the packet itself
+        """
+        base = type(self)._uncached_cls or type(self)
+        self.__dict__.pop('_value_cache', None)
+        self.__class__ = _cached_class(base) if enable else base
+        return self
+
+    def invalidate_values(self):
+        """Forgets the cached values of the fields (see :code:`cache_values`)"""
+        self.__dict__.pop('_value_cache', None)
+
+    def rebind(self, buf, offset=0):
+        """
+        Points the packet at the record at :code:`offset` in :code:`buf`, like a new packet
+        created with :code:`from_buffer` but without creating one, i.e. to walk the records of
+        a buffer with a single packet.  Cached values are invalidated and tracked changes are
+        cleared.
+
+        :param buf: a writable object supporting the buffer protocol
+        :param int offset: the byte offset of the packet within :code:`buf` (default 0)
+        :return: the packet itself
+        :raises FrozenPacketError: if the packet is frozen
+        """
+        if self._mutable_cls is not None:
+            _frozen_set(self)
+        self.__c_pkt = self.__c_struct.from_buffer(buf, offset)
+        self.__view = None
+        if self._var_fields:
+            self._var_tail = memoryview(buf)[offset + ctypes.sizeof(self.__c_struct):]
+            self._var_values = self._var_spans = self._var_cache = None
+        self.__dict__.pop('_value_cache', None)
+        if self._dirty is not None:
+            self.clear_changes()
+        return self
+
+    def track_changes(self, enable=True):
+        """
+        Starts (or stops) tracking which fields of this packet are modified, so the packet can be
+        re-serialized incrementally: only the modified byte ranges need to be written into an
+        existing copy of the packet (:code:`pack_dirty_into`), and checksums over the packet can
+        be updated from just those ranges (:code:`dirty_changes`).  The modifications are tracked
+        from this call, and from every :code:`to_bytes` or :code:`clear_changes` that follows.
+
+        Tracking is enabled per packet, by replacing :code:`set_c_field` for this packet only,
+        so setting the fields of packets that don't track their changes costs nothing more.
+
+        .. warning:: only fields set through the packet's attributes are tracked.  Changes made
+            to the internal c structure directly (i.e. to the c structure of a
+            :code:`PacketField`) or to the buffer of a packet created with :code:`from_buffer`
+            aren't.
+
+        Example::
+
+            pkt = UDP_HEADER_BIG.from_bytes(data).track_changes()
+            pkt.dest_port = 5353
+            pkt.pack_dirty_into(out_buffer)
+
+        :param bool enable: whether to track the changes (default True)
+        :return: the packet itself
+        :raises FrozenPacketError: if the packet is frozen
+        """
+        if self._mutable_cls is not None:
+            _frozen_set(self)
+        if not enable:
+            for name in ('set_c_field', '_set_var_field', 'to_bytes', '_dirty', '_clean'):
+                self.__dict__.pop(name, None)
+            return self
+
+        # Instance attributes take precedence over the class' methods, for this packet only
+        self.set_c_field = self._tracked_set_c_field
+        self.to_bytes = self._tracked_to_bytes
+        if self._var_fields:
+            self._set_var_field = self._tracked_set_var_field
+        self.clear_changes()
+        return self
+
+    def _tracked_set_c_field(self, field_name, val):
+        type(self).set_c_field(self, field_name, val)
+        self._dirty.add(field_name)
+
+    def _tracked_set_var_field(self, field, val):
+        type(self)._set_var_field(self, field, val)
+        self._dirty.add(field.field_name)
+
+    def _tracked_to_bytes(self):
+        data = type(self).to_bytes(self)
+        self.clear_changes()
+        return data
+
+    @property
+    def is_tracking_changes(self):
+        """whether the modified fields of the packet are tracked (see :code:`track_changes`)"""
+        return self._dirty is not None
+
+    def _check_tracking(self):
+        if self._dirty is None:
+            raise TypeError("The changes of this {} aren't tracked, see track_changes()".format(
+                type(self).__name__
+            ))
+
+    def clear_changes(self):
+        """Forgets the modified fields, the packet is considered unmodified from now on"""
+        self._dirty = set()
+        self._clean = ctypes.string_at(
+            ctypes.addressof(self.__c_pkt), ctypes.sizeof(self.__c_struct)
+        )
+
+    @property
+    def dirty_fields(self):
+        """
+        The names of the fields modified since changes are tracked, or since the last
+        :code:`to_bytes` or :code:`clear_changes`.
+
+        :rtype: frozenset
+        :raises TypeError: if the packet's changes aren't tracked
+        """
+        self._check_tracking()
+        return frozenset(self._dirty)
+
+    def dirty_ranges(self):
+        """
+        Returns the byte ranges of the packet holding the modified fields, merged and sorted.
+        Bit fields cover their whole storage unit.  A modified variable length field covers
+        every byte from the end of the fixed size fields to the end of the packet, as the
+        lengths of the variable length fields may have changed.
+
+        :return: a list of :code:`(start, end)` tuples
+        :raises TypeError: if the packet's changes aren't tracked
+        """
+        self._check_tracking()
+        layout = get_layout(type(self))
+        fixed = ctypes.sizeof(self.__c_struct)
+        ranges = []
+        for name in self._dirty:
+            field = layout.fields.get(name)
+            if field is not None:
+                ranges.append((field.offset, field.offset + field.size))
+
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        if len(ranges) < len(self._dirty):
+            # variable length fields are never merged with the fixed size fields' ranges
+            merged.append((fixed, len(self)))
+        return merged
+
+    def dirty_changes(self):
+        """
+        Returns the previous and current bytes of the modified ranges of the fixed size fields
+        (see :code:`dirty_ranges`), i.e. to update a checksum with
+        :code:`calpack.common.checksum.update_checksum`.
+
+        :return: a list of :code:`(offset, old_bytes, new_bytes)` tuples
+        :raises TypeError: if the packet's changes aren't tracked
+        """
+        ranges = self.dirty_ranges()
+        fixed = ctypes.sizeof(self.__c_struct)
+        data = ctypes.string_at(ctypes.addressof(self.__c_pkt), fixed)
+        clean = self._clean
+        return [
+            (start, clean[start:end], data[start:end]) for start, end in ranges if start < fixed
+        ]
+
+    def pack_dirty_into(self, buf, offset=0):
+        """
+        Writes only the modified byte ranges of the packet into a buffer already holding the
+        packet as it was before the changes, and forgets the changes.
+
+        :param buf: a writable buffer holding the unmodified packet
+        :param int offset: the byte offset of the packet within :code:`buf` (default 0)
+        :return: the byte ranges written (see :code:`dirty_ranges`)
+        :raises TypeError: if the packet's changes aren't tracked
+        :raises ValueError: if :code:`buf` is too small
+        """
+        ranges = self.dirty_ranges()
+        fixed = ctypes.sizeof(self.__c_struct)
+        if ranges and offset + ranges[-1][1] > len(buf):
+            raise ValueError("Buffer too small to pack the packet at offset {}".format(offset))
+
+        if PY2:  # pragma: no cover
+            # ctypes structures don't support python 2's memoryview
+            view = _c_bytes(self.__c_pkt)
+        else:
+            view = memoryview(self.__c_pkt).cast('B')
+        for start, end in ranges:
+            if start < fixed:
+                buf[offset + start:offset + end] = view[start:end]
+            else:
+                buf[offset + start:offset + end] = _join(self._var_parts())
+        self.clear_changes()
+        return ranges
+
+    def _var_span(self, index):
+        """returns the (start, end) of the variable field at index within the tail"""
+        spans = self._var_spans
+        if spans is None:
+            spans = self._var_spans = []
+        # only the fields up to index are measured, and each of them only once
+        while len(spans) <= index:
+            pos = spans[-1][1] if spans else 0
+            spans.append(self._var_fields[len(spans)].measure(self, self._var_tail, pos))
+        return spans[index]
+
+    def _get_var_field(self, field):
+        values = self._var_values
+        if values is not None:
+            return values[field.field_name]
+        if self._var_tail is None:
+            return field.empty()
+        if not field.memoize:
+            start, end = self._var_span(field.var_index)
+            return field.decode(self, self._var_tail[start:end])
+
+        cache = self._var_cache
+        if cache is None:
+            cache = self._var_cache = {}
+        try:
+            return cache[field.field_name]
+        except KeyError:
+            start, end = self._var_span(field.var_index)
+            val = cache[field.field_name] = field.decode(self, self._var_tail[start:end])
+            return val
+
+    def _set_var_field(self, field, val):
+        # Once a variable field changes, the offsets of the following ones are meaningless, so
+        #   every value is decoded and the packet is re-encoded from the values from then on.
+        if self._var_values is None:
+            values = dict(
+                (each.field_name, self._get_var_field(each)) for each in self._var_fields
+            )
+            self._var_values = values
+            self._var_tail = None
+            self._var_spans = None
+            self._var_cache = None
+            if not self.__c_pkt._b_needsfree_:
+                # The packet was created with from_buffer: the new values don't fit the record
+                #   in the buffer, so the fixed size part is detached from it as well, leaving the
+                #   record (i.e. its length fields) untouched.
+                self.__c_pkt = self.__c_struct.from_buffer_copy(self.__c_pkt)
+                self.__view = None
+        self._var_values[field.field_name] = field.prepare(self, val)
+
+    def _var_parts(self):
+        """returns a list of the bytes-like encodings of the variable length fields"""
+        values = self._var_values
+        if values is None:
+            if self._var_tail is not None:
+                return [self._var_tail[:self._var_span(len(self._var_fields) - 1)[1]]]
+            values = {}
+        return [
+            field.to_bytes(self, values.get(field.field_name, field.empty()))
+            for field in self._var_fields
+        ]
 
     def get_c_field(self, field_name):
         """
@@ -244,7 +925,159 @@ class Packet(object):
         return f_string.format(name=self.__class__.__name__, fields=vals_string)
 
     def __len__(self):
-        return ctypes.sizeof(self.__c_struct)
+        size = ctypes.sizeof(self.__c_struct)
+        if self._var_fields:
+            if self._var_values is None and self._var_tail is not None:
+                size += self._var_span(len(self._var_fields) - 1)[1]
+            else:
+                size += sum(len(part) for part in self._var_parts())
+        return size
+
+
+if PY2:  # pragma: no cover
+    def _join(parts):
+        # python 2's bytes.join doesn't take memoryviews (i.e. a payload)
+        return b''.join(
+            part.tobytes() if isinstance(part, memoryview) else part for part in parts
+        )
+else:
+    _join = b''.join
+
+
+def _c_bytes(c_pkt):
+    """returns a copy of the bytes of a c structure"""
+    return ctypes.string_at(ctypes.addressof(c_pkt), ctypes.sizeof(c_pkt))
+
+
+def _cached_from_bytes(owner):
+    """returns the :code:`from_bytes` of a packet class with a decode cache"""
+    def from_bytes(cls, buf):
+        cache = owner.__dict__['_decode_cache']
+        if cls is owner:
+            return cache.get(cls, buf)
+        # subclasses of the class owning the cache (including those reaching it through super()
+        #   from their own from_bytes) decode without it
+        return cache.decode(cls, buf)
+    from_bytes.__doc__ = Packet.from_bytes.__doc__
+    return from_bytes
+
+
+def _unpickle_packet(cls, data, frozen=False):
+    """restores a pickled packet, copying its bytes into a new c structure in one step"""
+    if cls._var_fields:
+        pkt = cls.from_bytes(data if isinstance(data, bytes) else bytes(data))
+    else:
+        pkt = cls(cls._Packet__c_struct.from_buffer_copy(data))
+    return pkt.frozen() if frozen else pkt
+
+
+def _frozen_set(self, *args):
+    raise FrozenPacketError("{} is frozen and can't be modified".format(type(self).__name__))
+
+
+def _frozen_hash(self):
+    content_hash = self.__dict__.get('_content_hash')
+    if content_hash is None:
+        content_hash = self.__dict__['_content_hash'] = hash(self.to_bytes())
+    return content_hash
+
+
+def _frozen_eq(self, other):
+    # frozen packets compare with packets of the mutable class as well
+    if not isinstance(other, self._mutable_cls):
+        return False
+    if other._uncached_cls is not None:
+        # cached packets aren't instances of the frozen class either
+        return _cached_eq(other, self)
+    return Packet.__eq__(other, self)
+
+
+def _frozen_class(cls):
+    """returns the (cached) frozen variant of a packet class"""
+    if cls._mutable_cls is not None:
+        return cls
+    frozen_cls = cls.__dict__.get('_frozen_cls')
+    if frozen_cls is None:
+        # type.__new__ is used directly so the fields and c structure are inherited as-is
+        frozen_cls = type.__new__(type(cls), 'Frozen' + cls.__name__, (cls,), {
+            '__module__': cls.__module__,
+            '__doc__': "A frozen, hashable {}".format(cls.__name__),
+            '_mutable_cls': cls,
+            'set_c_field': _frozen_set,
+            '_set_var_field': _frozen_set,
+            '__eq__': _frozen_eq,
+            '__hash__': _frozen_hash,
+        })
+        cls._frozen_cls = frozen_cls
+    return frozen_cls
+
+
+class _CachedField(object):
+    """
+    Wraps a field of a cached packet class, caching the values it converts in the packet's
+    :code:`_value_cache`.  Setting the field goes through :code:`set_c_field`, which invalidates
+    the cached value.
+    """
+    def __init__(self, field):
+        self.field = field
+        self.field_name = field.field_name
+
+    def __getattr__(self, name):
+        return getattr(self.field, name)
+
+    def __get__(self, instance, cls):
+        if instance is None:
+            return self.field
+        cache = instance.__dict__.get('_value_cache')
+        if cache is None:
+            cache = instance.__dict__['_value_cache'] = {}
+        try:
+            return cache[self.field_name]
+        except KeyError:
+            val = cache[self.field_name] = self.field.__get__(instance, cls)
+            return val
+
+    def __set__(self, instance, val):
+        self.field.__set__(instance, val)
+
+
+def _cached_set(self, field_name, val):
+    self._uncached_cls.set_c_field(self, field_name, val)
+    cache = self.__dict__.get('_value_cache')
+    if cache:
+        cache.pop(field_name, None)
+
+
+def _cached_eq(self, other):
+    # cached packets compare with packets of the uncached (and mutable) class as well
+    base = self._uncached_cls._mutable_cls or self._uncached_cls
+    if not isinstance(other, base):
+        return False
+    return Packet.to_bytes(self) == Packet.to_bytes(other)
+
+
+def _cached_class(cls):
+    """returns the (cached) variant of a packet class caching the values of its fields"""
+    if cls._uncached_cls is not None:
+        return cls
+    cached_cls = cls.__dict__.get('_cached_cls')
+    if cached_cls is None:
+        clsdict = {
+            '__module__': cls.__module__,
+            '__doc__': "A {} caching the values of its fields".format(cls.__name__),
+            '_uncached_cls': cls,
+            'set_c_field': _cached_set,
+            '__eq__': _cached_eq,
+            '__hash__': cls.__hash__,
+        }
+        for name in cls.fields_order:
+            field = getattr(cls, name)
+            if isinstance(field, Field) and not isinstance(field, VarField):
+                clsdict[name] = _CachedField(field)
+        # type.__new__ is used directly so the fields and c structure are inherited as-is
+        cached_cls = type.__new__(type(cls), 'Cached' + cls.__name__, (cls,), clsdict)
+        cls._cached_cls = cached_cls
+    return cached_cls
 
 
 class PacketBigEndian(Packet):
@@ -0,0 +1,289 @@
+"""
+Aggregations of a field over buffers and files of fixed size packet records.
+
+:code:`aggregate` computes reductions (count, sum, min, max, mean, histogram and distinct count)
+of a field across every record, optionally grouped by the values of another field, i.e. the bytes
+sent to every destination port.  The fields are read as columns (see :code:`read_columns`) at the
+offsets precomputed in the packet's layout, so no :code:`Packet` is ever created.  With NumPy the
+reductions are vectorized over the columns; without NumPy they fall back to python loops over
+:code:`array.array` columns.
+
+Example::
+
+    totals = aggregate(UDP_HEADER_BIG, 'udp_headers.bin', 'length', 'sum', by='dest_port')
+    stats = aggregate(UDP_HEADER_BIG, 'udp_headers.bin', 'length', ['min', 'max', 'mean'])
+"""
+import bisect
+from collections import Counter, OrderedDict
+
+from calpack.models.layout import get_layout
+from calpack.records import columns
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+__all__ = ['aggregate', 'AGGREGATIONS']
+
+
+AGGREGATIONS = ('count', 'sum', 'min', 'max', 'mean', 'histogram', 'distinct')
+
+# Integer group keys spanning at most this many values (or the number of records) are counted
+# directly by value, instead of being sorted
+_DENSE_KEYS = 1 << 20
+
+
+def _python_reduce(func, values, bins):
+    if func == 'count':
+        return len(values)
+    if func == 'sum':
+        return sum(values)
+    if func == 'distinct':
+        return len(set(values))
+    if func == 'histogram':
+        if bins is None:
+            return OrderedDict(sorted(Counter(values).items()))
+        counts = [0] * (len(bins) - 1)
+        last = len(bins) - 2
+        for val in values:
+            # bins are half open, except the last one which includes its upper edge
+            i = bisect.bisect_right(bins, val) - 1
+            if i > last and val == bins[-1]:
+                i = last
+            if 0 <= i <= last:
+                counts[i] += 1
+        return counts
+    if not len(values):
+        return None
+    if func == 'min':
+        return min(values)
+    if func == 'max':
+        return max(values)
+    return sum(values) / float(len(values))
+
+
+def _python_aggregate(funcs, values, keys, bins):
+    if keys is None:
+        return OrderedDict((func, _python_reduce(func, values, bins)) for func in funcs)
+
+    groups = {}
+    for key, val in zip(keys, values):
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = []
+        group.append(val)
+    return OrderedDict(
+        (key, OrderedDict((func, _python_reduce(func, groups[key], bins)) for func in funcs))
+        for key in sorted(groups)
+    )
+
+
+def _value_counts(values):
+    """the distinct values of a NumPy column, sorted, and how many times they occur"""
+    if values.dtype.kind in 'iu' and len(values):
+        low, high = int(values.min()), int(values.max())
+        if high - low < max(_DENSE_KEYS, len(values)):
+            counts = numpy.bincount((values - low).astype(numpy.intp))
+            present = numpy.flatnonzero(counts)
+            return (present + low).astype(values.dtype), counts[present]
+    return numpy.unique(values, return_counts=True)
+
+
+def _numpy_reduce(func, values, bins):
+    if func == 'count':
+        return len(values)
+    if func == 'sum':
+        return values.sum().item()
+    if func == 'distinct':
+        return len(_value_counts(values)[0])
+    if func == 'histogram':
+        if bins is None:
+            uniques, counts = _value_counts(values)
+            return OrderedDict(zip(uniques.tolist(), counts.tolist()))
+        return numpy.histogram(values, bins)[0].tolist()
+    if not len(values):
+        return None
+    if func == 'min':
+        return values.min().item()
+    if func == 'max':
+        return values.max().item()
+    return values.mean().item()
+
+
+class _Groups(object):
+    """The group of every record of a NumPy key column, numbered from 0 in key order"""
+    def __init__(self, keys):
+        uniques = None
+        if keys.dtype.kind in 'iu' and len(keys):
+            low, high = int(keys.min()), int(keys.max())
+            if high - low < max(_DENSE_KEYS, len(keys)):
+                # Number the groups with a lookup table of the key values, no sort needed
+                offsets = (keys - low).astype(numpy.intp)
+                present = numpy.bincount(offsets) > 0
+                numbers = numpy.cumsum(present) - 1
+                uniques = (numpy.flatnonzero(present) + low).astype(keys.dtype)
+                self.index = numbers[offsets]
+        if uniques is None:
+            uniques, self.index = numpy.unique(keys, return_inverse=True)
+            self.index = self.index.ravel()
+        self.keys = uniques.tolist()
+        self.size = len(uniques)
+        self._order = None
+
+    @property
+    def order(self):
+        """the records sorted by group, and the position of the first record of every group"""
+        if self._order is None:
+            order = numpy.argsort(self.index, kind='stable')
+            starts = numpy.searchsorted(self.index[order], numpy.arange(self.size))
+            self._order = order, starts
+        return self._order
+
+    def counts(self):
+        return numpy.bincount(self.index, minlength=self.size)
+
+    def sums(self, values):
+        if values.dtype.kind == 'f':
+            return numpy.bincount(self.index, values, self.size)
+        if len(values) and max(-int(values.min()), int(values.max())) * len(values) < 1 << 53:
+            # the sums are small enough to be exact as doubles, which avoid sorting the records
+            return numpy.bincount(self.index, values, self.size).astype(numpy.int64)
+        # larger integer sums are accumulated exactly, in 64 bits
+        order, starts = self.order
+        return numpy.add.reduceat(values[order], starts, dtype=values.dtype.kind + '8')
+
+    def reduce(self, ufunc, values):
+        order, starts = self.order
+        return ufunc.reduceat(values[order], starts)
+
+    def distinct_pairs(self, values):
+        """the group, value and number of records of every distinct (group, value) pair"""
+        order = numpy.lexsort((values, self.index))
+        index, values = self.index[order], values[order]
+        first = numpy.ones(len(index), dtype=bool)
+        first[1:] = (index[1:] != index[:-1]) | (values[1:] != values[:-1])
+        starts = numpy.flatnonzero(first)
+        return index[starts], values[starts], numpy.diff(numpy.append(starts, len(index)))
+
+
+def _numpy_grouped(func, values, groups, bins):
+    counts = groups.counts()
+    if func == 'count':
+        return counts.tolist()
+    if func == 'sum':
+        return groups.sums(values).tolist()
+    if func == 'mean':
+        return (groups.sums(values) / counts).tolist()
+    if func == 'min':
+        return groups.reduce(numpy.minimum, values).tolist()
+    if func == 'max':
+        return groups.reduce(numpy.maximum, values).tolist()
+    if func == 'histogram' and bins is not None:
+        bins = numpy.asarray(bins)
+        nbins = len(bins) - 1
+        slots = numpy.searchsorted(bins, values, side='right') - 1
+        slots[values == bins[-1]] = nbins - 1
+        valid = (slots >= 0) & (slots < nbins)
+        hist = numpy.bincount(
+            groups.index[valid] * nbins + slots[valid], minlength=groups.size * nbins
+        )
+        return hist.reshape(groups.size, nbins).tolist()
+
+    index, uniques, pair_counts = groups.distinct_pairs(values)
+    if func == 'distinct':
+        return numpy.bincount(index, minlength=groups.size).tolist()
+    hists = [OrderedDict() for _ in range(groups.size)]
+    for group, val, num in zip(index.tolist(), uniques.tolist(), pair_counts.tolist()):
+        hists[group][val] = num
+    return hists
+
+
+def _numpy_aggregate(funcs, values, keys, bins):
+    if keys is None:
+        return OrderedDict((func, _numpy_reduce(func, values, bins)) for func in funcs)
+
+    groups = _Groups(keys)
+    results = OrderedDict((key, OrderedDict()) for key in groups.keys)
+    for func in funcs:
+        for key, val in zip(groups.keys, _numpy_grouped(func, values, groups, bins)):
+            results[key][func] = val
+    return results
+
+
+def aggregate(packet_cls, source, field, funcs, by=None, bins=None, offset=0, stride=None,
+              count=None):
+    """
+    Aggregates a field across every record of a buffer or file of records.
+
+    :param packet_cls: the :code:`Packet` class of the records
+    :param source: a :code:`PacketTable`, the path of a file of records or a bytes-like object
+    :param str field: the (dotted) name of the int, bool or float field to aggregate.  The items
+        of an array field are aggregated together.
+    :param funcs: an aggregation, or a list of aggregations, out of :code:`AGGREGATIONS`:
+
+        * :code:`count`: the number of values
+        * :code:`sum`, :code:`min`, :code:`max` and :code:`mean`: the sum, minimum, maximum and
+          mean of the values (the minimum, maximum and mean of no values are None)
+        * :code:`histogram`: with :code:`bins`, the number of values in each bin.  Without
+          :code:`bins`, an :code:`OrderedDict` of every distinct value to the number of times
+          it occurs, in value order
+        * :code:`distinct`: the number of distinct values
+
+    :param str by: the (dotted) name of an int, bool or float field to group the records by
+        (default no grouping)
+    :param bins: the increasing edges of the histogram's bins.  Every bin includes its lower
+        edge, and the last bin also includes its upper edge (like :code:`numpy.histogram`).
+    :param int offset: the byte offset of the first record in a file or buffer (default 0)
+    :param int stride: the distance in bytes between records (default the packet size)
+    :param int count: the number of records (default as many as fit)
+    :return: the result of the aggregation, or an :code:`OrderedDict` of every aggregation to its
+        result when :code:`funcs` is a list.  When grouped, an :code:`OrderedDict` of every value
+        of the :code:`by` field (in value order) to the group's result(s).  Integer sums are
+        computed in 64 bits with NumPy.
+    :raises ValueError: if an aggregation is unknown
+    :raises TypeError: if a field can't be aggregated
+    """
+    single = isinstance(funcs, str)
+    if single:
+        funcs = [funcs]
+    for func in funcs:
+        if func not in AGGREGATIONS:
+            raise ValueError("Unknown aggregation {f!r}, expected one of {a}".format(
+                f=func, a=', '.join(AGGREGATIONS)
+            ))
+    if 'histogram' in funcs and bins is not None and len(bins) < 2:
+        raise ValueError("A histogram needs at least 2 bin edges")
+
+    layout = get_layout(packet_cls)
+    items = layout[field].count
+    if by is not None and layout[by].count > 1:
+        raise TypeError("{} is an array field, records can't be grouped by it".format(by))
+
+    names = [field] if by is None else [field, by]
+    cols = columns.read_columns(packet_cls, source, names, offset, stride, count)
+    values = cols[field]
+    keys = cols[by] if by is not None else None
+
+    if numpy is not None:
+        # bool columns are aggregated as 0 and 1, like without NumPy
+        if values.dtype.kind == 'b':
+            values = values.view(numpy.uint8)
+        if keys is not None and keys.dtype.kind == 'b':
+            keys = keys.view(numpy.uint8)
+        if items > 1:
+            values = values.ravel()
+            if keys is not None:
+                keys = numpy.repeat(keys, items)
+        results = _numpy_aggregate(funcs, values, keys, bins)
+    else:
+        if items > 1 and keys is not None:
+            keys = [key for key in keys for _ in range(items)]
+        results = _python_aggregate(funcs, values, keys, bins)
+
+    if not single:
+        return results
+    if by is None:
+        return results[funcs[0]]
+    return OrderedDict((key, result[funcs[0]]) for key, result in results.items())
@@ -0,0 +1,239 @@
+"""
+Column projected scans of buffers and files of fixed size packet records.
+
+:code:`read_columns` decodes only the requested fields of every record, as one column per field,
+without ever creating a :code:`Packet` (or any other per record object).  Every field is read
+with a single strided pass over the records at the offset precomputed in the packet's
+:code:`PacketLayout`.  With NumPy the columns are NumPy arrays read through strided views of the
+buffer, and bit fields are extracted with vectorized shifts and masks.  Without NumPy the columns
+are :code:`array.array` objects, whose bytes are gathered with strided slices of the buffer.
+
+Example::
+
+    cols = read_columns(TCP_HEADER_BIG, 'tcp_headers.bin', ['dest_port', 'flag_syn'])
+    syn_ports = cols['dest_port'][cols['flag_syn'] == 1]
+"""
+import array
+import mmap
+import sys
+from collections import OrderedDict
+
+from calpack.models.layout import get_layout, NATIVE_BYTE_ORDER
+from calpack.records.table import PacketTable, TABLE_HEADER_SIZE
+from calpack.utils import PY2
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+__all__ = ['read_columns', 'read_column', 'open_records']
+
+
+# array.array type codes by item size, as the sizes of 'l' and 'i' vary between platforms (and
+#   'q' / 'Q' only exist from python 3.3)
+_ARRAY_CODES = {}
+for _code in 'bBhHiIlL' + ('qQ' if sys.version_info >= (3, 3) else ''):
+    _ARRAY_CODES.setdefault((array.array(_code).itemsize, _code.islower()), _code)
+_ARRAY_CODES[(4, 'f')] = 'f'
+_ARRAY_CODES[(8, 'f')] = 'd'
+
+
+if PY2:  # pragma: no cover
+    # python 2's memoryview has no nbytes or cast, and doesn't support mmap or buffer objects,
+    #   which are sliced directly instead
+    def _nbytes(source):
+        try:
+            view = memoryview(source)
+        except TypeError:
+            return len(source)
+        return len(view) * view.itemsize
+
+    def _byte_view(buf):
+        return buf
+else:
+    def _nbytes(source):
+        return memoryview(source).nbytes
+
+    def _byte_view(buf):
+        return memoryview(buf).cast('B')
+
+
+class _Records(object):
+    """A buffer of records, along with where they are and what to close once they're read"""
+    def __init__(self, buf, offset, stride, count, closer=None):
+        self.buf = buf
+        self.offset = offset
+        self.stride = stride
+        self.count = count
+        self._closer = closer
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.buf = None
+        if self._closer is not None:
+            self._closer()
+
+
+def open_records(packet_cls, source, offset=0, stride=None, count=None):
+    """
+    Locates the records of a source for a scan.  Used as a context manager, which closes any
+    file opened for a path.
+
+    :param packet_cls: the :code:`Packet` class of the records
+    :param source: a :code:`PacketTable`, the path of a file of records or a bytes-like object.
+        On python 2, where bytes are str, a str is always a path (pass records as a
+        :code:`bytearray`, :code:`buffer` or :code:`memoryview`).
+    :param int offset: the byte offset of the first record in a file or buffer (default 0)
+    :param int stride: the distance in bytes between records (default the packet size)
+    :param int count: the number of records (default as many as fit)
+    :return: an object with the :code:`buf`, :code:`offset`, :code:`stride` and :code:`count`
+        of the records
+    """
+    size = get_layout(packet_cls).size
+    closer = None
+    if isinstance(source, PacketTable):
+        buf, offset, stride, available = source._map, TABLE_HEADER_SIZE, size, len(source)
+        nbytes = None
+    elif isinstance(source, str):
+        with open(source, 'rb') as file_obj:
+            try:
+                buf = mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+                if hasattr(buf, 'madvise'):
+                    buf.madvise(mmap.MADV_SEQUENTIAL)
+                closer = buf.close
+            except ValueError:
+                # mmap refuses empty files
+                buf = b''
+        nbytes = len(buf)
+    else:
+        buf = source
+        nbytes = _nbytes(source)
+
+    if stride is None:
+        stride = size
+    if nbytes is not None:
+        available = nbytes - offset
+        available = 0 if available < size else (available - size) // stride + 1
+    if count is None or count > available:
+        count = available
+    return _Records(buf, offset, stride, count, closer)
+
+
+def _array_code(field, signed):
+    item_size = field.size // field.count
+    if field.kind == 'float':
+        return _ARRAY_CODES[(item_size, 'f')]
+    return _ARRAY_CODES[(item_size, signed)]
+
+
+def _numpy_column(field, buf, base, count, stride):
+    shape, strides = (count,), (stride,)
+    if field.count > 1:
+        shape, strides = (count, field.count), (stride, field.size // field.count)
+    view = numpy.ndarray(
+        shape, numpy.dtype(field.byte_order + field.fmt), buffer=buf, offset=base + field.offset,
+        strides=strides
+    )
+    # a contiguous copy in native byte order, so the column doesn't keep the records alive
+    col = view.astype(view.dtype.newbyteorder('='))
+    if field.bit_len is None:
+        return col
+
+    col >>= field.bit_offset
+    col &= field.mask
+    if field.signed:
+        col = col.astype(col.dtype.str.replace('u', 'i'))
+        col -= (col >> (field.bit_len - 1)) << field.bit_len
+    return col
+
+
+def _array_column(field, buf, base, count, stride):
+    if count == 0:
+        return array.array(_array_code(field, field.signed))
+    item_size = field.size // field.count
+    # bit fields are read as unsigned storage units and sign extended afterwards
+    code = _array_code(field, field.signed and field.bit_len is None)
+
+    # Gather the field's bytes out of every record with one strided slice per byte of the field
+    view = _byte_view(buf)
+    start = base + field.offset
+    end = base + (count - 1) * stride + field.offset + 1
+    raw = bytearray(count * field.size)
+    for j in range(field.size):
+        raw[j::field.size] = view[start + j:end + j:stride]
+    if not PY2:
+        view.release()
+
+    col = array.array(code)
+    if PY2:  # pragma: no cover
+        col.fromstring(bytes(raw))
+    else:
+        col.frombytes(bytes(raw))
+    if field.byte_order != NATIVE_BYTE_ORDER and item_size > 1:
+        col.byteswap()
+    if field.bit_len is None:
+        return col
+
+    shift, mask = field.bit_offset, field.mask
+    if field.signed:
+        sign, span = 1 << (field.bit_len - 1), 1 << field.bit_len
+        return array.array(_array_code(field, True), [
+            val - span if val & sign else val for val in ((unit >> shift) & mask for unit in col)
+        ])
+    return array.array(code, [(unit >> shift) & mask for unit in col])
+
+
+def read_columns(packet_cls, source, fields, offset=0, stride=None, count=None):
+    """
+    Decodes some fields of every record of a buffer or file of records, as columns.
+
+    :param packet_cls: the :code:`Packet` class of the records
+    :param source: a :code:`PacketTable`, the path of a file of records or a bytes-like object
+    :param fields: the (dotted) names of the fields to decode.  Fields are int, bool or float
+        fields (including bit fields) or arrays of them.
+    :param int offset: the byte offset of the first record in a file or buffer (default 0)
+    :param int stride: the distance in bytes between records (default the packet size)
+    :param int count: the number of records (default as many as fit)
+    :return: an :code:`OrderedDict` of field names to columns.  Columns are NumPy arrays in
+        native byte order when NumPy is available, otherwise :code:`array.array` objects (bool
+        fields decode to 0 and 1).  Array fields decode to 2 dimensional NumPy arrays, or flat
+        :code:`array.array` objects of all of the items one record after the other.
+    :raises KeyError: if a field doesn't exist
+    :raises TypeError: if a field can't be decoded into a column
+    """
+    if isinstance(fields, str):
+        fields = [fields]
+    layout = get_layout(packet_cls)
+    field_layouts = [layout[name] for name in fields]
+    for field in field_layouts:
+        if field.kind not in ('int', 'bool', 'float', 'array') or field.fmt is None:
+            raise TypeError("{f} is a {k} field, it can't be decoded into a column".format(
+                f=field.name, k=field.kind
+            ))
+
+    columns = OrderedDict()
+    with open_records(packet_cls, source, offset, stride, count) as records:
+        decode = _numpy_column if numpy is not None else _array_column
+        buf, base, stride = records.buf, records.offset, records.stride
+        if records.count == 0:
+            # empty columns of the right type, from a placeholder record
+            buf, base, stride = bytearray(layout.size), 0, layout.size
+        for name, field in zip(fields, field_layouts):
+            columns[name] = decode(field, buf, base, records.count, stride)
+    return columns
+
+
+def read_column(packet_cls, source, field, offset=0, stride=None, count=None):
+    """
+    Decodes a single field of every record as a column (see :code:`read_columns`).
+
+    :param packet_cls: the :code:`Packet` class of the records
+    :param source: a :code:`PacketTable`, the path of a file of records or a bytes-like object
+    :param str field: the (dotted) name of the field
+    :rtype: numpy.ndarray or array.array
+    """
+    return read_columns(packet_cls, source, [field], offset, stride, count)[field]
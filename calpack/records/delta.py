@@ -0,0 +1,334 @@
+"""
+Delta encoding of streams of packets of the same class.
+
+Consecutive samples of telemetry packets mostly repeat the fields of the previous sample.  A
+:code:`DeltaEncoder` encodes every packet against the previous one as a bitmap of the fields that
+changed followed by only the changed fields: integer fields (including the storage units of bit
+fields and the items of integer arrays) as the zigzag varint of their difference with the
+previous value, so counters and slowly varying values take a byte or two, and other fields as
+their raw bytes.  An unchanged packet takes only its bitmap.  The first packet (and the first
+after a :code:`reset`) is encoded against a packet of zeros.
+
+A :code:`DeltaDecoder` of the same packet class rebuilds the packets' exact bytes.  Both sides
+keep the previous packet, so a stream must be decoded in order, from its start (or from a point
+where both sides were :code:`reset`).
+
+Example::
+
+    encoder = DeltaEncoder(TELEMETRY)
+    link.send(encoder.encode(sample))
+
+    decoder = DeltaDecoder(TELEMETRY)
+    sample = TELEMETRY.from_bytes(decoder.decode(link.receive())[0])
+"""
+import struct
+
+from calpack.models.layout import get_layout
+from calpack.records.columns import open_records
+from calpack.utils import PY2, DeltaFormatError
+
+
+__all__ = ['DeltaEncoder', 'DeltaDecoder', 'delta_encode', 'delta_decode']
+
+
+_UNIT_FORMATS = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+
+if PY2:  # pragma: no cover
+    import binascii
+
+    def _bitmap_to_bytes(bitmap, size):
+        return binascii.unhexlify('{:0{}x}'.format(bitmap, size * 2))[::-1]
+
+    def _bitmap_from_bytes(data):
+        return int(binascii.hexlify(bytes(data)[::-1]) or '0', 16)
+
+    def _record_bytes(data):
+        return data.tobytes() if isinstance(data, memoryview) else bytes(data)
+
+    # indexing python 2's str gives characters, and its memoryview has no cast
+    _octets = bytearray
+else:
+    def _bitmap_to_bytes(bitmap, size):
+        return bitmap.to_bytes(size, 'little')
+
+    def _bitmap_from_bytes(data):
+        return int.from_bytes(data, 'little')
+
+    _record_bytes = bytes
+
+    def _octets(data):
+        return memoryview(data).cast('B')
+
+
+def _leaf_fields(layout, base=0):
+    """yields the (offset, size, is_int) of every field's storage, recursing into packets"""
+    for field in layout:
+        offset = base + field.offset
+        if field.kind == 'packet':
+            for leaf in _leaf_fields(field.layout, offset):
+                yield leaf
+        elif field.kind == 'array' and field.fmt is not None and field.fmt in 'bBhHiIlLqQ':
+            item_size = field.size // field.count
+            for i in range(field.count):
+                yield offset + i * item_size, item_size, True
+        else:
+            is_int = field.kind in ('int', 'bool') and field.size in _UNIT_FORMATS
+            yield offset, field.size, is_int
+
+
+def _segments(layout):
+    """
+    Splits a packet's bytes into the segments tracked by the bitmap: one per storage unit (bit
+    fields sharing a unit share its segment), and one per gap of padding between them.
+    """
+    units = {}
+    for offset, size, is_int in _leaf_fields(layout):
+        units.setdefault(offset, (size, is_int))
+
+    spans = []
+    pos = 0
+    for offset in sorted(units):
+        size, is_int = units[offset]
+        if offset < pos:
+            # overlapping storage is tracked as raw bytes along with the previous segment
+            start, end, _ = spans[-1]
+            spans[-1] = (start, max(end, offset + size), False)
+        else:
+            if offset > pos:
+                spans.append((pos, offset, False))
+            spans.append((offset, offset + size, is_int))
+        pos = max(pos, offset + size)
+    if layout.size > pos:
+        spans.append((pos, layout.size, False))
+
+    segments = []
+    for index, (start, end, is_int) in enumerate(spans):
+        unit = None
+        if is_int:
+            unit = struct.Struct(layout.byte_order + _UNIT_FORMATS[end - start])
+        segments.append((1 << index, start, end, unit, (end - start) * 8))
+    return segments
+
+
+class _DeltaCodec(object):
+    def __init__(self, packet_cls):
+        if packet_cls._var_fields:
+            raise TypeError("{} has variable length fields, it can't be delta encoded".format(
+                packet_cls.__name__
+            ))
+        layout = get_layout(packet_cls)
+        self.packet_cls = packet_cls
+        self.record_size = layout.size
+        self._segments = _segments(layout)
+        self._bitmap_size = (len(self._segments) + 7) // 8
+        self.reset()
+
+    def reset(self):
+        """Forgets the previous packet, the next one is encoded against a packet of zeros"""
+        self._previous = b'\x00' * self.record_size
+
+
+class DeltaEncoder(_DeltaCodec):
+    """
+    Encodes packets as the differences with the previous packet encoded.
+
+    :param packet_cls: the :code:`Packet` class (without variable length fields)
+    """
+    def _encode_into(self, raw, out):
+        previous = self._previous
+        if raw == previous:
+            out += b'\x00' * self._bitmap_size
+            return
+
+        bitmap = 0
+        payload = bytearray()
+        for bit, start, end, unit, bits in self._segments:
+            if unit is None:
+                new = raw[start:end]
+                if new != previous[start:end]:
+                    bitmap |= bit
+                    payload += new
+                continue
+
+            new = unit.unpack_from(raw, start)[0]
+            old = unit.unpack_from(previous, start)[0]
+            if new == old:
+                continue
+            bitmap |= bit
+            # the wrapped difference, as a signed value zigzag encoded into an unsigned varint
+            diff = (new - old) & ((1 << bits) - 1)
+            if diff >> (bits - 1):
+                diff -= 1 << bits
+            diff = diff << 1 if diff >= 0 else (-diff << 1) - 1
+            while diff > 0x7f:
+                payload.append((diff & 0x7f) | 0x80)
+                diff >>= 7
+            payload.append(diff)
+
+        out += _bitmap_to_bytes(bitmap, self._bitmap_size)
+        out += payload
+        self._previous = raw
+
+    def encode(self, pkt):
+        """
+        Encodes the next packet of the stream.
+
+        :param pkt: a packet of the encoder's class, or its raw bytes
+        :rtype: bytes
+        """
+        raw = pkt.to_bytes() if isinstance(pkt, self.packet_cls) else _record_bytes(pkt)
+        if len(raw) != self.record_size:
+            raise ValueError("Expected a {c} record of {s} bytes, got {n} bytes".format(
+                c=self.packet_cls.__name__, s=self.record_size, n=len(raw)
+            ))
+        out = bytearray()
+        self._encode_into(raw, out)
+        return bytes(out)
+
+    def encode_records(self, source, offset=0, stride=None, count=None):
+        """
+        Encodes the next records of the stream from a buffer or file of records.
+
+        :param source: a :code:`PacketTable`, the path of a file of records or a bytes-like object
+        :param int offset: the byte offset of the first record in a file or buffer (default 0)
+        :param int stride: the distance in bytes between records (default the packet size)
+        :param int count: the number of records (default as many as fit)
+        :return: the encoded records, one after the other
+        :rtype: bytes
+        """
+        out = bytearray()
+        size = self.record_size
+        with open_records(self.packet_cls, source, offset, stride, count) as records:
+            if PY2:  # pragma: no cover
+                view = records.buf
+            else:
+                view = memoryview(records.buf).cast('B')
+            start = records.offset
+            for _ in range(records.count):
+                self._encode_into(_record_bytes(view[start:start + size]), out)
+                start += records.stride
+            if not PY2:
+                view.release()
+        return bytes(out)
+
+
+class DeltaDecoder(_DeltaCodec):
+    """
+    Decodes packets encoded by a :code:`DeltaEncoder` of the same packet class.
+
+    :param packet_cls: the :code:`Packet` class (without variable length fields)
+    """
+    def _decode_into(self, data, pos, record):
+        """decodes the record at :code:`pos` of :code:`data` into the bytearray :code:`record`"""
+        end = pos + self._bitmap_size
+        if end > len(data):
+            raise DeltaFormatError("The delta encoded stream is truncated")
+        bitmap = _bitmap_from_bytes(data[pos:end])
+        if bitmap >> len(self._segments):
+            raise DeltaFormatError("The delta encoded stream is corrupted (unknown fields changed)")
+        pos = end
+        record[:] = self._previous
+        if not bitmap:
+            return pos
+
+        try:
+            for bit, start, end, unit, bits in self._segments:
+                if not bitmap & bit:
+                    continue
+                if unit is None:
+                    if pos + end - start > len(data):
+                        raise IndexError
+                    record[start:end] = data[pos:pos + end - start]
+                    pos += end - start
+                    continue
+
+                diff = shift = 0
+                while True:
+                    byte = data[pos]
+                    pos += 1
+                    diff |= (byte & 0x7f) << shift
+                    if byte < 0x80:
+                        break
+                    shift += 7
+                    if shift >= bits:
+                        raise DeltaFormatError(
+                            "The delta encoded stream is corrupted (difference too long)"
+                        )
+                if diff >> bits:
+                    raise DeltaFormatError(
+                        "The delta encoded stream is corrupted (difference too large)"
+                    )
+                diff = diff >> 1 if not diff & 1 else -((diff + 1) >> 1)
+                old = unit.unpack_from(record, start)[0]
+                unit.pack_into(record, start, (old + diff) & ((1 << bits) - 1))
+        except IndexError:
+            raise DeltaFormatError("The delta encoded stream is truncated")
+        self._previous = bytes(record)
+        return pos
+
+    def decode(self, data, offset=0):
+        """
+        Decodes the next packet of the stream.
+
+        :param data: a bytes-like object holding the encoded packet
+        :param int offset: the position of the encoded packet within :code:`data` (default 0)
+        :return: the packet's raw bytes, and the position of the end of the encoded packet
+        :rtype: tuple
+        :raises DeltaFormatError: if the encoded packet is truncated or corrupted
+        """
+        record = bytearray(self.record_size)
+        pos = self._decode_into(_octets(data), offset, record)
+        return bytes(record), pos
+
+    def decode_records(self, data):
+        """
+        Decodes every packet of an encoded stream.
+
+        :param data: a bytes-like object holding the encoded packets
+        :return: the raw bytes of the packets, one after the other
+        :rtype: bytearray
+        :raises DeltaFormatError: if the stream is truncated or corrupted
+        """
+        data = bytearray(data) if PY2 else bytes(data)
+        out = bytearray()
+        record = bytearray(self.record_size)
+        pos, end = 0, len(data)
+        while pos < end:
+            pos = self._decode_into(data, pos, record)
+            out += record
+        return out
+
+    def decode_packets(self, data):
+        """
+        Decodes every packet of an encoded stream.
+
+        :param data: a bytes-like object holding the encoded packets
+        :return: the decoded packets
+        :rtype: list
+        """
+        records = self.decode_records(data)
+        from_buffer, size = self.packet_cls.from_buffer, self.record_size
+        return [from_buffer(records, i) for i in range(0, len(records), size)]
+
+
+def delta_encode(packet_cls, source, offset=0, stride=None, count=None):
+    """
+    Delta encodes a buffer or file of records as a new stream (see :code:`DeltaEncoder`).
+
+    :param packet_cls: the :code:`Packet` class of the records
+    :param source: a :code:`PacketTable`, the path of a file of records or a bytes-like object
+    :rtype: bytes
+    """
+    return DeltaEncoder(packet_cls).encode_records(source, offset, stride, count)
+
+
+def delta_decode(packet_cls, data):
+    """
+    Decodes a whole delta encoded stream into the raw bytes of its records.
+
+    :param packet_cls: the :code:`Packet` class of the records
+    :param data: a bytes-like object holding the stream
+    :rtype: bytearray
+    """
+    return DeltaDecoder(packet_cls).decode_records(data)
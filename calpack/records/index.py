@@ -0,0 +1,441 @@
+"""
+Hash indexes over buffers and files of fixed size packet records.
+
+A :code:`HashIndex` maps the value of one or more key fields (a device id, a sequence number, the
+5-tuple of a flow, ...) to the indices of the records holding it, so records are found without
+scanning.  Keys are read straight from the records at the fields' precomputed offsets (see
+:code:`calpack.models.layout`), and with NumPy the keys of all of the records are extracted,
+hashed and inserted as whole columns.
+
+The index is an open addressing table with linear probing, of 16 byte slots holding the 64 bit
+hash of a key and the index of its record.  It lives in a plain buffer, either in memory or in a
+memory mapped file, so a saved index is opened again without being rebuilt.  Keys don't need to
+be unique; hash collisions are resolved by comparing the keys of the records themselves.
+
+Example::
+
+    with PacketTable(FLOW_RECORD, 'flows.tbl') as flows:
+        index = HashIndex(FLOW_RECORD, ('src_addr', 'dst_addr', 'src_port', 'dst_port', 'proto'),
+                          flows, path='flows.idx')
+        for i in index.lookup((0x0a000001, 0x0a000002, 1234, 53, 17)):
+            print(flows[i])
+
+        index.append(FLOW_RECORD(...))   # appends to the table and indexes the new record
+"""
+import ctypes
+import hashlib
+import mmap
+import os
+import struct
+
+from calpack import models
+from calpack.models.layout import get_layout
+from calpack.records.columns import read_columns, _nbytes
+from calpack.records.table import PacketTable, TABLE_HEADER_SIZE
+from calpack.utils import TableFormatError
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+__all__ = ['HashIndex', 'INDEX_HEADER', 'INDEX_MAGIC', 'INDEX_HEADER_SIZE', 'hash_key']
+
+
+INDEX_MAGIC = 0x31584449504c4143  # "CALPIDX1"
+INDEX_VERSION = 1
+INDEX_HEADER_SIZE = 64
+SLOT_SIZE = 16
+
+_M64 = (1 << 64) - 1
+_GOLDEN = 0x9e3779b97f4a7c15
+_MIX1 = 0xbf58476d1ce4e5b9
+_MIX2 = 0x94d049bb133111eb
+
+
+class INDEX_HEADER(models.Packet):
+    """
+    INDEX HEADER class.  The header found at the start of every hash index file, followed by
+    :code:`capacity` slots.  This packet uses native byte ordering.
+    """
+    magic = models.IntField64()
+    version = models.IntField32()
+    record_size = models.IntField32()
+    capacity = models.IntField64()
+    count = models.IntField64()
+    indexed = models.IntField64()
+    fingerprint = models.IntField64()
+    key_fingerprint = models.IntField64()
+    reserved = models.IntField64()
+
+
+def _mix(x):
+    """the splitmix64 finalizer"""
+    x = ((x ^ (x >> 30)) * _MIX1) & _M64
+    x = ((x ^ (x >> 27)) * _MIX2) & _M64
+    return x ^ (x >> 31)
+
+
+def hash_key(values):
+    """
+    Returns the 64 bit hash of the values of a key, as stored in a :code:`HashIndex`.  The hash
+    is stable across processes and python versions.
+
+    :param values: the int (or bool) values of the key fields
+    :rtype: int
+    """
+    h = 0
+    for val in values:
+        h = _mix((h + _GOLDEN + (int(val) & _M64)) & _M64)
+    return h
+
+
+def _hash_columns(cols, count):
+    """the vectorized equivalent of hash_key over NumPy columns"""
+    h = numpy.zeros(count, dtype=numpy.uint64)
+    for col in cols:
+        if col.dtype != numpy.uint64:
+            col = col.astype(numpy.int64).view(numpy.uint64)
+        h = h + numpy.uint64(_GOLDEN) + col
+        h = (h ^ (h >> numpy.uint64(30))) * numpy.uint64(_MIX1)
+        h = (h ^ (h >> numpy.uint64(27))) * numpy.uint64(_MIX2)
+        h = h ^ (h >> numpy.uint64(31))
+    return h
+
+
+def _insert_columns(slots, hashes, refs, mask):
+    """
+    Inserts many entries into a NumPy view of the slots at once.  Every round the entries probing
+    an empty slot all write their record into it; the one whose write lands takes the slot and
+    every other entry moves on to the next slot.
+    """
+    pos = hashes & numpy.uint64(mask)
+    pending = numpy.arange(len(hashes))
+    placed = numpy.zeros(len(hashes), dtype=bool)
+    while pending.size:
+        probe = pos[pending]
+        empty = slots[probe, 1] == 0
+        candidates, probe = pending[empty], probe[empty]
+        slots[probe, 1] = refs[candidates]
+        won = slots[probe, 1] == refs[candidates]
+        winners = candidates[won]
+        slots[probe[won], 0] = hashes[winners]
+
+        placed[winners] = True
+        pending = pending[~placed[pending]]
+        pos[pending] = (pos[pending] + numpy.uint64(1)) & numpy.uint64(mask)
+
+
+class HashIndex(object):
+    """
+    A hash index mapping the values of key fields to the indices of the records holding them.
+    The records are indexed when the index is created (or, for a saved index, when the records
+    were appended since it was saved).  Call :code:`refresh` after appending records, or append
+    them through :code:`append`.
+
+    :param packet_cls: the :code:`Packet` class of the records
+    :param key: the name of the key field, or a tuple of names for a composite key.  Key fields
+        are int or bool fields (including bit fields and fields of encapsulated packets).
+    :param records: a :code:`PacketTable`, or a bytes-like object holding the records
+    :param str path: the path of the index file, which is opened when it exists and created
+        otherwise (default an index kept in memory)
+    :param int offset: the byte offset of the first record in :code:`records` (default 0)
+    :param int stride: the distance in bytes between records (default the packet size)
+    :param float load_factor: the highest fraction of used slots before the index grows
+        (default 0.5)
+    :raises TableFormatError: if the index file is malformed or indexes different records
+    """
+    def __init__(self, packet_cls, key, records, path=None, offset=0, stride=None,
+                 load_factor=0.5):
+        layout = get_layout(packet_cls)
+        self.packet_cls = packet_cls
+        self.key = key
+        self.key_names = (key,) if isinstance(key, str) else tuple(key)
+        self.key_fields = [layout[name] for name in self.key_names]
+        for field in self.key_fields:
+            if field.kind not in ('int', 'bool'):
+                raise TypeError("{} isn't an int or bool field".format(field.name))
+        self.records = records
+        self.record_size = layout.size
+        self.offset = offset
+        self.stride = layout.size if stride is None else stride
+        self.load_factor = load_factor
+        self.path = path
+
+        self._fingerprint = layout.fingerprint
+        digest = hashlib.sha1(",".join(self.key_names).encode('ascii')).digest()
+        self._key_fingerprint = struct.unpack('<Q', digest[:8])[0]
+
+        self._file = self._map = self._header = None
+        if path is not None and os.path.exists(path):
+            self._file = open(path, 'r+b')
+            self._map_file()
+            self._check_header()
+        else:
+            self._allocate(self._capacity_for(self._source()[2]))
+        self.refresh()
+
+    # Storage
+
+    def _capacity_for(self, count):
+        capacity = 64
+        while capacity * self.load_factor < count:
+            capacity *= 2
+        return capacity
+
+    def _allocate(self, capacity):
+        """creates empty storage of :code:`capacity` slots"""
+        size = INDEX_HEADER_SIZE + capacity * SLOT_SIZE
+        if self.path is None:
+            self._map = bytearray(size)
+        else:
+            if self._file is None:
+                self._file = open(self.path, 'w+b')
+            self._release()
+            self._file.truncate(0)
+            self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), size)
+
+        header = INDEX_HEADER.from_buffer(self._map)
+        header.magic = INDEX_MAGIC
+        header.version = INDEX_VERSION
+        header.record_size = self.record_size
+        header.capacity = capacity
+        header.fingerprint = self._fingerprint
+        header.key_fingerprint = self._key_fingerprint
+        del header
+        self._bind()
+
+    def _map_file(self):
+        size = os.fstat(self._file.fileno()).st_size
+        if size < INDEX_HEADER_SIZE:
+            raise TableFormatError("{} is too small to be a hash index".format(self.path))
+        self._map = mmap.mmap(self._file.fileno(), size)
+        if hasattr(self._map, 'madvise'):
+            self._map.madvise(mmap.MADV_RANDOM)
+        self._bind()
+
+    def _bind(self):
+        self._header = INDEX_HEADER.from_buffer(self._map)
+        capacity = self._header.capacity
+        if INDEX_HEADER_SIZE + capacity * SLOT_SIZE > len(self._map):
+            raise TableFormatError("{} is truncated".format(self.path))
+        self._mask = capacity - 1
+        self._slots = (ctypes.c_uint64 * (2 * capacity)).from_buffer(self._map, INDEX_HEADER_SIZE)
+
+    def _check_header(self):
+        header = self._header
+        if header.magic != INDEX_MAGIC or header.version != INDEX_VERSION:
+            raise TableFormatError("{} isn't a hash index".format(self.path))
+        if header.fingerprint != self._fingerprint or header.record_size != self.record_size:
+            raise TableFormatError("{p} indexes records of a different packet than {c}".format(
+                p=self.path, c=self.packet_cls.__name__
+            ))
+        if header.key_fingerprint != self._key_fingerprint:
+            raise TableFormatError("{p} isn't keyed on {k}".format(p=self.path, k=self.key_names))
+        if header.indexed > self._source()[2]:
+            raise TableFormatError("{} indexes more records than there are".format(self.path))
+
+    def _release(self):
+        self._header = self._slots = None
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._map = None
+
+    def _slot_array(self):
+        return numpy.frombuffer(
+            self._map, dtype=numpy.uint64, count=2 * self._header.capacity,
+            offset=INDEX_HEADER_SIZE
+        ).reshape(-1, 2)
+
+    def flush(self):
+        """Writes the changes made to a saved index to disk"""
+        if isinstance(self._map, mmap.mmap):
+            self._map.flush()
+
+    def close(self):
+        """Flushes and closes the index"""
+        if self._header is None:
+            return
+        self.flush()
+        self._release()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Records
+
+    def _source(self):
+        """returns the (buffer, offset, count) of the records"""
+        if isinstance(self.records, PacketTable):
+            # The table's mapping changes when it grows, so it's looked up every time
+            return self.records._map, TABLE_HEADER_SIZE, len(self.records)
+        available = _nbytes(self.records) - self.offset
+        if available < self.record_size:
+            return self.records, self.offset, 0
+        return self.records, self.offset, (available - self.record_size) // self.stride + 1
+
+    def _key_at(self, buf, base):
+        return tuple(field.unpack_from(buf, base) for field in self.key_fields)
+
+    def _stride(self):
+        return self.record_size if isinstance(self.records, PacketTable) else self.stride
+
+    # Updates
+
+    def _grow(self, count):
+        """makes room for :code:`count` entries, rehashing the existing entries when needed"""
+        if count <= self._header.capacity * self.load_factor:
+            return
+
+        header = self._header
+        entries = self._entries()
+        indexed, total = header.indexed, header.count
+        del header
+        self._allocate(self._capacity_for(count))
+        self._header.indexed, self._header.count = indexed, total
+
+        if numpy is not None and entries:
+            hashes = numpy.array([h for h, _ in entries], dtype=numpy.uint64)
+            refs = numpy.array([r for _, r in entries], dtype=numpy.uint64)
+            _insert_columns(self._slot_array(), hashes, refs, self._mask)
+        else:
+            for h, ref in entries:
+                self._insert(h, ref)
+
+    def _entries(self):
+        """returns the (hash, record index + 1) of every entry"""
+        if numpy is not None:
+            slots = self._slot_array()
+            used = slots[slots[:, 1] != 0]
+            return list(zip(used[:, 0].tolist(), used[:, 1].tolist()))
+        slots = self._slots
+        return [
+            (slots[2 * i], slots[2 * i + 1]) for i in range(self._header.capacity)
+            if slots[2 * i + 1]
+        ]
+
+    def _insert(self, h, ref):
+        slots, mask = self._slots, self._mask
+        pos = h & mask
+        while slots[2 * pos + 1]:
+            pos = (pos + 1) & mask
+        slots[2 * pos] = h
+        slots[2 * pos + 1] = ref
+
+    def refresh(self):
+        """
+        Indexes the records appended since the index was created (or last refreshed).
+
+        :return: the number of records added to the index
+        :rtype: int
+        """
+        buf, base, count = self._source()
+        start = self._header.indexed
+        added = count - start
+        if added <= 0:
+            return 0
+
+        self._grow(self._header.count + added)
+        stride = self._stride()
+        if numpy is not None and added > 1:
+            first = base + start * stride
+            cols = list(read_columns(
+                self.packet_cls, buf, self.key_names, first, stride, added
+            ).values())
+            hashes = _hash_columns(cols, added)
+            refs = numpy.arange(start + 1, count + 1, dtype=numpy.uint64)
+            _insert_columns(self._slot_array(), hashes, refs, self._mask)
+        else:
+            for i in range(start, count):
+                self._insert(hash_key(self._key_at(buf, base + i * stride)), i + 1)
+
+        self._header.count += added
+        self._header.indexed = count
+        return added
+
+    def append(self, pkt):
+        """
+        Appends a record to the indexed :code:`PacketTable` and indexes it.
+
+        :param pkt: a packet of the table's class
+        :return: the index of the new record
+        """
+        if not isinstance(self.records, PacketTable):
+            raise TypeError("only records of a PacketTable can be appended through the index")
+        index = self.records.append(pkt)
+        self.refresh()
+        return index
+
+    # Lookups
+
+    def _values(self, key):
+        values = (key,) if len(self.key_fields) == 1 and not isinstance(key, tuple) else key
+        if len(values) != len(self.key_fields):
+            raise ValueError("keys of this index have {} values".format(len(self.key_fields)))
+        return tuple(values)
+
+    def lookup(self, key):
+        """
+        Returns the indices of the records holding a key, in no particular order.
+
+        :param key: the value of the key field, or a tuple of values for a composite key
+        :rtype: list
+        """
+        values = self._values(key)
+        h = hash_key(values)
+        buf, base, _ = self._source()
+        stride = self._stride()
+        slots, mask = self._slots, self._mask
+
+        found = []
+        pos = h & mask
+        ref = slots[2 * pos + 1]
+        while ref:
+            if slots[2 * pos] == h and self._key_at(buf, base + (ref - 1) * stride) == values:
+                found.append(ref - 1)
+            pos = (pos + 1) & mask
+            ref = slots[2 * pos + 1]
+        return found
+
+    def first(self, key):
+        """returns the index of a record holding a key, or None"""
+        found = self.lookup(key)
+        return min(found) if found else None
+
+    def get(self, key):
+        """
+        Returns the first record holding a key as a :code:`Packet` (a view of the records when
+        they are writable), or None.
+        """
+        index = self.first(key)
+        if index is None:
+            return None
+        if isinstance(self.records, PacketTable):
+            return self.records[index]
+        offset = self.offset + index * self.stride
+        try:
+            return self.packet_cls.from_buffer(self.records, offset)
+        except TypeError:
+            return self.packet_cls.from_bytes(
+                memoryview(self.records)[offset:offset + self.record_size]
+            )
+
+    def __contains__(self, key):
+        return bool(self.lookup(key))
+
+    def __len__(self):
+        """the number of indexed records"""
+        return self._header.count
+
+    def __repr__(self):
+        return "HashIndex({c}, {k!r}, entries={n})".format(
+            c=self.packet_cls.__name__, k=self.key, n=len(self)
+        )
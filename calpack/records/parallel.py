@@ -0,0 +1,275 @@
+"""
+Parallel scans of large buffers and files of fixed size records.
+
+A :code:`ParallelScan` splits the records into shards on record boundaries and hands each shard
+to a pool of worker processes.  The records themselves are never pickled: every worker maps the
+file (or attaches to the :code:`multiprocessing.shared_memory` block holding the buffer) once,
+when it starts, and only the shard boundaries and the function to run travel to the workers.
+Each worker reduces its own shards and only the partial results are sent back and combined in
+the parent, so the throughput scales with the number of cores.
+
+Functions given to a scan are sent to the workers by pickle, so they need to be defined at the
+top level of a module (as do the packet classes).
+
+Example::
+
+    def count_port(total, udp):
+        return total + (udp.dest_port == 53)
+
+    with ParallelScan(UDP_HEADER_BIG, 'udp_headers.bin') as scan:
+        dns = scan.reduce(count_port, 0, operator.add)
+        matches = scan.filter("dest_port == 53 and length > 512")
+"""
+import mmap
+import multiprocessing
+import os
+
+from calpack.models.filters import compile_filter
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # pragma: no cover
+    shared_memory = None
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+__all__ = ['ParallelScan', 'parallel_reduce']
+
+
+# The record source of a worker process, set once by _init_worker
+_worker = {}
+
+
+def _open_source(kind, location):
+    """returns the (handle, buffer) of a record source inside a worker process"""
+    if kind == 'file':
+        with open(location, 'rb') as file_obj:
+            # A private mapping is writable, so packets can be created with from_buffer, but
+            # changes are never written back to the file.
+            handle = mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_COPY)
+        return handle, handle
+
+    try:
+        handle = shared_memory.SharedMemory(name=location, track=False)
+    except TypeError:  # pragma: no cover
+        # Before python 3.13 the segment can't be attached to without being tracked
+        handle = shared_memory.SharedMemory(name=location)
+    return handle, handle.buf
+
+
+def _init_worker(packet_cls, kind, location):
+    _worker['packet_cls'] = packet_cls
+    _worker['handle'], _worker['buf'] = _open_source(kind, location)
+    _worker['filters'] = {}
+
+
+def _records(buf, packet_cls, offset, count, stride):
+    from_buffer = packet_cls.from_buffer
+    for i in range(count):
+        yield from_buffer(buf, offset + i * stride)
+
+
+def _reduce_shard(func, initial, buf, packet_cls, offset, count, stride):
+    acc = initial
+    for pkt in _records(buf, packet_cls, offset, count, stride):
+        acc = func(acc, pkt)
+    return acc
+
+
+def _filter_shard(expression, buf, packet_cls, offset, count, stride):
+    packet_filter = _worker['filters'].get(expression)
+    if packet_filter is None:
+        packet_filter = compile_filter(packet_cls, expression)
+        _worker['filters'][expression] = packet_filter
+    return packet_filter.scan(buf, offset, stride, count)
+
+
+def _run_shard(task):
+    mode, func, args, offset, count, stride = task
+    buf, packet_cls = _worker['buf'], _worker['packet_cls']
+    if mode == 'shard':
+        return func(buf, offset, count, stride, *args)
+    if mode == 'reduce':
+        return _reduce_shard(func, args[0], buf, packet_cls, offset, count, stride)
+    return _filter_shard(func, buf, packet_cls, offset, count, stride)
+
+
+class ParallelScan(object):
+    """
+    A pool of worker processes scanning the fixed size records of a file or buffer.  The pool is
+    started on the first scan and reused by later ones; close it with :code:`close` (or use the
+    scan as a context manager).
+
+    :param packet_cls: the :code:`Packet` class of the records.  Classes with variable length
+        fields aren't supported, the records need to have a fixed size.
+    :param source: the path of a file of records, a :code:`multiprocessing.shared_memory.
+        SharedMemory` block, or any bytes-like object.  A bytes-like object is copied once into
+        a new shared memory block which is released by :code:`close`; pass a path or a
+        :code:`SharedMemory` block to avoid the copy.
+    :param int offset: the byte offset of the first record (default 0)
+    :param int stride: the distance in bytes between records (default the packet size)
+    :param int count: the number of records (default as many as fit in the source)
+    :param int processes: the number of worker processes (default the number of cores)
+    :param int shards_per_process: the number of shards given to each process, more shards
+        balance the load better when records take uneven times to process (default 4)
+    """
+    def __init__(self, packet_cls, source, offset=0, stride=None, count=None, processes=None,
+                 shards_per_process=4):
+        if packet_cls._var_fields:
+            raise TypeError(
+                "{} has variable length fields, only fixed size records can be scanned".format(
+                    packet_cls.__name__
+                )
+            )
+
+        self.packet_cls = packet_cls
+        self.size = len(packet_cls())
+        self.offset = offset
+        self.stride = self.size if stride is None else stride
+        self.processes = processes or multiprocessing.cpu_count()
+        self.shards_per_process = shards_per_process
+
+        self._owned = None
+        if isinstance(source, str):
+            self._kind, self._location = 'file', source
+            nbytes = os.path.getsize(source)
+        else:
+            if shared_memory is None:  # pragma: no cover
+                raise TypeError("only files can be scanned without multiprocessing.shared_memory")
+            if not isinstance(source, shared_memory.SharedMemory):
+                nbytes = memoryview(source).nbytes
+                self._owned = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+                self._owned.buf[:nbytes] = memoryview(source).cast('B')
+                source = self._owned
+            else:
+                nbytes = source.size
+            self._kind, self._location = 'shm', source.name
+
+        if count is None:
+            available = nbytes - offset
+            count = 0 if available < self.size else (available - self.size) // self.stride + 1
+        self.count = count
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Stops the worker processes and releases the shared memory block created for a buffer"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        if self._owned is not None:
+            self._owned.close()
+            self._owned.unlink()
+            self._owned = None
+
+    def shards(self):
+        """returns the (byte offset, record count) of every shard"""
+        num = min(self.count, self.processes * self.shards_per_process)
+        if num == 0:
+            return []
+        per_shard, extra = divmod(self.count, num)
+        shards = []
+        start = 0
+        for i in range(num):
+            size = per_shard + (1 if i < extra else 0)
+            shards.append((self.offset + start * self.stride, size))
+            start += size
+        return shards
+
+    def _map(self, mode, func, args=()):
+        if self.count == 0:
+            return []
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(
+                self.processes, _init_worker, (self.packet_cls, self._kind, self._location)
+            )
+        tasks = [
+            (mode, func, args, offset, count, self.stride) for offset, count in self.shards()
+        ]
+        return self._pool.map(_run_shard, tasks, chunksize=1)
+
+    def map_shards(self, func, *args):
+        """
+        Calls :code:`func(buf, offset, count, stride, *args)` once for every shard, in the
+        workers, and returns the results in shard order.  :code:`buf` is the whole source, the
+        shard is the :code:`count` records starting at :code:`offset`.
+
+        :param func: a function defined at the top level of a module
+        :param args: extra (picklable) arguments passed to :code:`func`
+        :rtype: list
+        """
+        return self._map('shard', func, args)
+
+    def reduce(self, func, initial, combine):
+        """
+        Folds every record into an accumulator.  Every worker folds its shards starting from
+        :code:`initial` with :code:`acc = func(acc, pkt)`, where :code:`pkt` is a zero-copy
+        :code:`Packet` view of the record, and the partial results are then folded together in
+        the parent with :code:`combine(acc, partial)`, in the order of the shards.
+
+        Every shard starts from its own (unpickled) copy of :code:`initial`, so it's folded into
+        the result once per shard: it must be an identity of :code:`combine` (i.e. :code:`0` for
+        :code:`operator.add` or :code:`[]` for concatenating lists), otherwise the result depends
+        on the number of shards.
+
+        :param func: the per record function, defined at the top level of a module
+        :param initial: the starting (picklable) value of every accumulator, an identity of
+            :code:`combine`.  It's returned as is when there are no records.
+        :param combine: the function merging two accumulators
+        :return: the combined accumulator
+        """
+        results = self._map('reduce', func, (initial,))
+        if not results:
+            return initial
+        acc = results[0]
+        for partial in results[1:]:
+            acc = combine(acc, partial)
+        return acc
+
+    def filter(self, expression):
+        """
+        Returns the indices of the records matching a filter expression (see
+        :code:`calpack.models.filters`).  The filter is compiled once in every worker.
+
+        :param str expression: the filter expression, i.e. :code:`"dest_port == 53"`
+        :return: the indices of the matching records, as a NumPy array when NumPy is available
+            otherwise a list
+        """
+        # Compiling it here first reports mistakes in the expression before the pool is involved
+        compile_filter(self.packet_cls, expression)
+
+        results = self._map('filter', expression)
+        starts = [(offset - self.offset) // self.stride for offset, _ in self.shards()]
+        if numpy is not None:
+            return numpy.concatenate([numpy.zeros(0, dtype=numpy.intp)] + [
+                numpy.asarray(indices, dtype=numpy.intp) + start
+                for indices, start in zip(results, starts)
+            ])
+        return [index + start for indices, start in zip(results, starts) for index in indices]
+
+
+def parallel_reduce(packet_cls, source, func, initial, combine, **kwargs):
+    """
+    Folds every record of a file or buffer into an accumulator using a temporary
+    :code:`ParallelScan` (see :code:`ParallelScan.reduce`).
+
+    :param packet_cls: the :code:`Packet` class of the records
+    :param source: the path of a file of records, a :code:`SharedMemory` block, or a bytes-like
+        object
+    :param func: the per record function, :code:`acc = func(acc, pkt)`
+    :param initial: the starting value of every accumulator, an identity of :code:`combine`
+    :param combine: the function merging two accumulators
+    :param kwargs: the other arguments of :code:`ParallelScan`
+    """
+    with ParallelScan(packet_cls, source, **kwargs) as scan:
+        return scan.reduce(func, initial, combine)
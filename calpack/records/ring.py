@@ -0,0 +1,445 @@
+"""
+A ring buffer of fixed size packet slots in shared memory, for handing packets between processes
+without pickling them.
+
+Producers copy packets into the slots of the ring (or write the fields of a claimed slot in
+place) and consumers read them back as zero-copy :code:`Packet` views of the shared memory.  Any
+number of producers can share a ring when it's created with :code:`multi_producer=True`, there
+is a single consumer.
+
+Every slot has a 64 bit sequence number, as in Dmitry Vyukov's bounded queue.  A slot at
+position :code:`pos` is free for a producer when its sequence is :code:`pos`, is ready for the
+consumer when it's :code:`pos + 1`, and is handed back to the producers by setting it to
+:code:`pos + capacity`.  Producers only coordinate (through a lock) to claim positions, slots are
+published independently, so a slow producer never corrupts the slots of a faster one.
+
+Memory ordering: the sequence numbers are aligned 64 bit words, stored with a single store after
+the slot's contents are written and loaded before they are read.  On the strongly ordered x86
+processors that is enough for the consumer to never see a partially written slot.  On weakly
+ordered processors (ARM, POWER) the sequence numbers are read and written while holding a shared
+lock, whose acquire/release ordering is what guarantees it; use batches to amortize its cost.
+
+Example::
+
+    ring = PacketRing.create(UDP_HEADER_BIG, capacity=4096)
+    consumer = multiprocessing.Process(target=analyse, args=(ring,))
+    consumer.start()
+
+    # producer
+    ring.put_many(headers)
+
+    # consumer
+    def analyse(ring):
+        while True:
+            with ring.read(256) as batch:
+                for udp in batch:
+                    handle(udp.dest_port)
+"""
+import ctypes
+import multiprocessing
+import os
+import platform
+import time
+import uuid
+
+try:
+    import queue
+except ImportError:  # pragma: no cover
+    import Queue as queue
+
+from calpack.models.packets import Packet
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # pragma: no cover
+    shared_memory = None
+
+
+__all__ = ['PacketRing', 'RingBatch']
+
+
+RING_MAGIC = 0x434c5052494e4731  # "CLPRING1"
+
+# The header is made of 64 bit words, the claim and read positions are on cache lines of their own
+#   so producers and the consumer don't contend for the same line.
+_HEADER_WORDS = 24
+_MAGIC, _CAPACITY, _SLOT_SIZE, _RECORD_SIZE, _MULTI_PRODUCER, _LOCKED = 0, 1, 2, 3, 4, 5
+_CLAIM_POS = 8
+_READ_POS = 16
+
+_STRONGLY_ORDERED = platform.machine().lower() in ('x86_64', 'amd64', 'i386', 'i686', 'x86')
+
+_Word = ctypes.c_uint64
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # pragma: no cover
+        # Before python 3.13 segments can't be attached to without being tracked
+        return shared_memory.SharedMemory(name=name)
+
+
+def _wait(ready, timeout, error):
+    """polls :code:`ready` with a growing back off until it's true or :code:`timeout` passes"""
+    deadline = None if timeout is None else time.time() + timeout
+    delay = 0.0
+    while not ready():
+        if deadline is not None and time.time() >= deadline:
+            raise error
+        time.sleep(delay)
+        delay = min(delay * 2 or 0.00001, 0.001)
+
+
+class RingBatch(object):
+    """
+    A run of consecutive slots of a :code:`PacketRing`, either claimed by a producer or read by
+    the consumer.  Iterating over (or indexing) the batch gives zero-copy :code:`Packet` views of
+    the slots.  Used as a context manager a claimed batch is committed, and a read batch released,
+    on exit.
+
+    :ivar int start: the ring position of the first slot
+    :ivar int count: the number of slots
+    """
+    __slots__ = ('ring', 'start', 'count', 'claimed')
+
+    def __init__(self, ring, start, count, claimed):
+        self.ring = ring
+        self.start = start
+        self.count = count
+        self.claimed = claimed
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("batch index out of range")
+        return self.ring.slot(self.start + index)
+
+    def __iter__(self):
+        slot = self.ring.slot
+        for pos in range(self.start, self.start + self.count):
+            yield slot(pos)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.claimed:
+            self.ring.commit(self)
+        else:
+            self.ring.release(self)
+
+
+class PacketRing(object):
+    """
+    A ring buffer of fixed size :code:`Packet` slots in :code:`multiprocessing.shared_memory`.
+    Use :code:`create` to make a new ring; rings are passed to other processes as arguments of
+    :code:`multiprocessing.Process` (or through any other pickling), or can be attached to by
+    name with :code:`attach`.
+
+    Views handed out by :code:`slot`, :code:`read` and :code:`claim` are only valid until their
+    slots are released (or committed), after which the slot is reused for another packet.
+    """
+    def __init__(self, packet_cls, shm, lock=None, owner=False):
+        self.packet_cls = packet_cls
+        self.record_size = len(packet_cls())
+        self.shm = shm
+        self._lock = lock
+        # Only the creating process releases the memory, not the processes forked from it
+        self._owner = os.getpid() if owner else None
+
+        buf = shm.buf
+        self._header = (_Word * _HEADER_WORDS).from_buffer(buf)
+        if self._header[_MAGIC] != RING_MAGIC:
+            raise ValueError("{} isn't a packet ring".format(shm.name))
+        if self._header[_RECORD_SIZE] != self.record_size:
+            raise ValueError("the ring holds records of {r} bytes, not {c} ({s} bytes)".format(
+                r=self._header[_RECORD_SIZE], c=packet_cls.__name__, s=self.record_size
+            ))
+        if self._header[_LOCKED] and lock is None:
+            raise ValueError(
+                "{} needs its lock, pass the ring itself to the process".format(shm.name)
+            )
+
+        self.capacity = self._header[_CAPACITY]
+        self.slot_size = self._header[_SLOT_SIZE]
+        self._mask = self.capacity - 1
+        self._seqs = (_Word * self.capacity).from_buffer(buf, _HEADER_WORDS * 8)
+        self._data_offset = self._slots_offset(self.capacity)
+        self._slots_address = ctypes.addressof(self._header) + self._data_offset
+        self._buf = buf
+        self._views = [None] * self.capacity
+        self._sync = lock if not _STRONGLY_ORDERED else None
+        self._multi_producer = bool(self._header[_MULTI_PRODUCER])
+
+    @staticmethod
+    def _slots_offset(capacity):
+        # The slots start on a cache line boundary
+        return ((_HEADER_WORDS + capacity) * 8 + 63) & ~63
+
+    @classmethod
+    def create(cls, packet_cls, capacity=1024, multi_producer=False, name=None, context=None):
+        """
+        Creates a new ring.  The shared memory is released when the creating ring is closed.
+
+        :param packet_cls: the :code:`Packet` class of the slots (without variable length fields)
+        :param int capacity: the number of slots, rounded up to a power of 2 (default 1024)
+        :param bool multi_producer: whether several processes put packets into the ring (default
+            False)
+        :param str name: the name of the shared memory block (default a unique name)
+        :param context: the :code:`multiprocessing` context the processes using the ring are
+            started with, i.e. :code:`multiprocessing.get_context('spawn')` (default the
+            default context)
+        :rtype: PacketRing
+        """
+        if shared_memory is None:  # pragma: no cover
+            raise TypeError("packet rings require multiprocessing.shared_memory")
+        if packet_cls._var_fields:
+            raise TypeError("{} has variable length fields, ring slots have a fixed size".format(
+                packet_cls.__name__
+            ))
+
+        capacity = 1 << max(int(capacity) - 1, 0).bit_length()
+        record_size = len(packet_cls())
+        slot_size = (record_size + 7) & ~7
+        size = cls._slots_offset(capacity) + capacity * slot_size
+        if name is None:
+            name = 'calpack_ring_' + uuid.uuid4().hex[:16]
+
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        locked = multi_producer or not _STRONGLY_ORDERED
+        header = (_Word * _HEADER_WORDS).from_buffer(shm.buf)
+        header[_CAPACITY] = capacity
+        header[_SLOT_SIZE] = slot_size
+        header[_RECORD_SIZE] = record_size
+        header[_MULTI_PRODUCER] = multi_producer
+        header[_LOCKED] = locked
+        seqs = (_Word * capacity).from_buffer(shm.buf, _HEADER_WORDS * 8)
+        for pos in range(capacity):
+            seqs[pos] = pos
+        header[_MAGIC] = RING_MAGIC
+        del header, seqs
+
+        lock = (context or multiprocessing).RLock() if locked else None
+        return cls(packet_cls, shm, lock, owner=True)
+
+    @classmethod
+    def attach(cls, packet_cls, name):
+        """
+        Attaches to an existing ring by the name of its shared memory block.  Rings needing a lock
+        (multiple producers, or weakly ordered processors) can't be attached to by name, pass the
+        ring to the process instead.
+
+        :param packet_cls: the :code:`Packet` class of the slots
+        :param str name: the name of the ring (:code:`ring.name`)
+        :rtype: PacketRing
+        """
+        return cls(packet_cls, _attach(name))
+
+    def __reduce__(self):
+        return _attach_ring, (self.packet_cls, self.shm.name, self._lock)
+
+    @property
+    def name(self):
+        """the name of the ring's shared memory block"""
+        return self.shm.name
+
+    def __len__(self):
+        """the (approximate) number of packets claimed by producers and not yet released"""
+        return self._header[_CLAIM_POS] - self._header[_READ_POS]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Detaches from the shared memory, and releases it if this ring created it.  Views still
+        referenced outside of the ring keep the memory mapped until they are released.
+        """
+        if self.shm is None:
+            return
+        self._views = self._header = self._seqs = self._buf = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+        if self._owner == os.getpid():
+            self.shm.unlink()
+        self.shm = None
+
+    def slot(self, pos):
+        """returns the zero-copy :code:`Packet` view of the slot of a ring position"""
+        index = pos & self._mask
+        view = self._views[index]
+        if view is None:
+            view = self.packet_cls.from_buffer(self._buf, self._data_offset + index * self.slot_size)
+            self._views[index] = view
+        return view
+
+    def _seq(self, pos):
+        if self._sync is None:
+            return self._seqs[pos & self._mask]
+        with self._sync:
+            return self._seqs[pos & self._mask]
+
+    def _publish(self, start, count, delta):
+        seqs, mask = self._seqs, self._mask
+        if self._sync is not None:
+            self._sync.acquire()
+        try:
+            for pos in range(start, start + count):
+                seqs[pos & mask] = pos + delta
+        finally:
+            if self._sync is not None:
+                self._sync.release()
+
+    # Producer side
+
+    def _copy_in(self, pos, pkt):
+        address = self._slots_address + (pos & self._mask) * self.slot_size
+        if isinstance(pkt, Packet):
+            ctypes.memmove(address, ctypes.addressof(pkt.c_pkt), self.record_size)
+        elif len(pkt) == self.record_size:
+            ctypes.memmove(address, bytes(pkt), self.record_size)
+        else:
+            raise ValueError("{} bytes given for a record of {} bytes".format(
+                len(pkt), self.record_size
+            ))
+
+    def claim(self, count=1, block=True, timeout=None):
+        """
+        Claims the next :code:`count` slots for writing.  The slots are views of the shared
+        memory, holding whatever packet was last in them, which are written in place and then
+        handed to the consumer with :code:`commit`.
+
+        :param int count: the number of slots, at most the capacity of the ring (default 1)
+        :param bool block: whether to wait for the slots to be free (default True)
+        :param float timeout: the longest time to wait in seconds (default forever)
+        :rtype: RingBatch
+        :raises queue.Full: if the slots aren't free in time
+        """
+        if not 0 < count <= self.capacity:
+            raise ValueError("count must be between 1 and {}".format(self.capacity))
+        header = self._header
+        lock = self._lock if self._multi_producer else None
+        if lock is not None:
+            lock.acquire()
+        try:
+            # Slots are released in order, so the last one being free means they all are
+            start = header[_CLAIM_POS]
+            last = start + count - 1
+            if self._seq(last) != last:
+                if not block:
+                    raise queue.Full
+                _wait(lambda: self._seq(last) == last, timeout, queue.Full)
+            header[_CLAIM_POS] = start + count
+        finally:
+            if lock is not None:
+                lock.release()
+        return RingBatch(self, start, count, True)
+
+    def commit(self, batch):
+        """Hands the slots of a claimed batch to the consumer"""
+        self._publish(batch.start, batch.count, 1)
+
+    def put(self, pkt, block=True, timeout=None):
+        """
+        Copies a packet into the next slot and hands it to the consumer.
+
+        :param pkt: a packet of the ring's class, or its raw bytes
+        :param bool block: whether to wait for a free slot (default True)
+        :param float timeout: the longest time to wait in seconds (default forever)
+        :raises queue.Full: if no slot is free in time
+        """
+        batch = self.claim(1, block, timeout)
+        self._copy_in(batch.start, pkt)
+        self._publish(batch.start, 1, 1)
+
+    def put_many(self, pkts, block=True, timeout=None):
+        """
+        Copies packets into the ring, claiming and committing slots in batches of up to a quarter
+        of the ring.
+
+        :param pkts: a sequence of packets of the ring's class (or their raw bytes)
+        :param bool block: whether to wait for free slots (default True)
+        :param float timeout: the longest time to wait for each batch in seconds (default forever)
+        :raises queue.Full: if no slots are free in time
+        """
+        copy_in = self._copy_in
+        step = max(self.capacity // 4, 1)
+        for first in range(0, len(pkts), step):
+            chunk = pkts[first:first + step]
+            batch = self.claim(len(chunk), block, timeout)
+            pos = batch.start
+            for pkt in chunk:
+                copy_in(pos, pkt)
+                pos += 1
+            self._publish(batch.start, batch.count, 1)
+
+    # Consumer side
+
+    def read(self, max_count=None, block=True, timeout=None):
+        """
+        Returns the packets handed to the consumer so far, as a batch of zero-copy views.  The
+        batch needs to be released (:code:`release`, or by using it as a context manager) once
+        the packets have been handled.
+
+        :param int max_count: the most packets to return (default the capacity of the ring)
+        :param bool block: whether to wait for at least one packet (default True)
+        :param float timeout: the longest time to wait in seconds (default forever)
+        :rtype: RingBatch
+        :raises queue.Empty: if no packet arrives in time
+        """
+        start = self._header[_READ_POS]
+        if self._seq(start) != start + 1:
+            if not block:
+                raise queue.Empty
+            _wait(lambda: self._seq(start) == start + 1, timeout, queue.Empty)
+
+        limit = self.capacity if max_count is None else min(max_count, self.capacity)
+        seqs, mask = self._seqs, self._mask
+        count = 1
+        if self._sync is not None:
+            self._sync.acquire()
+        try:
+            while count < limit and seqs[(start + count) & mask] == start + count + 1:
+                count += 1
+        finally:
+            if self._sync is not None:
+                self._sync.release()
+        return RingBatch(self, start, count, False)
+
+    def release(self, batch):
+        """Hands the slots of a read batch back to the producers"""
+        self._publish(batch.start, batch.count, self.capacity)
+        self._header[_READ_POS] = batch.start + batch.count
+
+    def get(self, block=True, timeout=None):
+        """
+        Removes the next packet from the ring and returns a copy of it.
+
+        :param bool block: whether to wait for a packet (default True)
+        :param float timeout: the longest time to wait in seconds (default forever)
+        :raises queue.Empty: if no packet arrives in time
+        """
+        batch = self.read(1, block, timeout)
+        offset = self._data_offset + (batch.start & self._mask) * self.slot_size
+        pkt = self.packet_cls.from_bytes(self._buf[offset:offset + self.record_size])
+        self.release(batch)
+        return pkt
+
+    def __repr__(self):
+        return "PacketRing({c}, capacity={n}, name={s!r})".format(
+            c=self.packet_cls.__name__, n=self.capacity, s=self.name
+        )
+
+
+def _attach_ring(packet_cls, name, lock):
+    return PacketRing(packet_cls, _attach(name), lock)
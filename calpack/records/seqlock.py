@@ -0,0 +1,212 @@
+"""
+Packets updated by one writer at a time and read concurrently by many readers, without readers
+ever seeing a torn mix of old and new fields.
+
+A :code:`SeqlockPacket` stores a 64 bit sequence counter in front of the packet's bytes.  A writer
+makes the counter odd, updates the packet in place and makes it even again.  A reader copies the
+packet's bytes between two reads of the counter, and simply tries again when the counter was odd
+or changed in between, so the read path never takes a lock and never blocks a writer.  Writers
+are serialized by a lock.
+
+The packet can live in shared memory (:code:`SeqlockPacket.shared`) to be read by other
+processes.  The counter is an aligned 64 bit word written with a single store, which on the
+strongly ordered x86 processors is all a sequence lock needs.  On weakly ordered processors (ARM,
+POWER) readers in other processes take the writers' lock instead, to get the memory ordering a
+plain python process can't otherwise request.
+
+Example::
+
+    state = SeqlockPacket(DEVICE_STATE)
+
+    # writer thread
+    with state.write() as pkt:
+        pkt.temperature = 21
+        pkt.pressure = 1013
+
+    # reader threads
+    raw = state.to_bytes()
+    temperature, pressure = state.read('temperature', 'pressure')
+"""
+import contextlib
+import ctypes
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+
+from calpack.models.layout import get_layout
+from calpack.records.ring import _STRONGLY_ORDERED, _attach
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # pragma: no cover
+    shared_memory = None
+
+
+__all__ = ['SeqlockPacket', 'SEQLOCK_HEADER_SIZE']
+
+
+SEQLOCK_HEADER_SIZE = 8
+
+
+class SeqlockPacket(object):
+    """
+    A packet protected by a sequence lock.
+
+    :param packet_cls: the :code:`Packet` class (without variable length fields)
+    :param buf: a writable buffer to keep the counter and packet in, at least
+        :code:`SeqlockPacket.size_of(packet_cls)` bytes long (default a new private buffer).
+        The buffer is used as it is, it isn't cleared.
+    :param int offset: the byte offset of the counter within :code:`buf`, preferably a multiple
+        of 8 (default 0)
+    :param lock: the lock serializing writers (default a new :code:`threading.Lock`).  When the
+        buffer is shared between processes this needs to be a :code:`multiprocessing` lock.
+    """
+    def __init__(self, packet_cls, buf=None, offset=0, lock=None, _shm=None):
+        if packet_cls._var_fields:
+            raise TypeError("{} has variable length fields, it can't be updated in place".format(
+                packet_cls.__name__
+            ))
+        self.packet_cls = packet_cls
+        self.record_size = len(packet_cls())
+        if buf is None:
+            buf = bytearray(self.size_of(packet_cls))
+
+        self._shm = _shm
+        self._owner = None
+        self._lock = threading.Lock() if lock is None else lock
+        self._seq = ctypes.c_uint64.from_buffer(buf, offset)
+        start = offset + SEQLOCK_HEADER_SIZE
+        self._data = memoryview(buf)[start:start + self.record_size]
+        self._pkt = packet_cls.from_buffer(buf, start)
+        self._layout = get_layout(packet_cls)
+
+        # Readers of a packet shared between processes on a weakly ordered processor use the lock
+        self._sync = self._lock if _shm is not None and not _STRONGLY_ORDERED else None
+
+    @staticmethod
+    def size_of(packet_cls):
+        """returns the number of bytes needed to hold a packet and its counter"""
+        return SEQLOCK_HEADER_SIZE + len(packet_cls())
+
+    @classmethod
+    def shared(cls, packet_cls, name=None, context=None):
+        """
+        Creates a packet in a new :code:`multiprocessing.shared_memory` block.  The packet is
+        passed to other processes as an argument of :code:`multiprocessing.Process` (or through
+        any other pickling), and the memory is released when the creating process closes it.
+
+        :param packet_cls: the :code:`Packet` class
+        :param str name: the name of the shared memory block (default a unique name)
+        :param context: the :code:`multiprocessing` context the other processes are started
+            with (default the default context)
+        :rtype: SeqlockPacket
+        """
+        if shared_memory is None:  # pragma: no cover
+            raise TypeError("shared packets require multiprocessing.shared_memory")
+        if name is None:
+            name = 'calpack_seqlock_' + uuid.uuid4().hex[:16]
+        shm = shared_memory.SharedMemory(name=name, create=True, size=cls.size_of(packet_cls))
+        lock = (context or multiprocessing).Lock()
+        shared = cls(packet_cls, shm.buf, 0, lock, _shm=shm)
+        shared._owner = os.getpid()
+        return shared
+
+    def __reduce__(self):
+        if self._shm is None:
+            raise TypeError("only shared packets can be passed to other processes")
+        return _attach_seqlock, (self.packet_cls, self._shm.name, self._lock)
+
+    def close(self):
+        """
+        Detaches a shared packet from its shared memory, and releases the memory in the process
+        that created it.
+        """
+        if self._shm is None:
+            return
+        shm, self._shm = self._shm, None
+        self._seq = self._data = self._pkt = None
+        try:
+            shm.close()
+        except BufferError:
+            pass
+        if self._owner == os.getpid():
+            shm.unlink()
+
+    @property
+    def version(self):
+        """the number of completed writes"""
+        return self._seq.value // 2
+
+    @contextlib.contextmanager
+    def write(self):
+        """
+        Updates the packet in place.  Used as a context manager, it yields the packet to modify;
+        readers see either none or all of the changes made inside the :code:`with` block.
+        """
+        with self._lock:
+            seq = self._seq
+            seq.value += 1
+            try:
+                yield self._pkt
+            finally:
+                seq.value += 1
+
+    def update(self, **kwargs):
+        """
+        Sets fields of the packet as a single write.
+
+        :param kwargs: the field names and their new values
+        """
+        with self.write() as pkt:
+            for name, val in kwargs.items():
+                setattr(pkt, name, val)
+
+    def to_bytes(self):
+        """
+        Returns a consistent copy of the packet's bytes.  Retries while a write is in progress.
+
+        :rtype: bytes
+        """
+        if self._sync is not None:
+            with self._sync:
+                return self._data.tobytes()
+
+        seq, data = self._seq, self._data
+        while True:
+            start = seq.value
+            if not start & 1:
+                raw = data.tobytes()
+                if seq.value == start:
+                    return raw
+            # Let the writer finish
+            time.sleep(0)
+
+    def snapshot(self):
+        """
+        Returns a consistent copy of the packet, which the writer doesn't modify.
+
+        :rtype: Packet
+        """
+        return self.packet_cls.from_bytes(self.to_bytes())
+
+    def read(self, *field_names):
+        """
+        Returns the values of some fields from the same consistent snapshot.  The fields are
+        decoded straight from the copied bytes through the packet's layout.
+
+        :param field_names: the (dotted) names of the fields
+        :rtype: tuple
+        """
+        raw = self.to_bytes()
+        layout = self._layout
+        return tuple(layout[name].unpack_from(raw) for name in field_names)
+
+    def __repr__(self):
+        return "SeqlockPacket({c}, version={v})".format(c=self.packet_cls.__name__, v=self.version)
+
+
+def _attach_seqlock(packet_cls, name, lock):
+    shm = _attach(name)
+    return SeqlockPacket(packet_cls, shm.buf, 0, lock, _shm=shm)
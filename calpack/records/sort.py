@@ -0,0 +1,424 @@
+"""
+Sorting, grouping and deduplicating buffers and files of fixed size packet records, without
+decoding them into packets.
+
+The sort keys are read as columns (see :code:`read_columns`), which decode them with the byte
+order and signedness of their fields, and sorted into a permutation of the records.  The records
+themselves are never decoded: they are gathered whole into a new buffer, in the permuted order,
+with one block copy per record (or per run of consecutive records).  Sorts are stable, so records
+with equal keys keep their relative order and deduplication keeps the first of them.
+
+Files larger than memory are sorted with :code:`sort_file`, which sorts chunks of the file in
+memory into temporary runs and merges the runs.
+
+Example::
+
+    data = sort_records(CAPTURE_RECORD, capture, ['timestamp', 'sequence'], dedup='record')
+    sort_file(CAPTURE_RECORD, 'capture.bin', 'sorted.bin', 'timestamp', memory_limit=1 << 30)
+"""
+import heapq
+import os
+import shutil
+import tempfile
+from itertools import groupby
+
+from calpack.models.layout import get_layout
+from calpack.records import columns
+from calpack.records.columns import open_records, _byte_view
+from calpack.utils import PY2
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+__all__ = ['sort_order', 'unique_order', 'gather', 'sort_records', 'group_records', 'sort_file']
+
+
+DEDUP_MODES = (None, 'key', 'record')
+
+# The default amount of records sort_file sorts in memory at once
+DEFAULT_MEMORY_LIMIT = 256 * 1024 * 1024
+
+# The number of bytes read at once from every run while merging them
+_MERGE_READ_SIZE = 1024 * 1024
+
+
+def _key_names(packet_cls, keys):
+    if isinstance(keys, str):
+        keys = [keys]
+    if not keys:
+        raise ValueError("At least one key field is needed")
+    layout = get_layout(packet_cls)
+    for name in keys:
+        if layout[name].count > 1:
+            raise TypeError("{} is an array field, records can't be sorted by it".format(name))
+    return list(keys)
+
+
+def _key_columns(packet_cls, records, keys):
+    cols = columns.read_columns(
+        packet_cls, records.buf, keys, records.offset, records.stride, records.count
+    )
+    return list(cols.values())
+
+
+def _sort(cols, count, reverse, subset=None):
+    """the stable order of the records (or of a subset of them) by their key columns"""
+    if numpy is not None:
+        if subset is not None:
+            cols = [col[subset] for col in cols]
+        if reverse:
+            # a stable descending sort, by sorting the reversed records in ascending order
+            last = len(cols[0]) - 1
+            order = last - numpy.lexsort([col[::-1] for col in reversed(cols)])[::-1]
+        else:
+            order = numpy.lexsort(list(reversed(cols)))
+        return order if subset is None else subset[order]
+
+    indices = range(count) if subset is None else subset
+    if len(cols) == 1:
+        return sorted(indices, key=cols[0].__getitem__, reverse=reverse)
+    return sorted(indices, key=list(zip(*cols)).__getitem__, reverse=reverse)
+
+
+def _key_starts(cols, order):
+    """the positions in :code:`order` where a new key starts"""
+    if numpy is not None:
+        first = numpy.zeros(len(order), dtype=bool)
+        first[:1] = True
+        for col in cols:
+            col = col[order]
+            first[1:] |= col[1:] != col[:-1]
+        return numpy.flatnonzero(first)
+
+    starts = []
+    previous = None
+    for pos, index in enumerate(order):
+        key = tuple(col[index] for col in cols)
+        if not pos or key != previous:
+            starts.append(pos)
+        previous = key
+    return starts
+
+
+def _unique_records(records, size):
+    """the indices of the first of every distinct record"""
+    count, stride = records.count, records.stride
+    if numpy is not None:
+        # Compare records as (contiguous) columns of unsigned words, which sort much faster than
+        # raw bytes
+        words = []
+        start = 0
+        for width in (8, 4, 2, 1):
+            while size - start >= width:
+                words.append(numpy.ascontiguousarray(numpy.ndarray(
+                    (count,), 'u{}'.format(width), buffer=records.buf,
+                    offset=records.offset + start, strides=(stride,)
+                )))
+                start += width
+        order = numpy.lexsort(words)
+        return numpy.sort(order[_key_starts(words, order)])
+
+    view = _byte_view(records.buf)
+    seen = set()
+    first = []
+    for i in range(count):
+        start = records.offset + i * stride
+        raw = bytes(view[start:start + size])
+        if raw not in seen:
+            seen.add(raw)
+            first.append(i)
+    if not PY2:
+        view.release()
+    return first
+
+
+def _gather(records, order, size, out=None, out_offset=0):
+    count = len(order)
+    if out is None:
+        out = bytearray(count * size)
+    if numpy is not None:
+        src = numpy.ndarray((records.count,), 'V{}'.format(size), buffer=records.buf,
+                            offset=records.offset, strides=(records.stride,))
+        dst = numpy.ndarray((count,), 'V{}'.format(size), buffer=out, offset=out_offset)
+        numpy.take(src, order, out=dst)
+        return out
+
+    src, dst = _byte_view(records.buf), _byte_view(out)
+    base, stride, contiguous = records.offset, records.stride, records.stride == size
+    pos = 0
+    while pos < count:
+        # copy runs of consecutive records with a single slice assignment
+        run = 1
+        if contiguous:
+            while pos + run < count and order[pos + run] == order[pos] + run:
+                run += 1
+        start = base + order[pos] * stride
+        target = out_offset + pos * size
+        dst[target:target + run * size] = src[start:start + run * size]
+        pos += run
+    if not PY2:
+        src.release()
+        dst.release()
+    return out
+
+
+def _ordered(packet_cls, records, keys, reverse, dedup):
+    """the order of the records in a sorted and deduplicated copy of them"""
+    if dedup not in DEDUP_MODES:
+        raise ValueError("Unknown dedup mode {d!r}, expected one of {m}".format(
+            d=dedup, m=', '.join(repr(mode) for mode in DEDUP_MODES)
+        ))
+    cols = _key_columns(packet_cls, records, keys)
+    subset = None
+    if dedup == 'record':
+        subset = _unique_records(records, get_layout(packet_cls).size)
+    order = _sort(cols, records.count, reverse, subset)
+    if dedup == 'key':
+        starts = _key_starts(cols, order)
+        order = order[starts] if numpy is not None else [order[pos] for pos in starts]
+    return order
+
+
+def sort_order(packet_cls, source, keys, reverse=False, offset=0, stride=None, count=None):
+    """
+    Computes the permutation sorting records by key fields.  The sort is stable.
+
+    :param packet_cls: the :code:`Packet` class of the records
+    :param source: a :code:`PacketTable`, the path of a file of records or a bytes-like object
+    :param keys: the (dotted) name, or list of names, of the int, bool or float fields to sort
+        by, the first one first.  Values are compared as decoded, according to the fields' byte
+        order and signedness.
+    :param bool reverse: whether to sort in descending order (default False)
+    :param int offset: the byte offset of the first record in a file or buffer (default 0)
+    :param int stride: the distance in bytes between records (default the packet size)
+    :param int count: the number of records (default as many as fit)
+    :return: the indices of the records in sorted order, as a NumPy array when NumPy is
+        available, otherwise a list
+    """
+    keys = _key_names(packet_cls, keys)
+    with open_records(packet_cls, source, offset, stride, count) as records:
+        return _sort(_key_columns(packet_cls, records, keys), records.count, reverse)
+
+
+def unique_order(packet_cls, source, keys=None, offset=0, stride=None, count=None):
+    """
+    Finds the first record of every distinct key, or of every distinct record.
+
+    :param packet_cls: the :code:`Packet` class of the records
+    :param source: a :code:`PacketTable`, the path of a file of records or a bytes-like object
+    :param keys: the (dotted) name, or list of names, of the key fields (default None, to compare
+        whole records byte for byte)
+    :param int offset: the byte offset of the first record in a file or buffer (default 0)
+    :param int stride: the distance in bytes between records (default the packet size)
+    :param int count: the number of records (default as many as fit)
+    :return: the indices of the records kept, in increasing order, as a NumPy array when NumPy
+        is available, otherwise a list
+    """
+    if keys is not None:
+        keys = _key_names(packet_cls, keys)
+    with open_records(packet_cls, source, offset, stride, count) as records:
+        if keys is None:
+            return _unique_records(records, get_layout(packet_cls).size)
+        first = _ordered(packet_cls, records, keys, False, 'key')
+        return numpy.sort(first) if numpy is not None else sorted(first)
+
+
+def gather(packet_cls, source, order, offset=0, stride=None, out=None, out_offset=0):
+    """
+    Copies records, whole and in the given order, into a contiguous buffer.
+
+    :param packet_cls: the :code:`Packet` class of the records
+    :param source: a :code:`PacketTable`, the path of a file of records or a bytes-like object
+    :param order: the indices of the records to copy (i.e. from :code:`sort_order`)
+    :param int offset: the byte offset of the first record in a file or buffer (default 0)
+    :param int stride: the distance in bytes between records (default the packet size)
+    :param out: a writable buffer to copy the records into (default a new :code:`bytearray`)
+    :param int out_offset: the byte offset to copy the records at within :code:`out`
+    :return: the buffer the records were copied into
+    """
+    size = get_layout(packet_cls).size
+    if numpy is not None:
+        order = numpy.asarray(order, dtype=numpy.intp)
+        low, high = (order.min(), order.max()) if len(order) else (0, -1)
+    else:
+        low, high = (min(order), max(order)) if len(order) else (0, -1)
+    with open_records(packet_cls, source, offset, stride) as records:
+        if low < 0 or high >= records.count:
+            raise IndexError("record index out of range")
+        return _gather(records, order, size, out, out_offset)
+
+
+def sort_records(packet_cls, source, keys, reverse=False, dedup=None, offset=0, stride=None,
+                 count=None):
+    """
+    Returns a copy of records sorted by key fields, optionally without duplicates.
+
+    :param packet_cls: the :code:`Packet` class of the records
+    :param source: a :code:`PacketTable`, the path of a file of records or a bytes-like object
+    :param keys: the (dotted) name, or list of names, of the fields to sort by (see
+        :code:`sort_order`)
+    :param bool reverse: whether to sort in descending order (default False)
+    :param dedup: :code:`'key'` to keep only the first record of every key, :code:`'record'` to
+        keep only the first of identical records or None to keep every record (default None)
+    :param int offset: the byte offset of the first record in a file or buffer (default 0)
+    :param int stride: the distance in bytes between records (default the packet size)
+    :param int count: the number of records (default as many as fit)
+    :rtype: bytearray
+    """
+    keys = _key_names(packet_cls, keys)
+    size = get_layout(packet_cls).size
+    with open_records(packet_cls, source, offset, stride, count) as records:
+        return _gather(records, _ordered(packet_cls, records, keys, reverse, dedup), size)
+
+
+def group_records(packet_cls, source, keys, offset=0, stride=None, count=None):
+    """
+    Groups records by key fields.
+
+    :param packet_cls: the :code:`Packet` class of the records
+    :param source: a :code:`PacketTable`, the path of a file of records or a bytes-like object
+    :param keys: the (dotted) name, or list of names, of the fields to group by
+    :param int offset: the byte offset of the first record in a file or buffer (default 0)
+    :param int stride: the distance in bytes between records (default the packet size)
+    :param int count: the number of records (default as many as fit)
+    :return: a list of :code:`(key, indices)` tuples in key order, where :code:`key` is the tuple
+        of the group's key values and :code:`indices` the increasing indices of its records
+    """
+    keys = _key_names(packet_cls, keys)
+    with open_records(packet_cls, source, offset, stride, count) as records:
+        cols = _key_columns(packet_cls, records, keys)
+        order = _sort(cols, records.count, False)
+        starts = list(_key_starts(cols, order))
+        ends = starts[1:] + [len(order)]
+        groups = []
+        for start, end in zip(starts, ends):
+            first = order[start]
+            key = tuple(col[first] for col in cols)
+            if numpy is not None:
+                key = tuple(val.item() for val in key)
+                groups.append((key, order[start:end]))
+            else:
+                groups.append((key, list(order[start:end])))
+        return groups
+
+
+def _read_run(path, size):
+    """yields the records of a run file"""
+    chunk = max(1, _MERGE_READ_SIZE // size) * size
+    with open(path, 'rb') as file_obj:
+        while True:
+            data = file_obj.read(chunk)
+            if not data:
+                return
+            for start in range(0, len(data), size):
+                yield data[start:start + size]
+
+
+if PY2:  # pragma: no cover
+    class _Descending(object):
+        """a key ordered the other way around"""
+        __slots__ = ('key',)
+
+        def __init__(self, key):
+            self.key = key
+
+        def __eq__(self, other):
+            return self.key == other.key
+
+        def __lt__(self, other):
+            return other.key < self.key
+
+    def _decorate(run, index, key, reverse):
+        for pos, raw in enumerate(run):
+            sort_key = key(raw)
+            yield (_Descending(sort_key) if reverse else sort_key), index, pos, raw
+
+    def _merge(runs, key, reverse):
+        # python 2's heapq.merge takes neither key nor reverse, so the records are decorated
+        #   with their key and position, which keeps the merge stable
+        decorated = [_decorate(run, index, key, reverse) for index, run in enumerate(runs)]
+        return (item[-1] for item in heapq.merge(*decorated))
+else:
+    def _merge(runs, key, reverse):
+        return heapq.merge(*runs, key=key, reverse=reverse)
+
+
+def _merge_runs(packet_cls, paths, out_file, keys, reverse, dedup):
+    layout = get_layout(packet_cls)
+    size = layout.size
+    fields = [layout[name] for name in keys]
+
+    def sort_key(raw):
+        return tuple(field.unpack_from(raw) for field in fields)
+
+    merged = _merge([_read_run(path, size) for path in paths], sort_key, reverse)
+    written = 0
+    for _, group in groupby(merged, key=sort_key):
+        if dedup == 'key':
+            group = [next(group)]
+        elif dedup == 'record':
+            # identical records have identical keys, they can only be within the same group
+            seen = set()
+            group = [raw for raw in group if not (raw in seen or seen.add(raw))]
+        for raw in group:
+            out_file.write(raw)
+            written += 1
+    return written
+
+
+def sort_file(packet_cls, path, out_path, keys, reverse=False, dedup=None,
+              memory_limit=DEFAULT_MEMORY_LIMIT, tmp_dir=None):
+    """
+    Sorts a file of records by key fields into a new file, optionally without duplicates.  Files
+    larger than :code:`memory_limit` are sorted in chunks of at most :code:`memory_limit` bytes
+    of records, written to temporary files and merged.
+
+    :param packet_cls: the :code:`Packet` class of the records
+    :param str path: the path of the file of records to sort
+    :param str out_path: the path of the sorted file to write
+    :param keys: the (dotted) name, or list of names, of the fields to sort by (see
+        :code:`sort_order`)
+    :param bool reverse: whether to sort in descending order (default False)
+    :param dedup: :code:`'key'`, :code:`'record'` or None (see :code:`sort_records`)
+    :param int memory_limit: the number of bytes of records sorted in memory at once
+    :param str tmp_dir: the directory of the temporary files (default the system's)
+    :return: the number of records written
+    :rtype: int
+    """
+    keys = _key_names(packet_cls, keys)
+    if dedup not in DEDUP_MODES:
+        raise ValueError("Unknown dedup mode {d!r}, expected one of {m}".format(
+            d=dedup, m=', '.join(repr(mode) for mode in DEDUP_MODES)
+        ))
+    size = get_layout(packet_cls).size
+    per_chunk = max(1, memory_limit // size)
+
+    if os.path.getsize(path) <= per_chunk * size:
+        data = sort_records(packet_cls, path, keys, reverse, dedup)
+        with open(out_path, 'wb') as out_file:
+            out_file.write(data)
+        return len(data) // size
+
+    run_dir = tempfile.mkdtemp(prefix='calpack_sort_', dir=tmp_dir)
+    try:
+        runs = []
+        with open(path, 'rb') as in_file:
+            while True:
+                # read into a bytearray, a bytes chunk would be taken for a path on python 2
+                chunk = bytearray(per_chunk * size)
+                read = in_file.readinto(chunk)
+                if read < size:
+                    break
+                del chunk[read:]
+                run_path = os.path.join(run_dir, 'run{}.bin'.format(len(runs)))
+                with open(run_path, 'wb') as run_file:
+                    run_file.write(sort_records(packet_cls, chunk, keys, reverse, dedup))
+                runs.append(run_path)
+
+        with open(out_path, 'wb') as out_file:
+            return _merge_runs(packet_cls, runs, out_file, keys, reverse, dedup)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
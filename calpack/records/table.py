@@ -0,0 +1,272 @@
+"""
+File backed tables of fixed size packet records.
+
+A :code:`PacketTable` memory maps a file holding a small header followed by the records back to
+back.  Opening a table only maps the file and checks its header, whatever its size, and every
+record is handed out as a :code:`Packet` view bound to the mapping: reading a field reads the
+page cache and setting a field writes it, with no intermediate copy.  Use :code:`flush` to force
+the changes to disk.
+
+The header records the size of the records and a fingerprint of the packet's encoding (see
+:code:`PacketLayout.fingerprint`), so a table is never read back with a packet class that
+doesn't match the records it holds.
+
+Example::
+
+    with PacketTable(DEVICE_STATE, 'devices.tbl') as table:
+        table.append(DEVICE_STATE(device_id=12))
+        table[0].temperature = 21
+        table.flush()
+"""
+import mmap
+import os
+
+from calpack import models
+from calpack.models.layout import get_layout
+from calpack.utils import PY2, TableFormatError
+
+
+__all__ = ['PacketTable', 'TABLE_HEADER', 'TABLE_MAGIC', 'TABLE_HEADER_SIZE']
+
+
+TABLE_MAGIC = 0x31424154504c4143  # "CALPTAB1"
+TABLE_VERSION = 1
+TABLE_HEADER_SIZE = 64
+
+# Files grow by at least this many bytes at a time, so appends don't remap the file every time
+_MIN_GROWTH = 1024 * 1024
+
+
+class TABLE_HEADER(models.Packet):
+    """
+    TABLE HEADER class.  The header found at the start of every packet table file.  The records
+    start :code:`TABLE_HEADER_SIZE` bytes into the file.  This packet uses native byte ordering.
+    """
+    magic = models.IntField64()
+    version = models.IntField32()
+    record_size = models.IntField32()
+    count = models.IntField64()
+    fingerprint = models.IntField64()
+    reserved = models.ArrayField(models.IntField8(), 32)
+
+
+class PacketTable(object):
+    """
+    A table of fixed size records of a :code:`Packet` class, stored in a memory mapped file.
+    The file is created when it doesn't exist.
+
+    Records are accessed by index (:code:`table[i]`) as :code:`Packet` views of the mapping, which
+    stay valid (and bound to the file) even after the table grows.  Slices return lists of views.
+
+    :param packet_cls: the :code:`Packet` class of the records (without variable length fields)
+    :param str path: the path of the table file
+    :param bool readonly: whether to open the table read only.  Views of a read only table can
+        still be modified, but the changes are private and never written to the file (default
+        False).
+    :raises TableFormatError: if the file isn't a packet table or holds different packets
+    """
+    def __init__(self, packet_cls, path, readonly=False):
+        if packet_cls._var_fields:
+            raise TypeError("{} has variable length fields, table records have a fixed size".format(
+                packet_cls.__name__
+            ))
+        self.packet_cls = packet_cls
+        self.path = path
+        self.readonly = readonly
+        self.record_size = len(packet_cls())
+        self.fingerprint = get_layout(packet_cls).fingerprint
+
+        if not readonly and not os.path.exists(path):
+            self._create(path)
+
+        self._file = open(path, 'rb' if readonly else 'r+b')
+        try:
+            self._map_file()
+            self._check_header()
+        except Exception:
+            self._file.close()
+            raise
+
+    def _create(self, path):
+        header = TABLE_HEADER(
+            magic=TABLE_MAGIC, version=TABLE_VERSION, record_size=self.record_size,
+            fingerprint=self.fingerprint
+        )
+        with open(path, 'wb') as file_obj:
+            file_obj.write(header.to_bytes())
+
+    def _map_file(self):
+        size = os.fstat(self._file.fileno()).st_size
+        if size < TABLE_HEADER_SIZE:
+            raise TableFormatError("{} is too small to be a packet table".format(self.path))
+
+        access = mmap.ACCESS_COPY if self.readonly else mmap.ACCESS_WRITE
+        self._map = mmap.mmap(self._file.fileno(), size, access=access)
+        if hasattr(self._map, 'madvise'):
+            self._map.madvise(mmap.MADV_RANDOM)
+        self._header = TABLE_HEADER.from_buffer(self._map)
+        self.capacity = (size - TABLE_HEADER_SIZE) // self.record_size
+
+    def _check_header(self):
+        header = self._header
+        if header.magic != TABLE_MAGIC:
+            raise TableFormatError("{} isn't a packet table".format(self.path))
+        if header.version != TABLE_VERSION:
+            raise TableFormatError("{p} has an unsupported version ({v})".format(
+                p=self.path, v=header.version
+            ))
+        if header.record_size != self.record_size or header.fingerprint != self.fingerprint:
+            raise TableFormatError(
+                "{p} holds records of a different packet than {c} (size {s}, fingerprint "
+                "{f:#018x})".format(
+                    p=self.path, c=self.packet_cls.__name__, s=header.record_size,
+                    f=header.fingerprint
+                )
+            )
+        if header.count > self.capacity:
+            raise TableFormatError("{} is truncated".format(self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Flushes and closes the table.  Views that are still referenced keep their mapping alive
+        until they are released.
+        """
+        if self._map is None:
+            return
+        if not self.readonly:
+            self._map.flush()
+        self._header = None
+        self._release(self._map)
+        self._map = None
+        self._file.close()
+
+    @staticmethod
+    def _release(old_map):
+        if PY2:  # pragma: no cover
+            # python 2's mmap can be closed under the views handed out, crashing them, so it's
+            #   left to be released along with its last view.
+            return
+        try:
+            old_map.close()
+        except BufferError:
+            # Views handed out are still alive, the mapping is released along with them.
+            pass
+
+    def flush(self):
+        """Writes the changes made to the table to disk"""
+        self._map.flush()
+
+    def __len__(self):
+        return self._header.count
+
+    def _offset(self, index):
+        count = self._header.count
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError("table index out of range")
+        return TABLE_HEADER_SIZE + index * self.record_size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return self.packet_cls.from_buffer(self._map, self._offset(index))
+
+    def _check_packet(self, pkt):
+        # a subclass adding fields would overrun its record
+        if not isinstance(pkt, self.packet_cls) or len(pkt) != self.record_size:
+            raise TypeError("table records must be of type {}, not {}".format(
+                self.packet_cls.__name__, type(pkt).__name__
+            ))
+
+    def __setitem__(self, index, pkt):
+        self._check_packet(pkt)
+        pkt.pack_into(self._map, self._offset(index))
+
+    def __iter__(self):
+        from_buffer, size, the_map = self.packet_cls.from_buffer, self.record_size, self._map
+        for i in range(len(self)):
+            yield from_buffer(the_map, TABLE_HEADER_SIZE + i * size)
+
+    def reserve(self, count):
+        """
+        Grows the file so it holds at least :code:`count` records without further growth.
+
+        :param int count: the number of records
+        """
+        if self.readonly:
+            raise TypeError("{} is open read only".format(self.path))
+        if count <= self.capacity:
+            return
+
+        # Grow geometrically so appending one record at a time stays cheap
+        size = TABLE_HEADER_SIZE + count * self.record_size
+        current = TABLE_HEADER_SIZE + self.capacity * self.record_size
+        size = max(size, current * 2, current + _MIN_GROWTH)
+        size -= (size - TABLE_HEADER_SIZE) % self.record_size
+
+        self._map.flush()
+        os.ftruncate(self._file.fileno(), size)
+        old_map = self._map
+        self._header = None
+        self._map_file()
+        # Views of the old mapping stay valid, both mappings share the file's pages
+        self._release(old_map)
+
+    def append(self, pkt):
+        """
+        Appends a record, growing the file when needed.
+
+        :param pkt: a packet of the table's class
+        :return: the index of the new record
+        :rtype: int
+        :raises TypeError: if :code:`pkt` isn't a packet of the table's class
+        """
+        self._check_packet(pkt)
+        index = self._header.count
+        self.reserve(index + 1)
+        pkt.pack_into(self._map, TABLE_HEADER_SIZE + index * self.record_size)
+        # The count is updated last, a crash never exposes a partially written record
+        self._header.count = index + 1
+        return index
+
+    def extend(self, pkts):
+        """
+        Appends several records, growing the file at most once.
+
+        :param pkts: a sequence of packets of the table's class
+        :raises TypeError: if any of :code:`pkts` isn't a packet of the table's class
+        """
+        for pkt in pkts:
+            self._check_packet(pkt)
+        index = self._header.count
+        self.reserve(index + len(pkts))
+        the_map, size = self._map, self.record_size
+        offset = TABLE_HEADER_SIZE + index * size
+        for pkt in pkts:
+            pkt.pack_into(the_map, offset)
+            offset += size
+        self._header.count = index + len(pkts)
+
+    @property
+    def records(self):
+        """
+        A zero-copy :code:`memoryview` of the records (without the header), i.e. to scan them
+        with a :code:`PacketFilter`.  On python 2, whose mmap doesn't support memoryview, it's a
+        read only :code:`buffer` of the records instead.
+        """
+        end = TABLE_HEADER_SIZE + len(self) * self.record_size
+        if PY2:  # pragma: no cover
+            return buffer(self._map, TABLE_HEADER_SIZE, end - TABLE_HEADER_SIZE)
+        return memoryview(self._map)[TABLE_HEADER_SIZE:end]
+
+    def __repr__(self):
+        return "PacketTable({c}, {p!r}, records={n})".format(
+            c=self.packet_cls.__name__, p=self.path, n=len(self)
+        )
@@ -5,7 +5,8 @@ import sys
 
 __all__ = [
     'InvalidArrayFieldSizeError', 'FieldNameError', 'FieldNameDoesntExistError', 'typed_property',
-    'PY2', 'PY3', 'PYPY'
+    'CaptureFormatError', 'DiscriminatorError', 'FilterError', 'FrozenPacketError',
+    'TableFormatError', 'DeltaFormatError', 'PY2', 'PY3', 'PYPY'
 ]
 
 _NO_TYPE = object()
@@ -31,6 +32,36 @@ class FieldAlreadyExistsError(Exception):
     pass
 
 
+class CaptureFormatError(Exception):
+    """An exception raised when a capture file is malformed or of an unknown format"""
+    pass
+
+
+class TableFormatError(Exception):
+    """An exception raised when a packet table file is malformed or holds different packets"""
+    pass
+
+
+class DiscriminatorError(Exception):
+    """An exception raised when a discriminator value is duplicated or isn't registered"""
+    pass
+
+
+class FilterError(Exception):
+    """An exception raised when a filter expression is invalid or can't be compiled"""
+    pass
+
+
+class FrozenPacketError(Exception):
+    """An exception raised when attempting to modify a frozen packet"""
+    pass
+
+
+class DeltaFormatError(Exception):
+    """An exception raised when a stream of delta encoded packets is truncated or malformed"""
+    pass
+
+
 def typed_property(name, expected_type, default_val=None):
     """
     Simple function used to ensure a specific type for a property defined within a class.  This can 
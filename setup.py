@@ -40,5 +40,5 @@ setup(
         'Topic :: Utilities',
     ],
     test_suite="tests.get_tests",
-    packages=find_packages(exclude=['tests', 'docs'])
+    packages=find_packages(exclude=['tests', 'docs', 'benchmarks'])
 )
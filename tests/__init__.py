@@ -20,7 +20,27 @@ def full_suite():
     from tests.test_FloatFields import Test_FloatField, Test_DoubleField, Test_LongDoubleField
     from tests.test_BoolField import Test_BoolField
     from tests.test_Repr import Test_Repr
-    from tests.test_Common_IP import Test_TCP_HEADER, Test_UDP_HEADER
+    from tests.test_Common_IP import Test_TCP_HEADER, Test_UDP_HEADER, Test_Network_Headers
+    from tests.test_Layout import Test_Layout
+    from tests.test_Checksum import Test_Checksum
+    from tests.test_Dissector import Test_Dissector
+    from tests.test_Registry import Test_Registry
+    from tests.test_Filters import Test_Filters
+    from tests.test_VarFields import Test_VarFields, Test_PayloadField, Test_OptionalField
+    from tests.test_Pickle import Test_Pickle
+    from tests.test_Parallel import Test_ParallelScan
+    from tests.test_Ring import Test_PacketRing
+    from tests.test_Seqlock import Test_SeqlockPacket
+    from tests.test_Table import Test_PacketTable
+    from tests.test_Index import Test_HashIndex
+    from tests.test_Columns import Test_Columns
+    from tests.test_Aggregate import Test_Aggregate
+    from tests.test_Sort import Test_Sort
+    from tests.test_Delta import Test_Delta
+    from tests.test_DirtyTracking import Test_DirtyTracking
+    from tests.test_ValueCache import Test_ValueCache
+    from tests.test_DecodeCache import Test_DecodeCache
+    from tests.test_Pcap import Test_PcapReader, Test_PcapNgReader, Test_PcapWriter
 
     return unittest.TestSuite([
         unittest.TestLoader().loadTestsFromTestCase(Test_BasicPacket),
@@ -37,7 +57,32 @@ def full_suite():
         unittest.TestLoader().loadTestsFromTestCase(Test_BoolField),
         unittest.TestLoader().loadTestsFromTestCase(Test_Repr),
         unittest.TestLoader().loadTestsFromTestCase(Test_TCP_HEADER),
-        unittest.TestLoader().loadTestsFromTestCase(Test_UDP_HEADER)
+        unittest.TestLoader().loadTestsFromTestCase(Test_UDP_HEADER),
+        unittest.TestLoader().loadTestsFromTestCase(Test_Layout),
+        unittest.TestLoader().loadTestsFromTestCase(Test_PcapReader),
+        unittest.TestLoader().loadTestsFromTestCase(Test_PcapNgReader),
+        unittest.TestLoader().loadTestsFromTestCase(Test_PcapWriter),
+        unittest.TestLoader().loadTestsFromTestCase(Test_Checksum),
+        unittest.TestLoader().loadTestsFromTestCase(Test_Network_Headers),
+        unittest.TestLoader().loadTestsFromTestCase(Test_Dissector),
+        unittest.TestLoader().loadTestsFromTestCase(Test_Registry),
+        unittest.TestLoader().loadTestsFromTestCase(Test_Filters),
+        unittest.TestLoader().loadTestsFromTestCase(Test_VarFields),
+        unittest.TestLoader().loadTestsFromTestCase(Test_PayloadField),
+        unittest.TestLoader().loadTestsFromTestCase(Test_OptionalField),
+        unittest.TestLoader().loadTestsFromTestCase(Test_Pickle),
+        unittest.TestLoader().loadTestsFromTestCase(Test_ParallelScan),
+        unittest.TestLoader().loadTestsFromTestCase(Test_PacketRing),
+        unittest.TestLoader().loadTestsFromTestCase(Test_SeqlockPacket),
+        unittest.TestLoader().loadTestsFromTestCase(Test_PacketTable),
+        unittest.TestLoader().loadTestsFromTestCase(Test_HashIndex),
+        unittest.TestLoader().loadTestsFromTestCase(Test_Columns),
+        unittest.TestLoader().loadTestsFromTestCase(Test_Aggregate),
+        unittest.TestLoader().loadTestsFromTestCase(Test_Sort),
+        unittest.TestLoader().loadTestsFromTestCase(Test_Delta),
+        unittest.TestLoader().loadTestsFromTestCase(Test_DirtyTracking),
+        unittest.TestLoader().loadTestsFromTestCase(Test_ValueCache),
+        unittest.TestLoader().loadTestsFromTestCase(Test_DecodeCache)
     ])
 
 if __name__ == "__main__":
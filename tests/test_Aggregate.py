@@ -0,0 +1,138 @@
+import unittest
+from collections import OrderedDict
+
+from calpack import models
+from calpack.common.ip import UDP_HEADER
+from calpack.records import aggregate, columns
+
+
+class SAMPLE(models.Packet):
+    port = models.IntField16()
+    delta = models.IntField(bit_len=6, signed=True)
+    urgent = models.BoolField()
+    gain = models.FloatField()
+    counters = models.ArrayField(models.IntField8(), 2)
+
+
+class Test_Aggregate(unittest.TestCase):
+    def setUp(self):
+        self.headers = [
+            UDP_HEADER(source_port=i % 7, dest_port=(i * 13) % 5 * 1000, length=8 + i % 60)
+            for i in range(500)
+        ]
+        self.buf = bytearray(b''.join(pkt.to_bytes() for pkt in self.headers))
+
+    def aggregate_both(self, *args, **kwargs):
+        """returns the results of an aggregation with and without NumPy"""
+        results = []
+        numpy = aggregate.numpy
+        for use_numpy in ([True, False] if numpy is not None else [False]):
+            aggregate.numpy = columns.numpy = numpy if use_numpy else None
+            try:
+                results.append(aggregate.aggregate(*args, **kwargs))
+            finally:
+                aggregate.numpy = columns.numpy = numpy
+        return results
+
+    def test_aggregations(self):
+        """
+        This test verifies every aggregation of a field across every record.
+        """
+        lengths = [pkt.length for pkt in self.headers]
+        for result in self.aggregate_both(UDP_HEADER, self.buf, 'length', aggregate.AGGREGATIONS,
+                                          bins=[0, 20, 40, 67]):
+            self.assertEqual(result['count'], 500)
+            self.assertEqual(result['sum'], sum(lengths))
+            self.assertEqual(result['min'], 8)
+            self.assertEqual(result['max'], 67)
+            self.assertAlmostEqual(result['mean'], sum(lengths) / 500.0)
+            self.assertEqual(result['distinct'], 60)
+            self.assertEqual(result['histogram'], [
+                sum(1 for val in lengths if val < 20),
+                sum(1 for val in lengths if 20 <= val < 40),
+                sum(1 for val in lengths if 40 <= val),
+            ])
+
+        for result in self.aggregate_both(UDP_HEADER, self.buf, 'source_port', 'histogram'):
+            self.assertEqual(result, OrderedDict(
+                (port, sum(1 for pkt in self.headers if pkt.source_port == port)) for port in range(7)
+            ))
+
+        for result in self.aggregate_both(UDP_HEADER, bytearray(), 'length',
+                                          ['count', 'sum', 'max'], by='dest_port'):
+            self.assertEqual(result, OrderedDict())
+        for result in self.aggregate_both(UDP_HEADER, bytearray(), 'length', ['count', 'mean']):
+            self.assertEqual(result, OrderedDict([('count', 0), ('mean', None)]))
+
+    def test_grouped_aggregations(self):
+        """
+        This test verifies aggregations grouped by the values of another field.
+        """
+        groups = OrderedDict()
+        for pkt in sorted(self.headers, key=lambda pkt: pkt.dest_port):
+            groups.setdefault(pkt.dest_port, []).append(pkt.length)
+
+        for result in self.aggregate_both(UDP_HEADER, self.buf, 'length', aggregate.AGGREGATIONS,
+                                          by='dest_port', bins=[0, 30, 100]):
+            self.assertEqual(list(result), list(groups))
+            for port, lengths in groups.items():
+                self.assertEqual(result[port]['count'], len(lengths))
+                self.assertEqual(result[port]['sum'], sum(lengths))
+                self.assertEqual(result[port]['min'], min(lengths))
+                self.assertEqual(result[port]['max'], max(lengths))
+                self.assertAlmostEqual(result[port]['mean'], sum(lengths) / float(len(lengths)))
+                self.assertEqual(result[port]['distinct'], len(set(lengths)))
+                self.assertEqual(result[port]['histogram'], [
+                    sum(1 for val in lengths if val < 30), sum(1 for val in lengths if val >= 30)
+                ])
+
+        results = self.aggregate_both(UDP_HEADER, self.buf, 'length', 'histogram', by='dest_port')
+        for result in results:
+            length = groups[1000][0]
+            self.assertEqual(result[1000][length], groups[1000].count(length))
+        self.assertEqual(results[0], results[-1])
+
+    def test_field_kinds(self):
+        """
+        This test verifies aggregating and grouping by bit, bool, float and array fields.
+        """
+        samples = [
+            SAMPLE(port=i % 3, delta=i % 64 - 32, urgent=i % 4 == 0, gain=i / 2.0,
+                   counters=[i % 10, 20])
+            for i in range(200)
+        ]
+        buf = bytearray(b''.join(pkt.to_bytes() for pkt in samples))
+
+        results = self.aggregate_both(SAMPLE, buf, 'delta', ['sum', 'min', 'max'], by='urgent')
+        for result in results:
+            self.assertEqual(list(result), [0, 1])
+            self.assertEqual(result[1]['sum'], sum(pkt.delta for pkt in samples if pkt.urgent))
+            self.assertEqual(result[0]['min'], -31)
+            self.assertEqual(result[1]['max'], 28)
+        self.assertEqual(results[0], results[-1])
+
+        for result in self.aggregate_both(SAMPLE, buf, 'gain', 'sum', by='port'):
+            self.assertEqual(result[2], sum(pkt.gain for pkt in samples if pkt.port == 2))
+        for result in self.aggregate_both(SAMPLE, buf, 'counters', ['count', 'sum'], by='port'):
+            self.assertEqual(result[0]['count'], 2 * 67)
+            self.assertEqual(result[0]['sum'],
+                             sum(sum(pkt.counters) for pkt in samples if pkt.port == 0))
+        for result in self.aggregate_both(SAMPLE, buf, 'port', 'distinct', by='gain'):
+            self.assertEqual(len(result), 200)
+        for result in self.aggregate_both(SAMPLE, buf, 'urgent', 'sum'):
+            self.assertEqual(result, 50)
+
+    def test_invalid_aggregations(self):
+        """
+        This test verifies that unknown aggregations and fields that can't be grouped by raise.
+        """
+        self.assertRaises(ValueError, aggregate.aggregate, UDP_HEADER, self.buf, 'length', 'median')
+        self.assertRaises(ValueError, aggregate.aggregate, UDP_HEADER, self.buf, 'length',
+                          'histogram', bins=[1])
+        self.assertRaises(TypeError, aggregate.aggregate, SAMPLE, bytearray(), 'port', 'sum',
+                          by='counters')
+        self.assertRaises(KeyError, aggregate.aggregate, UDP_HEADER, self.buf, 'nope', 'sum')
+
+
+if __name__ == '__main__':
+    unittest.main()
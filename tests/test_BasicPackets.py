@@ -1,10 +1,12 @@
 import unittest
+import copy
 import ctypes
 import struct
 import sys
 
 from calpack import models
-from calpack.utils import PYPY, FieldAlreadyExistsError, FieldNameDoesntExistError
+from calpack.utils import PYPY, FieldAlreadyExistsError, FieldNameDoesntExistError, \
+    FrozenPacketError
 
 
 class Test_BasicPacket(unittest.TestCase):
@@ -126,6 +128,116 @@ class Test_BasicPacket(unittest.TestCase):
         self.assertFalse(pkt_orig == pkt_same_class_different_values)
         self.assertNotEqual(pkt_orig, pkt_same_class_different_values)
 
+    def test_pkt_compare_after_modification(self):
+        """
+        This test verifies that comparing packets reflects changes made after an earlier
+        comparison, including changes made through a shared buffer.
+        """
+        class two_int_field_packet(models.Packet):
+            int_field = models.IntField()
+            int_field_signed = models.IntField(signed=True)
+
+        buf = bytearray(two_int_field_packet(int_field=1).to_bytes())
+        pkt1 = two_int_field_packet.from_buffer(buf)
+        pkt2 = two_int_field_packet(int_field=1)
+        self.assertEqual(pkt1, pkt2)
+
+        pkt2.int_field_signed = -3
+        self.assertNotEqual(pkt1, pkt2)
+
+        buf[4:8] = struct.pack('i', -3)
+        self.assertEqual(pkt1, pkt2)
+
+    def test_pkt_frozen_is_hashable(self):
+        """
+        This test verifies that frozen packets are hashable, equal to packets with the same
+        contents and can key sets and dicts.
+        """
+        class two_int_field_packet(models.Packet):
+            int_field = models.IntField()
+            int_field_signed = models.IntField(signed=True)
+
+        pkt = two_int_field_packet(int_field=1, int_field_signed=-1)
+        frozen = pkt.frozen()
+
+        self.assertIsInstance(frozen, two_int_field_packet)
+        self.assertEqual(frozen, pkt)
+        self.assertEqual(pkt, frozen)
+        self.assertIs(frozen.frozen(), frozen)
+        self.assertIs(type(frozen), type(two_int_field_packet().frozen()))
+
+        seen = set([frozen, two_int_field_packet(int_field=1, int_field_signed=-1).frozen()])
+        self.assertEqual(len(seen), 1)
+        seen.add(two_int_field_packet(int_field=2).frozen())
+        self.assertEqual(len(seen), 2)
+        self.assertEqual({frozen: 'flow'}[pkt.frozen()], 'flow')
+
+        # the frozen packet is a copy
+        pkt.int_field = 5
+        self.assertEqual(frozen.int_field, 1)
+        self.assertNotEqual(frozen, pkt)
+
+        with self.assertRaises(TypeError):
+            hash(pkt)
+
+    def test_pkt_frozen_cannot_be_modified(self):
+        """
+        This test verifies that setting a field of a frozen packet raises an error.
+        """
+        class two_int_field_packet(models.Packet):
+            int_field = models.IntField()
+            int_field_signed = models.IntField(signed=True)
+
+        frozen = two_int_field_packet(int_field=1).frozen()
+        with self.assertRaises(FrozenPacketError):
+            frozen.int_field = 2
+        self.assertEqual(frozen.int_field, 1)
+
+    def test_pkt_copy(self):
+        """
+        This test verifies that copies of a packet, including nested packet and array fields, are
+        independent of the original.
+        """
+        class inner_pkt(models.Packet):
+            int_field = models.IntField8()
+
+        class outer_pkt(models.Packet):
+            inner = models.PacketField(inner_pkt)
+            array = models.ArrayField(models.IntField16(), 3)
+
+        pkt = outer_pkt(array=[1, 2, 3])
+        pkt.inner.int_field = 5
+
+        for duplicate in (pkt.copy(), copy.copy(pkt), copy.deepcopy(pkt)):
+            self.assertIsInstance(duplicate, outer_pkt)
+            self.assertEqual(duplicate, pkt)
+
+        duplicate = pkt.copy()
+        pkt.inner.int_field = 7
+        pkt.array = [4, 5, 6]
+        self.assertEqual(duplicate.inner.int_field, 5)
+        self.assertEqual(duplicate.array, (1, 2, 3))
+
+    def test_pkt_clone_many(self):
+        """
+        This test verifies that clones of a template are equal to it and independent of each
+        other.
+        """
+        class two_int_field_packet(models.Packet):
+            int_field = models.IntField()
+            int_field_signed = models.IntField(signed=True)
+
+        template = two_int_field_packet(int_field=3, int_field_signed=-3)
+        clones = template.clone_many(4)
+
+        self.assertEqual(len(clones), 4)
+        self.assertTrue(all(clone == template for clone in clones))
+
+        clones[1].int_field = 9
+        self.assertEqual([clone.int_field for clone in clones], [3, 9, 3, 3])
+        self.assertEqual(template.int_field, 3)
+        self.assertEqual(template.clone_many(0), [])
+
     def test_pkt_export_to_bytes_string(self):
         """
         This test verifies that a `Packet` class can create a properly sized bytes string from the
@@ -179,6 +291,44 @@ class Test_BasicPacket(unittest.TestCase):
         self.assertEqual(p.int_field, p2.int_field)
         self.assertEqual(p.int_field_signed, p2.int_field_signed)
 
+    def test_pkt_from_buffer_shares_memory(self):
+        """
+        This test verifies that a packet created with `from_buffer` uses the buffer as its internal
+        memory without making a copy.
+        """
+        class two_int_field_packet(models.Packet):
+            int_field = models.IntField()
+            int_field_signed = models.IntField(signed=True)
+
+        buf = bytearray(4) + bytearray(struct.pack('Ii', 34, -12))
+        pkt = two_int_field_packet.from_buffer(buf, 4)
+
+        self.assertEqual(pkt.int_field, 34)
+        self.assertEqual(pkt.int_field_signed, -12)
+
+        pkt.int_field = 12
+        self.assertEqual(bytes(buf[4:8]), struct.pack('I', 12))
+
+        buf[8:12] = struct.pack('i', -1)
+        self.assertEqual(pkt.int_field_signed, -1)
+
+        with self.assertRaises(TypeError):
+            two_int_field_packet.from_buffer(bytes(buf))
+
+    def test_pkt_pack_into_buffer(self):
+        class two_int_field_packet(models.Packet):
+            int_field = models.IntField()
+            int_field_signed = models.IntField(signed=True)
+
+        pkt = two_int_field_packet(int_field=34, int_field_signed=-12)
+        buf = bytearray(12)
+
+        self.assertEqual(pkt.pack_into(buf, 2), 8)
+        self.assertEqual(bytes(buf), b'\x00\x00' + pkt.to_bytes() + b'\x00\x00')
+
+        with self.assertRaises(ValueError):
+            pkt.pack_into(buf, 6)
+
     def test_pkt_two_instances_different_field_instances(self):
         """
         This test verifies that two instances of the same `Packet` class can be created and does
@@ -0,0 +1,168 @@
+import random
+import struct
+import unittest
+
+from calpack.common import checksum
+from calpack.common.checksum import *
+from calpack.common.ip import UDP_HEADER_BIG, TCP_HEADER_OPTIONS_BIG
+from calpack.utils import PYPY
+
+
+def word_checksum(data):
+    """A straight forward word by word implementation of RFC 1071 to check against"""
+    if len(data) % 2:
+        data += b'\x00'
+    total = 0
+    for i in range(0, len(data), 2):
+        total += struct.unpack('>H', data[i:i + 2])[0]
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+
+class Test_Checksum(unittest.TestCase):
+    def setUp(self):
+        self.random = random.Random(1071)
+
+    def random_bytes(self, length):
+        return bytes(bytearray(self.random.randint(0, 255) for _ in range(length)))
+
+    def test_checksum_rfc1071_example(self):
+        data = b'\x00\x01\xf2\x03\xf4\xf5\xf6\xf7'
+        self.assertEqual(ones_complement_sum(data), 0xddf2)
+        self.assertEqual(internet_checksum(data), 0x220d)
+
+    def test_checksum_matches_word_by_word_sum(self):
+        """
+        This test verifies the checksum against a word by word implementation, including odd
+        length buffers split into odd length chunks.
+        """
+        for length in range(1, 64):
+            data = self.random_bytes(length)
+            self.assertEqual(internet_checksum(data), word_checksum(data))
+            self.assertEqual(internet_checksum(memoryview(data)), word_checksum(data))
+
+            cut_1 = self.random.randint(0, length)
+            cut_2 = self.random.randint(cut_1, length)
+            self.assertEqual(
+                internet_checksum(data[:cut_1], bytearray(data[cut_1:cut_2]), data[cut_2:]),
+                word_checksum(data)
+            )
+
+        self.assertEqual(internet_checksum(b'\x00\x00'), 0xffff)
+        self.assertEqual(internet_checksum(b'\xff\xff'), 0)
+
+    def test_checksum_incremental_update(self):
+        for _ in range(200):
+            data = self.random_bytes(self.random.randint(2, 40))
+            offset = self.random.randint(0, len(data) - 1)
+            length = self.random.randint(1, len(data) - offset)
+            new = self.random_bytes(length)
+            updated = data[:offset] + new + data[offset + length:]
+
+            self.assertEqual(
+                update_checksum(internet_checksum(data), data[offset:offset + length], new,
+                                offset),
+                word_checksum(updated)
+            )
+
+        with self.assertRaises(ValueError):
+            update_checksum(0, b'\x00', b'\x00\x00')
+
+    def test_checksum_many(self):
+        data = self.random_bytes(21 * 50) + b'\xff' * 21
+        expected = [word_checksum(data[i * 21:(i + 1) * 21]) for i in range(51)]
+
+        if checksum.numpy is not None:
+            self.assertEqual([int(c) for c in checksum_many(data, 21)], expected)
+
+        numpy, checksum.numpy = checksum.numpy, None
+        try:
+            self.assertEqual(checksum_many(data, 21), expected)
+            self.assertEqual(checksum_many(data, 21, 3), expected[:3])
+        finally:
+            checksum.numpy = numpy
+
+    def test_checksum_udp_ipv4_and_ipv6(self):
+        """
+        This test verifies that a UDP datagram with its computed checksum sums to zero with its
+        pseudo header, and that rewriting the port incrementally matches a recomputation.
+        """
+        if PYPY:
+            return True
+
+        payload = b'calpack!x'
+        for src, dst, pseudo in [
+                ('10.0.0.1', '10.0.0.2', ipv4_pseudo_header),
+                ('fe80::1', 'fe80::2', ipv6_pseudo_header)]:
+            udp = UDP_HEADER_BIG(source_port=1234, dest_port=53, length=8 + len(payload),
+                                 checksum=0xbeef)
+            udp.checksum = udp_checksum(udp, payload, src, dst)
+
+            header = pseudo(src, dst, IPPROTO_UDP, 8 + len(payload))
+            self.assertEqual(internet_checksum(header, udp.to_bytes(), payload), 0)
+
+            udp.checksum = update_checksum_word(udp.checksum, udp.dest_port, 5353)
+            udp.dest_port = 5353
+            self.assertEqual(udp.checksum, udp_checksum(udp, payload, src, dst))
+
+    def test_checksum_tcp(self):
+        if PYPY:
+            return True
+
+        tcp = TCP_HEADER_OPTIONS_BIG(source_port=80, dest_port=4000, seq_num=1, data_offset=6)
+        tcp.options = b'\x02\x04\x05\xb4'
+        self.assertEqual(len(tcp.to_bytes()), 24)
+        tcp.checksum = tcp_checksum(tcp, b'abc', b'\x0a\x00\x00\x01', b'\x0a\x00\x00\x02')
+
+        header = ipv4_pseudo_header('10.0.0.1', '10.0.0.2', IPPROTO_TCP, 24 + 3)
+        self.assertEqual(internet_checksum(header, tcp.to_bytes(), b'abc'), 0)
+
+        old = tcp.to_bytes()
+        tcp.seq_num = 0xdeadbeef
+        self.assertEqual(
+            update_checksum(tcp.checksum, old[4:8], tcp.to_bytes()[4:8], 4),
+            tcp_checksum(tcp, b'abc', '10.0.0.1', '10.0.0.2')
+        )
+
+    def test_checksum_tcp_captured_segment(self):
+        """
+        This test verifies the checksum of a captured segment (an ACK from 131.151.32.129 to
+        131.151.32.21 with a timestamp option) against the checksum it was sent with.
+        """
+        if PYPY:
+            return True
+
+        segment = (
+            b'\x04\x95\x17\x70\x51\xd4\xee\x9c\x51\xa5\x5b\x36\x80\x10\x7c\x70'
+            b'\x12\xc7\x00\x00\x01\x01\x08\x0a\x00\x04\xf0\xd4\x01\x99\xa3\xfd'
+        )
+        tcp = TCP_HEADER_OPTIONS_BIG.from_bytes(segment)
+        self.assertEqual(tcp.to_bytes(), segment)
+        self.assertEqual(tcp.checksum, 0x12c7)
+        self.assertEqual(tcp_checksum(tcp, b'', '131.151.32.129', '131.151.32.21'), 0x12c7)
+        self.assertEqual(
+            tcp_checksum(tcp, b'', b'\x83\x97\x20\x81', b'\x83\x97\x20\x15'), 0x12c7
+        )
+
+    def test_checksum_dirty_update(self):
+        if PYPY:
+            return True
+
+        tcp = TCP_HEADER_OPTIONS_BIG(source_port=80, dest_port=4000, seq_num=1, data_offset=5)
+        tcp.checksum = tcp_checksum(tcp, b'abc', '10.0.0.1', '10.0.0.2')
+        original = tcp.checksum
+
+        tcp.track_changes()
+        tcp.dest_port = 8080
+        tcp.flag_syn = 1
+        tcp.ack_num = 0x01020304
+        updated = update_checksum_dirty(original, tcp)
+        # the checksum field's own changes are left out when excluded
+        tcp.checksum = 0x1234
+        self.assertEqual(update_checksum_dirty(original, tcp, exclude=['checksum']), updated)
+
+        tcp.checksum = 0
+        self.assertEqual(updated, tcp_checksum(tcp, b'abc', '10.0.0.1', '10.0.0.2'))
+
+if __name__ == '__main__':
+    unittest.main()
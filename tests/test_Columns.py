@@ -0,0 +1,123 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from calpack import models
+from calpack.common.ip import TCP_HEADER, TCP_HEADER_BIG
+from calpack.records import columns
+from calpack.records.table import PacketTable
+from calpack.utils import PYPY
+
+
+class SAMPLE(models.Packet):
+    temperature = models.IntField16(signed=True)
+    level = models.IntField(bit_len=5, signed=True)
+    mode = models.IntField(bit_len=3)
+    valid = models.BoolField()
+    gain = models.FloatField()
+    channels = models.ArrayField(models.IntField16(), 3)
+
+
+class Test_Columns(unittest.TestCase):
+    def setUp(self):
+        self.samples = [
+            SAMPLE(temperature=i - 50, level=(i % 32) - 16, mode=i % 8, valid=i % 3 == 0,
+                   gain=i / 4.0, channels=[i, i + 1, i + 2])
+            for i in range(100)
+        ]
+        self.buf = bytearray(b''.join(pkt.to_bytes() for pkt in self.samples))
+
+    def read_both(self, *args, **kwargs):
+        """returns the columns read with and without NumPy, as lists"""
+        results = []
+        numpy = columns.numpy
+        for use_numpy in ([True, False] if numpy is not None else [False]):
+            columns.numpy = numpy if use_numpy else None
+            try:
+                cols = columns.read_columns(*args, **kwargs)
+            finally:
+                columns.numpy = numpy
+            results.append(dict((name, [
+                val.tolist() if hasattr(val, 'tolist') else val for val in col
+            ]) for name, col in cols.items()))
+        return results
+
+    def test_read_columns(self):
+        """
+        This test verifies that signed, bit, bool, float and array fields decode into columns.
+        """
+        for cols in self.read_both(SAMPLE, self.buf, ['level', 'temperature', 'mode', 'valid',
+                                                      'gain']):
+            self.assertEqual(cols['temperature'], [pkt.temperature for pkt in self.samples])
+            self.assertEqual(cols['level'], [pkt.level for pkt in self.samples])
+            self.assertEqual(cols['mode'], [pkt.mode for pkt in self.samples])
+            self.assertEqual([bool(v) for v in cols['valid']], [pkt.valid for pkt in self.samples])
+            self.assertEqual(cols['gain'], [pkt.gain for pkt in self.samples])
+
+        numpy_cols = self.read_both(SAMPLE, self.buf, 'channels')
+        if columns.numpy is not None:
+            self.assertEqual(numpy_cols[0]['channels'], [[i, i + 1, i + 2] for i in range(100)])
+        self.assertEqual(
+            numpy_cols[-1]['channels'], [i + j for i in range(100) for j in range(3)]
+        )
+
+    def test_byte_orders_offsets_and_strides(self):
+        """
+        This test verifies columns of big endian packets, of records at an offset or with gaps
+        between them, and empty sources.
+        """
+        classes = [TCP_HEADER] if PYPY else [TCP_HEADER, TCP_HEADER_BIG]
+        for cls in classes:
+            pkts = [cls(dest_port=i * 300, seq_num=i << 20, flag_syn=i % 2, data_offset=i % 16)
+                    for i in range(40)]
+            buf = bytearray(b'\xff' * 3 + b''.join(pkt.to_bytes() + b'\xee' * 2 for pkt in pkts))
+            names = ['dest_port', 'seq_num', 'flag_syn', 'data_offset']
+            for cols in self.read_both(cls, buf, names, offset=3, stride=len(pkts[0]) + 2):
+                for name in names:
+                    self.assertEqual(cols[name], [getattr(pkt, name) for pkt in pkts])
+
+            for cols in self.read_both(cls, buf, names, offset=3, stride=len(pkts[0]) + 2,
+                                       count=5):
+                self.assertEqual(cols['dest_port'], [i * 300 for i in range(5)])
+
+            for cols in self.read_both(cls, bytearray(), names):
+                self.assertEqual(cols['seq_num'], [])
+
+    def test_files_and_tables(self):
+        """
+        This test verifies reading the columns of a file of records and of a PacketTable.
+        """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'samples.bin')
+            with open(path, 'wb') as file_obj:
+                file_obj.write(self.buf)
+            self.assertEqual(
+                list(columns.read_column(SAMPLE, path, 'temperature')), list(range(-50, 50))
+            )
+
+            with PacketTable(SAMPLE, os.path.join(tmp_dir, 'samples.tbl')) as table:
+                table.extend(self.samples[:10])
+                self.assertEqual(list(columns.read_column(SAMPLE, table, 'mode')),
+                                 [i % 8 for i in range(10)])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_invalid_fields(self):
+        """
+        This test verifies that fields that can't be columns are refused.
+        """
+        class WRAPPER(models.Packet):
+            sample = models.PacketField(SAMPLE)
+
+        self.assertRaises(TypeError, columns.read_columns, WRAPPER, b'', ['sample'])
+        self.assertRaises(KeyError, columns.read_columns, SAMPLE, b'', ['nope'])
+        self.assertEqual(
+            list(columns.read_column(WRAPPER, self.buf, 'sample.temperature')),
+            list(range(-50, 50))
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
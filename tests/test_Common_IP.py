@@ -147,3 +147,80 @@ class Test_TCP_HEADER(unittest.TestCase):
         expected_val = struct.pack('<HHIIBBHH', *expected_data)
 
         self.assertEqual(header.to_bytes(), expected_val)
+
+
+class Test_Network_Headers(unittest.TestCase):
+    def test_ipv4_header_big(self):
+        if PYPY:
+            return True
+
+        header = IPV4_HEADER_BIG(
+            version=4,
+            ihl=5,
+            dscp=0x2e,
+            ecn=1,
+            total_length=28,
+            identification=0xbeef,
+            flags=2,
+            fragment_offset=0x123,
+            ttl=64,
+            protocol=17,
+            checksum=0xcafe,
+            source_addr=0x0a000001,
+            dest_addr=0x0a000002
+        )
+
+        expected_val = struct.pack(
+            '>BBHHHBBHII', 0x45, 0xb9, 28, 0xbeef, 0x4123, 64, 17, 0xcafe, 0x0a000001, 0x0a000002
+        )
+
+        self.assertEqual(header.to_bytes(), expected_val)
+
+    def test_ipv6_header_big(self):
+        if PYPY:
+            return True
+
+        header = IPV6_HEADER_BIG(
+            version=6,
+            traffic_class=0xab,
+            flow_label=0x12345,
+            payload_length=8,
+            next_header=17,
+            hop_limit=255,
+            dest_addr=tuple(range(16))
+        )
+
+        expected_val = struct.pack('>IHBB', 0x6ab12345, 8, 17, 255) + b'\x00' * 16 + \
+            bytes(bytearray(range(16)))
+
+        self.assertEqual(header.to_bytes(), expected_val)
+
+    def test_ethernet_icmp_arp_header_sizes(self):
+        self.assertEqual(len(ETHERNET_HEADER()), 14)
+        self.assertEqual(len(VLAN_HEADER()), 4)
+        self.assertEqual(len(ICMP_HEADER()), 8)
+        self.assertEqual(len(ARP_HEADER()), 28)
+
+        if PYPY:
+            return True
+
+        header = ETHERNET_HEADER_BIG(dest_mac=(1, 2, 3, 4, 5, 6), ethertype=0x0800)
+        self.assertEqual(header.to_bytes(), b'\x01\x02\x03\x04\x05\x06' + b'\x00' * 6 + b'\x08\x00')
+
+    def test_tcp_header_options(self):
+        self.assertEqual(len(TCP_HEADER_OPTIONS()), 20)
+
+        cls = TCP_HEADER_OPTIONS if PYPY else TCP_HEADER_OPTIONS_BIG
+        header = cls(dest_port=443, data_offset=6, urgent_pointer=5, options=b'\x02\x04\x05\xb4')
+        self.assertEqual(len(header), 24)
+        self.assertTrue(header.to_bytes().endswith(b'\x00\x05\x02\x04\x05\xb4'))
+
+        decoded = cls.from_bytes(header.to_bytes() + b'payload')
+        self.assertIsNone(decoded._var_cache)
+        self.assertEqual(decoded.options, b'\x02\x04\x05\xb4')
+        self.assertEqual(decoded.urgent_pointer, 5)
+        self.assertEqual(len(decoded), 24)
+
+        no_options = cls.from_bytes(cls(data_offset=5).to_bytes() + b'payload')
+        self.assertIsNone(no_options.options)
+        self.assertEqual(len(no_options), 20)
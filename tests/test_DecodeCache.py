@@ -0,0 +1,169 @@
+import threading
+import unittest
+
+from calpack import models
+from calpack.models.cache import DecodeCache
+from calpack.utils import FrozenPacketError
+
+
+class HEARTBEAT(models.Packet):
+    node_id = models.IntField16()
+    state = models.IntField8(bit_len=4)
+    uptime = models.IntField32()
+
+
+class KEEPALIVE(models.Packet):
+    node_id = models.IntField16()
+    note = models.BytesField(length_prefix=models.IntField8())
+
+
+class Test_DecodeCache(unittest.TestCase):
+    def tearDown(self):
+        HEARTBEAT.disable_decode_cache()
+        KEEPALIVE.disable_decode_cache()
+
+    def test_cached_decodes(self):
+        """
+        This test verifies that identical bytes return the same frozen packet, and the counters.
+        """
+        cache = HEARTBEAT.enable_decode_cache(max_entries=4)
+        self.assertIs(HEARTBEAT.decode_cache(), cache)
+        data = HEARTBEAT(node_id=3, state=2, uptime=100).to_bytes()
+
+        first = HEARTBEAT.from_bytes(data)
+        self.assertIs(HEARTBEAT.from_bytes(bytearray(data)), first)
+        self.assertIs(HEARTBEAT.from_bytes(memoryview(data)), first)
+        self.assertIsInstance(first, HEARTBEAT)
+        self.assertEqual((first.node_id, first.state, first.uptime), (3, 2, 100))
+        self.assertEqual(first, HEARTBEAT(node_id=3, state=2, uptime=100))
+        with self.assertRaises(FrozenPacketError):
+            first.uptime = 5
+        self.assertEqual(cache.stats(), {
+            'hits': 2, 'misses': 1, 'evictions': 0, 'entries': 1, 'nbytes': 2 * len(data)
+        })
+
+        for uptime in range(10):
+            HEARTBEAT.from_bytes(HEARTBEAT(uptime=uptime).to_bytes())
+        self.assertEqual(len(cache), 4)
+        self.assertEqual((cache.misses, cache.evictions), (11, 7))
+
+        # the least recently used packets are evicted first
+        recent = HEARTBEAT(uptime=6).to_bytes()
+        HEARTBEAT.from_bytes(recent)
+        HEARTBEAT.from_bytes(HEARTBEAT(uptime=10).to_bytes())
+        hits = cache.hits
+        HEARTBEAT.from_bytes(recent)
+        self.assertEqual(cache.hits, hits + 1)
+
+        cache.clear()
+        self.assertEqual((len(cache), cache.nbytes), (0, 0))
+
+    def test_copies_and_limits(self):
+        """
+        This test verifies returning copies, and the byte limit of the cache.
+        """
+        cache = HEARTBEAT.enable_decode_cache(frozen=False, max_bytes=40)
+        data = HEARTBEAT(node_id=1).to_bytes()
+        first, second = HEARTBEAT.from_bytes(data), HEARTBEAT.from_bytes(data)
+        self.assertIsNot(first, second)
+        self.assertIs(type(first), HEARTBEAT)
+        first.node_id = 2
+        self.assertEqual(HEARTBEAT.from_bytes(data).node_id, 1)
+
+        for node_id in range(10):
+            HEARTBEAT.from_bytes(HEARTBEAT(node_id=node_id).to_bytes())
+        self.assertLessEqual(cache.nbytes, 40)
+        self.assertEqual(len(cache), 40 // (2 * len(data)))
+
+        self.assertRaises(ValueError, HEARTBEAT.enable_decode_cache, max_entries=0)
+
+        # variable length packets own their bytes
+        KEEPALIVE.enable_decode_cache()
+        data = bytearray(KEEPALIVE(node_id=1, note=b'alive').to_bytes())
+        pkt = KEEPALIVE.from_bytes(data)
+        data[4] = ord('X')
+        self.assertEqual(pkt.note, b'alive')
+        self.assertEqual(KEEPALIVE.from_bytes(data).note, b'aXive')
+
+    def test_cache_is_per_class(self):
+        """
+        This test verifies that subclasses, frozen variants and other classes decode without the
+        cache, and disabling it.
+        """
+        class SUB_HEARTBEAT(HEARTBEAT):
+            pass
+
+        cache = HEARTBEAT.enable_decode_cache()
+        data = HEARTBEAT(node_id=9).to_bytes()
+        self.assertIs(type(SUB_HEARTBEAT.from_bytes(data)), SUB_HEARTBEAT)
+        self.assertEqual(KEEPALIVE.decode_cache(), None)
+        self.assertEqual(cache.stats()['misses'], 0)
+        self.assertEqual(type(HEARTBEAT().frozen()).from_bytes(data).node_id, 9)
+
+        HEARTBEAT.disable_decode_cache()
+        self.assertIs(HEARTBEAT.decode_cache(), None)
+        self.assertIs(type(HEARTBEAT.from_bytes(data)), HEARTBEAT)
+        self.assertNotIn('from_bytes', HEARTBEAT.__dict__)
+
+    def test_subclass_caches(self):
+        """
+        This test verifies that a subclass of a class with a cache can have its own, and that
+        disabling a cache puts a class' own from_bytes back.
+        """
+        class SUB_HEARTBEAT(HEARTBEAT):
+            pass
+
+        class CUSTOM_HEARTBEAT(HEARTBEAT):
+            @classmethod
+            def from_bytes(cls, buf):
+                pkt = super(CUSTOM_HEARTBEAT, cls).from_bytes(buf)
+                pkt.node_id += 1000
+                return pkt
+
+        HEARTBEAT.enable_decode_cache()
+        sub_cache = SUB_HEARTBEAT.enable_decode_cache()
+        data = HEARTBEAT(node_id=4).to_bytes()
+        pkt = SUB_HEARTBEAT.from_bytes(data)
+        self.assertIs(type(pkt)._mutable_cls, SUB_HEARTBEAT)
+        self.assertIs(SUB_HEARTBEAT.from_bytes(data), pkt)
+        self.assertEqual(sub_cache.stats()['misses'], 1)
+        self.assertEqual(HEARTBEAT.decode_cache().stats()['misses'], 0)
+        SUB_HEARTBEAT.disable_decode_cache()
+        self.assertNotIn('from_bytes', SUB_HEARTBEAT.__dict__)
+
+        override = CUSTOM_HEARTBEAT.__dict__['from_bytes']
+        CUSTOM_HEARTBEAT.enable_decode_cache()
+        self.assertEqual(CUSTOM_HEARTBEAT.from_bytes(data).node_id, 1004)
+        self.assertEqual(CUSTOM_HEARTBEAT.decode_cache().stats()['misses'], 1)
+        CUSTOM_HEARTBEAT.disable_decode_cache()
+        self.assertIs(CUSTOM_HEARTBEAT.__dict__['from_bytes'], override)
+        self.assertEqual(CUSTOM_HEARTBEAT.from_bytes(data).node_id, 1004)
+        self.assertIsNone(CUSTOM_HEARTBEAT.decode_cache())
+
+    def test_threads(self):
+        """
+        This test verifies decoding through the cache from several threads.
+        """
+        cache = HEARTBEAT.enable_decode_cache(max_entries=8)
+        datas = [HEARTBEAT(node_id=i % 12).to_bytes() for i in range(2000)]
+        errors = []
+
+        def decode():
+            try:
+                for data in datas:
+                    self.assertEqual(HEARTBEAT.from_bytes(data).to_bytes(), data)
+            except Exception as exc:  # pragma: no cover
+                errors.append(exc)
+
+        threads = [threading.Thread(target=decode) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(cache.hits + cache.misses, 8000)
+        self.assertIsInstance(cache, DecodeCache)
+
+
+if __name__ == '__main__':
+    unittest.main()
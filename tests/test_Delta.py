@@ -0,0 +1,189 @@
+import struct
+import unittest
+
+from calpack import models
+from calpack.common.ip import TCP_HEADER_BIG
+from calpack.records.delta import DeltaEncoder, DeltaDecoder, delta_encode, delta_decode
+from calpack.utils import DeltaFormatError, PYPY
+
+
+class POSITION(models.Packet):
+    x = models.IntField16(signed=True)
+    y = models.IntField16(signed=True)
+
+
+class TELEMETRY(models.Packet):
+    timestamp = models.IntField64()
+    sequence = models.IntField32()
+    mode = models.IntField8(bit_len=3)
+    alarm = models.IntField8(bit_len=1)
+    temperature = models.FloatField()
+    position = models.PacketField(POSITION)
+    channels = models.ArrayField(models.IntField16(signed=True), 4)
+    status = models.IntField8()
+
+
+class WIDE(models.Packet):
+    gains = models.ArrayField(models.DoubleField(), 2)
+    counts = models.ArrayField(models.IntField8(), 70)
+    total = models.IntField64()
+
+
+class Test_Delta(unittest.TestCase):
+    def setUp(self):
+        self.samples = []
+        for i in range(300):
+            self.samples.append(TELEMETRY(
+                timestamp=1000000 + i, sequence=(i * 7) % (1 << 32), mode=(i // 50) % 8,
+                alarm=int(i == 120), temperature=21.5 + (i // 100) * 0.25,
+                position=POSITION(x=-3 * (i // 10), y=i % 5), channels=[i % 3, -1, 0, i],
+                status=255 if i > 200 else 0,
+            ))
+        self.raw = bytearray(b''.join(pkt.to_bytes() for pkt in self.samples))
+
+    def test_round_trip(self):
+        """
+        This test verifies that streams decode to the exact bytes of the packets, and are
+        smaller than the packets.
+        """
+        encoder, decoder = DeltaEncoder(TELEMETRY), DeltaDecoder(TELEMETRY)
+        data = b''
+        for pkt in self.samples:
+            encoded = encoder.encode(pkt)
+            raw, end = decoder.decode(encoded)
+            self.assertEqual(raw, pkt.to_bytes())
+            self.assertEqual(end, len(encoded))
+            data += encoded
+        self.assertLess(len(data), len(self.raw) // 4)
+
+        self.assertEqual(delta_encode(TELEMETRY, self.raw), data)
+        self.assertEqual(bytes(delta_decode(TELEMETRY, data)), self.raw)
+        self.assertEqual(
+            [pkt.to_bytes() for pkt in DeltaDecoder(TELEMETRY).decode_packets(data)],
+            [pkt.to_bytes() for pkt in self.samples]
+        )
+
+        # an unchanged packet is only its bitmap
+        unchanged = encoder.encode(self.samples[-1])
+        self.assertEqual(unchanged, b'\x00' * len(unchanged))
+        self.assertLessEqual(len(unchanged), 2)
+
+    def test_wrapping_and_extremes(self):
+        """
+        This test verifies differences that wrap around, and the extreme values of signed and
+        unsigned fields.
+        """
+        values = [0, (1 << 64) - 1, 0, 1 << 63, (1 << 63) - 1, 5, 4]
+        pkts = [
+            TELEMETRY(timestamp=val, sequence=val >> 32, position=POSITION(x=(val >> 48) - 32768),
+                      channels=[-32768, 32767, val & 0x7fff, 0])
+            for val in values
+        ]
+        raw = bytearray(b''.join(pkt.to_bytes() for pkt in pkts))
+        self.assertEqual(bytes(delta_decode(TELEMETRY, delta_encode(TELEMETRY, raw))), raw)
+
+        # big endian bit fields and padding
+        if not PYPY:
+            headers = [TCP_HEADER_BIG(seq_num=i * 1000, data_offset=i % 16, flag_syn=i % 2)
+                       for i in range(40)]
+            raw = bytearray(b''.join(pkt.to_bytes() for pkt in headers))
+            self.assertEqual(bytes(delta_decode(TCP_HEADER_BIG, delta_encode(TCP_HEADER_BIG, raw))),
+                             raw)
+
+    def test_first_packet_and_deltas(self):
+        """
+        This test verifies that the first packet is encoded against a packet of zeros and the
+        following ones against the previous packet.
+        """
+        encoder = DeltaEncoder(POSITION)
+        self.assertEqual(encoder.encode(POSITION()), b'\x00')
+        encoder.reset()
+
+        pkts = [POSITION(x=1, y=-1), POSITION(x=1, y=-1), POSITION(x=3, y=-1)]
+        encoded = [encoder.encode(pkt) for pkt in pkts]
+        self.assertEqual(encoded, [b'\x03\x02\x01', b'\x00', b'\x01\x04'])
+
+        decoder = DeltaDecoder(POSITION)
+        self.assertEqual([decoder.decode(data)[0] for data in encoded],
+                         [pkt.to_bytes() for pkt in pkts])
+        # a delta decoded out of order applies to whatever packet came before it
+        self.assertEqual(DeltaDecoder(POSITION).decode(encoded[2])[0],
+                         POSITION(x=2).to_bytes())
+
+    def test_zigzag_extremes(self):
+        """
+        This test verifies the zigzag encoding of the largest positive and negative differences
+        of a field, which wrap around between its min and max.
+        """
+        encoder, decoder = DeltaEncoder(POSITION), DeltaDecoder(POSITION)
+        expected = [
+            (POSITION(x=-32768), b'\x01\xff\xff\x03'),
+            (POSITION(x=32767), b'\x01\x01'),
+            (POSITION(x=-32768), b'\x01\x02'),
+            (POSITION(x=-32768, y=32767), b'\x02\xfe\xff\x03'),
+            (POSITION(x=0, y=-32768), b'\x03\xff\xff\x03\x02'),
+        ]
+        for pkt, data in expected:
+            self.assertEqual(encoder.encode(pkt), data)
+            self.assertEqual(decoder.decode(data)[0], pkt.to_bytes())
+
+        encoder, decoder = DeltaEncoder(WIDE), DeltaDecoder(WIDE)
+        data = encoder.encode(WIDE(total=1 << 63))
+        self.assertEqual(data, b'\x00' * 8 + b'\x80' + b'\xff' * 9 + b'\x01')
+        self.assertEqual(decoder.decode(data)[0], WIDE(total=1 << 63).to_bytes())
+
+    def test_wide_fields(self):
+        """
+        This test verifies fields wider than 8 bytes, which are encoded as raw bytes, and bitmaps
+        of more than 64 fields.
+        """
+        encoder, decoder = DeltaEncoder(WIDE), DeltaDecoder(WIDE)
+        first = WIDE(gains=[1.5, -2.25], counts=list(range(70)), total=(1 << 64) - 1)
+        second = WIDE(gains=[1.5, -2.25], counts=list(range(70)), total=5)
+        third = WIDE(gains=[0.5, -2.25], counts=list(range(70)), total=5)
+
+        encoded = [encoder.encode(pkt) for pkt in (first, second, third)]
+        # the bitmap of the 72 fields (gains, every count and total) is 9 bytes
+        self.assertEqual(encoded[1], b'\x00' * 8 + b'\x80' + b'\x0c')
+        self.assertEqual(encoded[2], b'\x01' + b'\x00' * 8 + struct.pack('=2d', 0.5, -2.25))
+        self.assertEqual([decoder.decode(data)[0] for data in encoded],
+                         [pkt.to_bytes() for pkt in (first, second, third)])
+
+    def test_corrupted_streams(self):
+        """
+        This test verifies that truncated and corrupted packets raise, leaving the decoder as it
+        was.
+        """
+        decoder = DeltaDecoder(POSITION)
+        for data in (b'', b'\x01', b'\x01\xff', b'\x03\x02'):
+            self.assertRaises(DeltaFormatError, decoder.decode, data)
+        # a field that doesn't exist, a difference longer or larger than a 16 bit field's
+        for data in (b'\x04', b'\x01\xff\xff\xff\x01', b'\x01\xff\xff\x07'):
+            self.assertRaises(DeltaFormatError, decoder.decode, data)
+        self.assertEqual(decoder.decode(b'\x01\x02')[0], POSITION(x=1).to_bytes())
+
+        data = DeltaEncoder(WIDE).encode(WIDE(gains=[1.5, 0]))
+        self.assertRaises(DeltaFormatError, DeltaDecoder(WIDE).decode, data[:-1])
+        self.assertRaises(DeltaFormatError, delta_decode, WIDE, data + data[:5])
+
+    def test_reset_and_errors(self):
+        """
+        This test verifies resetting both sides of a stream, and that malformed streams raise.
+        """
+        encoder, decoder = DeltaEncoder(TELEMETRY), DeltaDecoder(TELEMETRY)
+        first = encoder.encode(self.samples[5])
+        encoder.encode(self.samples[6])
+        encoder.reset()
+        self.assertEqual(encoder.encode(self.samples[5]), first)
+        self.assertEqual(decoder.decode(first)[0], self.samples[5].to_bytes())
+        decoder.reset()
+        self.assertEqual(decoder.decode(first)[0], self.samples[5].to_bytes())
+
+        data = delta_encode(TELEMETRY, self.raw)
+        self.assertRaises(DeltaFormatError, delta_decode, TELEMETRY, data[:-1])
+        self.assertRaises(DeltaFormatError, delta_decode, TELEMETRY, first[:2])
+        self.assertRaises(ValueError, encoder.encode, b'\x00')
+
+
+if __name__ == '__main__':
+    unittest.main()
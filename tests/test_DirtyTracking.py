@@ -0,0 +1,163 @@
+import unittest
+
+from calpack import models
+from calpack.models.fields import Field
+from calpack.utils import FrozenPacketError
+
+
+class POINT(models.Packet):
+    x = models.IntField16()
+    y = models.IntField16()
+
+
+class RELAYED(models.Packet):
+    msg_id = models.IntField32()
+    hops = models.IntField8()
+    priority = models.IntField8(bit_len=3)
+    urgent = models.IntField8(bit_len=1)
+    position = models.PacketField(POINT)
+    values = models.ArrayField(models.IntField16(), 4)
+
+
+class MESSAGE(models.Packet):
+    msg_id = models.IntField16()
+    name = models.BytesField(length_prefix=models.IntField8())
+
+
+class Test_DirtyTracking(unittest.TestCase):
+    def test_dirty_fields_and_ranges(self):
+        """
+        This test verifies which fields and byte ranges of a packet are tracked as modified.
+        """
+        pkt = RELAYED.from_bytes(RELAYED(msg_id=7, hops=1, values=[1, 2, 3, 4]).to_bytes())
+        self.assertFalse(pkt.is_tracking_changes)
+        self.assertRaises(TypeError, lambda: pkt.dirty_fields)
+        self.assertIs(pkt.track_changes(), pkt)
+        self.assertTrue(pkt.is_tracking_changes)
+        self.assertEqual(pkt.dirty_fields, frozenset())
+        self.assertEqual(pkt.dirty_ranges(), [])
+
+        pkt.hops = 2
+        pkt.urgent = 1
+        pkt.values = [1, 2, 3, 5]
+        self.assertEqual(pkt.dirty_fields, frozenset(['hops', 'urgent', 'values']))
+        # hops and the bit fields' storage unit are adjacent, and merged
+        self.assertEqual(pkt.dirty_ranges(), [(4, 6), (10, 18)])
+        self.assertEqual(pkt.dirty_changes(), [
+            (4, b'\x01\x00', b'\x02\x08'),
+            (10, b'\x01\x00\x02\x00\x03\x00\x04\x00', b'\x01\x00\x02\x00\x03\x00\x05\x00'),
+        ])
+
+        pkt.position = POINT(x=3)
+        self.assertIn((4, 18), pkt.dirty_ranges())
+
+        pkt.to_bytes()
+        self.assertEqual(pkt.dirty_fields, frozenset())
+        pkt.msg_id = 8
+        self.assertEqual(pkt.dirty_ranges(), [(0, 4)])
+        pkt.clear_changes()
+        self.assertEqual(pkt.dirty_fields, frozenset())
+
+        pkt.track_changes(False)
+        pkt.hops = 3
+        self.assertFalse(pkt.is_tracking_changes)
+        self.assertNotIn('set_c_field', pkt.__dict__)
+
+    def test_pack_dirty_into(self):
+        """
+        This test verifies patching only the modified ranges into an existing copy of a packet.
+        """
+        pkt = RELAYED(msg_id=7, hops=1, values=[1, 2, 3, 4])
+        out = bytearray(b'\xee' * 4) + bytearray(pkt.to_bytes())
+        pkt.track_changes()
+        pkt.priority = 5
+        pkt.values = [9, 9, 9, 9]
+        self.assertEqual(pkt.pack_dirty_into(out, 4), [(5, 6), (10, 18)])
+        self.assertEqual(bytes(out), b'\xee' * 4 + pkt.to_bytes())
+        self.assertEqual(pkt.pack_dirty_into(out, 4), [])
+
+        pkt.hops = 4
+        self.assertRaises(ValueError, pkt.pack_dirty_into, bytearray(4))
+
+        msg = MESSAGE.from_bytes(MESSAGE(msg_id=1, name=b'abc').to_bytes()).track_changes()
+        out = bytearray(msg.to_bytes()) + bytearray(2)
+        msg.name = b'abcde'
+        msg.msg_id = 2
+        self.assertEqual(msg.dirty_ranges(), [(0, 2), (2, 8)])
+        self.assertEqual(msg.dirty_changes(), [(0, b'\x01\x00', b'\x02\x00')])
+        msg.pack_dirty_into(out)
+        self.assertEqual(bytes(out), MESSAGE(msg_id=2, name=b'abcde').to_bytes())
+
+    def test_adjacent_and_bit_field_ranges(self):
+        """
+        This test verifies that adjacent ranges are merged while separate ones aren't, and that a
+        bit field covers its whole storage unit.
+        """
+        pkt = RELAYED(msg_id=7, hops=1, priority=2, values=[1, 2, 3, 4]).track_changes()
+        pkt.urgent = 1
+        self.assertEqual(pkt.dirty_ranges(), [(5, 6)])
+        self.assertEqual(pkt.dirty_changes(), [(5, b'\x02', b'\x0a')])
+
+        pkt.clear_changes()
+        pkt.msg_id = 8
+        pkt.position = POINT(y=1)
+        self.assertEqual(pkt.dirty_ranges(), [(0, 4), (6, 10)])
+        pkt.hops = 2
+        self.assertEqual(pkt.dirty_ranges(), [(0, 5), (6, 10)])
+        pkt.priority = 3
+        self.assertEqual(pkt.dirty_ranges(), [(0, 10)])
+
+    def test_set_c_field_and_var_fields_tracked(self):
+        """
+        This test verifies that fields set with set_c_field and variable length fields are
+        tracked like any other field.
+        """
+        pkt = RELAYED().track_changes()
+        pkt.set_c_field('hops', 3)
+        self.assertEqual(pkt.dirty_fields, frozenset(['hops']))
+        self.assertEqual(pkt.dirty_ranges(), [(4, 5)])
+
+        msg = MESSAGE(msg_id=1, name=b'abc').track_changes()
+        msg.name = b'xyz'
+        self.assertEqual(msg.dirty_fields, frozenset(['name']))
+        self.assertEqual(msg.dirty_ranges(), [(2, 6)])
+        self.assertEqual(msg.dirty_changes(), [])
+
+    def test_pack_dirty_into_keeps_clean_bytes(self):
+        """
+        This test verifies that pack_dirty_into only writes the modified ranges, leaving the
+        other bytes of the buffer as they were even when they don't hold the packet.
+        """
+        pkt = RELAYED(msg_id=7, hops=1, values=[1, 2, 3, 4]).track_changes()
+        pkt.hops = 2
+        pkt.values = [5, 6, 7, 8]
+        out = bytearray(b'\xee' * (len(pkt) + 2))
+        self.assertEqual(pkt.pack_dirty_into(out, 1), [(4, 5), (10, 18)])
+
+        expected = bytearray(b'\xee' * (len(pkt) + 2))
+        raw = pkt.to_bytes()
+        expected[1 + 4:1 + 5] = raw[4:5]
+        expected[1 + 10:1 + 18] = raw[10:18]
+        self.assertEqual(out, expected)
+
+    def test_tracking_is_opt_in(self):
+        """
+        This test verifies that tracking a packet's changes doesn't affect other packets, and
+        that frozen packets can't track changes.
+        """
+        tracked, untracked = RELAYED().track_changes(), RELAYED()
+        untracked.hops = 1
+        self.assertNotIn('set_c_field', untracked.__dict__)
+        self.assertEqual(type(untracked).set_c_field, models.Packet.set_c_field)
+        self.assertEqual(tracked.dirty_fields, frozenset())
+        self.assertRaises(TypeError, untracked.dirty_ranges)
+        self.assertEqual(RELAYED.__dict__['hops'].__class__.__set__, Field.__set__)
+
+        self.assertRaises(FrozenPacketError, RELAYED().frozen().track_changes)
+
+        copied = tracked.copy()
+        self.assertFalse(copied.is_tracking_changes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+
+from calpack import models
+from calpack.common.dissector import *
+from calpack.common.ip import *
+from calpack.utils import PYPY
+
+
+def eth(ethertype):
+    return ETHERNET_HEADER_BIG(dest_mac=(1, 2, 3, 4, 5, 6), ethertype=ethertype).to_bytes()
+
+
+def ipv4(protocol, ihl=5, fragment_offset=0):
+    header = IPV4_HEADER_BIG(version=4, ihl=ihl, protocol=protocol, ttl=64,
+                             fragment_offset=fragment_offset).to_bytes()
+    return header + b'\x00' * (ihl * 4 - len(header))
+
+
+class Test_Dissector(unittest.TestCase):
+    def setUp(self):
+        if PYPY:
+            self.skipTest("PyPy does not support non-native endianess")
+        self.dissector = Dissector()
+
+    def test_dissect_ethernet_ipv4_udp(self):
+        """
+        This test verifies that the layers of a frame are found and decoded as views over the
+        frame's bytes.
+        """
+        data = bytearray(
+            eth(ETHERTYPE_IPV4) + ipv4(IPPROTO_UDP) +
+            UDP_HEADER_BIG(source_port=1234, dest_port=53, length=12).to_bytes() + b'dns!'
+        )
+        frame = self.dissector.dissect(data)
+
+        self.assertEqual(frame.layers, ('ethernet', 'ipv4', 'udp'))
+        self.assertEqual(frame.ethernet.dest_mac, (1, 2, 3, 4, 5, 6))
+        self.assertEqual(frame.ipv4.ttl, 64)
+        self.assertEqual(frame[UDP_HEADER_BIG].dest_port, 53)
+        self.assertIs(frame.udp, frame['udp'])
+        self.assertEqual(frame.offset('udp'), 34)
+        self.assertEqual(frame.payload.tobytes(), b'dns!')
+        self.assertIsNone(frame.tcp)
+        self.assertNotIn('tcp', frame)
+
+        frame.udp.dest_port = 5353
+        self.assertEqual(bytes(data[36:38]), b'\x14\xe9')
+
+    def test_dissect_is_lazy(self):
+        data = bytearray(eth(ETHERTYPE_IPV4) + ipv4(IPPROTO_TCP) + b'\x00' * 20)
+        frame = self.dissector.dissect(data)
+
+        self.assertIsNotNone(frame.ethernet)
+        self.assertEqual(len(frame._steps), 1)
+        self.assertEqual(list(frame._packets), [self.dissector.layer('ethernet')])
+        self.assertIn('ipv4', frame)
+        self.assertEqual(len(frame._steps), 2)
+
+    def test_dissect_vlan_ipv6_tcp_with_options(self):
+        tcp = TCP_HEADER_BIG(source_port=80, dest_port=4000, data_offset=6).to_bytes()
+        data = bytearray(
+            eth(ETHERTYPE_VLAN) +
+            VLAN_HEADER_BIG(vlan_id=100, ethertype=ETHERTYPE_IPV6).to_bytes() +
+            IPV6_HEADER_BIG(version=6, next_header=IPPROTO_TCP).to_bytes() +
+            tcp + b'\x00' * (24 - len(tcp)) + b'body'
+        )
+        frame = self.dissector.dissect(data)
+
+        self.assertEqual(frame.layers, ('ethernet', 'vlan', 'ipv6', 'tcp'))
+        self.assertEqual(frame.vlan.vlan_id, 100)
+        self.assertEqual(frame.tcp.dest_port, 4000)
+        self.assertEqual(frame.tcp.options, b'\x00' * 4)
+        self.assertEqual(frame.payload.tobytes(), b'body')
+
+        # read-only frames decode the options from a view of the frame
+        frame = self.dissector.dissect(bytes(data))
+        self.assertEqual(frame.tcp.options, b'\x00' * 4)
+
+    def test_dissect_stops_at_fragments_unknown_and_truncated(self):
+        fragment = eth(ETHERTYPE_IPV4) + ipv4(IPPROTO_UDP, fragment_offset=10) + b'\x00' * 8
+        self.assertEqual(self.dissector.classify(fragment), ('ethernet', 'ipv4'))
+
+        unknown = eth(0x88b5) + b'\x00' * 20
+        self.assertEqual(self.dissector.classify(unknown), ('ethernet',))
+
+        truncated = eth(ETHERTYPE_IPV4) + ipv4(IPPROTO_UDP) + b'\x00' * 4
+        self.assertEqual(self.dissector.classify(truncated), ('ethernet', 'ipv4'))
+
+        self.assertEqual(self.dissector.classify(b'\x00' * 4), ())
+        self.assertEqual(self.dissector.dissect(b'\x00' * 4).layers, ())
+
+    def test_dissect_read_only_frames_and_arp(self):
+        arp = ARP_HEADER_BIG(operation=1, target_proto_addr=0x0a000001)
+        data = eth(ETHERTYPE_ARP) + arp.to_bytes()
+        frame = self.dissector.dissect(data)
+
+        self.assertEqual(frame.layers, ('ethernet', 'arp'))
+        self.assertEqual(frame.arp.operation, 1)
+        self.assertEqual(frame.arp.target_proto_addr, 0x0a000001)
+
+    def test_dissect_registered_layer(self):
+        class TELEMETRY(models.PacketBigEndian):
+            msg_id = models.IntField16()
+
+        ports = {}
+        self.dissector.register(UDP_HEADER_BIG, 'udp', 'dest_port', ports)
+        ports[9000] = TELEMETRY
+        self.dissector.register(TELEMETRY, 'telemetry')
+
+        data = bytearray(
+            eth(ETHERTYPE_IPV4) + ipv4(IPPROTO_UDP) +
+            UDP_HEADER_BIG(dest_port=9000).to_bytes() + TELEMETRY(msg_id=7).to_bytes()
+        )
+        frame = self.dissector.dissect(data)
+        self.assertEqual(frame.telemetry.msg_id, 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
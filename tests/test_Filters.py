@@ -0,0 +1,153 @@
+import random
+import struct
+import unittest
+
+from calpack import models
+from calpack.common.ip import TCP_HEADER, TCP_HEADER_BIG, ETHERNET_HEADER_BIG
+from calpack.models import filters
+from calpack.utils import FilterError, FieldNameDoesntExistError, PYPY
+
+
+class Test_Filters(unittest.TestCase):
+    def setUp(self):
+        self.tcp_classes = [TCP_HEADER] if PYPY else [TCP_HEADER, TCP_HEADER_BIG]
+
+    def scan_both(self, pkt_filter, buf, **kwargs):
+        """returns the results of scan with and without NumPy"""
+        numpy = filters.numpy
+        results = [list(pkt_filter.scan(buf, **kwargs))]
+        if numpy is not None:
+            filters.numpy = None
+            try:
+                plain = filters.compile_filter(pkt_filter.packet_cls, pkt_filter.expression)
+            finally:
+                filters.numpy = numpy
+            results.append(list(plain.scan(buf, **kwargs)))
+        return results
+
+    def test_filter_single_record(self):
+        """
+        This test verifies that a filter evaluates bit fields and whole byte fields on raw bytes,
+        for native and big endian packets.
+        """
+        for cls in self.tcp_classes:
+            syn_https = cls.compile_filter("dest_port == 443 and flag_syn")
+
+            self.assertTrue(syn_https(cls(dest_port=443, flag_syn=1).to_bytes()))
+            self.assertFalse(syn_https(cls(dest_port=443, flag_ack=1).to_bytes()))
+            self.assertFalse(syn_https(cls(dest_port=80, flag_syn=1).to_bytes()))
+
+            # offsets into a larger buffer and the internal c structure of a packet
+            raw = bytearray(10) + cls(dest_port=443, flag_syn=1).to_bytes()
+            self.assertTrue(syn_https(raw, 10))
+            self.assertTrue(syn_https(cls(dest_port=443, flag_syn=1).c_pkt))
+
+    def test_filter_scan(self):
+        """
+        This test verifies that scanning a buffer of records returns the same indices as testing
+        each decoded packet, with and without NumPy.
+        """
+        rand = random.Random(42)
+        expressions = [
+            "dest_port == 443 and flag_syn",
+            "not flag_ack or data_offset > 5",
+            "source_port in (1, 2, 3) and dest_port not in [4, 5]",
+            "1000 < seq_num - 10 <= 2000000 and (flag_fin | flag_rst)",
+            "(source_port & 0xff) == 3 or window_size // 2 == 7",
+        ]
+
+        for cls in self.tcp_classes:
+            pkts = []
+            for _ in range(300):
+                pkts.append(cls(
+                    source_port=rand.randint(0, 5), dest_port=rand.choice([4, 80, 443, 259]),
+                    seq_num=rand.randint(0, 3000000), data_offset=rand.randint(0, 15),
+                    flag_syn=rand.randint(0, 1), flag_ack=rand.randint(0, 1),
+                    flag_fin=rand.randint(0, 1), flag_rst=rand.randint(0, 1),
+                    window_size=rand.randint(10, 20)
+                ))
+            buf = b''.join(pkt.to_bytes() for pkt in pkts)
+
+            for expression in expressions:
+                predicate = eval("lambda pkt: " + expression.replace(
+                    "dest_port", "pkt.dest_port").replace("source_port", "pkt.source_port"
+                ).replace("seq_num", "pkt.seq_num").replace("flag_", "pkt.flag_").replace(
+                    "data_offset", "pkt.data_offset").replace("window_size", "pkt.window_size"))
+                expected = [i for i, pkt in enumerate(pkts) if predicate(pkt)]
+                self.assertTrue(expected)
+
+                pkt_filter = cls.compile_filter(expression)
+                for result in self.scan_both(pkt_filter, buf):
+                    self.assertEqual(result, expected, expression)
+
+    def test_filter_scan_stride(self):
+        """
+        This test verifies scanning records with a stride larger than the packet and a start
+        offset, and that partial trailing records are ignored.
+        """
+        class record(models.PacketLittleEndian if not PYPY else models.Packet):
+            value = models.IntField16(signed=True)
+            small = models.IntField8(bit_len=3, signed=True)
+            other = models.IntField8(bit_len=5)
+
+        values = [-5, 3, 7, -5, 0]
+        buf = bytearray(3)
+        for val in values:
+            buf += record(value=val, small=-2 if val < 0 else 1).to_bytes() + b'\x00' * 4
+        buf += b'\xfb\xff'
+
+        pkt_filter = record.compile_filter("value == -5 and small < 0")
+        for result in self.scan_both(pkt_filter, buf, offset=3, stride=7):
+            self.assertEqual(result, [0, 3])
+        for result in self.scan_both(pkt_filter, buf, offset=3, stride=7, count=2):
+            self.assertEqual(result, [0])
+        for result in self.scan_both(pkt_filter, b''):
+            self.assertEqual(result, [])
+
+    def test_filter_nested_and_arrays(self):
+        """
+        This test verifies dotted names of encapsulated packets and items of array fields.
+        """
+        eth = ETHERNET_HEADER_BIG(dest_mac=[0xff] * 6, source_mac=[0, 1, 2, 3, 4, 5],
+                                  ethertype=0x0800)
+        broadcast_ipv4 = ETHERNET_HEADER_BIG.compile_filter(
+            "dest_mac[0] == 0xff and source_mac[-1] == 5 and ethertype == 0x800"
+        )
+        self.assertTrue(broadcast_ipv4(eth.to_bytes()))
+
+        class inner(models.Packet):
+            msg_id = models.IntField16()
+
+        class outer(models.Packet):
+            flag = models.BoolField()
+            header = models.PacketField(inner)
+
+        pkts = [outer(flag=True), outer(), outer()]
+        pkts[1].header.msg_id = 9
+        buf = b''.join(pkt.to_bytes() for pkt in pkts)
+        pkt_filter = outer.compile_filter("header.msg_id == 9 or flag == True")
+        for result in self.scan_both(pkt_filter, buf):
+            self.assertEqual(result, [0, 1])
+
+    def test_filter_errors(self):
+        """
+        This test verifies the errors raised for invalid expressions.
+        """
+        with self.assertRaises(FieldNameDoesntExistError):
+            TCP_HEADER.compile_filter("not_a_field == 1")
+        with self.assertRaises(FilterError):
+            TCP_HEADER.compile_filter("dest_port ==")
+        with self.assertRaises(FilterError):
+            TCP_HEADER.compile_filter("dest_port == 'abc'")
+        with self.assertRaises(FilterError):
+            TCP_HEADER.compile_filter("len(dest_port) == 1")
+        with self.assertRaises(FilterError):
+            TCP_HEADER.compile_filter("dest_port in source_port")
+        with self.assertRaises(FilterError):
+            ETHERNET_HEADER_BIG.compile_filter("dest_mac == 1")
+        with self.assertRaises(FilterError):
+            ETHERNET_HEADER_BIG.compile_filter("dest_mac[6] == 1")
+
+
+if __name__ == '__main__':
+    unittest.main()
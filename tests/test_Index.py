@@ -0,0 +1,136 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from calpack import models
+from calpack.common.ip import UDP_HEADER
+from calpack.records import index
+from calpack.records.table import PacketTable
+from calpack.utils import TableFormatError
+
+
+class FLOW(models.Packet):
+    src_addr = models.IntField32()
+    dst_addr = models.IntField32()
+    src_port = models.IntField16()
+    dst_port = models.IntField16()
+    proto = models.IntField(bit_len=5)
+    direction = models.IntField(bit_len=3, signed=True)
+
+
+FIVE_TUPLE = ('src_addr', 'dst_addr', 'src_port', 'dst_port', 'proto')
+
+
+class Test_HashIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.flows = [
+            FLOW(src_addr=i % 50, dst_addr=7, src_port=1000 + i % 50, dst_port=53, proto=17,
+                 direction=-1 if i % 2 else 1)
+            for i in range(300)
+        ]
+        self.buf = b''.join(flow.to_bytes() for flow in self.flows)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def both(self, func):
+        """runs func with and without NumPy"""
+        func()
+        numpy = index.numpy
+        if numpy is not None:
+            index.numpy = None
+            try:
+                func()
+            finally:
+                index.numpy = numpy
+
+    def test_lookup_in_buffer(self):
+        """
+        This test verifies single field and composite keys, including bit fields and keys held
+        by several records, for an index over a buffer.
+        """
+        def check():
+            by_port = index.HashIndex(FLOW, 'src_port', self.buf)
+            self.assertEqual(len(by_port), 300)
+            self.assertEqual(sorted(by_port.lookup(1003)), list(range(3, 300, 50)))
+            self.assertEqual(by_port.lookup(999), [])
+            self.assertEqual(by_port.first(1049), 49)
+            self.assertNotIn(80, by_port)
+
+            flows = index.HashIndex(FLOW, FIVE_TUPLE, self.buf)
+            self.assertEqual(len(flows.lookup((3, 7, 1003, 53, 17))), 6)
+            self.assertEqual(flows.get((3, 7, 1003, 53, 17)), self.flows[3])
+            self.assertIsNone(flows.get((3, 7, 1003, 53, 6)))
+            self.assertRaises(ValueError, flows.lookup, (3, 7))
+
+            signed = index.HashIndex(FLOW, ('direction', 'src_addr'), self.buf)
+            self.assertEqual(sorted(signed.lookup((-1, 1))), list(range(1, 300, 50)))
+
+        self.both(check)
+
+    def test_hash_matches_columns(self):
+        """
+        This test verifies that the NumPy and pure python hashes agree.
+        """
+        numpy = index.numpy
+        if numpy is None:
+            self.skipTest("requires NumPy")
+        cols = [
+            numpy.array([0, 1, 2 ** 63, 2 ** 64 - 1, 12345, 7], dtype=numpy.uint64),
+            numpy.array([0, -1, 1, -12345, 2 ** 62, -2 ** 63], dtype=numpy.int64),
+            numpy.array([True, False, True, False, True, False]),
+        ]
+        hashes = index._hash_columns(cols, 6).tolist()
+        expected = [index.hash_key(values) for values in zip(*[col.tolist() for col in cols])]
+        self.assertEqual(hashes, expected)
+
+    def test_saved_index_over_table(self):
+        """
+        This test verifies that an index saved to a file is reopened without being rebuilt,
+        follows records appended to its table and grows as needed.
+        """
+        def check():
+            table_path = os.path.join(self.tmp_dir, 'udp.tbl')
+            index_path = os.path.join(self.tmp_dir, 'udp.idx')
+            with PacketTable(UDP_HEADER, table_path) as table:
+                table.extend([UDP_HEADER(source_port=i, dest_port=i % 7) for i in range(20)])
+                with index.HashIndex(UDP_HEADER, 'source_port', table, index_path) as by_port:
+                    self.assertEqual(by_port.lookup(5), [5])
+
+            with PacketTable(UDP_HEADER, table_path) as table:
+                table.append(UDP_HEADER(source_port=500))
+                with index.HashIndex(UDP_HEADER, 'source_port', table, index_path) as by_port:
+                    self.assertEqual(by_port.lookup(500), [20])
+
+                    capacity = by_port._header.capacity
+                    for i in range(100):
+                        by_port.append(UDP_HEADER(source_port=1000 + i))
+                    self.assertGreater(by_port._header.capacity, capacity)
+                    self.assertEqual(len(by_port), 121)
+                    self.assertEqual(by_port.lookup(1050), [71])
+                    self.assertEqual(by_port.lookup(5), [5])
+                    by_port.get(1050).dest_port = 99
+
+                self.assertEqual(table[71].dest_port, 99)
+                self.assertRaises(
+                    TableFormatError, index.HashIndex, UDP_HEADER, 'dest_port', table, index_path
+                )
+            os.remove(table_path)
+            os.remove(index_path)
+
+        self.both(check)
+
+    def test_invalid_key(self):
+        """
+        This test verifies that only int and bool fields can be keys.
+        """
+        class ARRAY_PKT(models.Packet):
+            items = models.ArrayField(models.IntField8(), 4)
+
+        self.assertRaises(TypeError, index.HashIndex, ARRAY_PKT, 'items', b'')
+
+
+if __name__ == '__main__':
+    unittest.main()
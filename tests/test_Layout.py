@@ -0,0 +1,108 @@
+import unittest
+
+from calpack import models
+from calpack.common.ip import TCP_HEADER, TCP_HEADER_BIG, UDP_HEADER_BIG
+from calpack.models.layout import get_layout
+from calpack.utils import PYPY
+
+
+class Test_Layout(unittest.TestCase):
+    def test_layout_offsets_and_struct(self):
+        """
+        This test verifies the offsets of a simple packet and that a precompiled struct is created
+        when every field is a whole byte scalar.
+        """
+        class simple_pkt(models.Packet):
+            field1 = models.IntField16()
+            field2 = models.IntField32(signed=True)
+            field3 = models.BoolField()
+
+        layout = get_layout(simple_pkt)
+
+        self.assertIs(layout, get_layout(simple_pkt()))
+        self.assertEqual(layout.size, 7)
+        self.assertEqual([f.offset for f in layout], [0, 2, 6])
+        self.assertEqual(layout.struct.size, 7)
+
+        pkt = simple_pkt(field1=1, field2=-2, field3=True)
+        self.assertEqual(layout.struct.unpack(pkt.to_bytes()), (1, -2, True))
+
+    def test_layout_bitfields_match_packet(self):
+        """
+        This test verifies that bit fields are extracted and inserted the same way ctypes does for
+        native and big endian packets.
+        """
+        classes = [TCP_HEADER] if PYPY else [TCP_HEADER, TCP_HEADER_BIG]
+        for cls in classes:
+            layout = get_layout(cls)
+            self.assertIsNone(layout.struct)
+
+            pkt = cls(data_offset=5, reserved=2, flag_syn=1, flag_ns=1, dest_port=443)
+            raw = pkt.to_bytes()
+            for name in cls.fields_order:
+                self.assertEqual(layout[name].unpack_from(raw), getattr(pkt, name))
+
+            buf = bytearray(len(raw))
+            for name in cls.fields_order:
+                layout[name].pack_into(buf, 0, getattr(pkt, name))
+            self.assertEqual(bytes(buf), raw)
+
+    def test_layout_signed_bitfield(self):
+        class bit_pkt(models.Packet):
+            field1 = models.IntField(bit_len=3, signed=True)
+            field2 = models.IntField(bit_len=5)
+
+        pkt = bit_pkt(field1=-2, field2=7)
+        layout = get_layout(bit_pkt)
+
+        self.assertEqual(layout['field1'].unpack_from(pkt.to_bytes()), -2)
+        self.assertEqual(layout['field2'].unpack_from(pkt.to_bytes()), 7)
+
+    def test_layout_nested_and_array_fields(self):
+        class nested_pkt(models.Packet):
+            values = models.ArrayField(models.IntField16(), 3)
+            header = models.PacketField(UDP_HEADER_BIG)
+
+        pkt = nested_pkt(values=(1, 2, 3))
+        pkt.header.dest_port = 53
+        layout = get_layout(nested_pkt)
+        raw = b'\x00' * 4 + pkt.to_bytes()
+
+        self.assertEqual(layout['values'].unpack_from(raw, 4), (1, 2, 3))
+        self.assertEqual(layout['header.dest_port'].offset, 8)
+        self.assertEqual(layout['header.dest_port'].unpack_from(raw, 4), 53)
+        self.assertIn('header.length', layout)
+        self.assertNotIn('header.nope', layout)
+        with self.assertRaises(KeyError):
+            layout['nope']
+
+
+    def test_layout_fingerprint(self):
+        """
+        This test verifies that the fingerprint of a layout only depends on the encoding of the
+        fields.
+        """
+        class first_pkt(models.Packet):
+            field1 = models.IntField16()
+            field2 = models.IntField(bit_len=4)
+
+        class same_pkt(models.Packet):
+            field1 = models.IntField16()
+            field2 = models.IntField(bit_len=4)
+
+        class signed_pkt(models.Packet):
+            field1 = models.IntField16(signed=True)
+            field2 = models.IntField(bit_len=4)
+
+        fingerprint = get_layout(first_pkt).fingerprint
+        self.assertEqual(fingerprint, get_layout(same_pkt).fingerprint)
+        self.assertNotEqual(fingerprint, get_layout(signed_pkt).fingerprint)
+        self.assertNotEqual(get_layout(TCP_HEADER).fingerprint, get_layout(UDP_HEADER_BIG).fingerprint)
+        if not PYPY:
+            self.assertNotEqual(
+                get_layout(TCP_HEADER).fingerprint, get_layout(TCP_HEADER_BIG).fingerprint
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
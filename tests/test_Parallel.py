@@ -0,0 +1,100 @@
+import operator
+import os
+import tempfile
+import unittest
+
+from calpack.common.ip import UDP_HEADER
+from calpack.records import parallel
+from tests.test_VarFields import TLV
+
+
+def _count_port(total, udp):
+    return total + (udp.dest_port == 53)
+
+
+def _collect_port(ports, udp):
+    ports.append(udp.source_port)
+    return ports
+
+
+def _sum_lengths(buf, offset, count, stride, scale):
+    return sum(
+        UDP_HEADER.from_buffer(buf, offset + i * stride).length for i in range(count)
+    ) * scale
+
+
+@unittest.skipIf(parallel.shared_memory is None, "requires multiprocessing.shared_memory")
+class Test_ParallelScan(unittest.TestCase):
+    def setUp(self):
+        self.pkts = [
+            UDP_HEADER(source_port=i, dest_port=53 if i % 3 == 0 else 80, length=i)
+            for i in range(100)
+        ]
+        self.buf = b''.join(pkt.to_bytes() for pkt in self.pkts)
+
+    def test_reduce_buffer(self):
+        """
+        This test verifies that the records of a buffer are reduced in the workers and combined
+        in the parent, whatever the number of shards.
+        """
+        for processes in (1, 2, 3):
+            with parallel.ParallelScan(UDP_HEADER, self.buf, processes=processes) as scan:
+                self.assertEqual(scan.count, 100)
+                self.assertEqual(sum(count for _, count in scan.shards()), 100)
+                self.assertEqual(scan.reduce(_count_port, 0, operator.add), 34)
+
+        self.assertEqual(
+            parallel.parallel_reduce(UDP_HEADER, self.buf, _count_port, 0, operator.add,
+                                     processes=2), 34
+        )
+
+    def test_reduce_initial_is_identity(self):
+        """
+        This test verifies that every shard folds its own copy of the initial value, which as an
+        identity of combine gives the same result as a serial fold whatever the number of shards.
+        """
+        initial = []
+        for processes in (1, 2, 3):
+            with parallel.ParallelScan(UDP_HEADER, self.buf, processes=processes) as scan:
+                self.assertGreaterEqual(len(scan.shards()), processes)
+                ports = scan.reduce(_collect_port, initial, operator.add)
+                self.assertEqual(ports, list(range(100)))
+        self.assertEqual(initial, [])
+
+        with parallel.ParallelScan(UDP_HEADER, b'') as scan:
+            self.assertIs(scan.reduce(_collect_port, initial, operator.add), initial)
+
+    def test_filter_and_map_shards_file(self):
+        """
+        This test verifies that a file of records is scanned in place, both with filters and with
+        functions run on whole shards.
+        """
+        handle, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(handle, 'wb') as file_obj:
+                file_obj.write(self.buf)
+
+            with parallel.ParallelScan(UDP_HEADER, path, processes=2) as scan:
+                indices = scan.filter("dest_port == 53 and length > 50")
+                self.assertEqual(list(indices), list(range(51, 100, 3)))
+
+                results = scan.map_shards(_sum_lengths, 2)
+                self.assertEqual(len(results), len(scan.shards()))
+                self.assertEqual(sum(results), 2 * sum(range(100)))
+        finally:
+            os.remove(path)
+
+    def test_empty_and_var_records(self):
+        """
+        This test verifies the handling of empty sources and of records without a fixed size.
+        """
+        with parallel.ParallelScan(UDP_HEADER, b'') as scan:
+            self.assertEqual(scan.reduce(_count_port, 0, operator.add), 0)
+            self.assertEqual(list(scan.filter("dest_port == 53")), [])
+
+        with self.assertRaises(TypeError):
+            parallel.ParallelScan(TLV, self.buf)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,263 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from calpack.common.ip import UDP_HEADER_BIG
+from calpack.common.pcap import *
+from calpack.utils import PYPY, CaptureFormatError
+
+
+def build_pcap(frames, byte_order='<', magic=PCAP_MAGIC):
+    """Builds a pcap file from a list of (ts_sec, ts_frac, frame bytes) tuples"""
+    data = [struct.pack(byte_order + 'IHHiIII', magic, 2, 4, 0, 0, 65535, LINKTYPE_ETHERNET)]
+    for ts_sec, ts_frac, frame in frames:
+        data.append(struct.pack(byte_order + 'IIII', ts_sec, ts_frac, len(frame), len(frame)))
+        data.append(frame)
+    return b''.join(data)
+
+
+def pcapng_block(block_type, body, byte_order='<'):
+    body += b'\x00' * (-len(body) % 4)
+    length = len(body) + 12
+    return struct.pack(byte_order + 'II', block_type, length) + body + \
+        struct.pack(byte_order + 'I', length)
+
+
+def build_pcapng(frames, byte_order='<', tsresol=None):
+    """Builds a single section pcapng file with one interface and an EPB for every frame"""
+    data = [pcapng_block(0x0a0d0d0a, struct.pack(byte_order + 'IHHq', 0x1a2b3c4d, 1, 0, -1),
+                         byte_order)]
+    options = b''
+    if tsresol is not None:
+        options = struct.pack(byte_order + 'HHB3x', 9, 1, tsresol) + struct.pack('4x')
+    data.append(pcapng_block(1, struct.pack(byte_order + 'HHI', 1, 0, 0) + options, byte_order))
+    for timestamp, frame in frames:
+        body = struct.pack(byte_order + 'IIIII', 0, timestamp >> 32, timestamp & 0xffffffff,
+                           len(frame), len(frame)) + frame
+        data.append(pcapng_block(6, body, byte_order))
+    data.append(pcapng_block(3, struct.pack(byte_order + 'I', 3) + b'xyz', byte_order))
+    return b''.join(data)
+
+
+def udp_frame(dest_port):
+    """An ethernet + ipv4 + udp frame with the given destination port"""
+    udp = UDP_HEADER_BIG(source_port=1234, dest_port=dest_port, length=8)
+    return b'\x00' * 34 + udp.to_bytes()
+
+
+class Test_PcapReader(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, data):
+        path = os.path.join(self.tmp_dir, 'capture')
+        with open(path, 'wb') as capture:
+            capture.write(data)
+        return path
+
+    def test_pcap_reads_records_little_endian(self):
+        """
+        This test verifies that the records of a little endian pcap file are read with their
+        timestamps, lengths and frame bytes.
+        """
+        path = self.write(build_pcap([(1, 2, b'abc'), (3, 4, b'defgh')]))
+
+        with PcapReader(path) as capture:
+            records = [(r.timestamp, r.orig_len, bytes(r.data)) for r in capture]
+            self.assertEqual(capture.linktype, LINKTYPE_ETHERNET)
+            self.assertFalse(capture.nanosecond)
+
+        self.assertEqual(records, [(1000002000, 3, b'abc'), (3000004000, 5, b'defgh')])
+
+    def test_pcap_reads_big_endian_nanosecond(self):
+        if PYPY:
+            return True
+
+        path = self.write(build_pcap([(1, 2, b'abc')], '>', PCAP_MAGIC_NS))
+
+        with open_capture(path) as capture:
+            self.assertIsInstance(capture, PcapReader)
+            self.assertTrue(capture.nanosecond)
+            records = [(r.timestamp, bytes(r.data)) for r in capture]
+
+        self.assertEqual(records, [(1000000002, b'abc')])
+
+    def test_pcap_truncated_record_ends_iteration(self):
+        data = build_pcap([(1, 2, b'abc'), (3, 4, b'defgh')])
+        path = self.write(data[:-2])
+
+        with PcapReader(path) as capture:
+            self.assertEqual([bytes(r.data) for r in capture], [b'abc'])
+
+    def test_pcap_decodes_headers_zero_copy(self):
+        """
+        This test verifies that headers are decoded directly from the mapping and that changing
+        them does not modify the file.
+        """
+        if PYPY:
+            return True
+
+        data = build_pcap([(0, 0, udp_frame(53)), (0, 0, b'short'), (0, 0, udp_frame(443))])
+        path = self.write(data)
+
+        capture = PcapReader(path)
+        headers = list(capture.headers(UDP_HEADER_BIG, 34))
+        self.assertEqual([h.dest_port for h in headers], [53, 443])
+
+        headers[0].dest_port = 80
+        self.assertEqual(headers[0].dest_port, 80)
+        del headers
+        capture.close()
+
+        with open(path, 'rb') as capture_file:
+            self.assertEqual(capture_file.read(), data)
+
+    def test_pcap_invalid_file_raises_error(self):
+        with self.assertRaises(CaptureFormatError):
+            PcapReader(self.write(b'\x00' * 40))
+
+        with self.assertRaises(CaptureFormatError):
+            PcapReader(self.write(b''))
+
+
+class Test_PcapNgReader(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, data):
+        path = os.path.join(self.tmp_dir, 'capture.pcapng')
+        with open(path, 'wb') as capture:
+            capture.write(data)
+        return path
+
+    def test_pcapng_reads_enhanced_and_simple_packets(self):
+        path = self.write(build_pcapng([(5, b'abcde'), ((1 << 32) + 7, b'fg')]))
+
+        with open_capture(path) as capture:
+            self.assertIsInstance(capture, PcapNgReader)
+            records = [(r.timestamp, r.orig_len, bytes(r.data), r.linktype) for r in capture]
+
+        self.assertEqual(records, [
+            (5000, 5, b'abcde', 1),
+            (((1 << 32) + 7) * 1000, 2, b'fg', 1),
+            (0, 3, b'xyz', 1)
+        ])
+
+    def test_pcapng_big_endian_with_timestamp_resolution(self):
+        if PYPY:
+            return True
+
+        path = self.write(build_pcapng([(5, udp_frame(53))], '>', tsresol=9))
+
+        with PcapNgReader(path) as capture:
+            records = list(capture)
+            self.assertEqual(records[0].timestamp, 5)
+            udp = UDP_HEADER_BIG.from_buffer(records[0].data, 34)
+            self.assertEqual(udp.dest_port, 53)
+            del udp, records
+
+    def test_pcapng_invalid_file_raises_error(self):
+        with self.assertRaises(CaptureFormatError):
+            PcapNgReader(self.write(build_pcap([])))
+
+    def test_pcapng_enhanced_packet_overrunning_its_block_raises_error(self):
+        data = bytearray(build_pcapng([(5, b'abcd'), (6, b'efgh')]))
+        # the captured length of the first EPB, which is right after the section header and IDB
+        epb = 28 + 20
+        struct.pack_into('<I', data, epb + 20, 12)
+
+        with PcapNgReader(self.write(bytes(data))) as capture:
+            with self.assertRaises(CaptureFormatError):
+                list(capture)
+
+    def test_pcapng_packet_before_interface_raises_error(self):
+        section = pcapng_block(0x0a0d0d0a, struct.pack('<IHHq', 0x1a2b3c4d, 1, 0, -1))
+        simple = pcapng_block(3, struct.pack('<I', 3) + b'xyz')
+        enhanced = pcapng_block(6, struct.pack('<IIIII', 0, 0, 5, 2, 2) + b'fg')
+
+        for block in (simple, enhanced):
+            with PcapNgReader(self.write(section + block)) as capture:
+                with self.assertRaises(CaptureFormatError):
+                    list(capture)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class Test_PcapWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'out.pcap')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read_back(self):
+        with PcapReader(self.path) as capture:
+            return [(r.timestamp, r.orig_len, bytes(r.data)) for r in capture]
+
+    def test_writer_matches_hand_built_file(self):
+        with PcapWriter(self.path) as capture:
+            capture.write(b'abc', timestamp=1000002000)
+            capture.write(bytearray(b'defgh'), timestamp=3000004000)
+
+        with open(self.path, 'rb') as capture_file:
+            self.assertEqual(
+                capture_file.read(), build_pcap([(1, 2, b'abc'), (3, 4, b'defgh')])
+            )
+
+    def test_writer_packets_and_small_buffers(self):
+        """
+        This test verifies that packets can be written directly, and that records are preserved
+        across many buffer flushes including records larger than the buffer itself.
+        """
+        if PYPY:
+            return True
+
+        expected = []
+        with PcapWriter(self.path, buffer_size=64, nanosecond=True, byte_order='>') as capture:
+            for i in range(20):
+                pkt = UDP_HEADER_BIG(dest_port=i)
+                capture.write(pkt, timestamp=i)
+                expected.append((i, 8, pkt.to_bytes()))
+            capture.write(b'x' * 100, timestamp=99)
+            expected.append((99, 100, b'x' * 100))
+
+        self.assertEqual(self.read_back(), expected)
+
+    def test_writer_background_thread(self):
+        frames = [(i * 1000, bytes(bytearray([i % 256])) * (i % 50)) for i in range(500)]
+        with PcapWriter(self.path, buffer_size=256, background=True, max_pending=2) as capture:
+            capture.write_many(frames)
+
+        self.assertEqual(self.read_back(), [(t, len(f), f) for t, f in frames])
+
+    def test_writer_snaplen_and_replay(self):
+        with PcapWriter(self.path, snaplen=4) as capture:
+            capture.write(b'abcdefgh', timestamp=5000)
+
+        self.assertEqual(self.read_back(), [(5000, 8, b'abcd')])
+
+        replay_path = os.path.join(self.tmp_dir, 'replay.pcap')
+        with PcapReader(self.path) as source:
+            with PcapWriter(replay_path) as capture:
+                capture.write_many(source)
+
+        with open(replay_path, 'rb') as replay, open(self.path, 'rb') as original:
+            self.assertEqual(replay.read()[24:], original.read()[24:])
+
+    def test_writer_closed_raises_error(self):
+        capture = PcapWriter(self.path)
+        capture.close()
+        capture.close()
+        with self.assertRaises(ValueError):
+            capture.write(b'abc')
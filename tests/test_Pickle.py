@@ -0,0 +1,67 @@
+import pickle
+import unittest
+
+from calpack import models
+from calpack.common.ip import TCP_HEADER, TCP_HEADER_OPTIONS
+from calpack.models import packets
+
+
+class large_pkt(models.Packet):
+    header = models.IntField32()
+    data = models.ArrayField(models.IntField8(), packets.PICKLE_BUFFER_SIZE)
+
+
+class Test_Pickle(unittest.TestCase):
+    def test_pickle_roundtrip(self):
+        """
+        This test verifies that packets, including packets created from bytes, packets with
+        variable length fields and frozen packets, survive pickling with every protocol.
+        """
+        pkts = [
+            TCP_HEADER(source_port=1, dest_port=443, flag_syn=1),
+            TCP_HEADER.from_bytes(TCP_HEADER(seq_num=12345).to_bytes()),
+            TCP_HEADER_OPTIONS(data_offset=6, options=b'\x01\x01\x01\x00'),
+            TCP_HEADER(dest_port=80).frozen(),
+        ]
+        for pkt in pkts:
+            for protocol in range(2, pickle.HIGHEST_PROTOCOL + 1):
+                restored = pickle.loads(pickle.dumps(pkt, protocol))
+                self.assertIs(type(restored), type(pkt))
+                self.assertEqual(restored, pkt)
+
+        frozen = pickle.loads(pickle.dumps(pkts[-1]))
+        self.assertEqual(hash(frozen), hash(pkts[-1]))
+
+    def test_pickle_restores_a_copy(self):
+        """
+        This test verifies that a restored packet doesn't share memory with the original.
+        """
+        buf = bytearray(TCP_HEADER(dest_port=443).to_bytes())
+        pkt = TCP_HEADER.from_buffer(buf)
+        restored = pickle.loads(pickle.dumps(pkt))
+        pkt.dest_port = 80
+        self.assertEqual(restored.dest_port, 443)
+
+    @unittest.skipIf(pickle.HIGHEST_PROTOCOL < 5, "requires pickle protocol 5")
+    def test_pickle_out_of_band(self):
+        """
+        This test verifies that large packets are sent out-of-band with protocol 5.
+        """
+        pkt = large_pkt(header=7, data=[3] * packets.PICKLE_BUFFER_SIZE)
+
+        buffers = []
+        data = pickle.dumps(pkt, 5, buffer_callback=buffers.append)
+        self.assertEqual(len(buffers), 1)
+        self.assertLess(len(data), packets.PICKLE_BUFFER_SIZE)
+
+        restored = pickle.loads(data, buffers=buffers)
+        self.assertEqual(restored, pkt)
+
+        # small packets stay in-band
+        buffers = []
+        pickle.dumps(TCP_HEADER(), 5, buffer_callback=buffers.append)
+        self.assertEqual(buffers, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
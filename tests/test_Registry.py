@@ -0,0 +1,115 @@
+import unittest
+
+from calpack import models
+from calpack.utils import DiscriminatorError, FieldNameDoesntExistError
+
+
+class Test_Registry(unittest.TestCase):
+    def setUp(self):
+        class telemetry(models.Packet):
+            discriminator_field = 'msg_id'
+            msg_id = models.IntField16()
+            length = models.IntField16()
+
+        class status(telemetry):
+            discriminator_value = 5
+            state = models.IntField8()
+
+        class position(telemetry):
+            discriminator_value = 7
+            x_pos = models.IntField32(signed=True)
+            y_pos = models.IntField32(signed=True)
+
+        self.telemetry = telemetry
+        self.status = status
+        self.position = position
+
+    def test_registry_default_value(self):
+        """
+        This test verifies that the discriminator field of a registered subclass defaults to its
+        discriminator value, without changing the base class' field.
+        """
+        self.assertEqual(self.status().msg_id, 5)
+        self.assertEqual(self.position().msg_id, 7)
+        self.assertEqual(self.telemetry().msg_id, 0)
+        self.assertEqual(self.status(msg_id=9).msg_id, 9)
+
+    def test_registry_decode(self):
+        """
+        This test verifies that decoding picks the subclass from the discriminator value.
+        """
+        raw = self.position(x_pos=-3, y_pos=4).to_bytes()
+        pkt = self.telemetry.decode(raw)
+        self.assertIsInstance(pkt, self.position)
+        self.assertEqual((pkt.x_pos, pkt.y_pos), (-3, 4))
+
+        raw = bytearray(8) + self.status(state=2).to_bytes()
+        pkt = self.telemetry.decode(raw, offset=8)
+        self.assertIsInstance(pkt, self.status)
+        self.assertEqual(pkt.state, 2)
+
+        # the packet holds a copy of the buffer
+        raw[8 + 4] = 9
+        self.assertEqual(pkt.state, 2)
+
+        # decoding from a subclass still uses the shared registry
+        self.assertIsInstance(self.status.decode(self.status().to_bytes()), self.status)
+
+    def test_registry_decode_errors(self):
+        """
+        This test verifies the errors raised for unknown values and short buffers.
+        """
+        with self.assertRaises(DiscriminatorError):
+            self.telemetry.decode(self.telemetry(msg_id=99).to_bytes())
+
+        with self.assertRaises(DiscriminatorError):
+            self.status.decode(self.position().to_bytes())
+
+        with self.assertRaises(ValueError):
+            self.telemetry.decode(self.position().to_bytes()[:6])
+
+        class plain(models.Packet):
+            field1 = models.IntField()
+
+        with self.assertRaises(DiscriminatorError):
+            plain.decode(plain().to_bytes())
+
+    def test_registry_definition_errors(self):
+        """
+        This test verifies that duplicate values and missing discriminator fields are rejected at
+        class definition.
+        """
+        with self.assertRaises(DiscriminatorError):
+            class duplicate(self.telemetry):
+                discriminator_value = 5
+
+        with self.assertRaises(DiscriminatorError):
+            class no_field(models.Packet):
+                discriminator_value = 1
+                field1 = models.IntField()
+
+        with self.assertRaises(FieldNameDoesntExistError):
+            class bad_field(models.Packet):
+                discriminator_field = 'missing'
+                field1 = models.IntField()
+
+    def test_registry_bitfield_discriminator(self):
+        """
+        This test verifies that bit field discriminators are peeked correctly.
+        """
+        class header(models.Packet):
+            discriminator_field = 'kind'
+            version = models.IntField8(bit_len=4)
+            kind = models.IntField8(bit_len=4)
+
+        class kind_three(header):
+            discriminator_value = 3
+            value = models.IntField16()
+
+        pkt = header.decode(kind_three(version=15, value=1000).to_bytes())
+        self.assertIsInstance(pkt, kind_three)
+        self.assertEqual((pkt.version, pkt.value), (15, 1000))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import multiprocessing
+import unittest
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from calpack.common.ip import UDP_HEADER, TCP_HEADER
+from calpack.records import ring
+
+
+def _produce(packet_ring, first, count):
+    packet_ring.put_many([UDP_HEADER(source_port=i, length=8) for i in range(first, first + count)])
+    packet_ring.close()
+
+
+@unittest.skipIf(ring.shared_memory is None, "requires multiprocessing.shared_memory")
+class Test_PacketRing(unittest.TestCase):
+    def setUp(self):
+        self.ring = ring.PacketRing.create(UDP_HEADER, capacity=6)
+
+    def tearDown(self):
+        self.ring.close()
+
+    def test_put_and_get(self):
+        """
+        This test verifies that packets put into the ring come out in order and that the ring
+        wraps around its slots.
+        """
+        self.assertEqual(self.ring.capacity, 8)
+        for i in range(20):
+            self.ring.put(UDP_HEADER(source_port=i, dest_port=53))
+            self.ring.put(UDP_HEADER(source_port=i + 100).to_bytes())
+            self.assertEqual(len(self.ring), 2)
+            self.assertEqual(self.ring.get().source_port, i)
+            self.assertEqual(self.ring.get(), UDP_HEADER(source_port=i + 100))
+
+        self.assertRaises(queue.Empty, self.ring.get, block=False)
+        self.assertRaises(queue.Empty, self.ring.get, timeout=0.01)
+
+    def test_batches(self):
+        """
+        This test verifies that claimed slots are written in place, that read batches are views
+        of the slots, and that a full ring refuses more packets.
+        """
+        with self.ring.claim(3) as batch:
+            for i, pkt in enumerate(batch):
+                pkt.source_port = i
+                pkt.length = 8
+
+        self.ring.put_many([UDP_HEADER(source_port=i) for i in range(3, 8)])
+        self.assertRaises(queue.Full, self.ring.put, UDP_HEADER(), block=False)
+        self.assertRaises(queue.Full, self.ring.claim, 1, timeout=0.01)
+
+        batch = self.ring.read(5)
+        self.assertEqual([pkt.source_port for pkt in batch], [0, 1, 2, 3, 4])
+        self.assertEqual(batch[0].length, 8)
+        self.assertIs(batch[-1], self.ring.slot(4))
+        self.ring.release(batch)
+
+        with self.ring.read() as batch:
+            self.assertEqual([pkt.source_port for pkt in batch], [5, 6, 7])
+
+        self.ring.put_many([UDP_HEADER(source_port=i) for i in range(8)])
+        with self.ring.read() as batch:
+            self.assertEqual(len(batch), 8)
+
+    def test_attach(self):
+        """
+        This test verifies attaching to a ring by name and that the packet class is checked.
+        """
+        self.ring.put(UDP_HEADER(dest_port=443))
+        with ring.PacketRing.attach(UDP_HEADER, self.ring.name) as other:
+            if not other._header[ring._LOCKED]:
+                self.assertEqual(other.get().dest_port, 443)
+
+        with self.assertRaises(ValueError):
+            ring.PacketRing.attach(TCP_HEADER, self.ring.name)
+
+    def test_multiple_producer_processes(self):
+        """
+        This test verifies that packets of several producer processes all arrive intact.
+        """
+        packet_ring = ring.PacketRing.create(UDP_HEADER, capacity=64, multi_producer=True)
+        try:
+            producers = [
+                multiprocessing.Process(target=_produce, args=(packet_ring, i * 1000, 500))
+                for i in range(3)
+            ]
+            for producer in producers:
+                producer.start()
+
+            received = []
+            while len(received) < 1500:
+                with packet_ring.read(timeout=10) as batch:
+                    received.extend((pkt.source_port, pkt.length) for pkt in batch)
+            for producer in producers:
+                producer.join()
+
+            self.assertEqual(
+                sorted(received),
+                [(i * 1000 + j, 8) for i in range(3) for j in range(500)]
+            )
+        finally:
+            packet_ring.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
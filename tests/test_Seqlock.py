@@ -0,0 +1,114 @@
+import multiprocessing
+import pickle
+import threading
+import unittest
+
+from calpack import models
+from calpack.records import seqlock
+
+
+class DEVICE_STATE(models.Packet):
+    first = models.IntField32()
+    flags = models.IntField(bit_len=4)
+    spare = models.IntField(bit_len=4)
+    second = models.IntField32()
+
+
+def _write_states(state, count):
+    for i in range(count):
+        state.update(first=i, second=i, flags=i & 0xf)
+    state.close()
+
+
+class Test_SeqlockPacket(unittest.TestCase):
+    def test_write_and_read(self):
+        """
+        This test verifies that writes are seen by readers, as bytes, packets and field values.
+        """
+        state = seqlock.SeqlockPacket(DEVICE_STATE)
+        self.assertEqual(state.version, 0)
+
+        with state.write() as pkt:
+            pkt.first = 7
+            pkt.flags = 3
+        state.update(second=9)
+
+        self.assertEqual(state.version, 2)
+        self.assertEqual(state.to_bytes(), DEVICE_STATE(first=7, flags=3, second=9).to_bytes())
+        self.assertEqual(state.read('second', 'flags', 'first'), (9, 3, 7))
+
+        snapshot = state.snapshot()
+        state.update(first=1)
+        self.assertEqual(snapshot.first, 7)
+
+        # a failed write still completes the sequence
+        with self.assertRaises(ValueError):
+            with state.write():
+                raise ValueError
+        self.assertEqual(state.version, 4)
+        self.assertEqual(state.read('first'), (1,))
+
+    def test_external_buffer(self):
+        """
+        This test verifies that the counter and packet are kept in a given buffer.
+        """
+        buf = bytearray(4 + seqlock.SeqlockPacket.size_of(DEVICE_STATE))
+        state = seqlock.SeqlockPacket(DEVICE_STATE, buf, 4)
+        state.update(first=0x01020304)
+        self.assertEqual(buf[4:12], bytearray([2, 0, 0, 0, 0, 0, 0, 0]))
+        self.assertEqual(bytes(buf[12:]), DEVICE_STATE(first=0x01020304).to_bytes())
+
+        self.assertRaises(TypeError, pickle.dumps, state)
+
+    def test_no_torn_reads_between_threads(self):
+        """
+        This test verifies that readers never see the fields of two different writes.
+        """
+        state = seqlock.SeqlockPacket(DEVICE_STATE)
+        done = threading.Event()
+
+        def writer():
+            for i in range(5000):
+                state.update(first=i, second=i, flags=i & 0xf)
+            done.set()
+
+        torn = []
+
+        def reader():
+            while not done.is_set():
+                first, second, flags = state.read('first', 'second', 'flags')
+                if first != second or flags != first & 0xf:
+                    torn.append((first, second, flags))
+
+        threads = [threading.Thread(target=writer)] + [
+            threading.Thread(target=reader) for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(torn, [])
+        self.assertEqual(state.read('first'), (4999,))
+
+    @unittest.skipIf(seqlock.shared_memory is None, "requires multiprocessing.shared_memory")
+    def test_shared_between_processes(self):
+        """
+        This test verifies that a shared packet written by another process is read consistently.
+        """
+        state = seqlock.SeqlockPacket.shared(DEVICE_STATE)
+        try:
+            writer = multiprocessing.Process(target=_write_states, args=(state, 5000))
+            writer.start()
+            while writer.is_alive():
+                first, second, flags = state.read('first', 'second', 'flags')
+                self.assertEqual(first, second)
+                self.assertEqual(flags, first & 0xf)
+            writer.join()
+            self.assertEqual(state.version, 5000)
+            self.assertEqual(state.snapshot().second, 4999)
+        finally:
+            state.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from calpack import models
+from calpack.records import columns, sort
+from calpack.utils import PYPY
+
+
+class CAPTURE(models.Packet):
+    timestamp = models.IntField32(signed=True)
+    sequence = models.IntField16()
+    channel = models.IntField8(bit_len=4)
+    payload = models.IntField8(bit_len=4)
+
+
+class CAPTURE_BIG(CAPTURE, models.PacketBigEndian):
+    pass
+
+
+class Test_Sort(unittest.TestCase):
+    def setUp(self):
+        rand = random.Random(7)
+        self.pkts = [
+            CAPTURE(timestamp=rand.randrange(-300, 300), sequence=rand.randrange(70000) % 65536,
+                    channel=rand.randrange(4), payload=rand.randrange(2))
+            for _ in range(400)
+        ]
+        # exact copies of some records
+        self.pkts += [CAPTURE.from_bytes(self.pkts[i].to_bytes()) for i in range(0, 400, 9)]
+        self.buf = bytearray(b''.join(pkt.to_bytes() for pkt in self.pkts))
+
+    def run_both(self, func, *args, **kwargs):
+        """returns the results of a function with and without NumPy"""
+        results = []
+        numpy = sort.numpy
+        for use_numpy in ([True, False] if numpy is not None else [False]):
+            sort.numpy = columns.numpy = numpy if use_numpy else None
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                sort.numpy = columns.numpy = numpy
+            results.append(list(result) if not isinstance(result, bytearray) else result)
+        return results
+
+    def key(self, pkt):
+        return (pkt.timestamp, pkt.channel)
+
+    def test_sort_order(self):
+        """
+        This test verifies the stable order of records by several keys, ascending and descending,
+        in both byte orders.
+        """
+        expected = sorted(range(len(self.pkts)), key=lambda i: self.key(self.pkts[i]))
+        for order in self.run_both(sort.sort_order, CAPTURE, self.buf, ['timestamp', 'channel']):
+            self.assertEqual(order, expected)
+
+        expected = sorted(range(len(self.pkts)), key=lambda i: self.key(self.pkts[i]),
+                          reverse=True)
+        for order in self.run_both(sort.sort_order, CAPTURE, self.buf, ['timestamp', 'channel'],
+                                   reverse=True):
+            self.assertEqual(order, expected)
+
+        if not PYPY:
+            pkts = [CAPTURE_BIG(timestamp=pkt.timestamp, sequence=pkt.sequence,
+                                channel=pkt.channel) for pkt in self.pkts]
+            big = bytearray(b''.join(pkt.to_bytes() for pkt in pkts))
+            expected = sorted(range(len(pkts)), key=lambda i: (pkts[i].sequence, pkts[i].timestamp))
+            for order in self.run_both(sort.sort_order, CAPTURE_BIG, big,
+                                       ['sequence', 'timestamp']):
+                self.assertEqual(order, expected)
+
+        for order in self.run_both(sort.sort_order, CAPTURE, bytearray(), 'timestamp'):
+            self.assertEqual(order, [])
+
+    def test_sort_records(self):
+        """
+        This test verifies gathering sorted records, with and without duplicates.
+        """
+        size = len(CAPTURE())
+        order = sorted(range(len(self.pkts)), key=lambda i: self.key(self.pkts[i]))
+        expected = b''.join(self.pkts[i].to_bytes() for i in order)
+        for data in self.run_both(sort.sort_records, CAPTURE, self.buf, ['timestamp', 'channel']):
+            self.assertEqual(bytes(data), expected)
+
+        seen, expected = set(), []
+        for i in order:
+            if self.key(self.pkts[i]) not in seen:
+                seen.add(self.key(self.pkts[i]))
+                expected.append(self.pkts[i].to_bytes())
+        for data in self.run_both(sort.sort_records, CAPTURE, self.buf, ['timestamp', 'channel'],
+                                  dedup='key'):
+            self.assertEqual(bytes(data), b''.join(expected))
+
+        seen, expected = set(), []
+        for i in order:
+            if self.pkts[i].to_bytes() not in seen:
+                seen.add(self.pkts[i].to_bytes())
+                expected.append(self.pkts[i].to_bytes())
+        for data in self.run_both(sort.sort_records, CAPTURE, self.buf, ['timestamp', 'channel'],
+                                  dedup='record'):
+            self.assertEqual(bytes(data), b''.join(expected))
+            self.assertEqual(len(data), (len(self.pkts) - 45) * size)
+
+        for first in self.run_both(sort.unique_order, CAPTURE, self.buf):
+            self.assertEqual(first, list(range(400)))
+        for first in self.run_both(sort.unique_order, CAPTURE, self.buf, 'channel'):
+            self.assertEqual(len(first), 4)
+            self.assertEqual(first, sorted(first))
+
+        padded = bytearray(b''.join(pkt.to_bytes() + b'\xaa' * 3 for pkt in self.pkts[:10]))
+        for data in self.run_both(sort.gather, CAPTURE, padded, [9, 2, 3, 4, 0], stride=size + 3):
+            self.assertEqual(bytes(data), b''.join(
+                self.pkts[i].to_bytes() for i in [9, 2, 3, 4, 0]
+            ))
+        for data in self.run_both(sort.gather, CAPTURE, self.buf, [1, 2, 3, 4, 0]):
+            self.assertEqual(bytes(data), self.buf[size:5 * size] + self.buf[:size])
+
+        self.assertRaises(IndexError, sort.gather, CAPTURE, self.buf, [len(self.pkts)])
+        self.assertRaises(ValueError, sort.sort_records, CAPTURE, self.buf, 'timestamp',
+                          dedup='all')
+        self.assertRaises(ValueError, sort.sort_order, CAPTURE, self.buf, [])
+
+    def test_group_records(self):
+        """
+        This test verifies grouping records by key.
+        """
+        for groups in self.run_both(sort.group_records, CAPTURE, self.buf, ['channel', 'payload']):
+            self.assertEqual([key for key, _ in groups],
+                             [(c, p) for c in range(4) for p in range(2)])
+            for (channel, payload), indices in groups:
+                self.assertEqual(list(indices), [
+                    i for i, pkt in enumerate(self.pkts)
+                    if pkt.channel == channel and pkt.payload == payload
+                ])
+
+    def test_sort_file(self):
+        """
+        This test verifies sorting files in memory and in external runs.
+        """
+        size = len(CAPTURE())
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'capture.bin')
+            out_path = os.path.join(tmp_dir, 'sorted.bin')
+            with open(path, 'wb') as file_obj:
+                file_obj.write(self.buf)
+
+            for dedup in sort.DEDUP_MODES:
+                for reverse in (False, True):
+                    expected = bytes(sort.sort_records(CAPTURE, self.buf, ['timestamp', 'channel'],
+                                                       reverse=reverse, dedup=dedup))
+                    for limit in (sort.DEFAULT_MEMORY_LIMIT, size * 50, size):
+                        written = sort.sort_file(CAPTURE, path, out_path, ['timestamp', 'channel'],
+                                                 reverse, dedup, memory_limit=limit,
+                                                 tmp_dir=tmp_dir)
+                        with open(out_path, 'rb') as file_obj:
+                            self.assertEqual(file_obj.read(), expected)
+                        self.assertEqual(written, len(expected) // size)
+            self.assertEqual(sorted(os.listdir(tmp_dir)), ['capture.bin', 'sorted.bin'])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
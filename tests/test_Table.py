@@ -0,0 +1,133 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from calpack import models
+from calpack.common.ip import UDP_HEADER, TCP_HEADER
+from calpack.records import table
+from calpack.utils import TableFormatError
+
+
+class DEVICE_STATE(models.Packet):
+    device_id = models.IntField32()
+    temperature = models.IntField16(signed=True)
+    online = models.BoolField()
+
+
+class Test_PacketTable(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'devices.tbl')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_append_and_reopen(self):
+        """
+        This test verifies that records appended to a table, and changes made through its views,
+        are found when the table is opened again.
+        """
+        with table.PacketTable(DEVICE_STATE, self.path) as devices:
+            self.assertEqual(len(devices), 0)
+            self.assertEqual(devices.append(DEVICE_STATE(device_id=1)), 0)
+            devices.extend([DEVICE_STATE(device_id=i) for i in range(2, 6)])
+            devices[0].temperature = -5
+            devices[-1] = DEVICE_STATE(device_id=99, online=True)
+            self.assertEqual(len(devices), 5)
+
+        self.assertEqual(os.path.getsize(self.path) % len(DEVICE_STATE()), 64 % 7)
+
+        with table.PacketTable(DEVICE_STATE, self.path) as devices:
+            self.assertEqual([pkt.device_id for pkt in devices], [1, 2, 3, 4, 99])
+            self.assertEqual(devices[0].temperature, -5)
+            self.assertTrue(devices[4].online)
+            self.assertEqual([pkt.device_id for pkt in devices[1:3]], [2, 3])
+            self.assertRaises(IndexError, devices.__getitem__, 5)
+            self.assertEqual(bytes(devices.records[:7]), DEVICE_STATE(
+                device_id=1, temperature=-5).to_bytes())
+
+    def test_growth_keeps_views(self):
+        """
+        This test verifies that views handed out before the file grows stay bound to the file.
+        """
+        min_growth, table._MIN_GROWTH = table._MIN_GROWTH, 0
+        self.addCleanup(setattr, table, '_MIN_GROWTH', min_growth)
+
+        with table.PacketTable(UDP_HEADER, self.path) as udp:
+            udp.append(UDP_HEADER(dest_port=53))
+            first = udp[0]
+            capacity = udp.capacity
+            udp.extend([UDP_HEADER(source_port=i) for i in range(capacity + 10)])
+            self.assertGreater(udp.capacity, capacity)
+
+            first.dest_port = 5353
+            self.assertEqual(udp[0].dest_port, 5353)
+            self.assertEqual(udp[-1].source_port, capacity + 9)
+            self.assertEqual(len(udp), capacity + 11)
+
+    def test_readonly(self):
+        """
+        This test verifies that changes to a read only table are never written to the file.
+        """
+        with table.PacketTable(UDP_HEADER, self.path) as udp:
+            udp.append(UDP_HEADER(dest_port=53))
+
+        with table.PacketTable(UDP_HEADER, self.path, readonly=True) as udp:
+            udp[0].dest_port = 80
+            self.assertRaises(TypeError, udp.append, UDP_HEADER())
+
+        with table.PacketTable(UDP_HEADER, self.path, readonly=True) as udp:
+            self.assertEqual(udp[0].dest_port, 53)
+
+    def test_record_type_checks(self):
+        """
+        This test verifies that only packets of the table's class can be stored, and that a
+        rejected batch leaves the table unchanged.
+        """
+        with table.PacketTable(UDP_HEADER, self.path) as udp:
+            udp.append(UDP_HEADER(dest_port=53))
+            self.assertRaises(TypeError, udp.append, TCP_HEADER())
+            self.assertRaises(TypeError, udp.append, UDP_HEADER().to_bytes())
+            self.assertRaises(TypeError, udp.__setitem__, 0, TCP_HEADER())
+            self.assertRaises(TypeError, udp.extend, [UDP_HEADER(), TCP_HEADER()])
+
+            class UDP_EXTENDED(UDP_HEADER):
+                extra = models.IntField32()
+
+            self.assertRaises(TypeError, udp.append, UDP_EXTENDED())
+            udp.append(UDP_HEADER(dest_port=80).frozen())
+            self.assertEqual(len(udp), 2)
+            self.assertEqual(udp[0].dest_port, 53)
+
+    def test_schema_checks(self):
+        """
+        This test verifies that a table can't be opened with a different packet class, or from a
+        file that isn't a table.
+        """
+        table.PacketTable(UDP_HEADER, self.path).close()
+        self.assertRaises(TableFormatError, table.PacketTable, TCP_HEADER, self.path)
+
+        class RENAMED(models.Packet):
+            source_port = models.IntField16()
+            dest_port = models.IntField16()
+            length = models.IntField16()
+            checksum = models.IntField16()
+
+        class REORDERED(models.Packet):
+            dest_port = models.IntField16()
+            source_port = models.IntField16()
+            length = models.IntField16()
+            checksum = models.IntField16()
+
+        table.PacketTable(RENAMED, self.path).close()
+        self.assertRaises(TableFormatError, table.PacketTable, REORDERED, self.path)
+
+        other = os.path.join(self.tmp_dir, 'other.bin')
+        with open(other, 'wb') as file_obj:
+            file_obj.write(b'\x00' * 100)
+        self.assertRaises(TableFormatError, table.PacketTable, UDP_HEADER, other)
+
+
+if __name__ == '__main__':
+    unittest.main()
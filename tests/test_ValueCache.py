@@ -0,0 +1,219 @@
+import pickle
+import socket
+import struct
+import unittest
+
+from calpack import models
+from calpack.utils import FrozenPacketError
+
+
+class IPv4Field(models.IntField32):
+    """A custom field converting an address to its dotted string, counting the conversions"""
+    conversions = 0
+
+    def c_to_py(self, c_field):
+        IPv4Field.conversions += 1
+        return socket.inet_ntoa(struct.pack('>I', c_field))
+
+    def py_to_c(self, val):
+        if isinstance(val, int):
+            return val
+        return struct.unpack('>I', socket.inet_aton(val))[0]
+
+
+class POINT(models.Packet):
+    x = models.IntField16()
+    y = models.IntField16()
+
+
+class FLOW(models.Packet):
+    source = IPv4Field()
+    dest = IPv4Field()
+    priority = models.IntField8(bit_len=3)
+    position = models.PacketField(POINT)
+    counters = models.ArrayField(models.IntField16(), 2)
+
+
+class Test_ValueCache(unittest.TestCase):
+    def setUp(self):
+        IPv4Field.conversions = 0
+
+    def test_cached_reads(self):
+        """
+        This test verifies that values are converted once and invalidated when set.
+        """
+        pkt = FLOW(source='10.0.0.1', dest='10.0.0.2', priority=3).cache_values()
+        self.assertIsInstance(pkt, FLOW)
+        for _ in range(5):
+            self.assertEqual(pkt.source, '10.0.0.1')
+            self.assertEqual(pkt.dest, '10.0.0.2')
+            self.assertEqual(pkt.priority, 3)
+        self.assertEqual(IPv4Field.conversions, 2)
+
+        pkt.source = '192.168.1.1'
+        self.assertEqual(pkt.source, '192.168.1.1')
+        pkt.set_c_field('dest', 0x08080808)
+        self.assertEqual(pkt.dest, '8.8.8.8')
+        self.assertEqual(pkt.priority, 3)
+        self.assertEqual(IPv4Field.conversions, 4)
+
+        pkt.counters = [1, 2]
+        self.assertEqual(pkt.counters, (1, 2))
+        pkt.position = POINT(x=4)
+        self.assertEqual(pkt.position.x, 4)
+
+        # changes behind the packet's back need an explicit invalidation
+        pkt.c_pkt.priority = 5
+        self.assertEqual(pkt.priority, 3)
+        pkt.invalidate_values()
+        self.assertEqual(pkt.priority, 5)
+
+        pkt.cache_values(False)
+        self.assertIs(type(pkt), FLOW)
+        pkt.source
+        pkt.source
+        self.assertEqual(IPv4Field.conversions, 6)
+
+    def test_rebind(self):
+        """
+        This test verifies walking the records of a buffer with a single cached packet.
+        """
+        flows = [FLOW(source='10.0.0.{}'.format(i), priority=i % 8) for i in range(10)]
+        buf = bytearray(b''.join(flow.to_bytes() for flow in flows))
+        size = len(FLOW())
+
+        pkt = FLOW.from_buffer(buf).cache_values()
+        for i in range(10):
+            self.assertIs(pkt.rebind(buf, i * size), pkt)
+            self.assertEqual(pkt.source, '10.0.0.{}'.format(i))
+            self.assertEqual(pkt.source, '10.0.0.{}'.format(i))
+        self.assertEqual(IPv4Field.conversions, 10)
+
+        pkt.priority = 1
+        self.assertEqual(FLOW.from_buffer(buf, 9 * size).priority, 1)
+        self.assertRaises(FrozenPacketError, flows[0].frozen().rebind, buf)
+
+        tracked = FLOW().track_changes()
+        tracked.priority = 2
+        tracked.rebind(buf)
+        self.assertEqual(tracked.dirty_fields, frozenset())
+
+    def test_set_c_field_invalidates_only_its_field(self):
+        """
+        This test verifies that set_c_field invalidates the cached value of its field, and only
+        that one.
+        """
+        pkt = FLOW(source='10.0.0.1', dest='10.0.0.2', priority=3).cache_values()
+        self.assertEqual((pkt.source, pkt.dest, pkt.priority), ('10.0.0.1', '10.0.0.2', 3))
+        self.assertEqual(IPv4Field.conversions, 2)
+
+        pkt.set_c_field('source', 0x0a000009)
+        pkt.set_c_field('priority', 6)
+        self.assertEqual(pkt.dest, '10.0.0.2')
+        self.assertEqual(IPv4Field.conversions, 2)
+        self.assertEqual((pkt.source, pkt.priority), ('10.0.0.9', 6))
+        self.assertEqual(pkt.source, '10.0.0.9')
+        self.assertEqual(IPv4Field.conversions, 3)
+
+    def test_rebind_invalidates_values(self):
+        """
+        This test verifies that rebinding a cached packet drops the values of the previous
+        record, including values made stale by changes to the buffer.
+        """
+        buf = bytearray(FLOW(source='10.0.0.1', priority=1).to_bytes() +
+                        FLOW(source='10.0.0.2', priority=2).to_bytes())
+        pkt = FLOW.from_buffer(buf).cache_values()
+        self.assertEqual((pkt.source, pkt.priority), ('10.0.0.1', 1))
+
+        FLOW.from_buffer(buf).source = '10.0.0.3'
+        self.assertEqual(pkt.source, '10.0.0.1')
+        pkt.rebind(buf)
+        self.assertNotIn('_value_cache', pkt.__dict__)
+        self.assertEqual(pkt.source, '10.0.0.3')
+
+        pkt.rebind(buf, len(pkt))
+        self.assertEqual((pkt.source, pkt.priority), ('10.0.0.2', 2))
+        self.assertEqual(IPv4Field.conversions, 3)
+
+    def test_cached_frozen_packets(self):
+        """
+        This test verifies that freezing a cached packet gives a plain frozen packet, and that
+        cached frozen packets cache their values but still can't be modified.
+        """
+        pkt = FLOW(source='1.2.3.4', priority=2).cache_values()
+        pkt.source
+        frozen = pkt.frozen()
+        self.assertIs(type(frozen), FLOW(source='1.2.3.4').frozen().__class__)
+        self.assertNotIn('_value_cache', frozen.__dict__)
+        self.assertEqual(frozen, pkt)
+        self.assertEqual(pkt, frozen)
+
+        cached = frozen.copy().cache_values()
+        self.assertEqual(cached.source, '1.2.3.4')
+        self.assertEqual(cached.source, '1.2.3.4')
+        self.assertEqual(IPv4Field.conversions, 2)
+        self.assertRaises(FrozenPacketError, cached.set_c_field, 'priority', 3)
+        self.assertRaises(FrozenPacketError, cached.rebind, bytearray(len(pkt)))
+        self.assertEqual(cached.priority, 2)
+        self.assertEqual({cached: 'flow'}[frozen], 'flow')
+        self.assertEqual(frozen, cached)
+        self.assertEqual(pkt, cached)
+        self.assertIs(type(cached.cache_values(False)), type(frozen))
+
+    def test_pickled_cached_packets(self):
+        """
+        This test verifies that cached packets pickle as packets of their class, without their
+        cached values, for every pickle protocol.
+        """
+        pkt = FLOW(source='1.2.3.4', priority=2).cache_values()
+        pkt.source
+        pkt.source = '4.3.2.1'
+        frozen = pkt.frozen().copy().cache_values()
+        frozen.source
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            loaded = pickle.loads(pickle.dumps(pkt, protocol))
+            self.assertIs(type(loaded), FLOW)
+            self.assertNotIn('_value_cache', loaded.__dict__)
+            self.assertEqual(loaded.source, '4.3.2.1')
+
+            loaded = pickle.loads(pickle.dumps(frozen, protocol))
+            self.assertIs(type(loaded), type(pkt.frozen()))
+            self.assertEqual(hash(loaded), hash(frozen))
+
+    def test_cached_class_behaves_like_its_class(self):
+        """
+        This test verifies comparing, copying, pickling and freezing cached packets, and
+        combining caching with change tracking.
+        """
+        pkt = FLOW(source='1.2.3.4', counters=[5, 6]).cache_values()
+        plain = FLOW(source='1.2.3.4', counters=[5, 6])
+        self.assertEqual(pkt, plain)
+        self.assertEqual(plain, pkt)
+        self.assertNotEqual(pkt, POINT())
+
+        self.assertIs(type(pkt.copy()), type(pkt))
+        self.assertIs(type(pickle.loads(pickle.dumps(pkt))), FLOW)
+        self.assertEqual(pickle.loads(pickle.dumps(pkt)), plain)
+
+        frozen = pkt.frozen()
+        self.assertIs(type(frozen)._mutable_cls, FLOW)
+        cached_frozen = frozen.copy().cache_values()
+        self.assertEqual(hash(cached_frozen), hash(frozen))
+        self.assertEqual(cached_frozen.source, '1.2.3.4')
+        with self.assertRaises(FrozenPacketError):
+            cached_frozen.source = '4.3.2.1'
+        self.assertIs(type(pickle.loads(pickle.dumps(cached_frozen))), type(frozen))
+
+        pkt.track_changes()
+        self.assertEqual(pkt.source, '1.2.3.4')
+        pkt.source = '4.3.2.1'
+        self.assertEqual(pkt.source, '4.3.2.1')
+        self.assertEqual(pkt.dirty_fields, frozenset(['source']))
+
+        # the field of the packet class is unchanged
+        self.assertIs(type(FLOW.__dict__['source']), IPv4Field)
+        self.assertIs(type(pkt).source, FLOW.__dict__['source'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,429 @@
+import copy
+import unittest
+
+from calpack import models
+from calpack.utils import PY2, PYPY
+
+
+BasePacket = models.Packet if PYPY else models.PacketBigEndian
+
+
+class TLV(BasePacket):
+    tag = models.IntField8()
+    length = models.IntField8()
+    value = models.BytesField(length='length')
+
+
+class Message(BasePacket):
+    msg_id = models.IntField16()
+    n_ids = models.IntField8()
+    name = models.BytesField(length_prefix=models.IntField8())
+    ids = models.VarArrayField(models.IntField32(), count='n_ids')
+    options = models.VarArrayField(TLV, length_prefix=models.IntField16())
+
+
+class Test_VarFields(unittest.TestCase):
+    def create_message(self):
+        return Message(
+            msg_id=3, name=b'hello', ids=[1, 2, 3],
+            options=[TLV(tag=1, value=b'ab'), TLV(tag=2, value=b'')]
+        )
+
+    def test_varfields_encode(self):
+        """
+        This test verifies that variable fields are encoded after the fixed fields, with their
+        prefixes, and that referenced length fields are updated.
+        """
+        msg = self.create_message()
+        self.assertEqual(msg.n_ids, 3)
+        self.assertEqual(msg.options[0].length, 2)
+        self.assertEqual(len(msg), 29)
+
+        expected = b'\x00\x03\x03' + b'\x05hello' + \
+            Message._var_fields[1].encode(msg, (1, 2, 3)) + \
+            b'\x00\x06' + b'\x01\x02ab' + b'\x02\x00'
+        self.assertEqual(msg.to_bytes(), expected)
+
+        buf = bytearray(32)
+        self.assertEqual(msg.pack_into(buf, 1), 29)
+        self.assertEqual(bytes(buf[1:30]), expected)
+        with self.assertRaises(ValueError):
+            msg.pack_into(bytearray(28))
+
+    def test_varfields_decode(self):
+        """
+        This test verifies decoding variable fields from bytes, ignoring any trailing bytes.
+        """
+        msg = self.create_message()
+        raw = msg.to_bytes()
+
+        decoded = Message.from_bytes(raw + b'trailing')
+        self.assertEqual(decoded.name, b'hello')
+        self.assertEqual(decoded.ids, (1, 2, 3))
+        self.assertEqual([(o.tag, o.value) for o in decoded.options], [(1, b'ab'), (2, b'')])
+        self.assertEqual(len(decoded), 29)
+        self.assertEqual(decoded.to_bytes(), raw)
+        self.assertEqual(decoded, msg)
+
+        # a fresh packet has empty variable fields
+        empty = Message()
+        self.assertEqual((empty.name, empty.ids, empty.options), (b'', (), ()))
+        self.assertEqual(empty.to_bytes(), b'\x00' * 4 + b'\x00\x00')
+
+    def test_varfields_lazy_offsets(self):
+        """
+        This test verifies that the offsets of variable fields are only computed up to the field
+        being read, and only once.
+        """
+        decoded = Message.from_bytes(self.create_message().to_bytes())
+        self.assertIsNone(decoded._var_spans)
+
+        self.assertEqual(decoded.name, b'hello')
+        self.assertEqual(len(decoded._var_spans), 1)
+
+        spans = decoded._var_spans
+        decoded.options
+        self.assertIs(decoded._var_spans, spans)
+        self.assertEqual(len(spans), 3)
+
+    def test_varfields_set_after_decode(self):
+        """
+        This test verifies that setting a variable field of a decoded packet re-encodes the
+        fields following it.
+        """
+        decoded = Message.from_bytes(self.create_message().to_bytes())
+        decoded.name = b'hi'
+        decoded.ids = [7]
+
+        again = Message.from_bytes(decoded.to_bytes())
+        self.assertEqual((again.name, again.ids, again.n_ids), (b'hi', (7,), 1))
+        self.assertEqual(len(again.options), 2)
+
+    def test_varfields_length_field_set_after_read(self):
+        """
+        This test verifies that setting the field holding the length of a variable field locates
+        that field again, whether or not it was read before.
+        """
+        class header(BasePacket):
+            n = models.IntField8()
+            body = models.BytesField(length='n')
+
+        read = header.from_bytes(b'\x03abcdef')
+        self.assertEqual(read.body, b'abc')
+        read.n = 5
+        unread = header.from_bytes(b'\x03abcdef')
+        unread.n = 5
+
+        for pkt in (read, unread):
+            self.assertEqual(pkt.body, b'abcde')
+            self.assertEqual(pkt.to_bytes(), b'\x05abcde')
+
+    def test_varfields_from_buffer(self):
+        """
+        This test verifies that packets created from a buffer read their variable fields from it.
+        """
+        buf = bytearray(b'\xff' + self.create_message().to_bytes())
+        pkt = Message.from_buffer(buf, 1)
+        self.assertEqual(pkt.name, b'hello')
+
+        buf[1 + 4] = ord('j')
+        self.assertEqual(pkt.name, b'jello')
+
+    def test_varfields_set_from_buffer(self):
+        """
+        This test verifies that setting a variable field of a packet created from a buffer leaves
+        the record in the buffer intact, including the field holding its length.
+        """
+        raw = TLV(tag=1, value=b'abc').to_bytes()
+        buf = bytearray(raw + b'\xee')
+        pkt = TLV.from_buffer(buf)
+        pkt.value = b'abcdef'
+        pkt.tag = 2
+
+        self.assertEqual(buf, bytearray(raw + b'\xee'))
+        self.assertEqual(TLV.from_bytes(bytes(buf)).value, b'abc')
+        self.assertEqual(pkt.length, 6)
+        self.assertEqual(pkt.to_bytes(), b'\x02\x06abcdef')
+
+    def test_varfields_copy(self):
+        """
+        This test verifies that copies own their variable fields.
+        """
+        buf = bytearray(self.create_message().to_bytes())
+        pkt = Message.from_buffer(buf)
+        duplicate = pkt.copy()
+        clones = pkt.clone_many(2)
+
+        buf[4] = ord('j')
+        self.assertEqual(pkt.name, b'jello')
+        self.assertEqual(duplicate.name, b'hello')
+        self.assertEqual(clones[1].name, b'hello')
+
+        msg = self.create_message()
+        deep = copy.deepcopy(msg)
+        self.assertEqual(deep, msg)
+        self.assertIsNot(deep.options[0], msg.options[0])
+
+    def test_varfields_callable_length(self):
+        """
+        This test verifies lengths computed from the fixed fields by a callable.
+        """
+        class header(BasePacket):
+            words = models.IntField8()
+            options = models.BytesField(length=lambda pkt: (pkt.words - 1) * 4)
+
+        pkt = header.from_bytes(b'\x03' + b'\x01' * 8 + b'\x02' * 4)
+        self.assertEqual(pkt.options, b'\x01' * 8)
+        self.assertEqual(len(pkt), 9)
+
+        with self.assertRaises(ValueError):
+            header.from_bytes(b'\x04' + b'\x01' * 8).options
+        with self.assertRaises(ValueError):
+            header.from_bytes(b'\x00').options
+
+    def test_varfields_definition_errors(self):
+        """
+        This test verifies the errors raised by invalid definitions.
+        """
+        with self.assertRaises(TypeError):
+            class fixed_after_var(BasePacket):
+                data = models.BytesField(length_prefix=models.IntField8())
+                field1 = models.IntField()
+
+        with self.assertRaises(TypeError):
+            class subclass_fixed_after_var(Message):
+                field1 = models.IntField()
+
+        with self.assertRaises(TypeError):
+            models.BytesField()
+        with self.assertRaises(TypeError):
+            models.BytesField(length='a', length_prefix=models.IntField8())
+        with self.assertRaises(TypeError):
+            models.BytesField(length_prefix=models.IntField8(bit_len=4))
+        with self.assertRaises(TypeError):
+            models.VarArrayField(models.IntField8(), count='a', length='b')
+        with self.assertRaises(TypeError):
+            models.ArrayField(models.BytesField(length='a'), 2)
+
+        with self.assertRaises(TypeError):
+            self.create_message().name = 5
+
+    def test_varfields_registry_decode(self):
+        """
+        This test verifies decoding registered packets with variable fields.
+        """
+        class base(BasePacket):
+            discriminator_field = 'kind'
+            kind = models.IntField8()
+
+        class text(base):
+            discriminator_value = 1
+            body = models.BytesField(length_prefix=models.IntField8())
+
+        pkt = base.decode(b'\x00' + text(body=b'abc').to_bytes(), 1)
+        self.assertIsInstance(pkt, text)
+        self.assertEqual(pkt.body, b'abc')
+
+
+class UDP(BasePacket):
+    source_port = models.IntField16()
+    dest_port = models.IntField16()
+    length = models.IntField16()
+    checksum = models.IntField16()
+    payload = models.PayloadField(length=lambda pkt: pkt.length - 8)
+
+
+class Telemetry(BasePacket):
+    msg_id = models.IntField16()
+    data = models.PayloadField()
+
+
+class Test_PayloadField(unittest.TestCase):
+    def test_payload_zero_copy(self):
+        """
+        This test verifies that the payload is a view of the original buffer, for both
+        from_buffer and from_bytes, and that nested packets are views on views.
+        """
+        frame = bytearray(b'\xee' * 4 + UDP(length=14, payload=Telemetry(
+            msg_id=7, data=b'abcd'
+        )).to_bytes() + b'\xee' * 3)
+
+        udp = UDP.from_buffer(frame, 4)
+        self.assertIsInstance(udp.payload, memoryview)
+        self.assertEqual(udp.payload.tobytes(), b'\x00\x07abcd')
+
+        frame[4 + 8 + 2] = ord('z')
+        self.assertEqual(udp.payload.tobytes(), b'\x00\x07zbcd')
+
+        # ctypes can't create a structure from a python 2 memoryview
+        if not PY2:
+            telemetry = Telemetry.from_buffer(udp.payload)
+            self.assertEqual(telemetry.msg_id, 7)
+            self.assertEqual(telemetry.data.tobytes(), b'zbcd')
+
+            frame[4 + 8 + 2] = ord('y')
+            self.assertEqual(telemetry.data.tobytes(), b'ybcd')
+            telemetry.msg_id = 9
+            self.assertEqual(frame[4 + 8:4 + 10], bytearray(b'\x00\x09'))
+            frame[4 + 8 + 2] = ord('z')
+
+        raw = bytes(frame[4:])
+        udp = UDP.from_bytes(raw)
+        if not PY2:
+            self.assertEqual(udp.payload.obj, raw)
+        self.assertEqual(Telemetry.from_bytes(udp.payload).data.tobytes(), b'zbcd')
+
+    def test_payload_encode(self):
+        """
+        This test verifies that the header and payload are written into one output buffer and
+        that setting the payload updates a referenced length field.
+        """
+        payload = bytearray(b'0123456789')
+        udp = UDP(source_port=1, length=18, payload=payload)
+        self.assertEqual(len(udp), 18)
+
+        class named_length(BasePacket):
+            size = models.IntField8()
+            data = models.PayloadField(length='size')
+
+        self.assertEqual(named_length(data=b'abc').size, 3)
+
+        buf = bytearray(20)
+        self.assertEqual(udp.pack_into(buf, 2), 18)
+        self.assertEqual(bytes(buf[2:]), udp.to_bytes())
+        self.assertEqual(bytes(buf[10:]), b'0123456789')
+
+        empty = Telemetry(msg_id=1)
+        self.assertEqual(empty.data.tobytes(), b'')
+        self.assertEqual(empty.to_bytes(), Telemetry(msg_id=1).to_bytes())
+
+        with self.assertRaises(TypeError):
+            empty.data = 5
+
+    def test_payload_must_be_last(self):
+        """
+        This test verifies that no field can follow a payload holding all remaining bytes.
+        """
+        with self.assertRaises(TypeError):
+            class bad(BasePacket):
+                data = models.PayloadField()
+                more = models.BytesField(length_prefix=models.IntField8())
+
+        with self.assertRaises(TypeError):
+            class bad_subclass(Telemetry):
+                more = models.PayloadField()
+
+
+class Optional(BasePacket):
+    has_ext = models.FlagField()
+    kind = models.IntField8(bit_len=7)
+    ext = models.OptionalField(models.IntField32(), present='has_ext')
+    point = models.OptionalField(TLV, present=lambda pkt: pkt.kind == 2)
+    options = models.OptionalField(
+        models.BytesField(length=lambda pkt: (pkt.kind - 2) * 4), present=lambda pkt: pkt.kind > 2
+    )
+
+
+class Test_OptionalField(unittest.TestCase):
+    def test_optional_absent(self):
+        """
+        This test verifies that absent fields take no bytes and read as None.
+        """
+        pkt = Optional.from_bytes(Optional().to_bytes())
+        self.assertEqual(len(pkt), 1)
+        self.assertIsNone(pkt.ext)
+        self.assertIsNone(pkt.point)
+        self.assertIsNone(pkt.options)
+
+    def test_optional_present(self):
+        """
+        This test verifies encoding and decoding present fields, and that setting a field gated
+        by a field name updates that field.
+        """
+        pkt = Optional(ext=0x01020304, kind=3, options=b'abcd')
+        self.assertTrue(pkt.has_ext)
+        self.assertEqual(len(pkt), 1 + 4 + 4)
+
+        decoded = Optional.from_bytes(pkt.to_bytes())
+        self.assertEqual(decoded.ext, 0x01020304)
+        self.assertIsNone(decoded.point)
+        self.assertEqual(decoded.options, b'abcd')
+
+        pkt = Optional(kind=2, point=TLV(tag=4, value=b'xy'))
+        decoded = Optional.from_bytes(pkt.to_bytes())
+        self.assertEqual((decoded.point.tag, decoded.point.value), (4, b'xy'))
+        self.assertIsNone(decoded.options)
+
+        decoded.ext = 7
+        decoded.kind = 0
+        decoded.point = None
+        again = Optional.from_bytes(decoded.to_bytes())
+        self.assertEqual((again.ext, again.point), (7, None))
+
+    def test_optional_memoized(self):
+        """
+        This test verifies that optional fields are decoded on first access only.
+        """
+        raw = bytearray(Optional(kind=2, point=TLV(tag=4, value=b'xy')).to_bytes())
+        pkt = Optional.from_buffer(raw)
+        self.assertIsNone(pkt._var_cache)
+
+        point = pkt.point
+        self.assertIs(pkt.point, point)
+        self.assertEqual(list(pkt._var_cache), ['point'])
+
+    def test_optional_gate_set_after_read(self):
+        """
+        This test verifies that setting the fields gating an optional field forgets its memoized
+        value, whether the field was read before or after.
+        """
+        raw = Optional(kind=3, options=b'abcd').to_bytes()
+        read = Optional.from_bytes(raw)
+        self.assertEqual(read.options, b'abcd')
+        read.kind = 1
+        unread = Optional.from_bytes(raw)
+        unread.kind = 1
+
+        for pkt in (read, unread):
+            self.assertIsNone(pkt.options)
+            self.assertEqual(len(pkt.to_bytes()), 1)
+        self.assertEqual(read, unread)
+
+        # and back, once absent
+        read.kind = 3
+        self.assertEqual(read.options, b'abcd')
+
+    @unittest.skipIf(PYPY, "PyPy does not support big endian packets")
+    def test_optional_tcp_data_offset(self):
+        """
+        This test verifies that lowering TCP's data offset drops its options, whether they were
+        read before or not.
+        """
+        from calpack.common.ip import TCP_HEADER_OPTIONS_BIG
+
+        raw = TCP_HEADER_OPTIONS_BIG(data_offset=6, options=b'\x01\x01\x01\x00').to_bytes()
+        read = TCP_HEADER_OPTIONS_BIG.from_bytes(raw)
+        self.assertEqual(read.options, b'\x01\x01\x01\x00')
+        read.data_offset = 5
+        unread = TCP_HEADER_OPTIONS_BIG.from_bytes(raw)
+        unread.data_offset = 5
+
+        for pkt in (read, unread):
+            self.assertIsNone(pkt.options)
+            self.assertEqual(len(pkt.to_bytes()), 20)
+        self.assertEqual(read, unread)
+
+    def test_optional_errors(self):
+        """
+        This test verifies the errors raised for invalid optional fields and values.
+        """
+        with self.assertRaises(TypeError):
+            models.OptionalField(models.IntField8(bit_len=4), present='a')
+        with self.assertRaises(TypeError):
+            Optional(kind=2, point=5)
+        with self.assertRaises(TypeError):
+            Optional(ext='abc')
+
+
+if __name__ == '__main__':
+    unittest.main()